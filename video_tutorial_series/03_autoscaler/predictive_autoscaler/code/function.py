@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Predictive Multi-Signal Autoscaler Policy
+
+Computes a target replica count from several load signals instead of fixed
+token thresholds:
+  - input/output token rates against a per-instance capacity model,
+  - queue_length per instance against a target backlog,
+  - p95 end-to-end latency against a latency objective,
+  - llm_active_sessions against a per-instance session capacity.
+
+Token rates are forecast ahead by the instance startup time with Holt's linear
+(level + trend) smoothing, seeded from the slope between the 1m/5m/15m rolling
+windows, so ramps are answered before the queues build up. Scale-ups may add
+several instances at once. Flapping is prevented with a tolerance band and with
+separate up/down stabilization windows (the most conservative recommendation in
+each window wins) instead of a single cooldown. Requested instances count as
+capacity until they report in (or scale_up_timeout_s passes), so evaluations
+during their startup do not request them again.
+"""
+import logging
+import math
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+# Configure logger
+logging.basicConfig(level=logging.INFO)
+
+# Rolling windows reported by the block metrics and the age (minutes) of their midpoints
+WINDOW_MIDPOINTS = (("average_1m", 0.5), ("average_5m", 2.5), ("average_15m", 7.5))
+
+
+def window_trend(rolling: Dict[str, float]) -> Tuple[float, float]:
+    """
+    Returns (latest, slope per minute) from a rolling-average dict. The slope is the
+    least-squares fit of the window averages against the age of each window midpoint.
+    """
+    points = [(-age, rolling[key]) for key, age in WINDOW_MIDPOINTS if rolling.get(key) is not None]
+    if not points:
+        return 0.0, 0.0
+    latest = points[0][1]
+    if len(points) < 2:
+        return latest, 0.0
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    var_t = sum((t - mean_t) ** 2 for t, _ in points)
+    slope = sum((t - mean_t) * (v - mean_v) for t, v in points) / var_t if var_t else 0.0
+    return latest, slope
+
+
+class HoltForecaster:
+    """Holt's linear exponential smoothing over irregularly spaced observations (time in minutes)."""
+
+    def __init__(self, alpha: float = 0.5, beta: float = 0.3):
+        self.alpha = alpha
+        self.beta = beta
+        self.level = None
+        self.trend = 0.0
+        self.last_ts = None
+
+    def update(self, value: float, ts: float, seed_trend: float = 0.0):
+        if self.level is None:
+            self.level, self.trend, self.last_ts = value, seed_trend, ts
+            return
+        dt = max((ts - self.last_ts) / 60.0, 1e-6)
+        predicted = self.level + self.trend * dt
+        level = self.alpha * value + (1 - self.alpha) * predicted
+        observed_trend = (level - self.level) / dt
+        # blend the smoothed trend with the trend implied by the rolling windows
+        self.trend = self.beta * (0.5 * observed_trend + 0.5 * seed_trend) + (1 - self.beta) * self.trend
+        self.level = level
+        self.last_ts = ts
+
+    def forecast(self, horizon_minutes: float) -> float:
+        if self.level is None:
+            return 0.0
+        return max(0.0, self.level + self.trend * horizon_minutes)
+
+
+class AIOSv1PolicyRule:
+    def __init__(self, rule_id, settings, parameters):
+        self.rule_id = rule_id
+        self.settings = settings
+        self.parameters = parameters
+        self.logger = logging.getLogger(f"PredictiveAutoscalerPolicy-{self.rule_id}")
+        self.logger.info("Initializing Predictive Autoscaler Policy")
+
+        self.min_replicas = self.parameters.get("min_replicas", 1)
+        self.max_replicas = self.parameters.get("max_replicas", 10)
+
+        # Capacity model: what one instance sustains at target_utilization
+        self.input_tokens_capacity = self.parameters.get("input_tokens_per_minute_capacity", 600)
+        self.output_tokens_capacity = self.parameters.get("output_tokens_per_minute_capacity", 400)
+        self.sessions_capacity = self.parameters.get("sessions_per_instance", 8)
+        self.target_utilization = self.parameters.get("target_utilization", 0.7)
+        self.queue_target = self.parameters.get("queue_length_per_instance_target", 2)
+        self.latency_target = self.parameters.get("latency_p95_target_s", 10.0)
+        self.latency_metric = self.parameters.get("latency_metric", "end_to_end_latency")
+
+        # Forecasting
+        self.forecast_horizon_s = self.parameters.get("forecast_horizon_s", 120)
+        self.alpha = self.parameters.get("smoothing_alpha", 0.5)
+        self.beta = self.parameters.get("smoothing_beta", 0.3)
+
+        # Stability
+        self.tolerance = self.parameters.get("tolerance", 0.1)
+        self.scale_up_stabilization_s = self.parameters.get("scale_up_stabilization_s", 0)
+        self.scale_down_stabilization_s = self.parameters.get("scale_down_stabilization_s", 300)
+        self.max_scale_up_step = self.parameters.get("max_scale_up_step", 4)
+        self.max_scale_down_step = self.parameters.get("max_scale_down_step", 1)
+        self.scale_up_timeout_s = self.parameters.get("scale_up_timeout_s", 600)
+
+        self._reset_state()
+
+    def _reset_state(self):
+        self.forecasters = {
+            "input": HoltForecaster(self.alpha, self.beta),
+            "output": HoltForecaster(self.alpha, self.beta),
+        }
+        self.recommendations = deque()  # (ts, desired replicas)
+        self.pending_target = None  # replicas requested by the last scale-up that are not running yet
+        self.pending_since = None
+
+    @staticmethod
+    def _rolling(instance: Dict[str, Any], name: str) -> Dict[str, float]:
+        value = instance.get(name)
+        if isinstance(value, dict):
+            return value
+        if isinstance(value, (int, float)):
+            return {"average_1m": value}
+        return {}
+
+    def _latency_p95(self, instances: List[Dict[str, Any]]) -> Optional[float]:
+        """p95 latency if the metric carries one, otherwise the p95 across instance averages."""
+        values = []
+        for instance in instances:
+            value = instance.get(self.latency_metric)
+            if isinstance(value, dict):
+                value = value.get("p95", value.get("average_1m"))
+            if isinstance(value, (int, float)):
+                values.append(value)
+        if not values:
+            return None
+        values.sort()
+        return values[min(len(values) - 1, int(math.ceil(0.95 * len(values))) - 1)]
+
+    def _signals(self, instances: List[Dict[str, Any]], now: float) -> Dict[str, float]:
+        """Aggregates fleet-wide signals and updates the token rate forecasters."""
+        signals = {}
+        horizon = self.forecast_horizon_s / 60.0
+        for key, metric in (("input", "llm_input_tokens_per_minute_rolling"),
+                            ("output", "llm_output_tokens_per_minute_rolling")):
+            latest, slope = 0.0, 0.0
+            for instance in instances:
+                inst_latest, inst_slope = window_trend(self._rolling(instance, metric))
+                latest += inst_latest
+                slope += inst_slope
+            forecaster = self.forecasters[key]
+            forecaster.update(latest, now, seed_trend=slope)
+            signals[f"{key}_tokens"] = latest
+            signals[f"{key}_tokens_forecast"] = forecaster.forecast(horizon)
+
+        signals["queue_length"] = sum(
+            self._rolling(inst, "queue_length").get("average_1m", 0) for inst in instances)
+        signals["active_sessions"] = sum(
+            self._rolling(inst, "llm_active_sessions").get("average_1m", 0) for inst in instances)
+        signals["latency_p95"] = self._latency_p95(instances)
+        return signals
+
+    def _desired_replicas(self, current: int, signals: Dict[str, float]) -> Tuple[int, Dict[str, float]]:
+        """Target replica count per signal; the largest one wins."""
+        util = self.target_utilization
+        # Never size below what is needed for the current load, even if the forecast trends down
+        input_load = max(signals["input_tokens"], signals["input_tokens_forecast"])
+        output_load = max(signals["output_tokens"], signals["output_tokens_forecast"])
+        per_signal = {
+            "input_tokens": input_load / (self.input_tokens_capacity * util),
+            "output_tokens": output_load / (self.output_tokens_capacity * util),
+            "active_sessions": signals["active_sessions"] / (self.sessions_capacity * util),
+        }
+        # Backlog and latency are ratio signals (as in a horizontal pod autoscaler): only push upwards
+        queue_per_instance = signals["queue_length"] / current
+        if queue_per_instance > self.queue_target:
+            per_signal["queue_length"] = current * queue_per_instance / self.queue_target
+        if signals["latency_p95"] is not None and signals["latency_p95"] > self.latency_target:
+            per_signal["latency_p95"] = current * signals["latency_p95"] / self.latency_target
+
+        raw = max(per_signal.values())
+        # tolerance band around the current size avoids reacting to noise
+        if abs(raw / current - 1.0) <= self.tolerance:
+            desired = current
+        else:
+            desired = math.ceil(raw - 1e-9)
+        desired = max(self.min_replicas, min(self.max_replicas, desired))
+        return desired, per_signal
+
+    def _stabilize(self, current: int, desired: int, now: float) -> int:
+        """
+        Scale-ups use the lowest recommendation of the up window, scale-downs the highest
+        of the down window, so a short dip or spike alone does not move the replica count.
+        """
+        self.recommendations.append((now, desired))
+        horizon = max(self.scale_up_stabilization_s, self.scale_down_stabilization_s)
+        while self.recommendations and self.recommendations[0][0] < now - horizon:
+            self.recommendations.popleft()
+
+        if desired > current:
+            window = [d for ts, d in self.recommendations if ts >= now - self.scale_up_stabilization_s]
+            return max(current, min(window or [desired]))
+        if desired < current:
+            window = [d for ts, d in self.recommendations if ts >= now - self.scale_down_stabilization_s]
+            return min(current, max(window or [desired]))
+        return current
+
+    def _expected_replicas(self, current: int, now: float) -> int:
+        """Running replicas plus those requested by a scale-up that are still starting."""
+        if self.pending_target is not None:
+            if current >= self.pending_target or now - self.pending_since > self.scale_up_timeout_s:
+                if current < self.pending_target:
+                    self.logger.warning(f"{self.pending_target - current} requested instance(s) did not start "
+                                        f"within {self.scale_up_timeout_s}s")
+                self.pending_target = self.pending_since = None
+        return max(current, self.pending_target or 0)
+
+    def eval(self, parameters: Dict[str, Any], input_data: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            metrics_collector = self.settings.get('get_metrics')
+            if not callable(metrics_collector):
+                self.logger.error("get_metrics function not found in settings")
+                return {"skip": True, "reason": "Metrics collector not configured."}
+
+            metrics = metrics_collector()
+
+            current_instances = input_data.get("current_instances")
+            if not current_instances:
+                self.logger.warning("No current instances provided. Skipping evaluation.")
+                return {"skip": True, "reason": "No current instances provided."}
+
+            block_metrics = metrics.get("block_metrics", [])
+            now = time.time()
+
+            instances_to_process = [
+                inst for inst in block_metrics
+                if inst.get('instanceId') in current_instances
+            ]
+            if not instances_to_process:
+                self.logger.warning("No metrics found for the specified current_instances.")
+                return {"skip": True, "reason": "No metrics found for the specified instances."}
+
+            current = len(current_instances)
+            expected = self._expected_replicas(current, now)
+            signals = self._signals(instances_to_process, now)
+            desired, per_signal = self._desired_replicas(current, signals)
+            target = self._stabilize(current, desired, now)
+            self.logger.info(f"Signals: {signals}, per-signal replicas: {per_signal}, "
+                             f"desired: {desired}, stabilized target: {target}, current: {current}, "
+                             f"expected: {expected}")
+
+            if target > expected:
+                count = min(target - expected, self.max_scale_up_step)
+                driver = max(per_signal, key=per_signal.get)
+                reason = f"Target {target} replicas for {current} running (driven by {driver})"
+                if expected > current:
+                    reason += f", {expected - current} starting"
+                self.logger.info(f"{reason}. Scaling up by {count}.")
+                self.pending_target = expected + count
+                self.pending_since = now
+                return {
+                    "skip": False,
+                    "operation": "upscale",
+                    "instances_count": count,
+                    "reason": reason
+                }
+
+            if target < current:
+                self.pending_target = self.pending_since = None
+                count = min(current - target, self.max_scale_down_step)
+                # Remove the least loaded instances first
+                instances_to_process.sort(key=lambda x:
+                    self._rolling(x, 'llm_input_tokens_per_minute_rolling').get('average_1m', 0) +
+                    self._rolling(x, 'llm_output_tokens_per_minute_rolling').get('average_1m', 0)
+                )
+                instances_list = [inst.get('instanceId') for inst in instances_to_process[:count]]
+                reason = f"Target {target} replicas for {current} running"
+                self.logger.info(f"{reason}. Scaling down. Removing instances {instances_list}")
+                return {
+                    "skip": False,
+                    "operation": "downscale",
+                    "instances_list": instances_list,
+                    "reason": reason
+                }
+
+            return {"skip": True, "reason": "No scaling action required."}
+
+        except Exception as e:
+            self.logger.exception(f"An unexpected error occurred during evaluation: {e}")
+            return {"skip": True, "reason": f"An error occurred: {e}"}
+
+    def management(self, action: str, data: dict) -> dict:
+        self.logger.info(f"Management action received: {action} with data: {data}")
+        tunables = {
+            "min_replicas": "min_replicas",
+            "max_replicas": "max_replicas",
+            "input_tokens_per_minute_capacity": "input_tokens_capacity",
+            "output_tokens_per_minute_capacity": "output_tokens_capacity",
+            "sessions_per_instance": "sessions_capacity",
+            "target_utilization": "target_utilization",
+            "queue_length_per_instance_target": "queue_target",
+            "latency_p95_target_s": "latency_target",
+            "forecast_horizon_s": "forecast_horizon_s",
+            "tolerance": "tolerance",
+            "scale_up_stabilization_s": "scale_up_stabilization_s",
+            "scale_down_stabilization_s": "scale_down_stabilization_s",
+            "max_scale_up_step": "max_scale_up_step",
+            "max_scale_down_step": "max_scale_down_step",
+            "scale_up_timeout_s": "scale_up_timeout_s",
+        }
+        try:
+            if action == "update_parameters":
+                updated = {k: v for k, v in data.items() if k in tunables}
+                if not updated:
+                    return {"status": "error", "reason": "No valid parameters provided"}
+                for key, value in updated.items():
+                    setattr(self, tunables[key], value)
+                self.min_replicas = max(1, self.min_replicas)
+                self.logger.info(f"Parameters updated: {updated}")
+                return {
+                    "status": "ok",
+                    "message": "Parameters updated successfully",
+                    "current_config": {k: getattr(self, attr) for k, attr in tunables.items()}
+                }
+
+            elif action == "get_state":
+                return {
+                    "status": "ok",
+                    "forecast": {
+                        key: {"level": f.level, "trend_per_min": f.trend}
+                        for key, f in self.forecasters.items()
+                    },
+                    "recommendations": list(self.recommendations),
+                    "pending_target": self.pending_target,
+                }
+
+            elif action == "reset_state":
+                self._reset_state()
+                self.logger.info("Forecast and stabilization state reset")
+                return {"status": "ok", "message": "State reset successfully"}
+
+            return {"status": "not_implemented", "action": action}
+        except Exception as e:
+            self.logger.exception(f"Error in management action '{action}': {e}")
+            return {"status": "not_implemented", "action": action}
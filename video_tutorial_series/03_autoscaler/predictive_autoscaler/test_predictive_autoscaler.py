@@ -0,0 +1,99 @@
+import unittest
+from unittest import mock
+import os,sys
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+import function
+from function import AIOSv1PolicyRule, HoltForecaster, window_trend
+sys.path.remove(os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+
+
+class TestForecast(unittest.TestCase):
+    def test_window_trend_fits_the_rolling_windows(self):
+        # a ramp of 10 tokens/min per minute: the older windows average lower
+        latest, slope = window_trend({"average_1m": 100, "average_5m": 80, "average_15m": 30})
+        self.assertEqual(latest, 100)
+        self.assertAlmostEqual(slope, 10.0)
+        self.assertEqual(window_trend({"average_1m": 5}), (5, 0.0))
+        self.assertEqual(window_trend({}), (0.0, 0.0))
+
+    def test_holt_follows_a_linear_ramp(self):
+        forecaster = HoltForecaster(alpha=0.5, beta=0.3)
+        self.assertEqual(forecaster.forecast(2), 0.0)
+        for minute in range(30):
+            forecaster.update(100 + 10 * minute, minute * 60.0, seed_trend=10)
+        self.assertAlmostEqual(forecaster.trend, 10.0, places=3)
+        self.assertAlmostEqual(forecaster.forecast(2), 100 + 10 * 29 + 20, places=1)
+
+        # a falling forecast is clamped at zero
+        forecaster.trend = -1000
+        self.assertEqual(forecaster.forecast(5), 0.0)
+
+
+class TestPredictiveAutoscaler(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(function.time, "time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.output_tokens = 0
+        self.instances = ["i1"]
+        self.policy = AIOSv1PolicyRule("test-autoscaler", {"get_metrics": self.metrics}, {
+            "output_tokens_per_minute_capacity": 100, "target_utilization": 1.0,
+            "scale_down_stabilization_s": 300, "scale_up_timeout_s": 600})
+
+    def metrics(self):
+        per_instance = self.output_tokens / len(self.instances)
+        rolling = {"average_1m": per_instance, "average_5m": per_instance, "average_15m": per_instance}
+        return {"block_metrics": [{"instanceId": i, "llm_output_tokens_per_minute_rolling": rolling}
+                                  for i in self.instances]}
+
+    def eval(self, advance_s=30):
+        self.now += advance_s
+        return self.policy.eval({}, {"current_instances": list(self.instances)}, {})
+
+    def test_scale_up_is_not_repeated_while_instances_start(self):
+        self.output_tokens = 350
+        result = self.eval()
+        self.assertEqual((result["operation"], result["instances_count"]), ("upscale", 3))
+        for _ in range(3):
+            self.assertTrue(self.eval()["skip"])
+
+        # two of three came up; the third still counts as starting
+        self.instances = ["i1", "i2", "i3"]
+        self.assertTrue(self.eval()["skip"])
+
+        # more load asks only for the difference
+        self.output_tokens = 550
+        result = self.eval()
+        self.assertEqual((result["operation"], result["instances_count"]), ("upscale", 2))
+
+    def test_instances_that_never_start_are_requested_again(self):
+        self.output_tokens = 250
+        self.assertEqual(self.eval()["instances_count"], 2)
+        self.assertTrue(self.eval(advance_s=599)["skip"])
+        result = self.eval(advance_s=2)
+        self.assertEqual((result["operation"], result["instances_count"]), ("upscale", 2))
+
+    def test_scale_down_waits_for_the_stabilization_window(self):
+        self.instances = ["i1", "i2", "i3"]
+        self.output_tokens = 300
+        self.assertTrue(self.eval()["skip"])
+
+        self.output_tokens = 100
+        for _ in range(9):
+            self.assertTrue(self.eval()["skip"])  # the 300 recommendation is still in the window
+        result = self.eval(advance_s=60)
+        self.assertEqual(result["operation"], "downscale")
+        self.assertEqual(len(result["instances_list"]), 1)
+
+    def test_state_can_be_inspected_and_reset(self):
+        self.output_tokens = 350
+        self.eval()
+        state = self.policy.management("get_state", {})
+        self.assertEqual(state["pending_target"], 4)
+        self.policy.management("reset_state", {})
+        self.assertIsNone(self.policy.management("get_state", {})["pending_target"])
+
+
+if __name__ == "__main__":
+    unittest.main()
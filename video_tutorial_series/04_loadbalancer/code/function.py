@@ -1,6 +1,98 @@
 import random
 import logging
-from typing import Dict, Any
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+
+class BoundedRendezvousAffinity:
+    """
+    Session affinity by rendezvous (highest-random-weight) hashing with bounded load.
+
+    A new session is placed on the instance with the highest hash(session, instance),
+    so adding or removing one of N instances remaps only about 1/N of the sessions.
+    An instance that already holds more than (1 + load_epsilon) times the mean number
+    of active sessions is skipped in favour of the session's next instance in hash
+    order. The bound is only applied at placement: once placed, a session stays on its
+    instance until it is idle for session_ttl_s, is evicted from the bounded LRU of
+    placements, or its instance leaves the fleet.
+    """
+
+    def __init__(self, load_epsilon: float = 0.25, max_sessions: int = 10000, session_ttl_s: float = 600.0):
+        self.load_epsilon = load_epsilon
+        self.max_sessions = max_sessions
+        self.session_ttl_s = session_ttl_s
+        self.placements = OrderedDict()  # session_id -> (instance_id, last_seen), least recently seen first
+        self.sessions: Dict[str, int] = {}  # instance_id -> number of active sessions placed on it
+
+    @staticmethod
+    def _weight(session_id: str, instance_id: str) -> int:
+        digest = hashlib.blake2b(f"{session_id}\x00{instance_id}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def _release(self, session_id: str):
+        instance_id, _ = self.placements.pop(session_id)
+        remaining = self.sessions.get(instance_id, 0) - 1
+        if remaining > 0:
+            self.sessions[instance_id] = remaining
+        else:
+            self.sessions.pop(instance_id, None)
+
+    def _expire(self, now: float):
+        while self.placements:
+            session_id, (_, last_seen) = next(iter(self.placements.items()))
+            if now - last_seen < self.session_ttl_s and len(self.placements) <= self.max_sessions:
+                break
+            self._release(session_id)
+
+    def _within_bound(self, instance_id: str, instances: List[str]) -> bool:
+        active = sum(self.sessions.get(i, 0) for i in instances)
+        bound = math.ceil((1.0 + self.load_epsilon) * (active + 1) / len(instances))
+        return self.sessions.get(instance_id, 0) + 1 <= bound
+
+    def peek(self, session_id: str, instances: List[str]) -> Optional[str]:
+        """The instance the session is currently bound to, without recording an assignment."""
+        placement = self.placements.get(session_id)
+        if placement and placement[0] in instances:
+            return placement[0]
+        if not instances:
+            return None
+        return max(instances, key=lambda i: self._weight(session_id, i))
+
+    def assign(self, session_id: str, instances: List[str]) -> Optional[str]:
+        if not instances:
+            return None
+        now = time.time()
+        self._expire(now)
+        placement = self.placements.get(session_id)
+        if placement is not None:
+            if placement[0] in instances:
+                self.placements[session_id] = (placement[0], now)
+                self.placements.move_to_end(session_id)
+                return placement[0]
+            self._release(session_id)
+
+        ranked = sorted(instances, key=lambda i: self._weight(session_id, i), reverse=True)
+        chosen = next((i for i in ranked if self._within_bound(i, instances)), ranked[0])
+        self.placements[session_id] = (chosen, now)
+        self.sessions[chosen] = self.sessions.get(chosen, 0) + 1
+        self._expire(now)
+        return chosen
+
+    def update_instances(self, instances: List[str]):
+        """Releases sessions of removed instances; they are placed again on their next request."""
+        alive = set(instances)
+        for session_id in [s for s, (i, _) in self.placements.items() if i not in alive]:
+            self._release(session_id)
+
+    def mapping(self) -> Dict[str, Any]:
+        return {
+            "sessions": {s: i for s, (i, _) in self.placements.items()},
+            "loads": dict(self.sessions),
+        }
+
 
 class AIOSv1PolicyRule:
     def __init__(self, rule_id, settings, parameters):
@@ -27,7 +119,11 @@ class AIOSv1PolicyRule:
         self.block_data = self.settings.get("block_data")
         self.cluster_data = self.settings.get("cluster_data")
         
-        self.session_ids_cache = {}
+        self.affinity = BoundedRendezvousAffinity(
+            load_epsilon=self.parameters.get("affinity_load_epsilon", 0.25),
+            max_sessions=self.parameters.get("affinity_max_sessions", 10000),
+            session_ttl_s=self.parameters.get("affinity_session_ttl_s", 600),
+        )
         self.current_instances = []
 
     def _calculate_weighted_tokens(self, instance_metrics: Dict[str, Any]) -> float:
@@ -74,6 +170,12 @@ class AIOSv1PolicyRule:
             self.logger.info(f"Final scores: {instance_scores}. Chosen instance with lowest score: '{chosen_instance}'")
             return chosen_instance
 
+    def _update_instances(self, latest_instances: List[str]):
+        if set(latest_instances) != set(self.current_instances):
+            self.logger.info(f"Instance list changed from {self.current_instances} to {latest_instances}. Updating session affinity.")
+            self.affinity.update_instances(latest_instances)
+        self.current_instances = latest_instances
+
     def eval(self, parameters: Dict[str, Any], input_data: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Evaluates the policy to select an instance based on weighted token metrics.
@@ -87,37 +189,19 @@ class AIOSv1PolicyRule:
             # The instance list is provided in the input data for load balancing
             latest_instances = input_data.get("instances", [])
 
-            if set(latest_instances) != set(self.current_instances):
-                self.logger.info(f"Instance list changed from {self.current_instances} to {latest_instances}. Updating session cache.")
-                
-                # Instead of clearing the whole cache, remove only stale entries
-                stale_sessions = [
-                    session_id for session_id, instance_id in self.session_ids_cache.items()
-                    if instance_id not in latest_instances
-                ]
-                
-                if stale_sessions:
-                    self.logger.info(f"Removing stale sessions from cache: {stale_sessions}")
-                    for session_id in stale_sessions:
-                        del self.session_ids_cache[session_id]
-
-                self.current_instances = latest_instances
+            self._update_instances(latest_instances)
 
             if not self.current_instances:
                 self.logger.warning("No instances available for routing.")
                 return {"instance_id": None, "reason": "No available instances."}
 
             packet = input_data.get("packet")
-            if packet:
-                session_id = getattr(packet, "session_id", None)
-                if session_id and session_id in self.session_ids_cache:
-                    cached_instance = self.session_ids_cache[session_id]
-                    if cached_instance in self.current_instances:
-                        self.logger.info(f"Session '{session_id}' found in cache. Routing to instance '{cached_instance}'.")
-                        return {"instance_id": cached_instance}
-                    else:
-                        self.logger.info(f"Cached instance '{cached_instance}' for session '{session_id}' is no longer active. Removing from cache.")
-                        del self.session_ids_cache[session_id]
+            session_id = getattr(packet, "session_id", None) if packet else None
+            if session_id:
+                # Sessions stick to their rendezvous-hash instance, subject to the load bound
+                chosen_instance = self.affinity.assign(session_id, self.current_instances)
+                self.logger.info(f"Session '{session_id}' routed to instance '{chosen_instance}'.")
+                return {"instance_id": chosen_instance}
 
             # Select the best instance using the refactored helper method
             chosen_instance = self._select_instance()
@@ -126,11 +210,6 @@ class AIOSv1PolicyRule:
                 self.logger.error("Failed to select an instance.")
                 return {"instance_id": None, "reason": "Instance selection failed."}
 
-            if packet and getattr(packet, "session_id", None):
-                session_id = packet.session_id
-                self.logger.info(f"Caching session '{session_id}' to instance '{chosen_instance}'.")
-                self.session_ids_cache[session_id] = chosen_instance
-
             return {"instance_id": chosen_instance}
 
         except Exception as e:
@@ -151,46 +230,22 @@ class AIOSv1PolicyRule:
         if action == "health_check":
             return {"instances": self.current_instances, "status": "healthy"}
         elif action == "get_current_mapping":
-            return {"mapping": self.session_ids_cache}
+            session_id = data.get("session_id")
+            if session_id:
+                return {"session_id": session_id, "instance_id": self.affinity.peek(session_id, self.current_instances)}
+            return {"mapping": self.affinity.mapping()}
         elif action == "assign_streaming":
             session_id = data.get("session_id")
             latest_instances = data.get("instances", [])
-            if set(latest_instances) != set(self.current_instances):
-                self.logger.info(f"Instance list changed from {self.current_instances} to {latest_instances}. Updating session cache.")
-                
-                # Instead of clearing the whole cache, remove only stale entries
-                stale_sessions = [
-                    session_id for session_id, instance_id in self.session_ids_cache.items()
-                    if instance_id not in latest_instances
-                ]
-                
-                if stale_sessions:
-                    self.logger.info(f"Removing stale sessions from cache: {stale_sessions}")
-                    for session_id in stale_sessions:
-                        del self.session_ids_cache[session_id]
-
-                self.current_instances = latest_instances
+            self._update_instances(latest_instances)
 
             if not session_id:
                 self.logger.error("'session_id' not provided for 'assign_streaming' action.")
                 return {"status": "error", "reason": "session_id is required."}
 
-            # If session is already cached, return the existing instance
-            if session_id in self.session_ids_cache:
-                cached_instance = self.session_ids_cache[session_id]
-                if cached_instance in self.current_instances:
-                    self.logger.info(f"Session '{session_id}' already assigned to '{cached_instance}'.")
-                    return {"instance_id": cached_instance, "status": "ok"}
-                else:
-                    self.logger.info(f"Cached instance '{cached_instance}' for session '{session_id}' is no longer active. Re-assigning.")
-                    del self.session_ids_cache[session_id]
-
-            # Select the best available instance
-            chosen_instance = self._select_instance()
-
+            chosen_instance = self.affinity.assign(session_id, self.current_instances)
             if chosen_instance:
                 self.logger.info(f"Pre-allocating instance '{chosen_instance}' for streaming session '{session_id}'.")
-                self.session_ids_cache[session_id] = chosen_instance
                 return {"instance_id": chosen_instance, "status": "ok"}
             else:
                 self.logger.error(f"Failed to select an instance for session '{session_id}'.")
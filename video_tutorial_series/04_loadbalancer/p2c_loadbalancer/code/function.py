@@ -0,0 +1,371 @@
+"""
+Power-of-Two-Choices / Least-Outstanding-Requests Load Balancer Policy
+
+Instead of scanning every instance's (up to 30s old) token metrics on each call and
+sending all new sessions to the single minimum, this policy:
+  - tracks requests assigned to each instance locally, reconciled with the reported
+    queue_length + llm_active_sessions whenever an instance publishes a new metrics
+    snapshot (assignments made before its timestamp are counted in it, later ones are not),
+  - samples two random instances and picks the one with the lower blended score of
+    live outstanding requests and normalized rolling token load,
+  - refreshes the metrics snapshot in a background thread (or lazily, every
+    metrics_refresh_s) instead of calling get_metrics on every decision. One thread
+    per process serves every policy instance.
+
+Session affinity works as in the token-based load balancer; pinned sessions are kept
+in an LRU of at most max_sessions entries and dropped after session_ttl_s idle.
+"""
+import random
+import logging
+import threading
+import time
+import weakref
+from collections import deque, OrderedDict
+from typing import Dict, Any, List, Optional
+
+
+# Policies with async_refresh, served by a single background thread
+_refresh_policies = weakref.WeakSet()
+_refresh_lock = threading.Lock()
+_refresh_wakeup = threading.Event()
+_refresh_thread = None
+_REFRESH_IDLE_S = 60.0
+
+
+def _register_for_refresh(policy):
+    global _refresh_thread
+    with _refresh_lock:
+        _refresh_policies.add(policy)
+        if _refresh_thread is None:
+            _refresh_thread = threading.Thread(target=_refresh_loop, name="p2c-metrics-refresh", daemon=True)
+            _refresh_thread.start()
+    _refresh_wakeup.set()
+
+
+def _unregister_for_refresh(policy):
+    with _refresh_lock:
+        _refresh_policies.discard(policy)
+    _refresh_wakeup.set()
+
+
+def _refresh_due_policies() -> float:
+    """Refreshes the policies whose metrics_refresh_s has passed; returns when the next one is due."""
+    with _refresh_lock:
+        policies = list(_refresh_policies)
+    next_due = time.time() + _REFRESH_IDLE_S
+    for policy in policies:
+        if time.time() >= policy.next_refresh:
+            policy._refresh_metrics()
+            policy.next_refresh = time.time() + policy.metrics_refresh_s
+        next_due = min(next_due, policy.next_refresh)
+    return next_due
+
+
+def _refresh_loop():
+    # Holds no reference to a policy between passes, so dropped policies leave the WeakSet
+    global _refresh_thread
+    while True:
+        _refresh_wakeup.clear()
+        with _refresh_lock:
+            if not _refresh_policies:
+                _refresh_thread = None
+                return
+        next_due = _refresh_due_policies()
+        _refresh_wakeup.wait(max(0.0, next_due - time.time()))
+
+
+class AIOSv1PolicyRule:
+    def __init__(self, rule_id, settings, parameters):
+        """
+        Initializes the P2C Load Balancer Policy.
+
+        Args:
+            rule_id (str): Unique identifier for the rule.
+            settings (dict): Configuration settings for the rule, including 'get_metrics'.
+            parameters (dict): Parameters defining the rule's behavior.
+        """
+        self.rule_id = rule_id
+        self.settings = settings
+        self.parameters = parameters
+        self.logger = logging.getLogger(f"P2CLoadBalancerPolicy-{self.rule_id}")
+
+        # Weights for token calculation
+        self.output_token_weight = self.parameters.get("output_token_weight", 0.9)
+        self.input_token_weight = self.parameters.get("input_token_weight", 0.1)
+        self.averaging_period = self.parameters.get("averaging_period", "average_1m")
+        # Blend of live outstanding requests and normalized token load
+        self.outstanding_weight = self.parameters.get("outstanding_weight", 1.0)
+        self.token_score_weight = self.parameters.get("token_score_weight", 1.0)
+        # Assignments older than this without a completion report are assumed finished
+        self.inflight_ttl_s = self.parameters.get("inflight_ttl_s", 60)
+        self.metrics_refresh_s = self.parameters.get("metrics_refresh_s", 5)
+        self.async_refresh = self.parameters.get("async_refresh", True)
+        # Pinned sessions: bounded LRU, idle sessions expire
+        self.max_sessions = self.parameters.get("max_sessions", 10000)
+        self.session_ttl_s = self.parameters.get("session_ttl_s", 600)
+
+        self.metrics_function = self.settings.get("get_metrics")
+        self.block_data = self.settings.get("block_data")
+        self.cluster_data = self.settings.get("cluster_data")
+
+        self.session_ids_cache = OrderedDict()  # session_id -> (instance_id, last_seen), least recently seen first
+        self.session_lock = threading.Lock()
+        self.current_instances = []
+
+        self.lock = threading.Lock()
+        self.token_scores: Dict[str, float] = {}   # instance -> normalized token score
+        self.reported: Dict[str, float] = {}       # instance -> outstanding reported by metrics
+        self.assigned: Dict[str, deque] = {}       # instance -> assignment times since the last snapshot
+        self.completed: Dict[str, deque] = {}      # instance -> completion times since the last snapshot
+        self.snapshot_keys: Dict[str, Any] = {}    # instance -> timestamp of the snapshot last reconciled
+        self.last_refresh = None
+        self.next_refresh = 0.0
+        self.background_refresh = bool(self.async_refresh and callable(self.metrics_function))
+        if self.background_refresh:
+            _register_for_refresh(self)
+
+    # ------------------------------------------------------------------ metrics snapshot
+    @staticmethod
+    def _gauge(instance_metrics: Dict[str, Any], name: str) -> Optional[float]:
+        value = instance_metrics.get(name)
+        if isinstance(value, dict):
+            value = value.get("current", value.get("average_1m"))
+        return float(value) if isinstance(value, (int, float)) else None
+
+    def _calculate_weighted_tokens(self, instance_metrics: Dict[str, Any]) -> float:
+        """Calculates the weighted token score for an instance."""
+        input_tokens_rolling = instance_metrics.get("llm_input_tokens_per_minute_rolling", {})
+        output_tokens_rolling = instance_metrics.get("llm_output_tokens_per_minute_rolling", {})
+
+        input_tokens = input_tokens_rolling.get(self.averaging_period, 0)
+        output_tokens = output_tokens_rolling.get(self.averaging_period, 0)
+
+        return (self.input_token_weight * input_tokens) + (self.output_token_weight * output_tokens)
+
+    def _refresh_metrics(self):
+        """Takes a new metrics snapshot and reconciles the local outstanding counters with it."""
+        try:
+            block_metrics = self.metrics_function().get("block_metrics", [])
+        except Exception as e:
+            self.logger.warning(f"Metrics refresh failed, keeping previous snapshot: {e}")
+            return
+
+        scores, reported = {}, {}
+        for instance_metric in block_metrics:
+            instance_id = instance_metric.get("instanceId")
+            if not instance_id:
+                continue
+            scores[instance_id] = self._calculate_weighted_tokens(instance_metric)
+            queue_length = self._gauge(instance_metric, "queue_length")
+            active = self._gauge(instance_metric, "llm_active_sessions")
+            if queue_length is not None or active is not None:
+                reported[instance_id] = ((queue_length or 0) + (active or 0), instance_metric.get("timestamp"))
+
+        # Token scores are relative to the fleet mean so they blend with request counts
+        mean_score = sum(scores.values()) / len(scores) if scores else 0
+        normalized = {i: (s / mean_score if mean_score > 0 else 0.0) for i, s in scores.items()}
+
+        with self.lock:
+            self.token_scores = normalized
+            for instance_id, (value, timestamp) in reported.items():
+                # get_metrics may return the same snapshot for up to 30s; reconcile once per snapshot
+                snapshot_key = timestamp if timestamp is not None else value
+                if self.snapshot_keys.get(instance_id) == snapshot_key:
+                    continue
+                self.snapshot_keys[instance_id] = snapshot_key
+                self.reported[instance_id] = value
+                # the snapshot already contains what happened before it, not what came after
+                cutoff = timestamp if timestamp is not None else time.time()
+                for events in (self.assigned.get(instance_id), self.completed.get(instance_id)):
+                    while events and events[0] <= cutoff:
+                        events.popleft()
+            self.last_refresh = time.time()
+
+    def _maybe_refresh(self):
+        if self.background_refresh and self.last_refresh is not None:
+            return
+        if self.last_refresh is None or time.time() - self.last_refresh >= self.metrics_refresh_s:
+            self._refresh_metrics()
+
+    # ------------------------------------------------------------------ outstanding tracking
+    def _outstanding(self, instance_id: str, now: float) -> float:
+        # Called with the lock held
+        assigned = self.assigned.get(instance_id)
+        if assigned:
+            while assigned and assigned[0] < now - self.inflight_ttl_s:
+                assigned.popleft()
+        local = len(assigned) if assigned else 0
+        completed = len(self.completed.get(instance_id) or ())
+        return max(0.0, self.reported.get(instance_id, 0) + local - completed)
+
+    def _record_assignment(self, instance_id: str):
+        with self.lock:
+            self.assigned.setdefault(instance_id, deque()).append(time.time())
+
+    def _score(self, instance_id: str, now: float) -> float:
+        return (self.outstanding_weight * self._outstanding(instance_id, now) +
+                self.token_score_weight * self.token_scores.get(instance_id, 0.0))
+
+    def _select_instance(self) -> Optional[str]:
+        """Picks the better of two randomly sampled instances."""
+        if not self.current_instances:
+            self.logger.warning("No instances available for routing.")
+            return None
+        if callable(self.metrics_function):
+            self._maybe_refresh()
+        if len(self.current_instances) == 1:
+            chosen_instance = self.current_instances[0]
+        else:
+            first, second = random.sample(self.current_instances, 2)
+            now = time.time()
+            with self.lock:
+                first_score, second_score = self._score(first, now), self._score(second, now)
+            chosen_instance = first if first_score <= second_score else second
+            self.logger.debug(f"P2C: '{first}'={first_score:.3f} vs '{second}'={second_score:.3f} -> '{chosen_instance}'")
+        self._record_assignment(chosen_instance)
+        return chosen_instance
+
+    # ------------------------------------------------------------------ session affinity
+    def _expire_sessions(self, now: float):
+        # Called with the session lock held
+        while self.session_ids_cache:
+            session_id, (_, last_seen) = next(iter(self.session_ids_cache.items()))
+            if now - last_seen < self.session_ttl_s and len(self.session_ids_cache) <= self.max_sessions:
+                return
+            del self.session_ids_cache[session_id]
+
+    def _cached_instance(self, session_id: str) -> Optional[str]:
+        """Returns the live instance the session is pinned to, or None."""
+        now = time.time()
+        with self.session_lock:
+            self._expire_sessions(now)
+            entry = self.session_ids_cache.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] not in self.current_instances:
+                del self.session_ids_cache[session_id]
+                return None
+            self.session_ids_cache[session_id] = (entry[0], now)
+            self.session_ids_cache.move_to_end(session_id)
+            return entry[0]
+
+    def _pin_session(self, session_id: str, instance_id: str):
+        now = time.time()
+        with self.session_lock:
+            self.session_ids_cache[session_id] = (instance_id, now)
+            self.session_ids_cache.move_to_end(session_id)
+            self._expire_sessions(now)
+
+    def _update_instances(self, latest_instances: List[str]):
+        if set(latest_instances) != set(self.current_instances):
+            self.logger.info(f"Instance list changed from {self.current_instances} to {latest_instances}. Updating session cache.")
+
+            # Instead of clearing the whole cache, remove only stale entries
+            with self.session_lock:
+                stale_sessions = [
+                    session_id for session_id, (instance_id, _) in self.session_ids_cache.items()
+                    if instance_id not in latest_instances
+                ]
+                for session_id in stale_sessions:
+                    del self.session_ids_cache[session_id]
+
+            with self.lock:
+                for instance_id in list(self.assigned):
+                    if instance_id not in latest_instances:
+                        self.assigned.pop(instance_id, None)
+                        self.completed.pop(instance_id, None)
+                        self.reported.pop(instance_id, None)
+                        self.snapshot_keys.pop(instance_id, None)
+
+        self.current_instances = list(latest_instances)
+
+    def eval(self, parameters: Dict[str, Any], input_data: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Evaluates the policy to select an instance by power-of-two-choices.
+        """
+        try:
+            self._update_instances(input_data.get("instances", []))
+
+            if not self.current_instances:
+                self.logger.warning("No instances available for routing.")
+                return {"instance_id": None, "reason": "No available instances."}
+
+            packet = input_data.get("packet")
+            session_id = getattr(packet, "session_id", None) if packet else None
+            cached_instance = self._cached_instance(session_id) if session_id else None
+            if cached_instance:
+                self._record_assignment(cached_instance)
+                return {"instance_id": cached_instance}
+
+            chosen_instance = self._select_instance()
+            if not chosen_instance:
+                self.logger.error("Failed to select an instance.")
+                return {"instance_id": None, "reason": "Instance selection failed."}
+
+            if session_id:
+                self._pin_session(session_id, chosen_instance)
+
+            return {"instance_id": chosen_instance}
+
+        except Exception as e:
+            self.logger.exception(f"An unexpected error occurred during evaluation: {e}")
+            # Fallback to random choice on error to maintain availability
+            if self.current_instances:
+                chosen_instance = random.choice(self.current_instances)
+                self.logger.warning(f"Error occurred. Falling back to random instance: {chosen_instance}")
+                return {"instance_id": chosen_instance}
+            return {"instance_id": None, "reason": "An error occurred and no instances are available."}
+
+    def management(self, action: str, data: dict) -> dict:
+        """
+        Executes a custom management command.
+        """
+        self.logger.info(f"Management action received: {action} with data: {data}")
+        if action == "health_check":
+            return {"instances": self.current_instances, "status": "healthy"}
+        elif action == "get_current_mapping":
+            with self.session_lock:
+                self._expire_sessions(time.time())
+                return {"mapping": {s: i for s, (i, _) in self.session_ids_cache.items()}}
+        elif action == "request_completed":
+            # Optional completion feedback, makes the outstanding counts exact between snapshots
+            instance_id = data.get("instance_id")
+            if not instance_id:
+                return {"status": "error", "reason": "instance_id is required."}
+            now = time.time()
+            with self.lock:
+                self.completed.setdefault(instance_id, deque()).extend([now] * int(data.get("count", 1)))
+            return {"status": "ok"}
+        elif action == "get_outstanding":
+            now = time.time()
+            with self.lock:
+                return {
+                    "status": "ok",
+                    "outstanding": {i: self._outstanding(i, now) for i in self.current_instances},
+                    "token_scores": dict(self.token_scores),
+                    "last_refresh": self.last_refresh,
+                }
+        elif action == "assign_streaming":
+            session_id = data.get("session_id")
+            self._update_instances(data.get("instances", self.current_instances))
+
+            if not session_id:
+                self.logger.error("'session_id' not provided for 'assign_streaming' action.")
+                return {"status": "error", "reason": "session_id is required."}
+
+            cached_instance = self._cached_instance(session_id)
+            if cached_instance:
+                return {"instance_id": cached_instance, "status": "ok"}
+
+            chosen_instance = self._select_instance()
+            if chosen_instance:
+                self._pin_session(session_id, chosen_instance)
+                return {"instance_id": chosen_instance, "status": "ok"}
+            return {"instance_id": None, "status": "error", "reason": "Instance selection failed."}
+        elif action == "stop":
+            self.background_refresh = False
+            _unregister_for_refresh(self)
+            return {"status": "ok"}
+
+        self.logger.warning(f"Unknown management action received: {action}")
+        return {"status": "unknown_action", "reason": f"Action '{action}' is not supported."}
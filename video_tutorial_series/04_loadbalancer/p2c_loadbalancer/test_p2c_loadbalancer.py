@@ -0,0 +1,160 @@
+import gc
+import threading
+import time
+import unittest
+from unittest import mock
+import os,sys
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+import function
+from function import AIOSv1PolicyRule
+sys.path.remove(os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+
+
+class TestP2CLoadBalancerPolicy(unittest.TestCase):
+    def setUp(self):
+        self.snapshot = self.metrics(timestamp=0.0, queue_length=0)
+        self.policy = AIOSv1PolicyRule(
+            rule_id="test-p2c",
+            settings={"get_metrics": lambda: self.snapshot},
+            parameters={"async_refresh": False, "metrics_refresh_s": 0},
+        )
+        self.policy._update_instances(["inst-a"])
+
+    @staticmethod
+    def metrics(timestamp, queue_length):
+        return {"block_metrics": [{"instanceId": "inst-a", "timestamp": timestamp,
+                                   "queue_length": queue_length, "llm_active_sessions": 0}]}
+
+    def outstanding(self):
+        return self.policy.management("get_outstanding", {})["outstanding"]["inst-a"]
+
+    def assign(self, count):
+        for _ in range(count):
+            self.policy._record_assignment("inst-a")
+
+    def test_same_snapshot_keeps_local_assignments(self):
+        self.policy._refresh_metrics()
+        self.assign(3)
+        # get_metrics keeps returning the cached snapshot until the instance pushes a new one
+        self.policy._refresh_metrics()
+        self.policy._refresh_metrics()
+        self.assertEqual(self.outstanding(), 3)
+
+    def test_new_snapshot_drops_only_assignments_before_it(self):
+        self.policy._refresh_metrics()
+        self.assign(2)
+        taken_at = self.policy.assigned["inst-a"][-1]
+        self.assign(1)
+        self.policy.assigned["inst-a"][-1] = taken_at + 1.0
+
+        # the new snapshot counts the first two assignments in its queue length
+        self.snapshot = self.metrics(timestamp=taken_at, queue_length=2)
+        self.policy._refresh_metrics()
+        self.assertEqual(len(self.policy.assigned["inst-a"]), 1)
+        self.assertEqual(self.outstanding(), 3)
+
+    def test_completions_after_the_snapshot_are_kept(self):
+        self.policy._refresh_metrics()
+        self.assign(2)
+        self.policy.management("request_completed", {"instance_id": "inst-a"})
+        self.assertEqual(self.outstanding(), 1)
+
+        self.snapshot = self.metrics(timestamp=self.policy.completed["inst-a"][0] - 1.0, queue_length=0)
+        self.policy._refresh_metrics()
+        self.assertEqual(self.outstanding(), 1)
+
+
+class Packet:
+    def __init__(self, session_id):
+        self.session_id = session_id
+
+
+class TestSessionCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(function.time, "time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.instances = ["inst-a", "inst-b", "inst-c"]
+
+    def policy(self, **parameters):
+        return AIOSv1PolicyRule(rule_id="test-p2c", settings={}, parameters=parameters)
+
+    def route(self, policy, session_id, instances=None):
+        return policy.eval({}, {"instances": instances or self.instances, "packet": Packet(session_id)}, {})["instance_id"]
+
+    def test_sessions_stick_to_their_instance(self):
+        policy = self.policy()
+        first = self.route(policy, "s1")
+        self.assertEqual({self.route(policy, "s1") for _ in range(20)}, {first})
+        self.assertEqual(policy.management("get_current_mapping", {})["mapping"], {"s1": first})
+
+    def test_cache_is_bounded_by_least_recent_use(self):
+        policy = self.policy(max_sessions=3)
+        for session_id in ("s1", "s2", "s3"):
+            self.route(policy, session_id)
+        self.route(policy, "s1")  # s2 is now the least recently used
+        self.route(policy, "s4")
+        self.assertEqual(sorted(policy.management("get_current_mapping", {})["mapping"]), ["s1", "s3", "s4"])
+
+    def test_idle_sessions_expire(self):
+        policy = self.policy(session_ttl_s=60)
+        self.route(policy, "s1")
+        self.now += 30
+        self.route(policy, "s2")
+        self.now += 40
+        self.assertEqual(list(policy.management("get_current_mapping", {})["mapping"]), ["s2"])
+        self.route(policy, "s2")  # seen again, so it lives another ttl
+        self.now += 50
+        self.assertEqual(list(policy.management("get_current_mapping", {})["mapping"]), ["s2"])
+
+    def test_sessions_of_a_removed_instance_are_dropped(self):
+        policy = self.policy()
+        placed = {f"s{n}": self.route(policy, f"s{n}") for n in range(30)}
+        gone = placed["s0"]
+        survivors = [i for i in self.instances if i != gone]
+        self.assertIn(self.route(policy, "s0", survivors), survivors)
+        mapping = policy.management("get_current_mapping", {})["mapping"]
+        self.assertNotIn(gone, mapping.values())
+        for session_id, instance_id in placed.items():
+            if instance_id != gone:
+                self.assertEqual(mapping[session_id], instance_id)
+
+
+class TestSharedRefreshThread(unittest.TestCase):
+    def refresh_threads(self):
+        return [t for t in threading.enumerate() if t.name == "p2c-metrics-refresh"]
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_one_thread_refreshes_every_policy(self):
+        calls = {"a": 0, "b": 0}
+
+        def metrics(name):
+            def get_metrics():
+                calls[name] += 1
+                return {"block_metrics": []}
+            return get_metrics
+
+        policies = [AIOSv1PolicyRule(rule_id=name, settings={"get_metrics": metrics(name)},
+                                     parameters={"metrics_refresh_s": 0.01}) for name in calls]
+        self.assertTrue(self.wait_for(lambda: min(calls.values()) >= 3))
+        self.assertEqual(len(self.refresh_threads()), 1)
+
+        policies[0].management("stop", {})
+        stopped_at = calls["a"]
+        self.assertTrue(self.wait_for(lambda: calls["b"] >= stopped_at + 3))
+        self.assertLessEqual(calls["a"], stopped_at + 1)
+
+        # the thread exits once no policy is left
+        del policies
+        gc.collect()
+        self.assertTrue(self.wait_for(lambda: not self.refresh_threads()))
+
+
+if __name__ == "__main__":
+    unittest.main()
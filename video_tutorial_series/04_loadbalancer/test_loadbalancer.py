@@ -0,0 +1,73 @@
+import unittest
+from unittest import mock
+import os,sys
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+import function
+from function import AIOSv1PolicyRule, BoundedRendezvousAffinity
+sys.path.remove(os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+
+
+class Packet:
+    def __init__(self, session_id):
+        self.session_id = session_id
+
+
+class TestBoundedRendezvousAffinity(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(function.time, "time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.instances = ["i1", "i2", "i3"]
+
+    def test_session_sticks_to_its_instance(self):
+        affinity = BoundedRendezvousAffinity()
+        routed = [affinity.assign("s1", self.instances) for _ in range(50)]
+        self.assertEqual(set(routed), {affinity.peek("s1", self.instances)})
+        self.assertEqual(affinity.mapping()["loads"], {routed[0]: 1})
+
+    def test_new_sessions_are_spread_within_the_bound(self):
+        affinity = BoundedRendezvousAffinity(load_epsilon=0.25)
+        placed = {f"s{n}": affinity.assign(f"s{n}", self.instances) for n in range(300)}
+        loads = affinity.mapping()["loads"]
+        self.assertEqual(sum(loads.values()), 300)
+        self.assertLessEqual(max(loads.values()), 125)
+        # repeated requests do not move placed sessions, whatever the load
+        for session_id, instance_id in placed.items():
+            self.assertEqual(affinity.assign(session_id, self.instances), instance_id)
+        self.assertEqual(affinity.mapping()["loads"], loads)
+
+    def test_idle_and_evicted_sessions_are_released(self):
+        affinity = BoundedRendezvousAffinity(max_sessions=2, session_ttl_s=60)
+        for session_id in ("a", "b", "c"):
+            affinity.assign(session_id, self.instances)
+        self.assertEqual(sorted(affinity.mapping()["sessions"]), ["b", "c"])
+        self.now += 60
+        affinity.assign("d", self.instances)
+        self.assertEqual(list(affinity.mapping()["sessions"]), ["d"])
+        self.assertEqual(sum(affinity.mapping()["loads"].values()), 1)
+
+    def test_removed_instance_only_moves_its_sessions(self):
+        affinity = BoundedRendezvousAffinity(load_epsilon=10)
+        placed = {f"s{n}": affinity.assign(f"s{n}", self.instances) for n in range(60)}
+        affinity.update_instances(["i1", "i2"])
+        for session_id, instance_id in placed.items():
+            moved = affinity.assign(session_id, ["i1", "i2"])
+            if instance_id != "i3":
+                self.assertEqual(moved, instance_id)
+        self.assertNotIn("i3", affinity.mapping()["loads"])
+
+
+class TestTokenLoadBalancerPolicy(unittest.TestCase):
+    def test_eval_routes_a_session_to_one_instance(self):
+        policy = AIOSv1PolicyRule("test-lb", {"get_metrics": lambda: {}}, {})
+        instances = ["i1", "i2", "i3"]
+        routed = {policy.eval({}, {"instances": instances, "packet": Packet("s1")}, {})["instance_id"]
+                  for _ in range(20)}
+        self.assertEqual(len(routed), 1)
+        mapping = policy.management("get_current_mapping", {"session_id": "s1"})
+        self.assertEqual(mapping["instance_id"], routed.pop())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,195 @@
 import json
+import re
 import requests
 import os
+import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
 import logging
 import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+
+
+_PATH_TOKEN = re.compile(r"([^.\[\]]+)|\[(\d+)\]")
+
+
+def compile_path(path: str):
+    """
+    Compiles a metric path such as "hardware.gpus[0].totalMem" into an accessor
+    function. Both "gpus[0]" and "gpus.0" index into lists. The accessor returns
+    None when any step is missing.
+    """
+    steps = []
+    for key, index in _PATH_TOKEN.findall(path):
+        if index:
+            steps.append(int(index))
+        elif key.isdigit():
+            steps.append(int(key))
+        else:
+            steps.append(key)
+    steps = tuple(steps)
+
+    def accessor(data):
+        current = data
+        for step in steps:
+            if isinstance(current, dict):
+                current = current.get(step if isinstance(step, str) else str(step))
+            elif isinstance(current, list) and isinstance(step, int):
+                current = current[step] if -len(current) <= step < len(current) else None
+            else:
+                return None
+            if current is None:
+                return None
+        return current
+
+    accessor.path = path
+    return accessor
+
+
+class MetricsClient:
+    """
+    Metrics access layer for routing policies.
+
+    Fetches block metrics concurrently over a pooled session and returns whatever
+    arrived within a short deadline. Results are cached per block for ttl seconds;
+    entries older than that but younger than stale_ttl are served immediately while
+    a background refresh runs (stale-while-revalidate). If bulk_url is set, all
+    missing blocks are fetched with one request ("?blockIds=a,b,c").
+    """
+
+    def __init__(self, base_url: Optional[str], bulk_url: Optional[str] = None, timeout: float = 0.5,
+                 ttl: float = 2.0, stale_ttl: float = 30.0, max_workers: int = 16,
+                 logger: Optional[logging.Logger] = None):
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.bulk_url = bulk_url
+        self.timeout = timeout
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="metrics-fetch")
+
+        self.cache: Dict[str, Tuple[Dict, float]] = {}  # block_id -> (metrics, fetched_at)
+        self.in_flight: Dict[str, Any] = {}            # block_id or bulk key -> Future
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def extract_instance(api_response: Dict, block_id: str) -> Dict:
+        """Returns the detailed (non 'executor') instance metrics of block_id, or {}."""
+        if not api_response.get("success") or not api_response.get("data"):
+            return {}
+        # The 'data' list can contain multiple entries for a block, we need to find the right one.
+        for block_data in api_response["data"]:
+            if block_data.get("blockId") == block_id:
+                # We need the instance with the detailed metrics, not the summary 'executor' instance.
+                for instance in block_data.get("instances", []):
+                    if instance.get("instanceId") != "executor":
+                        return instance
+        return {}
+
+    def _store(self, block_id: str, metrics: Dict):
+        with self.lock:
+            self.cache[block_id] = (metrics, time.monotonic())
+
+    def _fetch_one(self, block_id: str) -> Dict[str, Dict]:
+        try:
+            response = self.session.get(f"{self.base_url}/{block_id}", timeout=self.timeout)
+            response.raise_for_status()
+            metrics = self.extract_instance(response.json(), block_id)
+            self._store(block_id, metrics)
+            return {block_id: metrics}
+        except (requests.RequestException, ValueError) as e:
+            self.logger.info(f"Could not fetch or parse metrics for block {block_id}: {e}")
+            return {}
+        finally:
+            with self.lock:
+                self.in_flight.pop(block_id, None)
+
+    def _fetch_bulk(self, key: str, block_ids: List[str]) -> Dict[str, Dict]:
+        try:
+            response = self.session.get(self.bulk_url, params={"blockIds": ",".join(block_ids)}, timeout=self.timeout)
+            response.raise_for_status()
+            api_response = response.json()
+            result = {}
+            for block_id in block_ids:
+                result[block_id] = self.extract_instance(api_response, block_id)
+                self._store(block_id, result[block_id])
+            return result
+        except (requests.RequestException, ValueError) as e:
+            self.logger.info(f"Could not fetch or parse bulk metrics for {len(block_ids)} blocks: {e}")
+            return {}
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+                for block_id in block_ids:
+                    self.in_flight.pop(block_id, None)
+
+    def _schedule(self, block_ids: List[str]) -> List[Any]:
+        """Starts fetches for block_ids that are not already being fetched; returns the relevant futures."""
+        futures = []
+        with self.lock:
+            pending = []
+            for block_id in block_ids:
+                future = self.in_flight.get(block_id)
+                if future is not None:
+                    futures.append(future)
+                else:
+                    pending.append(block_id)
+            if not pending:
+                return futures
+            if self.bulk_url and len(pending) > 1:
+                key = "bulk:" + ",".join(pending)
+                future = self.executor.submit(self._fetch_bulk, key, pending)
+                self.in_flight[key] = future
+                for block_id in pending:
+                    self.in_flight[block_id] = future
+                futures.append(future)
+            else:
+                for block_id in pending:
+                    future = self.executor.submit(self._fetch_one, block_id)
+                    self.in_flight[block_id] = future
+                    futures.append(future)
+        return futures
+
+    def get_many(self, block_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Returns {block_id: metrics} for the given blocks. Blocks whose metrics are
+        neither cached nor fetched within the deadline are missing from the result.
+        """
+        if not self.base_url and not self.bulk_url:
+            return {}
+        now = time.monotonic()
+        result, stale, missing = {}, [], []
+        with self.lock:
+            for block_id in dict.fromkeys(block_ids):
+                entry = self.cache.get(block_id)
+                age = now - entry[1] if entry else None
+                if entry and age < self.ttl:
+                    result[block_id] = entry[0]
+                elif entry and age < self.stale_ttl:
+                    result[block_id] = entry[0]
+                    stale.append(block_id)
+                else:
+                    missing.append(block_id)
+
+        if stale:
+            self._schedule(stale)  # revalidate in the background, do not wait
+        if missing:
+            done, not_done = wait(self._schedule(missing), timeout=self.timeout)
+            if not_done:
+                self.logger.info(f"{len(not_done)} metrics fetch(es) missed the {self.timeout}s deadline.")
+            for future in done:
+                for block_id, metrics in future.result().items():
+                    if block_id in missing:
+                        result[block_id] = metrics
+        return result
+
 
 class AIOSv1PolicyRule:
     """
@@ -28,6 +214,7 @@ class AIOSv1PolicyRule:
         self.settings = settings
         self.parameters = parameters
         self.metrics_base_url =self.parameters.get("METRICS_BASE_URL", os.environ.get("METRICS_BASE_URL"))
+        self.metrics_bulk_url = self.parameters.get("METRICS_BULK_URL", os.environ.get("METRICS_BULK_URL"))
 
         # Set up structured logging
         self.logger = logging.getLogger(f"AIOSv1PolicyRule.{self.rule_id}")
@@ -69,6 +256,26 @@ class AIOSv1PolicyRule:
 
         }
 
+        self.metrics_client = MetricsClient(
+            self.metrics_base_url,
+            bulk_url=self.metrics_bulk_url,
+            timeout=float(self.parameters.get("METRICS_TIMEOUT_S", 0.5)),
+            ttl=float(self.parameters.get("METRICS_CACHE_TTL_S", 2.0)),
+            stale_ttl=float(self.parameters.get("METRICS_STALE_TTL_S", 30.0)),
+            max_workers=int(self.parameters.get("METRICS_MAX_WORKERS", 16)),
+            logger=self.logger,
+        )
+
+        # Compiled once: goal -> [(metric, accessor, higher_is_better)]
+        self.compiled_metric_map = {
+            goal_name: [
+                (metric, compile_path(props["path"]), props["normalize"] == "max")
+                for metric, props in metrics.items()
+            ]
+            for goal_name, metrics in self.optimization_metric_map.items()
+        }
+        self._path_cache = {}
+
         self.app_map = self.settings.get("APP_MAP", {
             "RAG": "chat-completion",
             "Code": "code-generation",
@@ -122,17 +329,16 @@ class AIOSv1PolicyRule:
                 return selected_candidate
             
             self.logger.info(f"Step 2: Scoring {len(filtered_candidates)} candidates based on {len(optimization_goals)} optimization goal(s).")
-            # Fetch metrics for all candidates first
+            # Fetch metrics for all candidates first, concurrently and from the cache where fresh
+            block_ids = [c.get("id") for c in filtered_candidates if c.get("id")]
+            if len(block_ids) < len(filtered_candidates):
+                self.logger.info("Found candidate(s) with no 'id'. They will be ignored.")
+            all_metrics = self._fetch_all_metrics(block_ids)
             for candidate in filtered_candidates:
-                block_id = candidate.get("id")
-                self.logger.info(f"Processing candidate block ID: {block_id}")
-                if not block_id:
-                    self.logger.info("Found a candidate with no 'id'. It will be ignored.")
-                    continue # Cannot score without an id
-                self.logger.info("Gettign metrics for block ID: %s", block_id)
-                metrics = self._fetch_metrics(block_id)
+                metrics = all_metrics.get(candidate.get("id"))
                 if metrics:
                     candidate.update(metrics) # Attach for scoring
+            # Candidates without live metrics are still scored, on their static metadata
 
             # Score candidates
             scored_candidates = self._score_candidates(filtered_candidates, optimization_goals)
@@ -170,159 +376,87 @@ class AIOSv1PolicyRule:
                 filtered.append(candidate)
         return filtered
 
-    def _fetch_metrics(self, block_id: str) -> Optional[Dict]:
-        """Fetches live metrics for a given block ID from the metrics API."""
-        if not self.metrics_base_url:
+    def _fetch_all_metrics(self, block_ids: List[str]) -> Dict[str, Dict]:
+        """Fetches live metrics for many block IDs, bounded by the metrics deadline."""
+        if not self.metrics_base_url and not self.metrics_bulk_url:
             self.logger.info("METRICS_BASE_URL not set. Skipping live metric fetch.")
             return {}
-        try:
-            url = f"{self.metrics_base_url.rstrip('/')}/{block_id}"
-            self.logger.info(f"Fetching metrics from URL: {url}")
-            response = requests.get(url, timeout=50)
-            response.raise_for_status()
-            api_response = response.json()
+        metrics = self.metrics_client.get_many(block_ids)
+        self.logger.info(f"Got metrics for {len(metrics)}/{len(block_ids)} candidate blocks.")
+        return metrics
 
-            if not api_response.get("success") or not api_response.get("data"):
-                self.logger.info(f"Metrics API response for {block_id} indicates failure or no data.")
-                return {}
-
-            # The 'data' list can contain multiple entries for a block, we need to find the right one.
-            for block_data in api_response["data"]:
-                if block_data.get("blockId") == block_id:
-                    # We need to find the instance with the detailed metrics, not the summary 'executor' instance.
-                    for instance in block_data.get("instances", []):
-                        if instance.get("instanceId") != "executor":
-                            self.logger.info(f"Found detailed metrics for instance {instance.get('instanceId')} of block {block_id}.")
-                            return instance # This instance has the detailed metrics we need.
-            
-            self.logger.info(f"No instance with detailed metrics found for block {block_id}.")
-            return {}
-            
-        except (requests.RequestException, json.JSONDecodeError) as e:
-            self.logger.info(f"Could not fetch or parse metrics for block {block_id}: {e}")
-            return {}
+    def _fetch_metrics(self, block_id: str) -> Optional[Dict]:
+        """Fetches live metrics for a given block ID from the metrics API."""
+        return self._fetch_all_metrics([block_id]).get(block_id, {})
 
     def _get_nested_value(self, data: Dict, path: str) -> Optional[Any]:
-        """Safely retrieves a value from a nested dict using a dot-separated path."""
-        self.logger.debug(f"Attempting to get value for path '{path}'")
-        keys = path.split('.')
-        current = data
-        for i, key in enumerate(keys):
-            path_so_far = '.'.join(keys[:i+1])
-            if isinstance(current, dict):
-                current = current.get(key)
-                self.logger.debug(f"  - Traversing path: '{path_so_far}'. Value: {current}")
-            elif isinstance(current, list):
-                try:
-                    idx = int(key)
-                    if idx < len(current):
-                        current = current[idx]
-                        self.logger.debug(f"  - Traversing list at index {idx}: '{path_so_far}'. Value: {current}")
-                    else:
-                        self.logger.debug(f"  - Index {idx} out of bounds for list at path '{'.'.join(keys[:i])}'.")
-                        return None
-                except (ValueError, IndexError):
-                    self.logger.debug(f"Failed to get value at index '{key}' in path '{path}'.")
-                    return None
-            else:
-                self.logger.debug(f"  - Path traversal stopped. Cannot get key '{key}' from non-dict/list value at path '{'.'.join(keys[:i])}'.")
-                return None
-            if current is None:
-                self.logger.debug(f"  - Value became None at path '{path_so_far}'.")
-                break
-        return current
-
-    def _normalize_metrics(self, values: List[float], method: str) -> List[float]:
-        """Normalizes a list of values."""
-        self.logger.info(f"Normalizing (method: {method}): {values}")
-        if not values or max(values) == min(values):
-            self.logger.info("All values are the same or list is empty. Returning neutral scores (0.5).")
-            return [0.5] * len(values) # Neutral score if all values are the same
-
-        max_val, min_val = max(values), min(values)
-        self.logger.info(f"Normalization range: min={min_val}, max={max_val}")
-        
-        normalized = []
-        for v in values:
-            # The denominator can't be zero here because we checked if max == min
-            denominator = max_val - min_val
-            if method == "max": # Higher is better
-                normalized.append((v - min_val) / denominator)
-            elif method == "min": # Lower is better
-                normalized.append(1 - ((v - min_val) / denominator))
-        
-        self.logger.info(f"Normalized result: {normalized}")
-        return normalized
+        """Safely retrieves a value from a nested dict using a dotted path with optional [i] list indexes."""
+        accessor = self._path_cache.get(path)
+        if accessor is None:
+            accessor = self._path_cache[path] = compile_path(path)
+        return accessor(data)
+
+    @staticmethod
+    def _to_number(value: Any) -> float:
+        if value.__class__ in (int, float):
+            return value
+        try:
+            return float(value) if value is not None else 0.0
+        except (TypeError, ValueError):
+            return 0.0
 
     def _score_candidates(self, candidates: List[Dict], goals: List[Dict]) -> List[Dict]:
-        """Calculates a weighted score for each candidate based on optimization goals."""
-        scores = {c["id"]: {"total_score": 0, "weighted_scores": {}} for c in candidates}
-        
-        # First, extract all necessary metric values for normalization
-        metric_values_for_norm = {}
-        for goal in goals:
-            goal_name = goal["name"]
-            if goal_name in self.optimization_metric_map:
-                metric_values_for_norm[goal_name] = {}
-                for metric, props in self.optimization_metric_map[goal_name].items():
-                    metric_values_for_norm[goal_name][metric] = [
-                        self._get_nested_value(c, props["path"]) or 0 for c in candidates
-                    ]
-
-        # Normalize them
-        normalized_values = {}
-        for goal_name, metrics in metric_values_for_norm.items():
-            normalized_values[goal_name] = {}
-            for metric, values in metrics.items():
-                norm_method = self.optimization_metric_map[goal_name][metric]["normalize"]
-                normalized_values[goal_name][metric] = self._normalize_metrics(values, norm_method)
-
-        # Now, calculate the final scores
-        for i, candidate in enumerate(candidates):
-            block_id = candidate["id"]
-            final_score = 0
-            
-            # Log the parsed metric values for this candidate
-            metric_log = {}
-            for goal in goals:
-                goal_name = goal["name"]
-                if goal_name in self.optimization_metric_map:
-                    for metric, props in self.optimization_metric_map[goal_name].items():
-                        value = self._get_nested_value(candidate, props["path"])
-                        metric_log[metric] = value
-            self.logger.info(f"Candidate '{block_id}' - Parsed Metrics: {json.dumps(metric_log)}")
-
-            for goal in goals:
-                goal_name = goal["name"]
-                goal_weight = goal.get("weight", 1.0)
-                
-                if goal_name in self.optimization_metric_map:
-                    goal_score = 0
-                    num_metrics = len(self.optimization_metric_map[goal_name])
-                    for metric in self.optimization_metric_map[goal_name]:
-                        # Get the pre-normalized value for this candidate
-                        norm_score = normalized_values[goal_name][metric][i]
-                        goal_score += norm_score
-                    
-                    # Average the scores for the metrics within the goal
-                    if num_metrics > 0:
-                        avg_goal_score = goal_score / num_metrics
-                        weighted_score = avg_goal_score * goal_weight
-                        scores[block_id]["weighted_scores"][goal_name] = weighted_score
-                        final_score += weighted_score
-
-            scores[block_id]["total_score"] = final_score
-            self.logger.info(f"Candidate '{block_id}' - Final Score: {final_score:.4f}")
+        """
+        Calculates a weighted score for each candidate based on optimization goals.
+
+        Metric values are extracted into an (n_candidates, n_metrics) matrix; each column
+        is min-max normalized (0.5 when all values are equal, inverted for "min" metrics),
+        averaged within its goal and weighted, all with array operations.
+        """
+        active_goals = [g for g in goals if g["name"] in self.compiled_metric_map]
+        columns = []  # (goal index, metric, accessor, higher_is_better)
+        for goal_index, goal in enumerate(active_goals):
+            for metric, accessor, higher_is_better in self.compiled_metric_map[goal["name"]]:
+                columns.append((goal_index, metric, accessor, higher_is_better))
+
+        n, m = len(candidates), len(columns)
+        if m == 0:
+            return [{"candidate": c, "final_score": 0, "breakdown": {}} for c in candidates]
+
+        accessors = [c[2] for c in columns]
+        to_number = self._to_number
+        values = np.fromiter(
+            (to_number(accessor(c)) for c in candidates for accessor in accessors), dtype=np.float64, count=n * m
+        ).reshape(n, m)
+
+        # Normalize every column at once
+        min_vals = values.min(axis=0)
+        spread = values.max(axis=0) - min_vals
+        flat = spread == 0
+        normalized = (values - min_vals) / np.where(flat, 1.0, spread)
+        higher_is_better = np.array([c[3] for c in columns])
+        normalized = np.where(higher_is_better, normalized, 1.0 - normalized)
+        normalized[:, flat] = 0.5
+
+        # (n_metrics, n_goals) matrix that averages metrics within a goal and applies its weight
+        goal_matrix = np.zeros((m, len(active_goals)))
+        for col, (goal_index, _, _, _) in enumerate(columns):
+            goal = active_goals[goal_index]
+            goal_matrix[col, goal_index] = goal.get("weight", 1.0) / len(self.compiled_metric_map[goal["name"]])
+        weighted = normalized @ goal_matrix
+        totals = weighted.sum(axis=1)
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for i, c in enumerate(candidates):
+                parsed = {metric: accessor(c) for _, metric, accessor, _ in columns}
+                self.logger.debug(f"Candidate '{c.get('id')}' - Parsed Metrics: {parsed} - Final Score: {totals[i]:.4f}")
 
         # Format the output
         result = []
         for i, c in enumerate(candidates):
-            block_id = c["id"]
             result.append({
                 "candidate": c,
-                "final_score": scores[block_id]["total_score"],
-                "breakdown": scores[block_id]["weighted_scores"]
+                "final_score": float(totals[i]),
+                "breakdown": {goal["name"]: float(weighted[i, j]) for j, goal in enumerate(active_goals)}
             })
-        
-        self.logger.debug(f"Final scores: {json.dumps(result, indent=2)}")
         return result
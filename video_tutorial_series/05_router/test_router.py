@@ -0,0 +1,196 @@
+import random
+import threading
+import unittest
+from unittest import mock
+import os,sys
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+import function
+from function import AIOSv1PolicyRule, MetricsClient, compile_path
+sys.path.remove(os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+
+
+class Response:
+    def __init__(self, block_ids, value=1):
+        self.payload = {"success": True, "data": [
+            {"blockId": block_id, "instances": [{"instanceId": "executor"},
+                                               {"instanceId": "i1", "end_to_end_fps": value}]}
+            for block_id in block_ids]}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class TestCompilePath(unittest.TestCase):
+    def test_dotted_and_indexed_paths(self):
+        data = {"hardware": {"gpus": [{"totalMem": 24}, {"totalMem": 80}]}, "a": {"0": "key"}}
+        self.assertEqual(compile_path("hardware.gpus[0].totalMem")(data), 24)
+        self.assertEqual(compile_path("hardware.gpus.1.totalMem")(data), 80)
+        self.assertEqual(compile_path("a.0")(data), "key")
+        self.assertEqual(compile_path("hardware.gpus[0]").path, "hardware.gpus[0]")
+
+    def test_missing_steps_return_none(self):
+        data = {"hardware": {"gpus": [{"totalMem": 24}], "name": "x"}}
+        for path in ("hardware.gpus[2].totalMem", "hardware.cpus.count", "hardware.name.first",
+                     "hardware.gpus.totalMem", "missing"):
+            self.assertIsNone(compile_path(path)(data), path)
+
+
+class TestMetricsClient(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(function.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+        self.value = 1
+        self.release = threading.Event()
+        self.release.set()
+
+    def client(self, **kwargs):
+        client = MetricsClient("http://metrics/block", ttl=2.0, stale_ttl=30.0, **kwargs)
+
+        def get(url, params=None, timeout=None):
+            self.calls.append((url, params))
+            self.release.wait(5)
+            block_ids = params["blockIds"].split(",") if params else [url.rsplit("/", 1)[1]]
+            return Response(block_ids, self.value)
+
+        client.session.get = get
+        return client
+
+    def wait_idle(self, client):
+        for future in list(client.in_flight.values()):
+            future.result(5)
+
+    def test_fresh_entries_are_served_from_the_cache(self):
+        client = self.client()
+        self.assertEqual(client.get_many(["b1", "b2"])["b1"]["end_to_end_fps"], 1)
+        self.assertEqual(len(self.calls), 2)
+        self.now += 1.9
+        client.get_many(["b1", "b2"])
+        self.assertEqual(len(self.calls), 2)
+
+    def test_stale_entries_are_served_while_revalidating(self):
+        client = self.client()
+        client.get_many(["b1"])
+        self.now += 5
+        self.value = 2
+        self.release.clear()
+        # served at once from the stale entry, the refresh runs in the background
+        self.assertEqual(client.get_many(["b1"])["b1"]["end_to_end_fps"], 1)
+        self.assertIn("b1", client.in_flight)
+        client.get_many(["b1"])  # no second refresh while one is in flight
+        self.release.set()
+        self.wait_idle(client)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(client.get_many(["b1"])["b1"]["end_to_end_fps"], 2)
+
+    def test_expired_entries_are_fetched_again(self):
+        client = self.client()
+        client.get_many(["b1"])
+        self.now += 31
+        self.value = 3
+        self.assertEqual(client.get_many(["b1"])["b1"]["end_to_end_fps"], 3)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_missed_deadline_leaves_the_block_out(self):
+        client = self.client(timeout=0.05)
+        self.release.clear()
+        self.assertEqual(client.get_many(["b1"]), {})
+        self.release.set()
+        self.wait_idle(client)
+        self.assertEqual(client.get_many(["b1"])["b1"]["end_to_end_fps"], 1)
+
+    def test_bulk_url_fetches_missing_blocks_at_once(self):
+        client = self.client(bulk_url="http://metrics/bulk")
+        result = client.get_many(["b1", "b2", "b1"])
+        self.assertEqual(sorted(result), ["b1", "b2"])
+        self.assertEqual(self.calls, [("http://metrics/bulk", {"blockIds": "b1,b2"})])
+
+
+def reference_scores(rule, candidates, goals):
+    """The per-candidate scoring the NumPy version replaced, with paths resolved by compile_path."""
+    def normalize(values, method):
+        if not values or max(values) == min(values):
+            return [0.5] * len(values)
+        max_val, min_val = max(values), min(values)
+        if method == "max":
+            return [(v - min_val) / (max_val - min_val) for v in values]
+        return [1 - ((v - min_val) / (max_val - min_val)) for v in values]
+
+    normalized = {}
+    for goal in goals:
+        for metric, props in rule.optimization_metric_map.get(goal["name"], {}).items():
+            values = [compile_path(props["path"])(c) or 0 for c in candidates]
+            normalized[(goal["name"], metric)] = normalize(values, props["normalize"])
+
+    result = []
+    for i, candidate in enumerate(candidates):
+        breakdown, total = {}, 0
+        for goal in goals:
+            metrics = rule.optimization_metric_map.get(goal["name"])
+            if metrics:
+                goal_score = sum(normalized[(goal["name"], metric)][i] for metric in metrics)
+                breakdown[goal["name"]] = goal_score / len(metrics) * goal.get("weight", 1.0)
+                total += breakdown[goal["name"]]
+        result.append({"candidate": candidate, "final_score": total, "breakdown": breakdown})
+    return result
+
+
+class TestScoring(unittest.TestCase):
+    def setUp(self):
+        self.rule = AIOSv1PolicyRule("router", {}, {})
+
+    def candidate(self, rng, n):
+        def value():
+            return rng.choice([None, 0, rng.randint(1, 5), rng.uniform(0, 100)])
+        return {
+            "id": f"b{n}",
+            "componentMetadata": {"architecture": {"parameterCountB": value()},
+                                  "evaluation": {"benchmarks": {"MMLU": {"value": value()}}}},
+            "hardware": {"gpus": [{"totalMem": value()}]},
+            "end_to_end_latency": value(), "end_to_end_fps": value(), "llm_tokens_per_second": value(),
+            "llm_active_sessions": value(), "queue_length": {"average_1m": value()},
+            "tasks_processed": {"average_1m": value()}, "end_to_end_count_total": value(),
+        }
+
+    def test_matches_per_candidate_scoring(self):
+        rng = random.Random(11)
+        goal_names = list(self.rule.optimization_metric_map) + ["Unknown_Goal"]
+        for _ in range(200):
+            candidates = [self.candidate(rng, n) for n in range(rng.randint(1, 8))]
+            goals = [{"name": name, "weight": rng.choice([0.5, 1.0, 2.0])}
+                     for name in rng.sample(goal_names, rng.randint(1, 3))]
+            got = self.rule._score_candidates(candidates, goals)
+            expected = reference_scores(self.rule, candidates, goals)
+            self.assertEqual(len(got), len(expected))
+            for g, e in zip(got, expected):
+                self.assertIs(g["candidate"], e["candidate"])
+                self.assertAlmostEqual(g["final_score"], e["final_score"], places=9)
+                self.assertEqual(g["breakdown"].keys(), e["breakdown"].keys())
+                for name, score in e["breakdown"].items():
+                    self.assertAlmostEqual(g["breakdown"][name], score, places=9)
+
+    def test_unknown_goals_score_zero(self):
+        scored = self.rule._score_candidates([{"id": "b1"}, {"id": "b2"}], [{"name": "Unknown_Goal"}])
+        self.assertEqual([s["final_score"] for s in scored], [0, 0])
+
+
+class TestRouterFallback(unittest.TestCase):
+    def test_candidates_without_metrics_are_still_scored(self):
+        rule = AIOSv1PolicyRule("router", {}, {"METRICS_BASE_URL": "http://metrics/block"})
+        # b1 missed the metrics deadline; its static metadata still makes it the best Cost_Saver
+        rule.metrics_client.get_many = lambda block_ids: {"b2": {"hardware": {"gpus": [{"totalMem": 80}]}}}
+        candidates = [
+            {"id": "b1", "componentMetadata": {"architecture": {"parameterCountB": 7}}},
+            {"id": "b2", "componentMetadata": {"architecture": {"parameterCountB": 70}}},
+        ]
+        selected = rule.eval({"selection_query": {"optimization_goals": [{"name": "Cost_Saver"}]}}, candidates, {})
+        self.assertEqual(selected["id"], "b1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Optional
+
+logging = logging.getLogger(__name__)
+
+
+EXPIRED = "expired"
+LATE = "late"
+SHED = "shed"
+
+
+class AdmissionController:
+    """
+    Deadline-aware admission of packets at block intake.
+
+    Packets may carry a deadline (Unix time) and a priority class: 0, the default, is the
+    most important, higher classes are shed first. Blocks with default_timeout_s give
+    packets without a deadline one, counted from packet.ts (the request's start) when set.
+
+    check() is called at intake, when listen_for_jobs takes the packet from the input
+    queue, and again right before on_data, after the executor queue and on_preprocess.
+    It returns why the packet is rejected, or None:
+      expired   the deadline has passed
+      late      (intake only) the deadline falls before the packet would start, judged by
+                the p95 queue wait less the time it already waited
+      shed      (intake only) the packet's class is being shed
+
+    The shed level follows the p95 of the queue waits of the last `window` packets
+    (enqueued_at to the start of processing; to intake for rejected packets), re-evaluated
+    every adjust_interval_s: above target_queue_wait_s one more class is shed, starting
+    from the lowest, below half of it one class is readmitted. Class 0 is never shed,
+    only rejected by its deadline, so under overload the block keeps spending its time
+    on requests that can still succeed.
+    """
+
+    def __init__(self, target_queue_wait_s: float = 0.5, num_classes: int = 4, window: int = 512,
+                 adjust_interval_s: float = 0.5, default_timeout_s: float = 0, metrics=None):
+        self.target_queue_wait_s = float(target_queue_wait_s)
+        self.num_classes = max(1, int(num_classes))
+        self.adjust_interval_s = float(adjust_interval_s)
+        self.default_timeout_s = float(default_timeout_s or 0)
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.waits = deque(maxlen=max(16, int(window)))
+        self.p95_queue_wait_s = 0.0
+        self.shed_level = 0  # classes >= num_classes - shed_level are shed
+        self.next_adjust = 0.0
+        self.counters = {"admitted": 0, EXPIRED: 0, LATE: 0, SHED: 0}
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+        if self.metrics is not None:
+            self.metrics.increment_counter(f"admission_{key}_count")
+
+    def stamp(self, packet, now: float = None):
+        """Gives a packet without a deadline the default one."""
+        if self.default_timeout_s and not packet.deadline:
+            packet.deadline = (packet.ts or now or time.time()) + self.default_timeout_s
+
+    def observe(self, queue_wait_s: float, now: float = None):
+        """Records the queue wait of a packet whose processing starts now."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.waits.append(max(0.0, queue_wait_s))
+            if now < self.next_adjust:
+                return
+            self.next_adjust = now + self.adjust_interval_s
+            ordered = sorted(self.waits)
+            self.p95_queue_wait_s = ordered[int(0.95 * (len(ordered) - 1))]
+            previous = self.shed_level
+            if self.p95_queue_wait_s > self.target_queue_wait_s:
+                self.shed_level = min(self.shed_level + 1, self.num_classes - 1)
+            elif self.p95_queue_wait_s < self.target_queue_wait_s / 2:
+                self.shed_level = max(self.shed_level - 1, 0)
+            level, p95 = self.shed_level, self.p95_queue_wait_s
+        if self.metrics is not None:
+            self.metrics.set_gauge("admission_queue_wait_p95", p95)
+            self.metrics.set_gauge("admission_shed_level", level)
+        if level != previous and level:
+            logging.warning(f"[AdmissionController] p95 queue wait {p95:.3f}s (target {self.target_queue_wait_s}s): "
+                            f"shedding priority classes >= {self.num_classes - level}")
+        elif level != previous:
+            logging.info(f"[AdmissionController] p95 queue wait {p95:.3f}s: shedding stopped")
+
+    def check(self, packet, now: float = None, intake: bool = True) -> Optional[str]:
+        now = time.time() if now is None else now
+        deadline = packet.deadline
+        if deadline and now >= deadline:
+            self._count(EXPIRED)
+            return EXPIRED
+        if not intake:
+            return None
+        waited = max(0.0, now - packet.enqueued_at) if packet.enqueued_at else 0.0
+        reason = None
+        if deadline and now + max(0.0, self.p95_queue_wait_s - waited) >= deadline:
+            reason = LATE
+        elif self.shed_level and packet.priority >= self.num_classes - self.shed_level:
+            reason = SHED
+        if reason is None:
+            self._count("admitted")
+            return None
+        # rejected packets never reach observe() otherwise, and the shed level must be
+        # able to come down while every packet is shed
+        self._count(reason)
+        self.observe(waited)
+        return reason
+
+    @staticmethod
+    def rejection(packet, reason: str) -> str:
+        """Final output answering a rejected request, so its client does not wait for a timeout."""
+        return json.dumps({
+            "error": "deadline exceeded" if reason in (EXPIRED, LATE) else "overloaded",
+            "reason": reason,
+            "session_id": packet.session_id,
+            "seq_no": packet.seq_no,
+        })
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats["p95_queue_wait_s"] = self.p95_queue_wait_s
+            stats["shed_level"] = self.shed_level
+        return stats
@@ -24,15 +24,27 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11\x61ios_packet.proto\"x\n\nAIOSPacket\x12\x12\n\nsession_id\x18\x01 \x01(\t\x12\x0e\n\x06seq_no\x18\x02 \x01(\x04\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\t\x12\n\n\x02ts\x18\x05 \x01(\x01\x12\x12\n\noutput_ptr\x18\x06 \x01(\t\x12\x18\n\x05\x66iles\x18\x07 \x03(\x0b\x32\t.FileInfo\"/\n\x08\x46ileInfo\x12\x10\n\x08metadata\x18\x01 \x01(\t\x12\x11\n\tfile_data\x18\x02 \x01(\x0c\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11\x61ios_packet.proto\"\x83\x02\n\nAIOSPacket\x12\x12\n\nsession_id\x18\x01 \x01(\t\x12\x0e\n\x06seq_no\x18\x02 \x01(\x04\x12\x0c\n\x04\x64\x61ta\x18\x04 \x01(\t\x12\n\n\x02ts\x18\x05 \x01(\x01\x12\x12\n\noutput_ptr\x18\x06 \x01(\t\x12\x18\n\x05\x66iles\x18\x07 \x03(\x0b\x32\t.FileInfo\x12\x1e\n\x07routing\x18\x08 \x01(\x0b\x32\r.RoutingTable\x12\x12\n\nstream_ref\x18\t \x01(\t\x12\x1c\n\x05trace\x18\n \x01(\x0b\x32\r.TraceContext\x12\x10\n\x08\x64\x65\x61\x64line\x18\x0b \x01(\x01\x12\x10\n\x08priority\x18\x0c \x01(\r\x12\x13\n\x0b\x65nqueued_at\x18\r \x01(\x01\"Z\n\x0cTraceContext\x12\x10\n\x08trace_id\x18\x01 \x01(\x0c\x12\x16\n\x0eparent_span_id\x18\x02 \x01(\x0c\x12\x0f\n\x07sampled\x18\x03 \x01(\x08\x12\x0f\n\x07sent_at\x18\x04 \x01(\x01\"/\n\x08\x46ileInfo\x12\x10\n\x08metadata\x18\x01 \x01(\t\x12\x11\n\tfile_data\x18\x02 \x01(\x0c\"o\n\rRoutingOutput\x12\x12\n\x05\x62lock\x18\x01 \x01(\rH\x00\x88\x01\x01\x12\x10\n\x08\x62lock_id\x18\x02 \x01(\t\x12\x0c\n\x04host\x18\x03 \x01(\t\x12\x0c\n\x04port\x18\x04 \x01(\r\x12\x12\n\nqueue_name\x18\x05 \x01(\tB\x08\n\x06_block\".\n\x0bRoutingNode\x12\x1f\n\x07outputs\x18\x01 \x03(\x0b\x32\x0e.RoutingOutput\"\x81\x02\n\x0cRoutingTable\x12\x11\n\tblock_ids\x18\x01 \x03(\t\x12\x1b\n\x05nodes\x18\x02 \x03(\x0b\x32\x0c.RoutingNode\x12\x1d\n\x05\x66inal\x18\x03 \x03(\x0b\x32\x0e.RoutingOutput\x12\x13\n\x06\x63ursor\x18\x04 \x01(\rH\x00\x88\x01\x01\x12\x11\n\tgraph_ref\x18\x05 \x01(\t\x12/\n\toverrides\x18\x06 \x03(\x0b\x32\x1c.RoutingTable.OverridesEntry\x1a>\n\x0eOverridesEntry\x12\x0b\n\x03key\x18\x01 \x01(\r\x12\x1b\n\x05value\x18\x02 \x01(\x0b\x32\x0c.RoutingNode:\x02\x38\x01\x42\t\n\x07_cursorb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'aios_packet_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_AIOSPACKET']._serialized_start=21
-  _globals['_AIOSPACKET']._serialized_end=141
-  _globals['_FILEINFO']._serialized_start=143
-  _globals['_FILEINFO']._serialized_end=190
+  _globals['_ROUTINGTABLE_OVERRIDESENTRY']._loaded_options = None
+  _globals['_ROUTINGTABLE_OVERRIDESENTRY']._serialized_options = b'8\001'
+  _globals['_AIOSPACKET']._serialized_start=22
+  _globals['_AIOSPACKET']._serialized_end=281
+  _globals['_TRACECONTEXT']._serialized_start=283
+  _globals['_TRACECONTEXT']._serialized_end=373
+  _globals['_FILEINFO']._serialized_start=375
+  _globals['_FILEINFO']._serialized_end=422
+  _globals['_ROUTINGOUTPUT']._serialized_start=424
+  _globals['_ROUTINGOUTPUT']._serialized_end=535
+  _globals['_ROUTINGNODE']._serialized_start=537
+  _globals['_ROUTINGNODE']._serialized_end=583
+  _globals['_ROUTINGTABLE']._serialized_start=586
+  _globals['_ROUTINGTABLE']._serialized_end=843
+  _globals['_ROUTINGTABLE_OVERRIDESENTRY']._serialized_start=770
+  _globals['_ROUTINGTABLE_OVERRIDESENTRY']._serialized_end=832
 # @@protoc_insertion_point(module_scope)
@@ -0,0 +1,264 @@
+import os
+import json
+import mmap
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import redis
+
+logging = logging.getLogger(__name__)
+
+
+BLOB_REF_KEY = "__blob__"
+BLOB_KEY_PREFIX = "blob:"
+
+
+def blob_digest(data) -> str:
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class FileBlobStore:
+    """
+    Content-addressed blobs as files under root, one file per digest; reads are mmap'ed,
+    so get() returns a memoryview without copying the blob. Only for pipelines whose blocks
+    all mount root, e.g. a hostPath /dev/shm of one node: a pod's own /dev/shm is not
+    visible to the next block.
+
+    A put of existing content only refreshes the file's mtime. Blobs not put again within
+    ttl_s are removed by a background sweep.
+    """
+
+    def __init__(self, root: str, ttl_s: float = 600, sweep_interval_s: float = 60):
+        self.root = root
+        self.ttl_s = float(ttl_s)
+        self.sweep_interval_s = float(sweep_interval_s)
+        os.makedirs(self.root, exist_ok=True)
+        self.sweeper = threading.Thread(target=self._sweep_loop, daemon=True)
+        self.sweeper.start()
+
+    @property
+    def location(self) -> str:
+        return f"file://{self.root}"
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest)
+
+    def put(self, data) -> str:
+        digest = blob_digest(data)
+        path = self._path(digest)
+        try:
+            os.utime(path)
+            return digest
+        except FileNotFoundError:
+            pass
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest: str) -> memoryview:
+        try:
+            with open(self._path(digest), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return memoryview(b"")
+                return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            raise KeyError(f"blob {digest} not found in {self.location}")
+
+    def delete(self, digest: str):
+        try:
+            os.unlink(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self, now: float = None) -> int:
+        """Removes the blobs older than ttl_s; returns the number removed."""
+        now = time.time() if now is None else now
+        removed = 0
+        for entry in os.scandir(self.root):
+            try:
+                if now - entry.stat().st_mtime > self.ttl_s:
+                    os.unlink(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval_s)
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"[FileBlobStore] sweep of {self.root} failed: {e}")
+
+
+class RedisBlobStore:
+    """
+    Content-addressed blobs in Redis, "blob:<digest>", expiring ttl_s after the last put.
+    Use a Redis every block of the pipeline can reach (e.g. a node-local instance for
+    blocks scheduled on one node).
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", ttl_s: float = 600):
+        self.url = url
+        self.ttl_s = float(ttl_s)
+        self.client = redis.Redis.from_url(url)
+
+    @property
+    def location(self) -> str:
+        return self.url
+
+    def put(self, data) -> str:
+        digest = blob_digest(data)
+        key = BLOB_KEY_PREFIX + digest
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(key, bytes(data), ex=int(self.ttl_s), nx=True)
+        pipe.expire(key, int(self.ttl_s))
+        pipe.execute()
+        return digest
+
+    def get(self, digest: str) -> memoryview:
+        data = self.client.get(BLOB_KEY_PREFIX + digest)
+        if data is None:
+            raise KeyError(f"blob {digest} not found in {self.location}")
+        return memoryview(data)
+
+    def delete(self, digest: str):
+        self.client.delete(BLOB_KEY_PREFIX + digest)
+
+
+def open_blob_store(location: str, ttl_s: float = 600):
+    """A store for a location: redis://host:port/db or file:///shared/mount/aios_blobs."""
+    scheme = urlparse(location).scheme
+    if scheme == "file":
+        return FileBlobStore(urlparse(location).path, ttl_s=ttl_s)
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisBlobStore(location, ttl_s=ttl_s)
+    raise ValueError(f"Unsupported blob store location: {location}")
+
+
+def blob_ref(file_info) -> Optional[dict]:
+    """The blob reference of a FileInfo, or None for inline files."""
+    if BLOB_REF_KEY not in file_info.metadata or len(file_info.file_data):
+        return None
+    try:
+        metadata = json.loads(file_info.metadata)
+    except json.JSONDecodeError:
+        return None
+    return metadata.get(BLOB_REF_KEY) if isinstance(metadata, dict) else None
+
+
+class BlobTransport:
+    """
+    Out-of-band transport of large AIOSPacket attachments.
+
+    offload(packet) moves each inline file of at least threshold bytes to the store at
+    location (or BLOB_STORE_URL), which every block of the pipeline must be able to reach,
+    and leaves a reference in its metadata: {..., "__blob__": {"digest": ..., "size": ...,
+    "location": ...}} with empty file_data. Identical content is stored once. Packets then
+    carry the reference from hop to hop instead of the bytes. References never leave the
+    pipeline: inline(packet) puts the bytes back before a packet goes to the final outputs.
+
+    read(file_info) returns the content as a memoryview, resolving a reference from the
+    store named in it (opened on first use) or wrapping inline bytes. Blobs expire ttl_s
+    after their last offload.
+    """
+
+    def __init__(self, threshold: int = 256 * 1024, location: str = None, ttl_s: float = 600):
+        self.threshold = int(threshold)
+        self.ttl_s = float(ttl_s)
+        self.location = location or os.getenv("BLOB_STORE_URL")
+        self.lock = threading.Lock()
+        self.stores: Dict[str, object] = {}
+        self.counters = {"offloaded": 0, "offloaded_bytes": 0, "resolved": 0, "missing": 0}
+
+    def store(self, location: str = None):
+        location = location or self.location
+        if not location:
+            raise ValueError("Blob offload requires a blob store shared by the pipeline (blob_store_url or BLOB_STORE_URL)")
+        store = self.stores.get(location)
+        if store is None:
+            with self.lock:
+                store = self.stores.get(location)
+                if store is None:
+                    store = self.stores[location] = open_blob_store(location, ttl_s=self.ttl_s)
+        return store
+
+    def offload(self, packet) -> int:
+        """Replaces large inline files of the packet with blob references; returns the number moved."""
+        moved = 0
+        for file_info in packet.files:
+            data = file_info.file_data  # read once, every access materializes the bytes
+            size = len(data)
+            if size < self.threshold or size == 0:
+                continue
+            # JSON object metadata stays readable next to the reference, and the original
+            # string travels verbatim so inline() restores it exactly
+            original = file_info.metadata
+            try:
+                metadata = json.loads(original) if original else {}
+            except json.JSONDecodeError:
+                metadata = {}
+            if not isinstance(metadata, dict):
+                metadata = {}
+
+            store = self.store()
+            digest = store.put(data)
+            metadata[BLOB_REF_KEY] = {"digest": digest, "size": size, "location": store.location, "metadata": original}
+            file_info.metadata = json.dumps(metadata)
+            file_info.file_data = b""
+            moved += 1
+            with self.lock:
+                self.counters["offloaded"] += 1
+                self.counters["offloaded_bytes"] += size
+        return moved
+
+    def inline(self, packet) -> int:
+        """Replaces the blob references of the packet with their content; returns the number restored."""
+        restored = 0
+        for file_info in packet.files:
+            if blob_ref(file_info) is None:
+                continue
+            metadata = self.metadata(file_info)
+            file_info.file_data = bytes(self.read(file_info))
+            file_info.metadata = metadata
+            restored += 1
+        return restored
+
+    def read(self, file_info) -> memoryview:
+        """Content of a FileInfo, inline or out-of-band."""
+        ref = blob_ref(file_info)
+        if ref is None:
+            return memoryview(file_info.file_data)
+        try:
+            data = self.store(ref.get("location")).get(ref["digest"])
+        except KeyError:
+            with self.lock:
+                self.counters["missing"] += 1
+            raise
+        with self.lock:
+            self.counters["resolved"] += 1
+        return data
+
+    def metadata(self, file_info) -> str:
+        """The FileInfo metadata as it was before offload, inline or out-of-band."""
+        ref = blob_ref(file_info)
+        if ref is None:
+            return file_info.metadata
+        return ref.get("metadata", "")
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counters)
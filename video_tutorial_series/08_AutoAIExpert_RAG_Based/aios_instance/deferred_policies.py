@@ -0,0 +1,77 @@
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+
+logging = logging.getLogger(__name__)
+
+
+class DeferredPolicyQueue:
+    """
+    Runs side-effect-only policies (executionMode "async_after_emit") after the packet
+    has been forwarded.
+
+    Submissions go to a bounded queue; when it is full the new submission is dropped and
+    counted, so a slow audit sink never blocks the job thread. A background thread takes
+    up to batch_size submissions at a time, waiting at most linger_ms for a batch to fill,
+    and hands each evaluator its share in one execute_policy_rule_batch call, so a policy
+    implementing eval_batch can pipeline its I/O.
+    """
+
+    def __init__(self, max_size: int = 10000, batch_size: int = 64, linger_ms: float = 10):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.batch_size = max(1, int(batch_size))
+        self.linger_s = linger_ms / 1000.0
+        self.lock = threading.Lock()
+        self.counters = {"submitted": 0, "dropped": 0, "executed": 0, "failed": 0, "batches": 0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+    def submit(self, evaluator, input_data: dict) -> bool:
+        try:
+            self.queue.put_nowait((evaluator, input_data))
+        except queue.Full:
+            self._count("dropped")
+            if self.counters["dropped"] % 1000 == 1:
+                logging.warning(f"[DeferredPolicyQueue] queue full, dropped {self.counters['dropped']} deferred policy calls so far")
+            return False
+        self._count("submitted")
+        return True
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.linger_s
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            groups = OrderedDict()
+            for evaluator, input_data in batch:
+                groups.setdefault(id(evaluator), (evaluator, []))[1].append(input_data)
+
+            for evaluator, inputs in groups.values():
+                try:
+                    evaluator.execute_policy_rule_batch(inputs)
+                    self._count("executed", len(inputs))
+                except Exception as e:
+                    self._count("failed", len(inputs))
+                    logging.error(f"[DeferredPolicyQueue] deferred policy batch of {len(inputs)} failed: {e}")
+            self._count("batches")
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+        stats["pending"] = self.queue.qsize()
+        return stats
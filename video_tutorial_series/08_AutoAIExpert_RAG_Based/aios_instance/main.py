@@ -14,7 +14,12 @@ from .ws import WebsocketStreamingManager
 from .metrics import AIOSMetrics
 from .aios_packet_pb2 import AIOSPacket
 from .tools import Muxer
+from .blob_store import BlobTransport
+from .streaming import StreamHub, StreamPublisher, StreamingInferenceServicer, serve_streaming_inference
+from .tracing import Tracer, NOOP_TRACE, open_span_exporter
+from .admission import AdmissionController
 from .vdag_process import vDAGProcessor
+from .routing import RoutingResolver
 from .side_cars import BlockSideCars
 from .events import BlockEvents
 
@@ -30,6 +35,29 @@ logging.basicConfig(level=logging.DEBUG)
 logging = logging.getLogger(__name__)
 
 
+POLICY_POOL_GAUGES = {
+    "calls": "policy calls sent to isolated policy worker processes",
+    "errors": "isolated policy calls that raised",
+    "timeouts": "isolated policy calls that timed out",
+    "rejected": "isolated policy calls rejected because every worker was busy",
+    "fallbacks": "isolated policy calls answered by the fallback",
+    "restarts": "policy worker processes replaced",
+    "idle_workers": "idle policy worker processes",
+    "workers": "policy worker processes alive or being restarted",
+    "restarting_workers": "policy worker processes being restarted",
+    "lost_workers": "policy worker processes given up after failed restarts",
+    "degraded": "policy process pools running below their configured size",
+    "latency_p95_s": "p95 latency of recent isolated policy calls (worst pool)",
+}
+DEFERRED_POLICY_GAUGES = {
+    "submitted": "post-processing policy calls deferred after emit",
+    "dropped": "deferred policy calls dropped because the queue was full",
+    "executed": "deferred policy calls executed",
+    "failed": "deferred policy calls that failed",
+    "pending": "deferred policy calls waiting in the queue",
+}
+
+
 class InferenceProxyClient:
     def __init__(self, block_id, url):
         self.channel = grpc.insecure_channel(url)
@@ -60,6 +88,7 @@ class Context:
         self.instance_path = f'/{os.getenv("INSTANCE_ID")}'
         self.common_path = '/common'
         self.write_ws = None
+        self.blobs = None
 
 
 
@@ -194,6 +223,39 @@ class Block:
 
             self.processors = vDAGProcessor(self.block_id, block_data_full)
 
+            # JSON graph output_ptrs are compiled to a RoutingTable header when enabled
+            self.routing = RoutingResolver(self.block_id)
+            self.compile_routing_header = self.block_init_data.get("compile_routing_header", False)
+            self.routing_graph_ref = self.block_init_data.get("routing_graph_ref", False)
+
+            # Attachments of at least blob_offload_threshold bytes travel between the pipeline's
+            # blocks out of band, in a store all of them reach (by default this block's Redis)
+            self.blob_offload_threshold = self.block_init_data.get("blob_offload_threshold", 0)
+            self.blobs = BlobTransport(
+                threshold=self.blob_offload_threshold or 0,
+                location=self.block_init_data.get("blob_store_url") or os.getenv(
+                    "BLOB_STORE_URL", f"redis://{self.block_id}-executor-svc.blocks.svc.cluster.local:6379/0"),
+                ttl_s=self.block_init_data.get("blob_ttl_s", 600))
+
+            # Final nodes publish the partial outputs of packets carrying a stream_ref to its hub
+            self.stream_hub = StreamHub(
+                maxlen=self.block_init_data.get("stream_maxlen", 4096),
+                ttl_s=self.block_init_data.get("stream_ttl_s", 300))
+            self.streams = StreamPublisher(self.stream_hub)
+            self.streaming_grpc_port = int(self.block_init_data.get(
+                "streaming_grpc_port", os.getenv("STREAMING_GRPC_PORT", 0)))
+            self.stream_hub_url = self.block_init_data.get("stream_hub_url") or os.getenv(
+                "STREAM_HUB_REDIS_URL", f"redis://{self.block_id}-executor-svc.blocks.svc.cluster.local:6379/0")
+
+            # Sampled packets record per-hop spans, exported to a Redis stream or an OTLP/HTTP collector
+            trace_exporter_url = self.block_init_data.get("trace_exporter_url") or os.getenv("TRACE_EXPORTER_URL")
+            self.tracer = None
+            if trace_exporter_url:
+                self.tracer = Tracer(
+                    self.block_id, self.instance_id,
+                    open_span_exporter(trace_exporter_url, stream=self.block_init_data.get("trace_stream", "aios_traces")),
+                    sample_rate=self.block_init_data.get("trace_sample_rate", 0.01))
+
             self.metrics = AIOSMetrics()
             self.metrics.start_http_server()
 
@@ -209,7 +271,8 @@ class Block:
             )
 
             self.ws_server = WebsocketStreamingManager(self.listen_for_jobs_now)
-            self.context.write_ws = self.ws_server.write_data
+            self.context.write_ws = self.write_partial
+            self.context.blobs = self.blobs
 
             self.block_module = block_class(self.context)
 
@@ -244,6 +307,49 @@ class Block:
                 "on_data_fps", "frames per second for on_data")
             self.metrics.register_gauge(
                 "end_to_end_fps", "frames per second for end-to-end processing")
+
+            # fan-in (Muxer) metrics:
+            self.metrics.register_histogram(
+                "muxer_join_wait_seconds", "time from the first to the last packet of a fan-in group",
+                buckets=[0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30])
+            self.metrics.register_counter(
+                "muxer_completed_count", "fan-in groups merged with all packets")
+            self.metrics.register_counter(
+                "muxer_partial_count", "incomplete fan-in groups merged partially")
+            self.metrics.register_counter(
+                "muxer_dropped_count", "incomplete fan-in groups dropped")
+
+            # admission control metrics:
+            self.metrics.register_counter(
+                "admission_admitted_count", "packets admitted at intake")
+            self.metrics.register_counter(
+                "admission_expired_count", "packets rejected because their deadline had passed")
+            self.metrics.register_counter(
+                "admission_late_count", "packets rejected at intake because they would expire in the queue")
+            self.metrics.register_counter(
+                "admission_shed_count", "packets of a shed priority class rejected at intake")
+            self.metrics.register_counter(
+                "executor_rejected_count", "packets dropped because the job executor queue was full")
+            self.metrics.register_gauge(
+                "admission_queue_wait_p95", "p95 queue wait of recently processed packets")
+            self.metrics.register_gauge(
+                "admission_shed_level", "number of priority classes being shed")
+
+            # vDAG policy metrics, totals since start, refreshed with the queue length:
+            for name, documentation in POLICY_POOL_GAUGES.items():
+                self.metrics.register_gauge(f"policy_pool_{name}", documentation)
+            for name, documentation in DEFERRED_POLICY_GAUGES.items():
+                self.metrics.register_gauge(f"deferred_policy_{name}", documentation)
+
+            # Deadline-aware admission: expired, late and shed packets are rejected before on_data
+            self.admission = None
+            if self.block_init_data.get("admission_control", False):
+                self.admission = AdmissionController(
+                    target_queue_wait_s=self.block_init_data.get("admission_target_queue_wait_s", 0.5),
+                    num_classes=self.block_init_data.get("admission_priority_classes", 4),
+                    window=self.block_init_data.get("admission_window", 512),
+                    default_timeout_s=self.block_init_data.get("default_timeout_s", 0),
+                    metrics=self.metrics)
             self.counter = 0
             self.redis_cache = RedisConnectionCache()
 
@@ -296,9 +402,22 @@ class Block:
             queue_length = self.redis_client.llen(self.input_queue_name)
             self.metrics.set_gauge("queue_length", queue_length)
             self.metrics.observe_rolling("queue_length", queue_length)
+            self.update_policy_metrics()
 
             time.sleep(10)
 
+    def update_policy_metrics(self):
+        """Publishes the stats of the vDAG policy process pools and of the deferred policy queue."""
+        try:
+            pool_stats = self.processors.pool_stats()
+            for name in POLICY_POOL_GAUGES:
+                self.metrics.set_gauge(f"policy_pool_{name}", pool_stats.get(name, 0))
+            deferred_stats = self.processors.deferred_stats() or {}
+            for name in DEFERRED_POLICY_GAUGES:
+                self.metrics.set_gauge(f"deferred_policy_{name}", deferred_stats.get(name, 0))
+        except Exception as e:
+            logging.error(f"Failed to update policy metrics: {str(e)}")
+
     def check_is_vdag_packet(self, session_id: str):
         try:
 
@@ -342,20 +461,31 @@ class Block:
             try:
                 # Blocking wait on input queue
                 _, job_data = self.redis_client.brpop(self.input_queue_name)
+                received_at = time.time()
 
-                if self.job_executor:
-                    # Extract session_id only
+                proto = None
+                if self.job_executor or self.admission:
                     proto = AIOSPacket()
                     proto.ParseFromString(job_data)
-                    session_id = proto.session_id
 
-                    job_tuple = (job_data, time.time())
+                if self.admission:
+                    deadline = proto.deadline
+                    if not self.admit(proto, received_at):
+                        continue
+                    if proto.deadline != deadline:
+                        job_data = proto.SerializeToString()
+
+                if self.job_executor:
+                    job_tuple = (job_data, received_at)
 
-                    success = self.job_executor.assign_job(job_tuple, session_id=session_id)
+                    success = self.job_executor.assign_job(job_tuple, session_id=proto.session_id)
                     if not success:
                         logging.warning("[Block] Dropping job due to full thread/process queue")
+                        self.metrics.increment_counter("executor_rejected_count")
+                elif proto is not None:
+                    self.listen_for_jobs_now((proto, received_at), serialized=True)
                 else:
-                    self.listen_for_jobs_now((job_data, time.time()))
+                    self.listen_for_jobs_now((job_data, received_at))
 
             except Exception as e:
                 logging.error(f"[Block] Error in listen_for_jobs: {str(e)}")
@@ -365,7 +495,57 @@ class Block:
                 self.reconnect_redis_client()
 
 
-    def listen_for_jobs_now(self, job_tuple, session_id=None, serialized=False, is_ws=False):
+    def admit(self, proto, now, intake=True):
+        """
+        Admission check of a packet (stamping its default deadline at intake). A rejected
+        packet is dropped; a streamed one is first answered with an error on its stream.
+        """
+        if intake:
+            self.admission.stamp(proto, now)
+        reason = self.admission.check(proto, now, intake=intake)
+        if reason is None:
+            return True
+        logging.debug(f"[Block] rejected {proto.session_id}:{proto.seq_no}: {reason}")
+        if proto.stream_ref:
+            try:
+                self.stream_hub.publish(proto.stream_ref, self.admission.rejection(proto, reason), final=True)
+            except Exception as e:
+                logging.error(f"[Block] answering rejected {proto.session_id}:{proto.seq_no} failed: {str(e)}")
+        return False
+
+    def write_partial(self, session_id, data: dict, seq_no: int = None):
+        """
+        Partial output of the current job: to the session's WebSocket and, on a final node, its
+        stream. seq_no (or data["seq_no"]) picks the request when a session has several in flight.
+        """
+        self.ws_server.write_data(session_id, data)
+        self.streams.partial(session_id, data, seq_no)
+
+    def is_final_hop(self, proto):
+        """True when this block sends the packet to the final outputs, or nowhere."""
+        try:
+            if proto.HasField("routing"):
+                return self.routing.is_final(proto)
+            if not proto.output_ptr:
+                return True
+            output_config = json.loads(proto.output_ptr)
+            if output_config.get("is_graph"):
+                return len(output_config["graph"].get(self.block_id, {}).get("outputs", [])) == 0
+            return True
+        except Exception:
+            return True
+
+    def submit_stream_request(self, packet):
+        """Queues a request received by the streaming gRPC server like any other job."""
+        packet.enqueued_at = time.time()
+        self.redis_client.lpush(self.input_queue_name, packet.SerializeToString())
+
+    def process_partial_merge(self, packet):
+        """Runs a partially merged fan-in group (closed by the Muxer) through the rest of the pipeline."""
+        self.listen_for_jobs_now((packet, time.time()), serialized=True, muxed=True)
+
+    def listen_for_jobs_now(self, job_tuple, session_id=None, serialized=False, is_ws=False, muxed=False):
+        trace = NOOP_TRACE
         try:
 
             job_data_proto = None
@@ -379,26 +559,43 @@ class Block:
             else:
                 job_data_proto, job_start_time = job_tuple
 
+            if self.tracer:
+                trace = self.tracer.begin(job_data_proto, job_start_time)
 
-            # check pre-processing:
+            if self.admission and not muxed:
+                self.admission.observe(time.time() - (job_data_proto.enqueued_at or job_start_time))
+
+            # check pre-processing (already done for the packets of a merged group):
             is_vdag, uri = self.check_is_vdag_packet(
                 job_data_proto.session_id)
-            if is_vdag:
-                job_data_proto = self.processors.execute_pre_process_policy_rule_if_present(uri, job_data_proto)
+            if is_vdag and not muxed:
+                with trace.span("pre_process_policy"):
+                    job_data_proto = self.processors.execute_pre_process_policy_rule_if_present(uri, job_data_proto)
 
-            muxer: Muxer = self.block_module.get_muxer()
+            muxer: Muxer = None if muxed else self.block_module.get_muxer()
             if muxer:
-                op = muxer.process_packet(job_data)
+                if muxer.metrics is None:
+                    muxer.metrics = self.metrics
+                if muxer.partial_policy == "merge" and muxer.on_partial is None:
+                    muxer.on_partial = self.process_partial_merge
+                with trace.span("muxer"):
+                    op = muxer.process_packet(job_data_proto)
                 if not op:
+                    trace.end(muxer="waiting")
                     return
-                job_data = op
+                job_data_proto = op
+
+            if job_data_proto.stream_ref and self.is_final_hop(job_data_proto):
+                self.streams.open(job_data_proto)
 
             preprocess_start = time.time()
             ret, data = self.block_module.on_preprocess(job_data_proto)
             preprocess_end = time.time()
+            trace.add("on_preprocess", preprocess_start, preprocess_end)
 
             if not ret:
                 logging.error(f"Error in on_preprocess: {data}")
+                trace.fail(f"on_preprocess: {data}")
                 return
 
             if not data:
@@ -415,30 +612,72 @@ class Block:
                 "on_preprocess_fps", 1 / preprocess_latency if preprocess_latency > 0 else 0)
 
             for entry in data:
+                if self.admission and not self.admit(entry.packet, time.time(), intake=False):
+                    trace.fail("expired before on_data")
+                    continue
+
                 on_data_start = time.time()
                 ret, on_data_result = self.block_module.on_data(entry, is_ws=is_ws)
                 on_data_end = time.time()
+                trace.add("on_data", on_data_start, on_data_end)
 
                 if is_ws:
                     continue
 
                 if not ret:
                     logging.error(f"Error in on_data: {on_data_result}")
+                    trace.fail(f"on_data: {on_data_result}")
                     continue
 
                 output = on_data_result.output
 
                 proto = entry.packet
+                is_vdag, uri = self.check_is_vdag_packet(proto.session_id)
+                deferred = is_vdag and self.processors.is_post_process_deferred(uri)
+                request_proto = None
+                if deferred:
+                    # what the policy sees of the request; the files stay out of the copy
+                    request_proto = AIOSPacket(
+                        session_id=proto.session_id, seq_no=proto.seq_no, data=proto.data,
+                        ts=proto.ts, output_ptr=proto.output_ptr)
+
                 proto.data = json.dumps(output)
 
-                is_vdag, uri = self.check_is_vdag_packet(proto.session_id)
-                if is_vdag:
-                    proto = self.processors.execute_post_process_policy_rule_if_present(
-                        uri, proto)
+                if is_vdag and not deferred:
+                    with trace.span("post_process_policy"):
+                        proto = self.processors.execute_post_process_policy_rule_if_present(
+                            uri, proto)
 
-                output_bytes = proto.SerializeToString()
+                final_hop = self.is_final_hop(proto)
+                if proto.stream_ref:
+                    if final_hop:
+                        self.streams.finish(proto)
+                    else:
+                        self.streams.close(proto)
 
-                if proto.output_ptr and proto.output_ptr != "":
+                push_start = time.time()
+                if len(proto.files):
+                    try:
+                        if final_hop:
+                            # results leave the pipeline with their bytes, not references
+                            self.blobs.inline(proto)
+                        elif self.blob_offload_threshold:
+                            self.blobs.offload(proto)
+                    except Exception as e:
+                        logging.error(f"Blob transport failed, sending files as they are: {str(e)}")
+
+                if self.compile_routing_header and proto.output_ptr and not proto.HasField("routing"):
+                    try:
+                        self.routing.compile_packet(proto, self.routing_graph_ref)
+                    except (ValueError, KeyError, json.JSONDecodeError) as e:
+                        logging.debug(f"output_ptr kept as JSON: {str(e)}")
+
+                trace.inject(proto)
+                proto.enqueued_at = time.time()
+                if proto.HasField("routing"):
+                    self.push_routed_outputs(proto)
+                elif proto.output_ptr and proto.output_ptr != "":
+                    output_bytes = proto.SerializeToString()
                     try:
                         output_config = json.loads(proto.output_ptr)
                         if 'is_graph' in output_config and output_config['is_graph']:
@@ -469,8 +708,15 @@ class Block:
 
                     except json.JSONDecodeError as e:
                         logging.error(f"Invalid output_ptr JSON: {str(e)}")
-                else:
-                    self.block_output.lpush("OUTPUT", output_bytes)
+                elif not proto.stream_ref:
+                    # streamed requests without outputs are answered through their stream only
+                    self.block_output.lpush("OUTPUT", proto.SerializeToString())
+                trace.add("output_push", push_start, time.time())
+
+                if deferred:
+                    # side-effect-only policy, off the critical path
+                    self.processors.submit_deferred_post_process_policy_rule(
+                        uri, request_proto, proto)
 
                 self.metrics.increment_counter("on_data_count")
                 on_data_latency = on_data_end - on_data_start
@@ -494,11 +740,38 @@ class Block:
 
         except Exception as e:
             logging.error(f"Error when executing job: {str(e)}")
+            trace.fail(str(e))
+            return
+        finally:
+            trace.end()
+
+    def push_routed_outputs(self, proto):
+        """Pushes a packet with a RoutingTable header to this block's outputs, serializing it once."""
+        try:
+            outputs = self.routing.resolve(proto)
+        except Exception as e:
+            logging.error(f"Invalid routing header: {str(e)}")
             return
 
+        proto.routing.ClearField("cursor")
+        base_bytes = proto.SerializeToString()
+        for output, destination in outputs:
+            redis_conn = self.redis_cache.get(
+                output["block_id"], output["host"], output["port"])
+            if redis_conn:
+                logging.info(
+                    f"pushing output now: {proto.session_id}:{proto.seq_no} -> {output['host']}:{output['port']}")
+                redis_conn.lpush(
+                    output["queue_name"], self.routing.serialize_for(base_bytes, destination))
+
     def run(self):
         self.start_parameters_server()
         self.ws_server.start_as_thread()
+        if self.streaming_grpc_port:
+            self.streaming_servicer = StreamingInferenceServicer(
+                self.submit_stream_request, self.stream_hub, self.stream_hub_url,
+                timeout_s=self.block_init_data.get("stream_timeout_s", 300))
+            self.streaming_server = serve_streaming_inference(self.streaming_servicer, self.streaming_grpc_port)
         self.listen_for_jobs()
 
     def start_parameters_server(self):
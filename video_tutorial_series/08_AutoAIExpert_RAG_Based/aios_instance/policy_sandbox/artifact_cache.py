@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+import tarfile
+import zipfile
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+
+import requests
+
+
+DEFAULT_CACHE_DIR = "/tmp/aios_policy_cache"
+DEFAULT_REVALIDATE_S = 60
+
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sha256_tree(root: Path) -> str:
+    """Content hash of a directory: relative paths and file contents, in sorted order."""
+    digest = hashlib.sha256()
+    for path in sorted(p for p in root.rglob("*") if p.is_file() and "__pycache__" not in p.parts):
+        digest.update(str(path.relative_to(root)).encode("utf-8") + b"\0")
+        digest.update(sha256_file(path).encode("ascii"))
+    return digest.hexdigest()
+
+
+def requirements_hash(requirements_file: Path) -> str:
+    """Hash of the normalized requirement lines (comments, blank lines and order ignored)."""
+    lines = []
+    with open(requirements_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                lines.append(line)
+    digest = hashlib.sha256("\n".join(sorted(lines)).encode("utf-8"))
+    digest.update(sys.version.split()[0].encode("ascii"))  # wheels are interpreter specific
+    return digest.hexdigest()
+
+
+def extract_tar(tar: tarfile.TarFile, target: Path):
+    """
+    Extracts a downloaded archive without letting it write outside target: absolute
+    paths, '..' components, links leaving the tree and device files are rejected.
+    """
+    if hasattr(tarfile, "data_filter"):
+        tar.extractall(target, filter="data")
+        return
+    root = os.path.realpath(target)
+    for member in tar.getmembers():
+        path = os.path.realpath(os.path.join(root, member.name))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(f"Archive member {member.name} is outside the extraction directory")
+        if member.issym() or member.islnk():
+            link = os.path.realpath(os.path.join(os.path.dirname(path), member.linkname) if member.issym()
+                                    else os.path.join(root, member.linkname))
+            if os.path.commonpath([root, link]) != root:
+                raise ValueError(f"Archive link {member.name} points outside the extraction directory")
+        elif not (member.isfile() or member.isdir()):
+            raise ValueError(f"Archive member {member.name} is not a regular file or directory")
+    tar.extractall(target)
+
+
+@contextmanager
+def file_lock(path: Path):
+    """Node-wide exclusive lock, so concurrent block processes build each artifact once."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class PolicyArtifactCache:
+    """
+    Content-addressed, node-wide cache of policy artifacts.
+
+    Layout of the cache directory (POLICY_CACHE_DIR, default /tmp/aios_policy_cache):
+        downloads/<sha256 of url>   downloaded archives, with <sha256 of url>.json holding
+                                    the ETag/Last-Modified they were served with
+        trees/<sha256 of content>/  extracted policy trees, containing code/
+        envs/<sha256 of requirements>/site-packages
+                                    dependencies installed once per requirements set
+
+    Every artifact is built in a temporary directory and renamed into place, under a
+    file lock, and is reused by all blocks on the node afterwards. A downloaded archive is
+    revalidated with the server (a conditional GET) once it is older than revalidate_s
+    (POLICY_ARCHIVE_REVALIDATE_S), so a policy republished at the same URL is picked up.
+    """
+
+    def __init__(self, cache_dir: str = None, revalidate_s: float = None):
+        self.root = Path(cache_dir or os.getenv("POLICY_CACHE_DIR", DEFAULT_CACHE_DIR))
+        if revalidate_s is None:
+            revalidate_s = os.getenv("POLICY_ARCHIVE_REVALIDATE_S", DEFAULT_REVALIDATE_S)
+        self.revalidate_s = float(revalidate_s)
+        self.downloads_dir = self.root / "downloads"
+        self.trees_dir = self.root / "trees"
+        self.envs_dir = self.root / "envs"
+        for directory in (self.downloads_dir, self.trees_dir, self.envs_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def _publish_dir(self, build_dir: Path, target: Path):
+        # Called with the target lock held
+        if target.exists():
+            shutil.rmtree(build_dir, ignore_errors=True)
+        else:
+            os.rename(build_dir, target)
+
+    @staticmethod
+    def _read_validators(path: Path) -> dict:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_validators(self, path: Path, validators: dict):
+        fd, tmp_path = tempfile.mkstemp(dir=self.downloads_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(validators, f)
+        os.replace(tmp_path, path)
+
+    def _is_fresh(self, target: Path, validators_path: Path) -> bool:
+        if not target.exists():
+            return False
+        checked_at = self._read_validators(validators_path).get("checked_at", 0)
+        return time.time() - checked_at < self.revalidate_s
+
+    def fetch(self, url: str) -> Path:
+        """
+        Returns the local path of the archive at url. It is downloaded once per node and
+        revalidated with If-None-Match/If-Modified-Since when older than revalidate_s.
+        """
+        target = self.downloads_dir / hashlib.sha256(url.encode()).hexdigest()
+        validators_path = target.with_suffix(".json")
+        if self._is_fresh(target, validators_path):
+            logging.info(f"Policy archive cache hit for {url}")
+            return target
+        with file_lock(target.with_suffix(".lock")):
+            if self._is_fresh(target, validators_path):
+                return target
+            validators = self._read_validators(validators_path) if target.exists() else {}
+            headers = {}
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+            try:
+                response = requests.get(url, stream=True, timeout=60, headers=headers)
+                if response.status_code != 304:
+                    response.raise_for_status()
+            except requests.RequestException as e:
+                if not target.exists():
+                    raise
+                logging.warning(f"Revalidation of policy archive {url} failed, using the cached copy: {e}")
+                return target
+
+            if response.status_code == 304:
+                logging.info(f"Policy archive {url} not modified")
+            else:
+                fd, tmp_path = tempfile.mkstemp(dir=self.downloads_dir)
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        f.write(chunk)
+                os.replace(tmp_path, target)
+                validators = {"etag": response.headers.get("ETag"),
+                              "last_modified": response.headers.get("Last-Modified")}
+                logging.info(f"Downloaded policy archive {url} to {target}")
+            validators["checked_at"] = time.time()
+            self._write_validators(validators_path, validators)
+        return target
+
+    def tree_from_archive(self, archive_path: Path) -> Path:
+        """Extracts an archive once per content hash; returns the directory holding code/."""
+        target = self.trees_dir / sha256_file(archive_path)
+        if (target / "code").exists():
+            return target
+        with file_lock(target.with_suffix(".lock")):
+            if (target / "code").exists():
+                return target
+            build_dir = Path(tempfile.mkdtemp(dir=self.trees_dir))
+            if tarfile.is_tarfile(archive_path):
+                with tarfile.open(archive_path) as tar:
+                    extract_tar(tar, build_dir)
+            elif zipfile.is_zipfile(archive_path):
+                with zipfile.ZipFile(archive_path, "r") as zip_ref:
+                    zip_ref.extractall(build_dir)
+            else:
+                shutil.rmtree(build_dir, ignore_errors=True)
+                raise ValueError("Unsupported file format")
+            if not (build_dir / "code").exists():
+                shutil.rmtree(build_dir, ignore_errors=True)
+                raise FileNotFoundError("code/ directory not found in archive")
+            self._publish_dir(build_dir, target)
+            logging.info(f"Extracted policy archive {archive_path} to {target}")
+        return target
+
+    def tree_from_directory(self, source_dir: Path) -> Path:
+        """Copies a local policy directory once per content hash; returns the directory holding code/."""
+        target = self.trees_dir / sha256_tree(source_dir)
+        if (target / "code").exists():
+            return target
+        with file_lock(target.with_suffix(".lock")):
+            if (target / "code").exists():
+                return target
+            build_dir = Path(tempfile.mkdtemp(dir=self.trees_dir))
+            shutil.copytree(source_dir, build_dir / "code", dirs_exist_ok=True)
+            self._publish_dir(build_dir, target)
+            logging.info(f"Copied local policy directory {source_dir} to {target}")
+        return target
+
+    def dependencies(self, requirements_file: Path) -> Path:
+        """
+        Installs requirements into a site-packages directory shared by every policy with
+        the same requirements, building it only once. Returns that directory.
+        """
+        target = self.envs_dir / requirements_hash(requirements_file)
+        site_packages = target / "site-packages"
+        if site_packages.exists():
+            logging.info(f"Policy dependencies cache hit: {target.name[:12]}")
+            return site_packages
+        with file_lock(target.with_suffix(".lock")):
+            if site_packages.exists():
+                return site_packages
+            build_dir = Path(tempfile.mkdtemp(dir=self.envs_dir))
+            try:
+                subprocess.check_call([
+                    sys.executable, "-m", "pip", "install", "--disable-pip-version-check",
+                    "--target", str(build_dir / "site-packages"), "-r", str(requirements_file)])
+                shutil.copy(requirements_file, build_dir / "requirements.txt")
+            except subprocess.CalledProcessError:
+                shutil.rmtree(build_dir, ignore_errors=True)
+                raise
+            self._publish_dir(build_dir, target)
+            logging.info(f"Installed policy dependencies into {target}")
+        return site_packages
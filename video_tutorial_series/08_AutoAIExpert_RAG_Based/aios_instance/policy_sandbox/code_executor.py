@@ -1,77 +1,70 @@
-import os
 import uuid
-import tempfile
 import requests
 import subprocess
-import tarfile
-import zipfile
 import importlib.util
 import sys
 import logging
+from contextlib import contextmanager
 from pathlib import Path
-import hashlib
-import shutil
+
+from .artifact_cache import PolicyArtifactCache
 
 
 logging.basicConfig(level=logging.INFO)
 
 
 class LocalCodeExecutor:
+    """
+    Loads and runs a policy function.py.
+
+    Archives, extracted trees and installed requirements come from the node-wide
+    PolicyArtifactCache, so only the first block on a node pays for downloads and
+    pip installs. Each executor imports the policy under its own module name.
+    """
+
     def __init__(self, download_url: str, settings: dict, parameters: dict):
         self.download_url = download_url
         self.session_uuid = str(uuid.uuid4())
-        self.temp_dir = Path(f"/tmp/{self.session_uuid}")
-        self.code_dir = self.temp_dir / "code"
-        self.requirements_file = self.code_dir / "requirements.txt"
-        self.function_file = self.code_dir / "function.py"
+        self.artifact_cache = PolicyArtifactCache()
+        self.temp_dir = None
+        self.code_dir = None
+        self.requirements_file = None
+        self.function_file = None
+        self.module_name = None
         self.function_class = None
+        self.site_packages = None
         self.settings = settings
         self.parameters = parameters
-        self.cache = {}
 
     def download(self):
         # Check if the path is a local file or directory
-        self.temp_dir.mkdir(parents=True, exist_ok=True)
         target_path = Path(self.download_url)
 
-        print(target_path, target_path.exists())
-
         if target_path.exists():
             if target_path.is_file() and (target_path.suffix in [".gz", ".zip", ".xz"] or target_path.suffixes[-2:] == [".tar", ".gz"]):
                 logging.info(f"Using local archive: {target_path}")
                 return target_path
             elif target_path.is_dir():
                 logging.info(f"Using local directory: {target_path}")
-                self.code_dir.mkdir(parents=True, exist_ok=True)
-                shutil.copytree(target_path, self.code_dir, dirs_exist_ok=True)
-                logging.info(f"Copied local directory to {self.code_dir}")
+                self._set_tree(self.artifact_cache.tree_from_directory(target_path))
                 return None  # No need to unpack or download
             else:
                 raise ValueError(
                     "Unsupported local path format or non-existing path")
 
         # Handle remote downloads
-        url_hash = hashlib.md5(self.download_url.encode()).hexdigest()
-        if url_hash in self.cache:
-            logging.info("Loading from cache")
-            cached_path = Path(self.cache.get(url_hash))
-            if cached_path.exists():
-                return cached_path
-
         try:
-            response = requests.get(self.download_url, stream=True)
-            response.raise_for_status()
-            archive_path = self.temp_dir / "archive"
-            with open(archive_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            self.cache[url_hash] = str(archive_path)
-            logging.info(f"Downloaded and cached file to {archive_path}")
-            return archive_path
+            return self.artifact_cache.fetch(self.download_url)
         except requests.exceptions.RequestException as e:
             logging.error(f"Error downloading file: {e}")
             raise
 
+    def _set_tree(self, tree_dir: Path):
+        self.temp_dir = tree_dir
+        self.code_dir = self.temp_dir / "code"
+        self.requirements_file = self.code_dir / "requirements.txt"
+        self.function_file = self.code_dir / "function.py"
+
     def unpack(self, archive_path):
         if not archive_path:
             # If archive_path is None, it means the code was copied directly from a directory
@@ -80,19 +73,8 @@ class LocalCodeExecutor:
             return
 
         try:
-            if tarfile.is_tarfile(archive_path):
-                with tarfile.open(archive_path) as tar:
-                    tar.extractall(self.temp_dir)
-                    logging.info(f"Extracted tar file to {self.temp_dir}")
-            elif zipfile.is_zipfile(archive_path):
-                with zipfile.ZipFile(archive_path, "r") as zip_ref:
-                    zip_ref.extractall(self.temp_dir)
-                    logging.info(f"Extracted zip file to {self.temp_dir}")
-            else:
-                logging.error("Unsupported file format")
-                raise ValueError("Unsupported file format")
-            if not self.code_dir.exists():
-                raise FileNotFoundError("code/ directory not found in archive")
+            self._set_tree(self.artifact_cache.tree_from_archive(Path(archive_path)))
+            logging.info(f"Using policy tree {self.temp_dir}")
         except Exception as e:
             logging.error(f"Error extracting archive: {e}")
             raise
@@ -100,25 +82,43 @@ class LocalCodeExecutor:
     def install_dependencies(self):
         try:
             if self.requirements_file.exists():
-                subprocess.check_call(
-                    [sys.executable, "-m", "pip", "install", "-r", str(self.requirements_file)])
-                logging.info("Installed dependencies from requirements.txt")
+                self.site_packages = str(self.artifact_cache.dependencies(self.requirements_file))
+                # Appended, so packages the runtime imports later keep resolving to its own copies
+                if self.site_packages not in sys.path:
+                    sys.path.append(self.site_packages)
+                logging.info(f"Policy dependencies available from {self.site_packages}")
             else:
                 logging.warning("No requirements.txt found")
         except subprocess.CalledProcessError as e:
             logging.error(f"Error installing dependencies: {e}")
             raise
 
+    @contextmanager
+    def _policy_imports_first(self):
+        """While the policy module is imported, its pinned dependencies win over the runtime's."""
+        if not self.site_packages:
+            yield
+            return
+        sys.path.insert(0, self.site_packages)
+        try:
+            yield
+        finally:
+            sys.path.remove(self.site_packages)  # the first occurrence, the appended one stays
+
     def initialize_function(self):
         try:
+            # Unique per executor: several policies no longer overwrite sys.modules["function"]
+            if self.module_name is None:
+                self.module_name = f"aios_policy_{self.temp_dir.name[:16]}_{self.session_uuid.replace('-', '')[:8]}"
             spec = importlib.util.spec_from_file_location(
-                "function", self.function_file)
+                self.module_name, self.function_file)
             module = importlib.util.module_from_spec(spec)
-            sys.modules["function"] = module
-            spec.loader.exec_module(module)
+            sys.modules[self.module_name] = module
+            with self._policy_imports_first():
+                spec.loader.exec_module(module)
             self.function_class = getattr(module, "AIOSv1PolicyRule")(
                 "", self.settings, self.parameters)
-            logging.info("Initialized AgentSpaceFunction")
+            logging.info(f"Initialized AgentSpaceFunction as module {self.module_name}")
         except (AttributeError, FileNotFoundError) as e:
             logging.error(f"Error initializing function: {e}")
             raise
@@ -132,6 +132,15 @@ class LocalCodeExecutor:
             logging.error(f"Error during evaluation: {e}")
             raise
 
+    def evaluate_batch(self, inputs):
+        """Uses the policy's eval_batch when it has one, otherwise evaluates one by one."""
+        if not self.function_class:
+            raise RuntimeError("Function class not initialized")
+        eval_batch = getattr(self.function_class, "eval_batch", None)
+        if callable(eval_batch):
+            return eval_batch(self.parameters, inputs, None)
+        return [self.function_class.eval(self.parameters, input_data, None) for input_data in inputs]
+
     def init(self):
         try:
             archive_path = self.download()
@@ -1,18 +1,41 @@
 import os
 from .client import PolicyDBClient
 from .code_executor import LocalCodeExecutor
-import logging
-import os
+from .process_pool import PolicyProcessPool
+import pickle
 import logging
 
-import os
+
+def isolation_config(overrides: dict = None) -> dict:
+    """
+    Isolated execution settings. Defaults come from the environment:
+        POLICY_ISOLATION         "inline" (default) or "process"
+        POLICY_POOL_WORKERS      warm worker processes per policy (default 2)
+        POLICY_TIMEOUT_S         per-call deadline in seconds (default 5)
+        POLICY_MAX_CONCURRENCY   concurrent calls (default: number of workers)
+        POLICY_TIMEOUT_FALLBACK  "passthrough" (default) or "error"
+        POLICY_MEMORY_LIMIT_MB   address space limit per worker (default: unlimited)
+    """
+    config = {
+        "mode": os.getenv("POLICY_ISOLATION", "inline"),
+        "workers": int(os.getenv("POLICY_POOL_WORKERS", "2")),
+        "timeout_s": float(os.getenv("POLICY_TIMEOUT_S", "5")),
+        "max_concurrency": int(os.getenv("POLICY_MAX_CONCURRENCY", "0")) or None,
+        "fallback": os.getenv("POLICY_TIMEOUT_FALLBACK", "passthrough"),
+        "memory_limit_mb": int(os.getenv("POLICY_MEMORY_LIMIT_MB", "0")) or None,
+    }
+    config.update(overrides or {})
+    return config
 
 
 class PolicyFunctionExecutor:
-    def __init__(self, policy_rule_uri: str = None, parameters: dict = None, settings: dict = None, custom_class=None):
+    def __init__(self, policy_rule_uri: str = None, parameters: dict = None, settings: dict = None, custom_class=None,
+                 isolation: dict = None):
 
         self.executor = None
         self.custom_function = None
+        self.pool = None
+        self.policy_rule_uri = policy_rule_uri
 
         if custom_class is not None:
             logging.info("Initializing directly from custom class")
@@ -46,6 +69,12 @@ class PolicyFunctionExecutor:
             else:
                 settings.update(policy_data.policy_settings)
 
+            isolation = isolation_config(isolation)
+            if isolation["mode"] == "process":
+                self._init_pool(policy_data.code, settings, parameters, isolation)
+                if self.pool is not None:
+                    return
+
             logging.info(
                 f"Initializing LocalCodeExecutor for policy {policy_rule_uri}")
             try:
@@ -60,6 +89,39 @@ class PolicyFunctionExecutor:
                 logging.error(f"Failed to initialize LocalCodeExecutor: {e}")
                 raise
 
+    def _init_pool(self, download_url, settings, parameters, isolation):
+        try:
+            pickle.dumps((settings, parameters))
+        except Exception as e:
+            logging.warning(
+                f"Settings of policy {self.policy_rule_uri} cannot be sent to a worker process ({e}), running inline")
+            return
+
+        logging.info(f"Starting policy process pool for {self.policy_rule_uri}")
+        try:
+            # Populate the node-wide artifact cache once, so every worker starts from it
+            prepared = LocalCodeExecutor(download_url=download_url, settings=settings, parameters=parameters)
+            prepared.unpack(prepared.download())
+            if prepared.requirements_file.exists():
+                prepared.install_dependencies()
+
+            self.pool = PolicyProcessPool(
+                download_url=download_url,
+                settings=settings,
+                parameters=parameters,
+                workers=isolation["workers"],
+                timeout_s=isolation["timeout_s"],
+                max_concurrency=isolation["max_concurrency"],
+                fallback=isolation["fallback"],
+                memory_limit_mb=isolation["memory_limit_mb"],
+            )
+        except Exception as e:
+            logging.error(f"Failed to start policy process pool: {e}")
+            raise
+
+    def pool_stats(self):
+        return self.pool.stats() if self.pool is not None else None
+
     def execute_policy_rule(self, input_data: dict):
 
         if self.custom_function is not None:
@@ -71,6 +133,13 @@ class PolicyFunctionExecutor:
                 logging.error(
                     f"Failed to execute custom class '{type(self.custom_function).__name__}': {e}")
                 raise
+        elif self.pool is not None:
+            try:
+                return self.pool.evaluate(input_data)
+            except Exception as e:
+                logging.error(
+                    f"Failed to execute policy function for URI '{self.policy_rule_uri}' in the process pool: {e}")
+                raise
         elif self.executor is not None:
             try:
                 logging.info(
@@ -84,11 +153,32 @@ class PolicyFunctionExecutor:
         else:
             raise RuntimeError("No executor or custom class is initialized")
 
+    def execute_policy_rule_batch(self, inputs: list):
+        """Evaluates several inputs at once, through the policy's eval_batch when it defines one."""
+        if self.custom_function is not None:
+            eval_batch = getattr(self.custom_function, "eval_batch", None)
+            if callable(eval_batch):
+                return eval_batch({}, inputs, None)
+            return [self.custom_function.eval({}, input_data, None) for input_data in inputs]
+        elif self.pool is not None:
+            return [self.pool.evaluate(input_data) for input_data in inputs]
+        elif self.executor is not None:
+            try:
+                return self.executor.evaluate_batch(inputs)
+            except Exception as e:
+                logging.error(
+                    f"Failed to execute policy batch for URI '{self.policy_rule_uri}': {e}")
+                raise
+        else:
+            raise RuntimeError("No executor or custom class is initialized")
+
     def execute_mgmt_command(self, action, mgmt_data):
         try:
 
             if self.custom_function:
                 return self.custom_function.management(action, mgmt_data)
+            elif self.pool is not None:
+                return self.pool.mgmt(action, mgmt_data)
             else:
                 return self.executor.mgmt(action, mgmt_data)
 
@@ -0,0 +1,361 @@
+import os
+import time
+import queue
+import logging
+import resource
+import importlib
+import threading
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+
+
+# Packets larger than this are handed over through shared memory instead of the pipe
+SHM_THRESHOLD = 64 * 1024
+
+
+class PolicyTimeoutError(TimeoutError):
+    pass
+
+
+def _encode_value(value, shm_threshold):
+    """Protobuf messages travel as their wire bytes, large ones through shared memory."""
+    if hasattr(value, "SerializeToString") and hasattr(value, "ParseFromString"):
+        data = value.SerializeToString()
+        kind = (type(value).__module__, type(value).__qualname__)
+        if len(data) >= shm_threshold:
+            shm = shared_memory.SharedMemory(create=True, size=len(data))
+            shm.buf[:len(data)] = data
+            name = shm.name
+            shm.close()
+            return ("__proto_shm__", kind, name, len(data))
+        return ("__proto__", kind, data)
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, tuple) and value and value[0] in ("__proto__", "__proto_shm__"):
+        module_name, class_name = value[1]
+        message = getattr(importlib.import_module(module_name), class_name)()
+        if value[0] == "__proto__":
+            message.ParseFromString(value[2])
+        else:
+            shm = shared_memory.SharedMemory(name=value[2])
+            try:
+                message.ParseFromString(shm.buf[:value[3]])
+            finally:
+                shm.close()
+                shm.unlink()
+        return message
+    return value
+
+
+def _encode_dict(data, shm_threshold):
+    if not isinstance(data, dict):
+        return _encode_value(data, shm_threshold)
+    return {k: _encode_value(v, shm_threshold) for k, v in data.items()}
+
+
+def _decode_dict(data):
+    if not isinstance(data, dict):
+        return _decode_value(data)
+    return {k: _decode_value(v) for k, v in data.items()}
+
+
+def _release(data):
+    """Frees shared memory of an encoded payload that was never decoded."""
+    values = data.values() if isinstance(data, dict) else [data]
+    for value in values:
+        if isinstance(value, tuple) and value and value[0] == "__proto_shm__":
+            try:
+                shm = shared_memory.SharedMemory(name=value[2])
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _worker_main(conn, download_url, settings, parameters, shm_threshold, memory_limit_mb):
+    """Worker process: loads the policy once, then serves eval/management calls from the pipe."""
+    from .code_executor import LocalCodeExecutor
+
+    try:
+        if memory_limit_mb:
+            limit = int(memory_limit_mb) * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        executor = LocalCodeExecutor(download_url=download_url, settings=settings, parameters=parameters)
+        executor.init()
+        conn.send(("ready", None))
+    except Exception as e:
+        conn.send(("error", f"policy init failed: {e}"))
+        return
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        op, payload = message
+        try:
+            if op == "eval":
+                result = executor.evaluate(_decode_dict(payload))
+                conn.send(("ok", _encode_dict(result, shm_threshold)))
+            elif op == "mgmt":
+                action, data = payload
+                conn.send(("ok", executor.mgmt(action, data)))
+        except MemoryError:
+            conn.send(("error", "policy exceeded its memory budget"))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class _Worker:
+    def __init__(self, ctx, download_url, settings, parameters, shm_threshold, memory_limit_mb):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, download_url, settings, parameters, shm_threshold, memory_limit_mb),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout):
+        if not self.conn.poll(timeout):
+            raise PolicyTimeoutError(f"policy worker did not start within {timeout}s")
+        status, detail = self.conn.recv()
+        if status != "ready":
+            raise RuntimeError(detail)
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(timeout=1)
+        finally:
+            self.conn.close()
+
+
+class PolicyProcessPool:
+    """
+    Runs a policy in a pool of warm worker processes.
+
+    Each worker loads the policy once (through the node-wide artifact cache) and keeps
+    the instance. Calls get a deadline: a call that does not finish in timeout_s has its
+    worker killed and replaced, and returns the fallback ("passthrough" returns the
+    input packet unchanged, "error" raises PolicyTimeoutError). At most max_concurrency
+    calls run at once; callers beyond that wait for a worker within the same deadline.
+    Protobuf packets cross the process boundary as wire bytes, through shared memory
+    when larger than shm_threshold. memory_limit_mb caps each worker's address space.
+
+    A worker that cannot be replaced is retried restart_attempts times with exponential
+    backoff starting at restart_backoff_s; after that the pool shrinks by one worker and
+    reports itself degraded in stats(). A pool without workers fails calls at once.
+
+    Policy state lives in each worker, so policies that keep state across calls should
+    use a single worker.
+    """
+
+    def __init__(self, download_url: str, settings: dict, parameters: dict, workers: int = 2,
+                 timeout_s: float = 5.0, max_concurrency: int = None, fallback: str = "passthrough",
+                 memory_limit_mb: int = None, start_timeout_s: float = 300.0, shm_threshold: int = SHM_THRESHOLD,
+                 start_method: str = None, restart_attempts: int = 5, restart_backoff_s: float = 1.0):
+        if fallback not in ("passthrough", "error"):
+            raise ValueError(f"Unsupported fallback: {fallback}")
+        self.download_url = download_url
+        self.settings = settings
+        self.parameters = parameters
+        self.timeout_s = timeout_s
+        self.fallback = fallback
+        self.start_timeout_s = start_timeout_s
+        self.shm_threshold = shm_threshold
+        self.memory_limit_mb = memory_limit_mb
+        self.restart_attempts = max(1, int(restart_attempts))
+        self.restart_backoff_s = restart_backoff_s
+        self.ctx = multiprocessing.get_context(start_method or os.getenv("POLICY_POOL_START_METHOD", "spawn"))
+
+        self.idle = queue.Queue()
+        self.slots = threading.BoundedSemaphore(max_concurrency or workers)
+        self.stats_lock = threading.Lock()
+        self.latencies = deque(maxlen=1000)
+        self.counters = {"calls": 0, "ok": 0, "errors": 0, "timeouts": 0, "rejected": 0, "fallbacks": 0,
+                         "restarts": 0, "restart_failures": 0, "lost_workers": 0}
+
+        self.workers = workers
+        self.size = workers  # workers alive or being restarted
+        self.restarting = 0
+        started = [self._spawn() for _ in range(workers)]
+        for worker in started:
+            worker.wait_ready(self.start_timeout_s)
+            self.idle.put(worker)
+        logging.info(f"Policy process pool ready with {workers} worker(s) for {download_url}")
+
+    def _spawn(self):
+        return _Worker(self.ctx, self.download_url, self.settings, self.parameters,
+                       self.shm_threshold, self.memory_limit_mb)
+
+    def _replace(self, worker, payload=None):
+        """
+        Kills a stuck worker and starts a replacement in the background. The shared memory
+        of the call it was serving is released only once the worker is dead.
+        """
+        worker.kill()
+        if payload is not None:
+            _release(payload)
+        with self.stats_lock:
+            self.counters["restarts"] += 1
+            self.restarting += 1
+
+        def start():
+            delay = self.restart_backoff_s
+            for attempt in range(1, self.restart_attempts + 1):
+                try:
+                    replacement = self._spawn()
+                    try:
+                        replacement.wait_ready(self.start_timeout_s)
+                    except Exception:
+                        replacement.kill()
+                        raise
+                    with self.stats_lock:
+                        self.restarting -= 1
+                    self.idle.put(replacement)
+                    return
+                except Exception as e:
+                    self._count("restart_failures")
+                    logging.error(f"Failed to restart policy worker (attempt {attempt}/{self.restart_attempts}): {e}")
+                    if attempt < self.restart_attempts:
+                        time.sleep(delay)
+                        delay *= 2
+            with self.stats_lock:
+                self.restarting -= 1
+                self.size -= 1
+                self.counters["lost_workers"] += 1
+                size = self.size
+            logging.error(f"Policy process pool for {self.download_url} degraded to {size}/{self.workers} worker(s)")
+
+        threading.Thread(target=start, daemon=True).start()
+
+    def _count(self, key, latency=None):
+        with self.stats_lock:
+            self.counters[key] += 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def _fallback(self, input_data, reason):
+        self._count("fallbacks")
+        if self.fallback == "passthrough" and isinstance(input_data, dict) and "packet" in input_data:
+            logging.warning(f"Policy call {reason}, passing the packet through unchanged")
+            return {"packet": input_data["packet"]}
+        raise PolicyTimeoutError(f"Policy call {reason}")
+
+    def evaluate(self, input_data):
+        self._count("calls")
+        start = time.monotonic()
+        deadline = start + self.timeout_s
+
+        if self.size == 0:
+            self._count("rejected")
+            return self._fallback(input_data, "found no live policy worker")
+        if not self.slots.acquire(timeout=self.timeout_s):
+            self._count("rejected")
+            return self._fallback(input_data, "rejected by the concurrency limit")
+        try:
+            try:
+                worker = self.idle.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self._count("rejected")
+                return self._fallback(input_data, "found no idle worker before its deadline")
+
+            payload = _encode_dict(input_data, self.shm_threshold)
+            try:
+                worker.conn.send(("eval", payload))
+                answered = worker.conn.poll(max(0.0, deadline - time.monotonic()))
+                if answered:
+                    status, result = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                self._replace(worker, payload)
+                self._count("errors", time.monotonic() - start)
+                return self._fallback(input_data, f"lost its worker process ({e})")
+            if not answered:
+                # outside the try: PolicyTimeoutError is an OSError
+                self._replace(worker, payload)
+                self._count("timeouts", time.monotonic() - start)
+                return self._fallback(input_data, f"exceeded its {self.timeout_s}s deadline")
+
+            self.idle.put(worker)
+            if status != "ok":
+                self._count("errors", time.monotonic() - start)
+                raise RuntimeError(result)
+            self._count("ok", time.monotonic() - start)
+            return _decode_dict(result)
+        finally:
+            self.slots.release()
+
+    def mgmt(self, action, mgmt_data):
+        """
+        Sends a management command to every worker; returns the first worker's response.
+
+        Busy workers are waited for (up to twice timeout_s) and all workers are held until
+        every one has answered, so no call sees a mix of old and new policy state. A worker
+        that times out or fails is replaced like in evaluate; its replacement starts from
+        the policy's initial state.
+        """
+        deadline = time.monotonic() + 2 * self.timeout_s
+        workers = []
+        # size is re-read while waiting: a worker whose restart gives up no longer counts
+        while len(workers) < self.size and time.monotonic() < deadline:
+            try:
+                workers.append(self.idle.get(timeout=max(0.0, min(deadline - time.monotonic(), 0.1))))
+            except queue.Empty:
+                continue
+        if not workers or len(workers) < self.size:
+            for worker in workers:
+                self.idle.put(worker)
+            raise PolicyTimeoutError(f"Management action {action} found {len(workers)}/{self.size} workers "
+                                     f"available within {2 * self.timeout_s}s ({self.restarting} restarting)")
+
+        responses, failure = [], None
+        for worker in workers:
+            try:
+                worker.conn.send(("mgmt", (action, mgmt_data)))
+                if not worker.conn.poll(max(0.0, deadline - time.monotonic())):
+                    raise PolicyTimeoutError(f"Management action {action} timed out")
+                status, result = worker.conn.recv()
+            except (PolicyTimeoutError, EOFError, OSError) as e:
+                # an unread reply would be taken for the next call's result
+                self._replace(worker)
+                failure = failure or e
+                continue
+            self.idle.put(worker)
+            if status != "ok":
+                failure = failure or RuntimeError(result)
+            responses.append(result)
+        if failure is not None:
+            raise failure
+        return responses[0]
+
+    def stats(self):
+        with self.stats_lock:
+            latencies = sorted(self.latencies)
+            stats = dict(self.counters)
+        if latencies:
+            stats["latency_avg_s"] = sum(latencies) / len(latencies)
+            stats["latency_p95_s"] = latencies[int(0.95 * (len(latencies) - 1))]
+        stats["idle_workers"] = self.idle.qsize()
+        stats["workers"] = self.size
+        stats["restarting_workers"] = self.restarting
+        stats["degraded"] = int(self.size < self.workers or self.restarting > 0)
+        return stats
+
+    def close(self):
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.kill()
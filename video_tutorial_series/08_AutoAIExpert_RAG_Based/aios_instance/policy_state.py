@@ -0,0 +1,238 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import redis
+
+logging = logging.getLogger(__name__)
+
+
+class InMemoryStateStore:
+    """
+    Per-process policy state: an LRU of at most max_entries states, each expiring ttl_s
+    after its last write.
+
+    State is a flat dict of fields per key. put merges fields into the stored state, incr
+    atomically adds to one integer field. get returns a shallow copy.
+    """
+
+    def __init__(self, namespace: str = "", max_entries: int = 10000, ttl_s: float = 3600):
+        self.namespace = namespace
+        self.max_entries = int(max_entries)
+        self.ttl_s = float(ttl_s)
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, list]" = OrderedDict()  # key -> [fields, expires_at]
+        self.evictions = 0
+
+    def __reduce__(self):
+        # Worker processes get an empty store with the same configuration
+        return (InMemoryStateStore, (self.namespace, self.max_entries, self.ttl_s))
+
+    def _entry(self, key: str, now: float, create: bool = False):
+        # Called with the lock held
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] <= now:
+            del self.entries[key]
+            entry = None
+        if entry is None and create:
+            entry = self.entries[key] = [{}, 0]
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self._entry(key, time.time())
+            return dict(entry[0]) if entry is not None else None
+
+    def put(self, key: str, fields: Dict[str, Any], ttl_s: float = None):
+        now = time.time()
+        with self.lock:
+            entry = self._entry(key, now, create=True)
+            entry[0].update(fields)
+            entry[1] = now + (ttl_s or self.ttl_s)
+
+    def incr(self, key: str, field: str, amount: int = 1, ttl_s: float = None) -> int:
+        now = time.time()
+        with self.lock:
+            entry = self._entry(key, now, create=True)
+            value = int(entry[0].get(field) or 0) + amount
+            entry[0][field] = value
+            entry[1] = now + (ttl_s or self.ttl_s)
+            return value
+
+    def delete(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def keys(self) -> List[str]:
+        now = time.time()
+        with self.lock:
+            return [key for key, entry in self.entries.items() if entry[1] > now]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def flush(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"backend": "memory", "entries": len(self.entries), "evictions": self.evictions}
+
+
+class RedisStateStore:
+    """
+    Policy state shared by every replica: one Redis hash per key, "<namespace>:<key>",
+    each field JSON-encoded, expiring ttl_s after the last write.
+
+    incr is a HINCRBY, so counters stay exact when several router blocks update the same
+    session. With write_behind_ms > 0, put only buffers the fields; a background thread
+    writes the buffered keys in one pipeline every write_behind_ms (or once batch_size keys
+    are pending). get and incr see this process's buffered writes.
+    """
+
+    def __init__(self, url: str, namespace: str = "", ttl_s: float = 3600,
+                 write_behind_ms: float = 0, batch_size: int = 256):
+        self.url = url
+        self.namespace = namespace
+        self.ttl_s = float(ttl_s)
+        self.write_behind_ms = float(write_behind_ms)
+        self.batch_size = int(batch_size)
+        self.client = redis.Redis.from_url(url)
+
+        self.lock = threading.Lock()
+        self.pending: "OrderedDict[str, list]" = OrderedDict()  # key -> [fields, ttl_s]
+        self.flushes = 0
+        self.wake = threading.Event()
+        if self.write_behind_ms > 0:
+            threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def __reduce__(self):
+        self.flush()
+        return (RedisStateStore, (self.url, self.namespace, self.ttl_s, self.write_behind_ms, self.batch_size))
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}" if self.namespace else key
+
+    def _write(self, pipe, key: str, fields: Dict[str, Any], ttl_s: float):
+        if fields:
+            pipe.hset(self._key(key), mapping={f: json.dumps(v) for f, v in fields.items()})
+        pipe.expire(self._key(key), int(ttl_s or self.ttl_s))
+
+    @staticmethod
+    def _decode(raw: Dict[bytes, bytes]) -> Dict[str, Any]:
+        return {f.decode(): json.loads(v) for f, v in raw.items()}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.hgetall(self._key(key))
+        with self.lock:
+            pending = self.pending.get(key)
+            pending = dict(pending[0]) if pending else None
+        if not raw and pending is None:
+            return None
+        fields = self._decode(raw)
+        if pending:
+            fields.update(pending)
+        return fields
+
+    def put(self, key: str, fields: Dict[str, Any], ttl_s: float = None):
+        if self.write_behind_ms <= 0:
+            pipe = self.client.pipeline(transaction=False)
+            self._write(pipe, key, fields, ttl_s)
+            pipe.execute()
+            return
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry is None:
+                self.pending[key] = [dict(fields), ttl_s]
+            else:
+                entry[0].update(fields)
+                entry[1] = ttl_s
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.wake.set()
+
+    def incr(self, key: str, field: str, amount: int = 1, ttl_s: float = None) -> int:
+        with self.lock:
+            entry = self.pending.pop(key, None)
+        pipe = self.client.pipeline(transaction=False)
+        if entry is not None:
+            # buffered fields first, so they cannot overwrite the counter later
+            self._write(pipe, key, entry[0], entry[1])
+        pipe.hincrby(self._key(key), field, amount)
+        pipe.expire(self._key(key), int(ttl_s or self.ttl_s))
+        return int(pipe.execute()[-2])
+
+    def delete(self, key: str):
+        with self.lock:
+            self.pending.pop(key, None)
+        self.client.delete(self._key(key))
+
+    def keys(self) -> List[str]:
+        self.flush()
+        prefix = f"{self.namespace}:" if self.namespace else ""
+        return [k.decode()[len(prefix):] for k in self.client.scan_iter(match=f"{prefix}*", count=1000)]
+
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+        for key in self.keys():
+            self.client.delete(self._key(key))
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, OrderedDict()
+        if not batch:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for key, (fields, ttl_s) in batch.items():
+            self._write(pipe, key, fields, ttl_s)
+        try:
+            pipe.execute()
+            self.flushes += 1
+        except Exception as e:
+            logging.error(f"[RedisStateStore] write-behind flush of {len(batch)} keys failed: {e}")
+            with self.lock:
+                # keep the newer buffered values on top of the failed batch
+                for key, entry in self.pending.items():
+                    if key in batch:
+                        batch[key][0].update(entry[0])
+                        batch[key][1] = entry[1]
+                    else:
+                        batch[key] = entry
+                self.pending = batch
+
+    def _flush_loop(self):
+        while True:
+            self.wake.wait(self.write_behind_ms / 1000.0)
+            self.wake.clear()
+            self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            pending = len(self.pending)
+        return {"backend": "redis", "pending": pending, "flushes": self.flushes}
+
+
+def create_state_store(config: Dict[str, Any] = None, namespace: str = ""):
+    """
+    Builds the state store handed to policies as settings["state_store"], from the
+    blockInitData "policy_state_store" entry:
+        {"backend": "memory", "max_entries": 10000, "ttl_s": 3600}
+        {"backend": "redis", "url": "redis://...", "ttl_s": 3600, "write_behind_ms": 50, "batch_size": 256}
+    """
+    config = dict(config or {})
+    backend = config.pop("backend", "memory")
+    if backend == "memory":
+        return InMemoryStateStore(namespace=namespace, **config)
+    if backend == "redis":
+        return RedisStateStore(namespace=namespace, **config)
+    raise ValueError(f"Unsupported policy state backend: {backend}")
@@ -0,0 +1,205 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+from .aios_packet_pb2 import AIOSPacket, RoutingTable, RoutingOutput
+
+logging = logging.getLogger(__name__)
+
+
+DEFAULT_PORT = 6379
+DEFAULT_QUEUE_NAME = "EXECUTOR_INPUTS"
+GRAPH_KEY_PREFIX = "routing_graph:"
+
+
+def default_host(block_id: str) -> str:
+    return f"{block_id}-executor-svc.blocks.svc.cluster.local"
+
+
+def _compile_output(output: dict, index: Dict[str, int]) -> RoutingOutput:
+    block_id = output.get("block_id", "")
+    compiled = RoutingOutput()
+    if block_id in index:
+        compiled.block = index[block_id]
+    else:
+        compiled.block_id = block_id
+    host = output.get("host", "localhost")
+    if not block_id or host != default_host(block_id):
+        compiled.host = host
+    port = int(output.get("port", DEFAULT_PORT))
+    if port != DEFAULT_PORT:
+        compiled.port = port
+    queue_name = output.get("queue_name", "OUTPUT")
+    if queue_name != DEFAULT_QUEUE_NAME:
+        compiled.queue_name = queue_name
+    return compiled
+
+
+def compile_routing_table(output_ptr) -> RoutingTable:
+    """
+    Compiles a JSON graph output_ptr ({"is_graph": true, "graph": {<block_id>: {"outputs": [...]},
+    "final": {"outputs": [...]}}}) into a RoutingTable. Fields equal to the defaults are omitted.
+    """
+    config = json.loads(output_ptr) if isinstance(output_ptr, (str, bytes)) else output_ptr
+    if not config.get("is_graph"):
+        raise ValueError("output_ptr is not a graph")
+    graph = config["graph"]
+
+    table = RoutingTable()
+    block_ids = [block_id for block_id in graph if block_id != "final"]
+    index = {block_id: i for i, block_id in enumerate(block_ids)}
+    table.block_ids.extend(block_ids)
+    for block_id in block_ids:
+        node = table.nodes.add()
+        node.outputs.extend(_compile_output(o, index) for o in graph[block_id].get("outputs", []))
+    table.final.extend(_compile_output(o, index) for o in graph.get("final", {}).get("outputs", []))
+    return table
+
+
+def graph_ref_of(table: RoutingTable) -> str:
+    """Content address of a table, so identical graphs share one cache entry."""
+    return hashlib.blake2b(table.SerializeToString(deterministic=True), digest_size=16).hexdigest()
+
+
+def publish_routing_graph(redis_client, table: RoutingTable, ttl_s: int = None) -> str:
+    """Stores a table under its content address (for the vDAG controller); returns the graph_ref."""
+    graph_ref = graph_ref_of(table)
+    redis_client.set(GRAPH_KEY_PREFIX + graph_ref, table.SerializeToString(), ex=ttl_s)
+    return graph_ref
+
+
+def encode_cursor(index: int) -> bytes:
+    """
+    Serialized AIOSPacket holding only routing.cursor. Protobuf merges concatenated messages,
+    so appending it to an already serialized packet sets the cursor without re-serializing.
+    """
+    packet = AIOSPacket()
+    packet.routing.cursor = index
+    return packet.SerializeToString()
+
+
+class RoutingResolver:
+    """
+    Resolves the outputs of a block from the packet's RoutingTable header.
+
+    Tables referenced by graph_ref are immutable and fetched once from the graph cache Redis
+    (ROUTING_GRAPH_REDIS_URL, default: the block's local Redis), then kept in memory.
+    """
+
+    def __init__(self, block_id: str, redis_url: str = None):
+        self.block_id = block_id
+        self.redis_url = redis_url or os.getenv("ROUTING_GRAPH_REDIS_URL", "redis://localhost:6379/0")
+        self.redis_client = None
+        self.lock = threading.Lock()
+        self.tables: Dict[str, Tuple[RoutingTable, Dict[str, int]]] = {}
+        self.cursor_suffixes: Dict[int, bytes] = {}
+        self.compiled: Dict[str, RoutingTable] = {}
+
+    def _graph(self, graph_ref: str) -> Tuple[RoutingTable, Dict[str, int]]:
+        cached = self.tables.get(graph_ref)
+        if cached is not None:
+            return cached
+        with self.lock:
+            if self.redis_client is None:
+                self.redis_client = redis.Redis.from_url(self.redis_url)
+            data = self.redis_client.get(GRAPH_KEY_PREFIX + graph_ref)
+        if data is None:
+            raise KeyError(f"routing graph {graph_ref} not found")
+        table = RoutingTable()
+        table.ParseFromString(data)
+        cached = (table, {block_id: i for i, block_id in enumerate(table.block_ids)})
+        self.tables[graph_ref] = cached
+        return cached
+
+    def compile_packet(self, packet: AIOSPacket, use_graph_ref: bool = False):
+        """
+        Replaces a JSON graph output_ptr with a RoutingTable header, inline or, with
+        use_graph_ref, published to the graph cache and referenced by graph_ref.
+        """
+        compiled = self.compiled.get(packet.output_ptr)
+        if compiled is None:
+            table = compile_routing_table(packet.output_ptr)
+            if use_graph_ref:
+                with self.lock:
+                    if self.redis_client is None:
+                        self.redis_client = redis.Redis.from_url(self.redis_url)
+                    graph_ref = publish_routing_graph(self.redis_client, table)
+                self.tables[graph_ref] = (table, {block_id: i for i, block_id in enumerate(table.block_ids)})
+                compiled = RoutingTable(graph_ref=graph_ref)
+            else:
+                compiled = table
+            if len(self.compiled) >= 1024:
+                self.compiled.clear()
+            self.compiled[packet.output_ptr] = compiled
+        packet.routing.CopyFrom(compiled)
+        packet.output_ptr = ""
+
+    def _table(self, routing: RoutingTable) -> Tuple[RoutingTable, Dict[str, int]]:
+        if routing.graph_ref:
+            return self._graph(routing.graph_ref)
+        return routing, None
+
+    def current_node(self, routing: RoutingTable) -> Optional[int]:
+        if routing.HasField("cursor"):
+            return routing.cursor
+        table, index = self._table(routing)
+        if index is not None:
+            return index.get(self.block_id)
+        try:
+            return list(table.block_ids).index(self.block_id)
+        except ValueError:
+            return None
+
+    def is_final(self, packet: AIOSPacket) -> bool:
+        """True when this block has no outputs of its own, so the packet goes to the final outputs."""
+        routing = packet.routing
+        table, _ = self._table(routing)
+        node = self.current_node(routing)
+        if node is None:
+            return True
+        if node in routing.overrides:
+            return len(routing.overrides[node].outputs) == 0
+        return node >= len(table.nodes) or len(table.nodes[node].outputs) == 0
+
+    def resolve(self, packet: AIOSPacket) -> List[Tuple[dict, Optional[int]]]:
+        """Returns (output, destination node index or None) pairs for this block."""
+        routing = packet.routing
+        table, _ = self._table(routing)
+        node = self.current_node(routing)
+
+        outputs = []
+        if node is not None:
+            if node in routing.overrides:
+                outputs = routing.overrides[node].outputs
+            elif node < len(table.nodes):
+                outputs = table.nodes[node].outputs
+        if len(outputs) == 0:
+            outputs = table.final
+
+        resolved = []
+        for output in outputs:
+            if output.HasField("block"):
+                block_id, destination = table.block_ids[output.block], output.block
+            else:
+                block_id, destination = output.block_id, None
+            resolved.append(({
+                "block_id": block_id,
+                "host": output.host or (default_host(block_id) if block_id else "localhost"),
+                "port": output.port or DEFAULT_PORT,
+                "queue_name": output.queue_name or DEFAULT_QUEUE_NAME,
+            }, destination))
+        return resolved
+
+    def serialize_for(self, base: bytes, destination: Optional[int]) -> bytes:
+        """Packet bytes for one destination: the shared serialization plus its cursor."""
+        if destination is None:
+            return base
+        suffix = self.cursor_suffixes.get(destination)
+        if suffix is None:
+            suffix = self.cursor_suffixes[destination] = encode_cursor(destination)
+        return base + suffix
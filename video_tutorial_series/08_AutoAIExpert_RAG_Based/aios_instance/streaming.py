@@ -0,0 +1,265 @@
+import json
+import time
+import uuid
+import logging
+import threading
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import grpc
+import redis
+
+from .aios_packet_pb2 import AIOSPacket
+from .vdag_service_pb2 import vDAGInferencePacket
+from . import vdag_service_pb2_grpc
+
+logging = logging.getLogger(__name__)
+
+
+STREAM_KEY_PREFIX = "vdag_stream:"
+
+
+def make_stream_ref(hub_url: str, session_id: str, seq_no: int) -> str:
+    return f"{hub_url}#{STREAM_KEY_PREFIX}{session_id}:{seq_no}:{uuid.uuid4().hex[:8]}"
+
+
+def parse_stream_ref(stream_ref: str) -> Tuple[str, str]:
+    hub_url, _, key = stream_ref.partition("#")
+    if not hub_url or not key:
+        raise ValueError(f"malformed stream_ref: {stream_ref}")
+    return hub_url, key
+
+
+class StreamHub:
+    """
+    Partial outputs of streamed requests, one Redis stream per request.
+
+    The final node of a request appends its partial outputs and then its final output; the
+    block holding the client's gRPC call reads them back in order. Streams are capped at
+    maxlen entries, so a producer never waits on a slow client (a client lagging by more
+    than maxlen entries loses the oldest ones, reported as a gap in chunk_no), and expire
+    ttl_s after the last write.
+    """
+
+    def __init__(self, maxlen: int = 4096, ttl_s: float = 300):
+        self.maxlen = int(maxlen)
+        self.ttl_s = int(ttl_s)
+        self.lock = threading.Lock()
+        self.clients: Dict[str, redis.Redis] = {}
+        self.chunks: Dict[str, int] = {}  # stream_ref -> next chunk_no, for streams this process writes
+
+    def client(self, hub_url: str) -> redis.Redis:
+        client = self.clients.get(hub_url)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(hub_url)
+                if client is None:
+                    client = self.clients[hub_url] = redis.Redis.from_url(hub_url)
+        return client
+
+    def publish(self, stream_ref: str, data, final: bool = False):
+        hub_url, key = parse_stream_ref(stream_ref)
+        with self.lock:
+            chunk_no = self.chunks.get(stream_ref, 0)
+            if final:
+                self.chunks.pop(stream_ref, None)
+            else:
+                self.chunks[stream_ref] = chunk_no + 1
+        fields = {
+            "data": data if isinstance(data, (str, bytes)) else json.dumps(data),
+            "chunk_no": chunk_no,
+            "final": int(final),
+        }
+        pipe = self.client(hub_url).pipeline(transaction=False)
+        pipe.xadd(key, fields, maxlen=self.maxlen, approximate=True)
+        pipe.expire(key, self.ttl_s)
+        pipe.execute()
+
+    def read(self, stream_ref: str, last_id: str = "0-0", block_ms: int = 1000,
+             count: int = 256) -> List[Tuple[str, str, int, bool]]:
+        """Entries after last_id as (entry id, data, chunk_no, final), waiting up to block_ms for the first."""
+        hub_url, key = parse_stream_ref(stream_ref)
+        response = self.client(hub_url).xread({key: last_id}, count=count, block=block_ms)
+        entries = []
+        for _, items in response or []:
+            for entry_id, fields in items:
+                entries.append((
+                    entry_id.decode() if isinstance(entry_id, bytes) else entry_id,
+                    fields[b"data"].decode(),
+                    int(fields[b"chunk_no"]),
+                    fields[b"final"] == b"1",
+                ))
+        return entries
+
+    def forget(self, stream_ref: str):
+        with self.lock:
+            self.chunks.pop(stream_ref, None)
+
+    def delete(self, stream_ref: str):
+        hub_url, key = parse_stream_ref(stream_ref)
+        self.client(hub_url).delete(key)
+
+
+class StreamPublisher:
+    """
+    Producer side, in every block: while a packet carrying a stream_ref is processed by the
+    block that is its final node, the partial outputs the block writes for that session
+    (context.write_ws) are also published to the packet's stream, then its final output.
+
+    Several requests of one session can be in flight, so streams are tracked per
+    (session_id, seq_no). A partial without a seq_no (neither passed nor in the data) goes
+    to the session's stream only when that is the only one open.
+    """
+
+    def __init__(self, hub: StreamHub):
+        self.hub = hub
+        self.lock = threading.Lock()
+        self.active: Dict[Tuple[str, int], str] = {}  # (session_id, seq_no) -> stream_ref
+
+    def open(self, packet: AIOSPacket):
+        with self.lock:
+            self.active[(packet.session_id, packet.seq_no)] = packet.stream_ref
+
+    def _stream_of(self, session_id: str, seq_no, data):
+        if seq_no is None and isinstance(data, dict):
+            seq_no = data.get("seq_no")
+        with self.lock:
+            if seq_no is not None:
+                return self.active.get((session_id, int(seq_no)))
+            stream_refs = [ref for (session, _), ref in self.active.items() if session == session_id]
+        if len(stream_refs) > 1:
+            logging.warning(f"[StreamPublisher] partial output for {session_id} without seq_no matches "
+                            f"{len(stream_refs)} open streams, not published")
+            return None
+        return stream_refs[0] if stream_refs else None
+
+    def partial(self, session_id: str, data, seq_no: int = None):
+        stream_ref = self._stream_of(session_id, seq_no, data)
+        if stream_ref is None:
+            return
+        try:
+            self.hub.publish(stream_ref, data)
+        except Exception as e:
+            logging.error(f"[StreamPublisher] publishing a partial output for {session_id} failed: {e}")
+
+    def _remove(self, packet: AIOSPacket):
+        key = (packet.session_id, packet.seq_no)
+        with self.lock:
+            if self.active.get(key) == packet.stream_ref:
+                del self.active[key]
+
+    def finish(self, packet: AIOSPacket):
+        self._remove(packet)
+        try:
+            self.hub.publish(packet.stream_ref, packet.data, final=True)
+        except Exception as e:
+            logging.error(f"[StreamPublisher] publishing the final output for {packet.session_id} failed: {e}")
+
+    def close(self, packet: AIOSPacket):
+        """Stops streaming partials for a packet this block forwards instead of finishing."""
+        self._remove(packet)
+        self.hub.forget(packet.stream_ref)
+
+
+class StreamingInferenceServicer(vdag_service_pb2_grpc.vDAGInferenceServiceServicer):
+    """
+    vDAGInferenceService for a block: each request is submitted as an AIOSPacket with a fresh
+    stream_ref on hub_url, and the response is relayed from that stream.
+
+    infer returns only the final output; infer_stream yields every partial output and then
+    the final one (is_final); infer_bidi answers the requests of one stream one after
+    another, like infer_stream. Responses are read from the hub only as fast as gRPC sends
+    them, so HTTP/2 flow control paces the relay. A request whose final output does not
+    arrive within timeout_s (or the call's own deadline) ends with DEADLINE_EXCEEDED. That
+    deadline and the request's priority class travel with the packet, for the admission
+    control of the blocks on its path.
+    """
+
+    def __init__(self, submit: Callable[[AIOSPacket], None], hub: StreamHub, hub_url: str,
+                 timeout_s: float = 300, poll_ms: int = 1000):
+        self.submit = submit
+        self.hub = hub
+        self.hub_url = hub_url
+        self.timeout_s = timeout_s
+        self.poll_ms = poll_ms
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "chunks": 0, "gaps": 0, "timeouts": 0, "cancelled": 0}
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+    def _start(self, request: vDAGInferencePacket, context) -> str:
+        self._count("requests")
+        packet = AIOSPacket(
+            session_id=request.session_id or str(uuid.uuid4()),
+            seq_no=request.seq_no,
+            data=request.data,
+            ts=request.ts or time.time(),
+            priority=request.priority,
+        )
+        remaining = context.time_remaining()
+        packet.deadline = time.time() + min(self.timeout_s, remaining if remaining is not None else self.timeout_s)
+        for file_info in request.files:
+            packet.files.add(metadata=file_info.metadata, file_data=file_info.file_data)
+        packet.stream_ref = make_stream_ref(self.hub_url, packet.session_id, packet.seq_no)
+        try:
+            self.submit(packet)
+        except Exception as e:
+            context.abort(grpc.StatusCode.UNAVAILABLE, f"request not accepted: {e}")
+        return packet.stream_ref
+
+    def _relay(self, request: vDAGInferencePacket, stream_ref: str, context) -> Iterator[vDAGInferencePacket]:
+        remaining = context.time_remaining()
+        deadline = time.monotonic() + min(self.timeout_s, remaining if remaining is not None else self.timeout_s)
+        last_id, expected = "0-0", 0
+        try:
+            while context.is_active():
+                block_ms = int(max(1, min(self.poll_ms, (deadline - time.monotonic()) * 1000)))
+                for entry_id, data, chunk_no, final in self.hub.read(stream_ref, last_id, block_ms):
+                    last_id = entry_id
+                    if chunk_no > expected:
+                        self._count("gaps")
+                        logging.warning(f"[StreamingInference] {stream_ref}: skipped {chunk_no - expected} trimmed partial outputs")
+                    expected = chunk_no + 1
+                    self._count("chunks")
+                    yield vDAGInferencePacket(session_id=request.session_id, seq_no=request.seq_no, data=data,
+                                              ts=time.time(), is_final=final, chunk_no=chunk_no)
+                    if final:
+                        return
+                if time.monotonic() >= deadline:
+                    self._count("timeouts")
+                    context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, f"no final output within {self.timeout_s}s")
+            self._count("cancelled")
+        finally:
+            try:
+                self.hub.delete(stream_ref)
+            except Exception:
+                pass
+
+    def infer(self, request, context):
+        response = None
+        for response in self._relay(request, self._start(request, context), context):
+            pass
+        return response
+
+    def infer_stream(self, request, context):
+        yield from self._relay(request, self._start(request, context), context)
+
+    def infer_bidi(self, request_iterator, context):
+        for request in request_iterator:
+            yield from self._relay(request, self._start(request, context), context)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counters)
+
+
+def serve_streaming_inference(servicer: StreamingInferenceServicer, port: int, max_workers: int = 32):
+    from concurrent import futures
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
+    vdag_service_pb2_grpc.add_vDAGInferenceServiceServicer_to_server(servicer, server)
+    server.add_insecure_port(f"0.0.0.0:{port}")
+    server.start()
+    logging.info(f"Streaming inference gRPC server started on port {port}")
+    return server
@@ -1,41 +1,173 @@
-import copy
-import json
-from collections import defaultdict
+import time
+import logging
+from collections import OrderedDict, deque
 import threading
 
 
 class Muxer:
-    def __init__(self, N: int):
+    """
+    Fan-in join: collects the N packets of a (session_id, seq_no) group and merges them into one.
+
+    The merge reuses the first packet of the group: its data becomes
+    {"inputs": [<data of each packet, in arrival order>]}, spliced from the packets' JSON
+    strings without parsing them, and the FileInfo entries of the other packets are moved
+    onto it. The group is never deep-copied; the other packets are released after the merge.
+
+    Incomplete groups are bounded. A group older than timeout_s, or the oldest group when
+    there are more than max_groups groups or more than max_pending_bytes bytes pending, is
+    closed according to partial_policy:
+        "drop"   discard the packets received so far
+        "merge"  merge them, with "partial": true and "expected": N in data, and hand the
+                 packet to on_partial(packet)
+    Packets arriving for a group that was already closed are dropped.
+
+    Join wait (first packet to complete group) and group counters are available from stats()
+    and, when metrics is set, reported to it.
+    """
+
+    def __init__(self, N: int, timeout_s: float = None, max_groups: int = 10000, max_pending_bytes: int = None,
+                 partial_policy: str = "drop", on_partial=None, metrics=None):
+        if partial_policy not in ("drop", "merge"):
+            raise ValueError(f"Unsupported partial_policy: {partial_policy}")
         self.N = N
-        self.store = defaultdict(list)
-        self.counts = defaultdict(int)
+        self.timeout_s = timeout_s
+        self.max_groups = max_groups
+        self.max_pending_bytes = max_pending_bytes
+        self.partial_policy = partial_policy
+        self.on_partial = on_partial
+        self.metrics = metrics
+
+        self.lock = threading.Lock()
+        self.store = OrderedDict()  # key -> [packets, first_seen, nbytes], oldest first
+        self.closed = OrderedDict()  # keys of groups closed recently, to drop late packets
+        self.pending_bytes = 0
+        self.join_waits = deque(maxlen=1000)
+        self.counters = {"completed": 0, "partial": 0, "dropped": 0, "late": 0}
+        self.sweeper = None
 
     def process_packet(self, packet):
         if self.N == 1:
             return packet  # No merging needed
 
         key = (packet.session_id, packet.seq_no)
-        self.store[key].append(packet)
-        self.counts[key] += 1
-
-        if self.counts[key] == self.N:
-            merged_packet = self._merge_packets(self.store[key])
-            del self.store[key]
-            del self.counts[key]
-            return merged_packet
-
-        return None
-
-    def _merge_packets(self, packets):
-        merged_data = {"inputs": [json.loads(p.data) for p in packets]}
-        merged_files = [file for p in packets for file in p.files]
-
-        base_packet = copy.deepcopy(packets[0])
-        base_packet.data = merged_data
-        base_packet.files = merged_files
+        now = time.monotonic()
+        with self.lock:
+            if key in self.closed:
+                self.counters["late"] += 1
+                return None
 
+            group = self.store.get(key)
+            if group is None:
+                group = self.store[key] = [[], now, 0]
+                if self.timeout_s and self.sweeper is None:
+                    self.sweeper = threading.Thread(target=self._sweep_loop, daemon=True)
+                    self.sweeper.start()
+            group[0].append(packet)
+            if self.max_pending_bytes:
+                size = packet.ByteSize()
+                group[2] += size
+                self.pending_bytes += size
+
+            complete = None
+            if len(group[0]) >= self.N:
+                complete = self._close(key)
+                self.counters["completed"] += 1
+                self.join_waits.append(now - group[1])
+            evicted = self._evict_over_caps()
+
+        self._emit_partials(evicted)
+        if complete is None:
+            return None
+        if self.metrics is not None:
+            self.metrics.observe_histogram("muxer_join_wait_seconds", now - complete[1])
+            self.metrics.increment_counter("muxer_completed_count")
+        return self._merge_packets(complete[0])
+
+    def _close(self, key):
+        # Called with the lock held
+        group = self.store.pop(key)
+        self.pending_bytes -= group[2]
+        self.closed[key] = None
+        while len(self.closed) > max(self.max_groups, 1024):
+            self.closed.popitem(last=False)
+        return group
+
+    def _evict_over_caps(self):
+        # Called with the lock held
+        evicted = []
+        while self.store and (len(self.store) > self.max_groups or
+                              (self.max_pending_bytes and self.pending_bytes > self.max_pending_bytes)):
+            evicted.append(self._close(next(iter(self.store))))
+        return evicted
+
+    def expire(self, now: float = None):
+        """Closes the groups older than timeout_s; returns the number closed."""
+        if not self.timeout_s:
+            return 0
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self.lock:
+            while self.store:
+                key, group = next(iter(self.store.items()))
+                if now - group[1] < self.timeout_s:
+                    break
+                expired.append(self._close(key))
+        self._emit_partials(expired)
+        return len(expired)
+
+    def _sweep_loop(self):
+        interval = min(max(self.timeout_s / 4.0, 0.01), 1.0)
+        while True:
+            time.sleep(interval)
+            try:
+                self.expire()
+            except Exception as e:
+                logging.error(f"[Muxer] expiring incomplete groups failed: {e}")
+
+    def _emit_partials(self, groups):
+        for packets, first_seen, _ in groups:
+            if self.partial_policy == "merge" and self.on_partial is not None:
+                with self.lock:
+                    self.counters["partial"] += 1
+                if self.metrics is not None:
+                    self.metrics.increment_counter("muxer_partial_count")
+                try:
+                    self.on_partial(self._merge_packets(packets, partial=True))
+                except Exception as e:
+                    logging.error(f"[Muxer] partial merge of {len(packets)}/{self.N} packets failed: {e}")
+            else:
+                with self.lock:
+                    self.counters["dropped"] += 1
+                if self.metrics is not None:
+                    self.metrics.increment_counter("muxer_dropped_count")
+                logging.warning(f"[Muxer] dropped incomplete group of {len(packets)}/{self.N} packets "
+                                f"for session {packets[0].session_id} seq_no {packets[0].seq_no}")
+
+    def _merge_packets(self, packets, partial=False):
+        base_packet = packets[0]
+        inputs = ",".join(p.data or "null" for p in packets)
+        if partial:
+            base_packet.data = f'{{"inputs": [{inputs}], "partial": true, "expected": {self.N}}}'
+        else:
+            base_packet.data = f'{{"inputs": [{inputs}]}}'
+        files = base_packet.files
+        for p in packets[1:]:
+            for file in p.files:
+                # add().CopyFrom is a single buffer copy; extend/append go through a slower merge
+                files.add().CopyFrom(file)
         return base_packet
 
+    def stats(self):
+        with self.lock:
+            waits = sorted(self.join_waits)
+            stats = dict(self.counters)
+            stats["pending_groups"] = len(self.store)
+            stats["pending_bytes"] = self.pending_bytes
+        if waits:
+            stats["join_wait_avg_s"] = sum(waits) / len(waits)
+            stats["join_wait_p95_s"] = waits[int(0.95 * (len(waits) - 1))]
+        return stats
+
 
 class Batcher:
     def __init__(self, N: int):
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List
+from urllib.parse import urlparse
+
+import redis
+import requests
+
+logging = logging.getLogger(__name__)
+
+
+TRACE_STREAM = "aios_traces"
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: bytes, parent_id: bytes = b"", start: float = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8)
+        self.parent_id = parent_id
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.attributes = {}
+        self.error = None
+
+    def to_dict(self, block_id: str, instance_id: str) -> dict:
+        return {
+            "trace_id": self.trace_id.hex(),
+            "span_id": self.span_id.hex(),
+            "parent_id": self.parent_id.hex(),
+            "name": self.name,
+            "block_id": block_id,
+            "instance_id": instance_id,
+            "start": self.start,
+            "end": self.end if self.end is not None else self.start,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class PacketTrace:
+    """
+    Spans of one sampled packet at this block: a "hop" span, child of the sender's hop,
+    with a child per stage. The hop starts when the sender pushed the packet, so its
+    first child is the time spent in this block's queue ("queue_wait").
+    """
+
+    def __init__(self, tracer, trace_id: bytes, parent_id: bytes, sent_at: float, received_at: float):
+        self.tracer = tracer
+        self.hop = Span("hop", trace_id, parent_id, start=min(sent_at or received_at, received_at))
+        self.hop.attributes["block_id"] = tracer.block_id
+        self.spans = [self.hop]
+        if sent_at:
+            self.add("queue_wait", self.hop.start, received_at)
+        now = time.time()
+        if now - received_at > 0.001:
+            # dequeued by listen_for_jobs, then waited for a worker of the job executor
+            self.add("executor_wait", received_at, now)
+
+    def add(self, name: str, start: float, end: float, **attributes) -> Span:
+        span = Span(name, self.hop.trace_id, self.hop.span_id, start=start)
+        span.end = end
+        span.attributes.update(attributes)
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = Span(name, self.hop.trace_id, self.hop.span_id)
+        span.attributes.update(attributes)
+        self.spans.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = str(e)
+            raise
+        finally:
+            span.end = time.time()
+
+    def fail(self, message: str):
+        self.hop.error = str(message)
+
+    def inject(self, packet):
+        """Makes this hop the parent of the packet's next hop; call right before pushing it."""
+        packet.trace.trace_id = self.hop.trace_id
+        packet.trace.parent_span_id = self.hop.span_id
+        packet.trace.sampled = True
+        packet.trace.sent_at = time.time()
+
+    def end(self, **attributes):
+        if self.hop.end is not None:
+            return
+        self.hop.end = time.time()
+        self.hop.attributes.update(attributes)
+        self.tracer.submit(self.spans)
+
+
+class NoopTrace:
+    """Stands in for PacketTrace when the packet is not sampled."""
+
+    def add(self, name, start, end, **attributes):
+        return None
+
+    def span(self, name: str, **attributes):
+        return nullcontext()
+
+    def fail(self, message: str):
+        pass
+
+    def inject(self, packet):
+        pass
+
+    def end(self, **attributes):
+        pass
+
+
+NOOP_TRACE = NoopTrace()
+
+
+class RedisSpanExporter:
+    """Appends spans as JSON to a Redis stream (default "aios_traces"), capped at maxlen entries."""
+
+    def __init__(self, url: str, stream: str = TRACE_STREAM, maxlen: int = 100000):
+        self.url = url
+        self.stream = stream
+        self.maxlen = int(maxlen)
+        self.client = redis.Redis.from_url(url)
+
+    def export(self, spans: List[dict]):
+        pipe = self.client.pipeline(transaction=False)
+        for span in spans:
+            pipe.xadd(self.stream, {"span": json.dumps(span)}, maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+
+
+def otlp_payload(spans: List[dict]) -> dict:
+    """OTLP/JSON ExportTraceServiceRequest for spans, one resource (service.name) per block."""
+    by_block: Dict[str, list] = {}
+    for span in spans:
+        attributes = dict(span["attributes"], instance_id=span["instance_id"])
+        otlp_span = {
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "name": span["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(int(span["start"] * 1e9)),
+            "endTimeUnixNano": str(int(span["end"] * 1e9)),
+            "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in attributes.items()],
+            "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1},
+        }
+        if span["parent_id"]:
+            otlp_span["parentSpanId"] = span["parent_id"]
+        by_block.setdefault(span["block_id"], []).append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": block_id}}]},
+        "scopeSpans": [{"scope": {"name": "aios_instance"}, "spans": block_spans}],
+    } for block_id, block_spans in by_block.items()]}
+
+
+class OTLPSpanExporter:
+    """Posts spans to an OTLP/HTTP collector (JSON encoding), e.g. http://localhost:4318/v1/traces."""
+
+    def __init__(self, endpoint: str = "http://localhost:4318/v1/traces", timeout_s: float = 5):
+        if urlparse(endpoint).path in ("", "/"):
+            endpoint = endpoint.rstrip("/") + "/v1/traces"
+        self.endpoint = endpoint
+        self.timeout_s = timeout_s
+        self.session = requests.Session()
+
+    def export(self, spans: List[dict]):
+        response = self.session.post(self.endpoint, json=otlp_payload(spans), timeout=self.timeout_s)
+        response.raise_for_status()
+
+
+def open_span_exporter(url: str, stream: str = TRACE_STREAM):
+    """An exporter for redis://host:port/db (Redis stream) or http(s)://collector:4318 (OTLP)."""
+    scheme = urlparse(url).scheme
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisSpanExporter(url, stream=stream)
+    if scheme in ("http", "https"):
+        return OTLPSpanExporter(url)
+    raise ValueError(f"Unsupported trace exporter: {url}")
+
+
+class Tracer:
+    """
+    Head-sampled tracing of packets across vDAG hops.
+
+    The first block a packet reaches decides once, with probability sample_rate, whether
+    the request is traced and records the decision in the packet's TraceContext; later
+    hops follow it. Unsampled packets cost one flag; sampled ones record a few spans per
+    hop, which are exported in batches by a background thread. When the export queue is
+    full, spans are dropped and counted instead of delaying jobs.
+    """
+
+    def __init__(self, block_id: str, instance_id: str, exporter, sample_rate: float = 0.01,
+                 max_queue: int = 10000, batch_size: int = 256, linger_ms: float = 500):
+        self.block_id = block_id
+        self.instance_id = instance_id or ""
+        self.exporter = exporter
+        self.sample_rate = float(sample_rate)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = max(1, int(batch_size))
+        self.linger_s = linger_ms / 1000.0
+        self.lock = threading.Lock()
+        self.counters = {"sampled": 0, "unsampled": 0, "spans": 0, "dropped": 0, "exported": 0, "failed": 0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+    def begin(self, packet, received_at: float = None):
+        """PacketTrace for a received packet, or NOOP_TRACE when its request is not sampled."""
+        received_at = received_at or time.time()
+        if packet.HasField("trace"):
+            context = packet.trace
+            if not context.sampled:
+                self._count("unsampled")
+                return NOOP_TRACE
+            self._count("sampled")
+            return PacketTrace(self, context.trace_id, context.parent_span_id, context.sent_at, received_at)
+
+        if random.random() >= self.sample_rate:
+            packet.trace.SetInParent()
+            self._count("unsampled")
+            return NOOP_TRACE
+        self._count("sampled")
+        trace = PacketTrace(self, os.urandom(16), b"", 0.0, received_at)
+        trace.hop.attributes["root"] = True
+        return trace
+
+    def submit(self, spans: List[Span]):
+        for span in spans:
+            try:
+                self.queue.put_nowait(span.to_dict(self.block_id, self.instance_id))
+            except queue.Full:
+                self._count("dropped")
+                continue
+            self._count("spans")
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.linger_s
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self.exporter.export(batch)
+                self._count("exported", len(batch))
+            except Exception as e:
+                self._count("failed", len(batch))
+                logging.error(f"[Tracer] export of {len(batch)} spans failed: {e}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+        stats["pending"] = self.queue.qsize()
+        return stats
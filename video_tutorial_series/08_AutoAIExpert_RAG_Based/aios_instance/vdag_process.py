@@ -6,6 +6,12 @@ import os
 
 from .policy_sandbox import LocalPolicyEvaluator
 from .default_policies import DefaultPostprocessingPolicy, DefaultPreprocessingPolicy
+from .deferred_policies import DeferredPolicyQueue
+from .policy_state import create_state_store
+
+# executionMode of a policy rule in the vDAG node config
+SYNC_MODE = "sync"
+ASYNC_AFTER_EMIT_MODE = "async_after_emit"
 
 
 @dataclass
@@ -143,10 +149,22 @@ class vDAGProcessor:
         self.vdag_data_cache: Dict[str, vDAGObject] = {}
         self.pre_policies_cache: Dict[str, LocalPolicyEvaluator] = {}
         self.post_policies_cache: Dict[str, LocalPolicyEvaluator] = {}
+        self.post_policy_modes: Dict[str, str] = {}
         self.block_id = block_id
         self.block_data = block_data
+        self.deferred_queue: DeferredPolicyQueue = None
         self.logger = logging.getLogger(__name__)
 
+    def _get_deferred_queue(self):
+        if self.deferred_queue is None:
+            init_data = (self.block_data or {}).get("blockInitData", {})
+            self.deferred_queue = DeferredPolicyQueue(
+                max_size=init_data.get("deferred_policy_queue_size", 10000),
+                batch_size=init_data.get("deferred_policy_batch_size", 64),
+                linger_ms=init_data.get("deferred_policy_linger_ms", 10),
+            )
+        return self.deferred_queue
+
     def _get_policy_evaluator(self, vdag_uri, cache, policy_key, default_class):
         try:
             if vdag_uri in cache:
@@ -181,7 +199,19 @@ class vDAGProcessor:
             if not policy_rule_uri:
                 raise Exception("Policy rule URI not specified")
 
+            execution_mode = policy.get("executionMode", SYNC_MODE)
+            if execution_mode not in (SYNC_MODE, ASYNC_AFTER_EMIT_MODE):
+                raise Exception(f"Unsupported executionMode: {execution_mode}")
+            if policy_key == 'postprocessingPolicyRule':
+                self.post_policy_modes[vdag_uri] = execution_mode
+            elif execution_mode != SYNC_MODE:
+                raise Exception(f"executionMode {execution_mode} is only supported for post-processing policies")
+
             parameters = policy.get("parameters", {})
+            init_data = (self.block_data or {}).get("blockInitData", {})
+            # shared by every replica of this node when the backend is external
+            state_store = create_state_store(
+                init_data.get("policy_state_store"), namespace=f"policy_state:{vdag_uri}:{node_label}:{policy_key}")
             settings = {
                 "vdag": vdag.to_dict(),
                 "modelParameters": node.modelParameters,
@@ -192,7 +222,8 @@ class vDAGProcessor:
                 "graph": vdag.compiled_graph_data['t2_graph'],
                 "connections": vdag.compiled_graph_data['t3_graph'],
                 "assignment_info": vdag.assignment_info,
-                "rev_mapping": vdag.compiled_graph_data['rev_mapping']
+                "rev_mapping": vdag.compiled_graph_data['rev_mapping'],
+                "state_store": state_store
             }
 
             evaluator = LocalPolicyEvaluator(
@@ -240,11 +271,58 @@ class vDAGProcessor:
             self.logger.error(f"Error executing pre-process policy for vDAG {vdag_uri}: {e}")
             return packet
 
+    def is_post_process_deferred(self, vdag_uri: str) -> bool:
+        """True when the post-processing policy runs after the output has been emitted."""
+        try:
+            if not self.get_post_processor(vdag_uri):
+                return False
+        except Exception:
+            return False
+        return self.post_policy_modes.get(vdag_uri) == ASYNC_AFTER_EMIT_MODE
+
+    def submit_deferred_post_process_policy_rule(self, vdag_uri: str, request_packet, packet):
+        """
+        Queues the post-processing policy of an already emitted packet. The policy gets the
+        packet plus the request/response pair; its returned packet is ignored.
+        """
+        try:
+            policy_rule = self.get_post_processor(vdag_uri)
+            if not policy_rule:
+                return False
+
+            return self._get_deferred_queue().submit(policy_rule, {
+                "packet": packet,
+                "input_data": {"request": request_packet, "response": packet}
+            })
+
+        except Exception as e:
+            self.logger.error(f"Error deferring post-process policy for vDAG {vdag_uri}: {e}")
+            return False
+
+    def pool_stats(self) -> dict:
+        """Stats of the process pools of every isolated pre/post-processing policy, summed."""
+        totals = {}
+        for cache in (self.pre_policies_cache, self.post_policies_cache):
+            for evaluator in list(cache.values()):
+                stats = evaluator.pool_stats() if evaluator is not None else None
+                for name, value in (stats or {}).items():
+                    if name == "latency_p95_s":
+                        totals[name] = max(totals.get(name, 0.0), value)
+                    elif name != "latency_avg_s":
+                        totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def deferred_stats(self):
+        return self.deferred_queue.stats() if self.deferred_queue is not None else None
+
     def execute_post_process_policy_rule_if_present(self, vdag_uri: str, packet):
         try:
             policy_rule = self.get_post_processor(vdag_uri)
             if not policy_rule:
                 return packet
+            if self.post_policy_modes.get(vdag_uri) == ASYNC_AFTER_EMIT_MODE:
+                # runs later through submit_deferred_post_process_policy_rule
+                return packet
 
             response = policy_rule.execute_policy_rule({
                 "packet": packet
@@ -0,0 +1,137 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+
+from . import vdag_service_pb2 as vdag__service__pb2
+
+
+class vDAGInferenceServiceStub(object):
+    """Define the gRPC service
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.infer = channel.unary_unary(
+                '/vDAGInferenceService/infer',
+                request_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+                response_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
+                )
+        self.infer_stream = channel.unary_stream(
+                '/vDAGInferenceService/infer_stream',
+                request_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+                response_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
+                )
+        self.infer_bidi = channel.stream_stream(
+                '/vDAGInferenceService/infer_bidi',
+                request_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+                response_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
+                )
+
+
+class vDAGInferenceServiceServicer(object):
+    """Define the gRPC service
+    """
+
+    def infer(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def infer_stream(self, request, context):
+        """Partial outputs of the final node as they are produced, ending with the final output
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def infer_bidi(self, request_iterator, context):
+        """Several requests over one stream; each is answered like infer_stream, in order
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_vDAGInferenceServiceServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'infer': grpc.unary_unary_rpc_method_handler(
+                    servicer.infer,
+                    request_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
+                    response_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+            ),
+            'infer_stream': grpc.unary_stream_rpc_method_handler(
+                    servicer.infer_stream,
+                    request_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
+                    response_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+            ),
+            'infer_bidi': grpc.stream_stream_rpc_method_handler(
+                    servicer.infer_bidi,
+                    request_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
+                    response_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'vDAGInferenceService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+
+
+ # This class is part of an EXPERIMENTAL API.
+class vDAGInferenceService(object):
+    """Define the gRPC service
+    """
+
+    @staticmethod
+    def infer(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/vDAGInferenceService/infer',
+            vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+            vdag__service__pb2.vDAGInferencePacket.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def infer_stream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/vDAGInferenceService/infer_stream',
+            vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+            vdag__service__pb2.vDAGInferencePacket.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def infer_bidi(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/vDAGInferenceService/infer_bidi',
+            vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+            vdag__service__pb2.vDAGInferencePacket.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
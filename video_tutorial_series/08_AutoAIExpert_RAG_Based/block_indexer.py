@@ -1,14 +1,20 @@
 import os
 import json
+import uuid
+import hashlib
+import queue
+import threading
 import warnings
 import logging
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import pandas as pd
 import pdfplumber
 import torch
 from tqdm.auto import tqdm
 import weaviate
-import networkx as nx
 from aios_instance import PreProcessResult, OnDataResult, Block
+from embedding_utils import EmbeddingUtils
+from quantized_embedding import dequantize_output
 import numpy as np
 import re
 import spacy
@@ -41,47 +47,6 @@ def unicode_to_ascii(s):
     return ''.join(c for c in unicodedata.normalize('NFD', s)
                    if unicodedata.category(c) != 'Mn')
 
-class EmbeddingUtils:
-    """
-    Generic embedding utility that can use SentenceTransformer or any HuggingFace model.
-    """
-    def __init__(
-        self,
-        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
-        device: str = None,
-        max_length: int = 512,
-    ):
-        self.model_name = model_name
-        if "sentence-transformers" in model_name:
-            from sentence_transformers import SentenceTransformer
-            self.model = SentenceTransformer(model_name, device=(device or "cuda" if torch.cuda.is_available() else "cpu"))
-            self.max_length = max_length
-        elif "openai" in model_name:
-            #model_name should openai/text-embedding-3-large
-            OPENAI_API_KEY="YOUR_API_KEY"
-            if OPENAI_API_KEY == "YOUR_API_KEY":
-                OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-            from llama_index.embeddings.openai import OpenAIEmbedding
-            model_version = model_name.split("/")[-1]  # Extract model name from path
-            self.model = OpenAIEmbedding(model=model_version, \
-                        api_key=OPENAI_API_KEY,
-                        dimensions=max_length)
-            self.max_length = max_length
-
-    def get_pooled_embeddings(self, texts):
-        if "sentence-transformers" in self.model_name:
-            return self.model.encode(texts, show_progress_bar=False, normalize_embeddings=True)
-        elif "openai" in self.model_name:
-            # For OpenAI models, we need to tokenize and get embeddings differently
-            if isinstance(texts, str):
-                texts = [texts]
-            # Use the correct method for OpenAIEmbedding
-            if len(texts) == 1:
-                outputs = [self.model.get_text_embedding(texts[0])]
-            else:
-                outputs = self.model.get_text_embedding_batch(texts)
-            return outputs
-
 def extract_text_from_pdf(pdf_path: str) -> str:
     """
     Extracts text from a PDF using pdfplumber.
@@ -174,7 +139,6 @@ def chunk_text_with_headers(text: str, chunk_size: int, overlap: int = 0):
     """
     lines = text.splitlines()
     header_for_line = get_header_for_lines(text)
-    chunks = []
     step = max(1, chunk_size - overlap)
     for i in range(0, len(lines), step):
         chunk_lines = lines[i:i+chunk_size]
@@ -184,8 +148,7 @@ def chunk_text_with_headers(text: str, chunk_size: int, overlap: int = 0):
         chunk_text = "\n".join(chunk_lines)
         if header:
             chunk_text = f"{header}\n{chunk_text}"
-        chunks.append(chunk_text)
-    return chunks
+        yield chunk_text
 
 def calculate_cosine_similarity(vec1, vec2):
     import numpy as np
@@ -301,6 +264,236 @@ def get_gemini_summary(text, api_key=None, model="models/gemini-1.5-pro-latest",
         print(f"Error occurred in Gemini summary: {e}")
         return "Error occurred while summarizing."
 
+# supported file extensions and their extractors
+EXTRACTORS = {
+    ".pdf": extract_text_from_pdf,
+    ".md": extract_text_from_file,
+    ".txt": extract_text_from_file,
+    ".py": extract_text_from_file,
+    ".js": extract_text_from_file,
+    ".java": extract_text_from_file,
+    ".html": extract_text_from_file,
+    ".css": extract_text_from_file,
+    ".json": extract_text_from_file,
+    ".yml": extract_text_from_file,
+    ".yaml": extract_text_from_file,
+    ".csv": extract_text_from_csv,
+    ".xlsx": extract_text_from_xlsx
+}
+
+def iter_repo_files(repo_dir, extractors):
+    """
+    Yields (file_path, ext) for every file under repo_dir that has an extractor.
+    """
+    for root, dirs, files in os.walk(repo_dir):
+        for fname in files:
+            ext = os.path.splitext(fname)[1].lower()
+            if ext not in extractors:
+                continue
+            if "scalelayout.txt" in fname:
+                continue
+            yield os.path.join(root, fname), ext
+
+def extract_document(file_path: str, ext: str):
+    """
+    Extracts and cleans a single file. Runs inside the extraction process pool,
+    so it only relies on module-level extractors and the module-level spaCy model.
+    """
+    original_text = EXTRACTORS[ext](file_path)
+    cleaned_text = clean_text(original_text, remove_stopwords=False)
+    return file_path, original_text, cleaned_text
+
+def iter_extracted_documents(file_entries, num_workers: int, max_in_flight: int):
+    """
+    Extracts files in a process pool and yields (file_path, original_text, cleaned_text)
+    as soon as each file is done. At most max_in_flight files are pending at once,
+    so extracted text never piles up ahead of the chunking stage.
+    """
+    if num_workers <= 1:
+        for file_path, ext in file_entries:
+            try:
+                yield extract_document(file_path, ext)
+            except Exception as e:
+                logger.error(f"[Extraction Error] {file_path}: {e}")
+        return
+
+    def _drain(futures):
+        for future in futures:
+            file_path = future_paths.pop(future)
+            try:
+                yield future.result()
+            except Exception as e:
+                logger.error(f"[Extraction Error] {file_path}: {e}")
+
+    future_paths = {}
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        pending = set()
+        for file_path, ext in file_entries:
+            future = pool.submit(extract_document, file_path, ext)
+            future_paths[future] = file_path
+            pending.add(future)
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from _drain(done)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield from _drain(done)
+
+def iter_passages(documents, repo_dir: str, chunk_size: int, chunk_overlap: int, include_filename_prefix: bool = True):
+    """
+    Turns extracted documents into passage dicts, one chunk at a time.
+    Cleaned chunks are used for embedding, original chunks (with headers) for LLM context.
+    """
+    for file_path, original_text, cleaned_text in documents:
+        title = os.path.relpath(file_path, repo_dir)
+        cleaned_chunks = chunk_text_split(cleaned_text, chunk_size, chunk_overlap)
+        original_chunks = chunk_text_with_headers(original_text, chunk_size, chunk_overlap)
+        count = 0
+        for idx, (chunk_clean, chunk_orig) in enumerate(zip(cleaned_chunks, original_chunks)):
+            chunk_text = f"[{title}] {chunk_orig}" if include_filename_prefix else chunk_orig
+            count += 1
+            yield {
+                "title": title,
+                "text": chunk_text,           # original for LLM context
+                "cleaned_text": chunk_clean,  # cleaned for embedding
+                "source": title,
+                "chunk_id": idx
+            }
+        logger.info(f"File: {title} - Created {count} chunks with {chunk_overlap} token overlap")
+
+def iter_token_batches(passages, max_batch_tokens: int, max_batch_size: int):
+    """
+    Groups passages into embedding batches bounded by an approximate token budget
+    (whitespace tokens of the cleaned text) and a maximum number of passages.
+    """
+    batch = []
+    batch_tokens = 0
+    for passage in passages:
+        n_tokens = max(1, len(passage["cleaned_text"].split()))
+        if batch and (batch_tokens + n_tokens > max_batch_tokens or len(batch) >= max_batch_size):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(passage)
+        batch_tokens += n_tokens
+    if batch:
+        yield batch
+
+def iter_topk_similar_pairs(embeddings, top_k: int, threshold: float, block_rows: int = 1024):
+    """
+    Yields (i, j, similarity) for the top-K most similar rows of every row whose cosine
+    similarity exceeds threshold. Works on row blocks, so only a block_rows x N slice of
+    the similarity matrix is materialized at a time.
+    """
+    n = embeddings.shape[0]
+    k = min(top_k, n - 1)
+    if k <= 0:
+        return
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normed = embeddings / (norms + 1e-8)
+    for start in range(0, n, block_rows):
+        sims = np.dot(normed[start:start + block_rows], normed.T)  # shape (B, N)
+        rows = np.arange(sims.shape[0])
+        sims[rows, start + rows] = 0  # Remove self-similarity
+        top_k_idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        for r in rows:
+            for j in top_k_idx[r]:
+                sim = sims[r, j]
+                if sim > threshold:
+                    yield start + int(r), int(j), float(sim)
+
+def file_content_hash(file_path: str) -> str:
+    """sha256 of the raw file bytes."""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def chunk_content_hash(passage) -> str:
+    """sha256 of everything that ends up in a node: the context text and the embedded text."""
+    return hashlib.sha256((passage["text"] + "\x00" + passage["cleaned_text"]).encode("utf-8")).hexdigest()
+
+def load_index_manifest(path: str):
+    """
+    Loads the index manifest (per-file and per-chunk content hashes with their node/edge uuids).
+    Returns None if there is no usable manifest.
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not read index manifest {path}: {e}")
+        return None
+
+def save_index_manifest(path: str, manifest):
+    """Writes the manifest atomically, so an interrupted run never leaves a half-written file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+class UploadWorkerPool:
+    """
+    Fixed set of upload threads fed through a bounded queue. submit() blocks while the
+    queue is full, which applies back-pressure to the embedding stage.
+    """
+    def __init__(self, num_workers: int = 4, max_pending: int = 64):
+        self.tasks = queue.Queue(maxsize=max_pending)
+        self.errors = []
+        self.threads = []
+        for _ in range(max(1, num_workers)):
+            t = threading.Thread(target=self._run, daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            try:
+                if task is None:
+                    return
+                fn, args = task
+                fn(*args)
+            except Exception as e:
+                logger.error(f"[Upload Error] {e}")
+                self.errors.append(e)
+            finally:
+                self.tasks.task_done()
+
+    def _raise_if_failed(self):
+        if self.errors:
+            raise self.errors[0]
+
+    def submit(self, fn, *args):
+        self._raise_if_failed()
+        self.tasks.put((fn, args))
+
+    def wait(self):
+        """Blocks until every submitted task has finished."""
+        self.tasks.join()
+        self._raise_if_failed()
+
+    def close(self, raise_errors: bool = True):
+        """Stops the workers once the queue is drained; re-raises the first upload error if raise_errors."""
+        for _ in self.threads:
+            self.tasks.put(None)
+        for t in self.threads:
+            t.join()
+        if raise_errors:
+            self._raise_if_failed()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # An upload error must not replace an exception that is already propagating
+        self.close(raise_errors=exc_type is None)
+        return False
+
 class IndexDocumentsBlock:
     """
     Block to extract text from a local repo (PDFs, MD, PY, TXT), chunk into passages,
@@ -311,13 +504,26 @@ class IndexDocumentsBlock:
         self.context = context
         self.repo_dir = context.block_init_data.get("repo_dir", "./")
         self.passages_json = context.block_init_data.get("passages_json", "data/psgs_w100.jsonl")
+        self.manifest_json = context.block_init_data.get(
+            "manifest_json", os.path.join(os.path.dirname(self.passages_json), "index_manifest.json"))
+        self.incremental_indexing = bool(context.block_init_parameters.get("incremental_indexing", True))
         self.chunk_size = int(context.block_init_parameters.get("chunk_size", 100))
         self.chunk_overlap = int(context.block_init_parameters.get("chunk_overlap", 20))  # Default 20% overlap
         self.max_length = int(context.block_init_parameters.get("max_length", 512))
         self.device = context.block_init_data.get("device", "cuda" if torch.cuda.is_available() else "cpu")
         self.similarity_threshold = float(context.block_init_parameters.get("similarity_threshold", 0.7))
         self.include_filename_prefix = bool(context.block_init_parameters.get("include_filename_prefix", True))
-        
+
+        # Streaming pipeline: extraction processes -> chunk generators -> token-sized
+        # embedding batches -> bounded queue -> upload threads
+        self.extraction_workers = int(context.block_init_parameters.get("extraction_workers", os.cpu_count() or 1))
+        self.max_files_in_flight = int(context.block_init_parameters.get("max_files_in_flight", 2 * self.extraction_workers))
+        self.embed_batch_tokens = int(context.block_init_parameters.get("embed_batch_tokens", 8192))
+        self.embed_batch_size = int(context.block_init_parameters.get("embed_batch_size", 64))
+        self.upload_workers = int(context.block_init_parameters.get("upload_workers", 4))
+        self.upload_queue_size = int(context.block_init_parameters.get("upload_queue_size", 64))
+        self.similarity_top_k = int(context.block_init_parameters.get("similarity_top_k", 50))
+
         # suppress pdfplumber CropBox warnings
         warnings.filterwarnings(
             "ignore",
@@ -325,28 +531,23 @@ class IndexDocumentsBlock:
         )
 
         # Embedding util, can swap the model name easily
+        # Embeddings are cached on disk per (model, text hash), shared with the retriever
+        self.embedding_cache_dir = context.block_init_data.get(
+            "embedding_cache_dir", os.path.join(os.path.dirname(self.passages_json), "embedding_cache"))
         self.embedder = EmbeddingUtils(
             model_name=context.block_init_data.get("embed_model", "sentence-transformers/all-MiniLM-L6-v2"),
             device=self.device,
             max_length=self.max_length,
+            cache_dir=self.embedding_cache_dir,
+            cache_dtype=context.block_init_data.get("embedding_cache_dtype", "float32"),
+            backend=context.block_init_data.get("embed_backend", "torch"),
+            intra_op_threads=context.block_init_data.get("embed_threads"),
+            output_dtype=context.block_init_data.get("embed_output_dtype", "float32"),
+            onnx_path=context.block_init_data.get("embed_onnx_path"),
         )
 
         # supported file extensions and their extractors
-        self.extractors = {
-            ".pdf": extract_text_from_pdf,
-            ".md": extract_text_from_file,
-            ".txt": extract_text_from_file,
-            ".py": extract_text_from_file,
-            ".js": extract_text_from_file,
-            ".java": extract_text_from_file,
-            ".html": extract_text_from_file,
-            ".css": extract_text_from_file,
-            ".json": extract_text_from_file,
-            ".yml": extract_text_from_file,
-            ".yaml": extract_text_from_file,
-            ".csv": extract_text_from_csv,
-            ".xlsx": extract_text_from_xlsx
-        }
+        self.extractors = EXTRACTORS
 
         # Weaviate client
         self.client_type = context.block_init_data.get("client_type", "weaviate")
@@ -403,242 +604,410 @@ class IndexDocumentsBlock:
         if self.edge_class not in [c["class"] for c in schema["classes"]]:
             self.client.schema.create_class(edge_schema)
 
+    def _create_node(self, node_uuid, passage, vector):
+        """Stores one passage as a PassageNode (runs on an upload worker)."""
+        self.client.data_object.create(
+            data_object={
+                "title": passage["title"],
+                "text": passage["text"],  # original for LLM context
+                "source": passage["source"],
+                "chunk_id": passage["chunk_id"]
+            },
+            class_name=self.node_class,
+            uuid=node_uuid,
+            vector=vector
+        )
+
+    def _create_edge(self, from_uuid, to_uuid, weight, edge_type, edge_uuid=None):
+        """Stores one PassageEdge and its from/to references (runs on an upload worker)."""
+        edge_uuid = self.client.data_object.create(
+            data_object={
+                "weight": float(weight),
+                "edge_type": edge_type
+            },
+            class_name=self.edge_class,
+            uuid=edge_uuid
+        )
+        self.client.data_object.reference.add(
+            from_class_name=self.edge_class,
+            from_uuid=edge_uuid,
+            from_property_name="from_node",
+            to_class_name=self.node_class,
+            to_uuid=from_uuid
+        )
+        self.client.data_object.reference.add(
+            from_class_name=self.edge_class,
+            from_uuid=edge_uuid,
+            from_property_name="to_node",
+            to_class_name=self.node_class,
+            to_uuid=to_uuid
+        )
+
+    def _update_chunk_id(self, node_uuid, chunk_id):
+        """Keeps chunk_id in sync for unchanged chunks that moved inside their file."""
+        self.client.data_object.update(
+            data_object={"chunk_id": chunk_id},
+            class_name=self.node_class,
+            uuid=node_uuid
+        )
+
+    def _delete_node(self, node_uuid):
+        """Deletes a PassageNode together with every edge that references it."""
+        self.client.batch.delete_objects(
+            class_name=self.edge_class,
+            where={
+                "operator": "Or",
+                "operands": [
+                    {"path": ["from_node", self.node_class, "id"], "operator": "Equal", "valueString": node_uuid},
+                    {"path": ["to_node", self.node_class, "id"], "operator": "Equal", "valueString": node_uuid}
+                ]
+            }
+        )
+        self.client.data_object.delete(uuid=node_uuid, class_name=self.node_class)
+
+    def _delete_edge(self, edge_uuid):
+        self.client.data_object.delete(uuid=edge_uuid, class_name=self.edge_class)
+
     def on_preprocess(self, packet):
         return True, [PreProcessResult(packet=packet, extra_data={}, session_id=packet.session_id)]
 
     def on_data(self, pre: PreProcessResult,is_ws=False):
         try:
             if self.client_type == "weaviate":
-                # 1) Walk repo and extract text
-                passages = []
-                for root, dirs, files in os.walk(self.repo_dir):
-                    for fname in files:
-                        ext = os.path.splitext(fname)[1].lower()
-                        if ext not in self.extractors:
-                            continue
-                        if "scalelayout.txt" in fname:
-                            continue
-                        file_path = os.path.join(root, fname)
-                        original_text = self.extractors[ext](file_path)
-                        cleaned_text = clean_text(original_text, remove_stopwords=False)
-                        title = os.path.relpath(file_path, self.repo_dir)
-                        source = title  # Store source file path
-                        # Create chunks with specified overlap (use cleaned for embedding, original for context)
-                        # cleaned_chunks = list(chunk_text_split(cleaned_text, self.chunk_size, self.chunk_overlap))
-                        # original_chunks = list(chunk_text_split(original_text, self.chunk_size, self.chunk_overlap))
-                        cleaned_chunks = list(chunk_text_split(cleaned_text, self.chunk_size, self.chunk_overlap))
-                        original_chunks = list(chunk_text_with_headers(original_text, self.chunk_size, self.chunk_overlap))
-                        logger.info(f"File: {title} - Created {len(cleaned_chunks)} chunks with {self.chunk_overlap} token overlap")
-                        for idx, (chunk_clean, chunk_orig) in enumerate(zip(cleaned_chunks, original_chunks)):
-                            chunk_text = chunk_orig
-                            if self.include_filename_prefix:
-                                chunk_text = f"[{title}] {chunk_orig}"
-                            passages.append({
-                                "title": title,
-                                "text": chunk_text,           # original for LLM context
-                                "cleaned_text": chunk_clean,  # cleaned for embedding
-                                "source": source,
-                                "chunk_id": idx
-                            })
-                # 2) Serialize passages
-                os.makedirs(os.path.dirname(self.passages_json), exist_ok=True)
-                with open(self.passages_json, "w", encoding="utf-8") as out:
-                    for p in passages:
-                        out.write(json.dumps(p, ensure_ascii=False) + "\n")
-                # 3) Embed passages and build node records
-                embeddings = []
-                node_uuids = []
-                batch_size = 32
-                chunks_by_source = {}
-                for i in tqdm(range(0, len(passages), batch_size), desc="Embedding & pushing to Weaviate"):
-                    batch_passages = passages[i : i + batch_size]
-                    batch_texts = [p["cleaned_text"] for p in batch_passages]  # use cleaned for embedding
-                    embs = self.embedder.get_pooled_embeddings(batch_texts)
-                    embeddings.extend(embs)
-                    for j, passage in enumerate(batch_passages):
-                        uuid = self.client.data_object.create(
-                            data_object={
-                                "title": passage["title"],
-                                "text": passage["text"],  # original for LLM context
-                                "source": passage["source"],
-                                "chunk_id": passage["chunk_id"]
-                            },
-                            class_name=self.node_class,
-                            vector=embs[j]
-                        )
-                        node_uuids.append(uuid)
-                        source = passage["source"]
-                        if source not in chunks_by_source:
-                            chunks_by_source[source] = []
-                        chunks_by_source[source].append({
-                            "uuid": uuid,
-                            "chunk_id": passage["chunk_id"]
-                        })
-                # 4) Build graph - both similarity-based and sequential connections
-                G = nx.Graph()
-                for i, node_id in enumerate(node_uuids):
-                    G.add_node(node_id, passage=passages[i], embedding=embeddings[i])
-
-                # 5) Add edges based on similarity threshold (Graph RAG)
-                similarity_edges = 0
-                sequential_edges = 0
-                
-                # First, create sequential edges between adjacent chunks from same source
-                for source, chunks in chunks_by_source.items():
-                    # Sort chunks by chunk_id
-                    sorted_chunks = sorted(chunks, key=lambda x: x["chunk_id"])
-                    
-                    # Connect sequential chunks
-                    for i in range(len(sorted_chunks) - 1):
-                        from_uuid = sorted_chunks[i]["uuid"]
-                        to_uuid = sorted_chunks[i + 1]["uuid"]
-                        
-                        # Create edge with type "sequential"
-                        edge_uuid = self.client.data_object.create(
-                            data_object={
-                                "weight": 1.0,  # Maximum weight for sequential connections
-                                "edge_type": "sequential"
-                            },
-                            class_name=self.edge_class
-                        )
-                        
-                        # Add the from_node and to_node references
-                        self.client.data_object.reference.add(
-                            from_class_name=self.edge_class,
-                            from_uuid=edge_uuid,
-                            from_property_name="from_node",
-                            to_class_name=self.node_class,
-                            to_uuid=from_uuid
-                        )
-                        self.client.data_object.reference.add(
-                            from_class_name=self.edge_class,
-                            from_uuid=edge_uuid,
-                            from_property_name="to_node",
-                            to_class_name=self.node_class,
-                            to_uuid=to_uuid
-                        )
-                        
-                        G.add_edge(from_uuid, to_uuid, weight=1.0, edge_type="sequential")
-                        sequential_edges += 1
-
-                # --- SPEEDUP: Vectorized similarity computation and top-K neighbors ---
-                # Convert embeddings to numpy array
-                embeddings_np = np.stack(embeddings)  # shape (N, D)
-                norms = np.linalg.norm(embeddings_np, axis=1, keepdims=True)
-                normed = embeddings_np / (norms + 1e-8)
-                similarity_matrix = np.dot(normed, normed.T)  # shape (N, N)
-                np.fill_diagonal(similarity_matrix, 0)  # Remove self-similarity
-
-                K = 50  # Number of top neighbors to connect per node (tune as needed)
-                for i in tqdm(range(len(node_uuids)), desc="Building similarity graph edges (top-K)"):
-                    # Get indices of top-K most similar nodes
-                    top_k_idx = np.argpartition(-similarity_matrix[i], K)[:K]
-                    for j in top_k_idx:
-                        # Skip if already connected sequentially
-                        if G.has_edge(node_uuids[i], node_uuids[j]):
-                            continue
-                        sim = similarity_matrix[i, j]
-                        if sim > self.similarity_threshold:
-                            # Create the edge object with weight and type
-                            edge_uuid = self.client.data_object.create(
-                                data_object={
-                                    "weight": float(sim),
-                                    "edge_type": "similarity"
-                                },
-                                class_name=self.edge_class
-                            )
-                            # Add the from_node and to_node references
-                            self.client.data_object.reference.add(
-                                from_class_name=self.edge_class,
-                                from_uuid=edge_uuid,
-                                from_property_name="from_node",
-                                to_class_name=self.node_class,
-                                to_uuid=node_uuids[i]
-                            )
-                            self.client.data_object.reference.add(
-                                from_class_name=self.edge_class,
-                                from_uuid=edge_uuid,
-                                from_property_name="to_node",
-                                to_class_name=self.node_class,
-                                to_uuid=node_uuids[j]
-                            )
-                            G.add_edge(node_uuids[i], node_uuids[j], weight=float(sim), edge_type="similarity")
-                            similarity_edges += 1
-
-                # # --- Multi-vector (document-level summary) embedding addition ---
-                # # This block is optional and can be commented out if not needed
-                # try:
-                #     for root, dirs, files in os.walk(self.repo_dir):
-                #         for fname in files:
-                #             ext = os.path.splitext(fname)[1].lower()
-                #             if ext not in self.extractors:
-                #                 continue
-                #             if "scalelayout.txt" in fname:
-                #                 continue
-                #             file_path = os.path.join(root, fname)
-                #             # Check if summary file exists in /summary directory
-                #             summary_dir = os.path.join(self.repo_dir, "../summary")
-                #             os.makedirs(summary_dir, exist_ok=True)
-                #             summary_file = os.path.join(summary_dir, os.path.splitext(os.path.relpath(file_path, self.repo_dir))[0] + ".txt")
-                #             summary = None
-                #             if os.path.isfile(summary_file):
-                #                 try:
-                #                     with open(summary_file, "r", encoding="utf-8") as sf:
-                #                         summary = sf.read().strip()
-                #                     print(f"Loaded summary from {summary_file}")
-                #                 except Exception as e:
-                #                     logger.warning(f"Failed to read summary file {summary_file}: {e}")
-                #                     summary = None
-                #             original_text = self.extractors[ext](file_path)
-                #             print(f"Processing file for multi-vector summary: {file_path}")
-                #             # Use OpenAI API to get a summary for the document
-                #             try:
-                #                 if not summary:
-                #                     #summary = get_openai_summary(original_text,model="gpt-4")
-                #                     summary = get_gemini_summary(original_text)
-                #                     print(f"Generated summary for {file_path}: {summary[:300]}...")  # Log first 300 chars
-                #                     if summary == "Error occurred while summarizing.":
-                #                         raise ValueError("OpenAI summary is empty or None")
-                #                     # Save summary to file
-                #                     os.makedirs(os.path.dirname(summary_file), exist_ok=True)
-                #                     with open(summary_file, "w", encoding="utf-8") as sf:
-                #                         sf.write(summary)
-                #             except Exception as e:
-                #                 logger.warning(f"OpenAI summarization failed, using fallback: {e}")
-                #                 summary = "\n".join(original_text.splitlines()[:3])
-                #             summary_embedding = self.embedder.get_pooled_embeddings([summary])[0]
-                #             # Store the summary as a special passage (chunk_id = -1)
-                #             passages.append({
-                #                 "title": os.path.relpath(file_path, self.repo_dir),
-                #                 "text": f"[SUMMARY] {original_text}",
-                #                 "cleaned_text": clean_text(summary, remove_stopwords=False),
-                #                 "source": os.path.relpath(file_path, self.repo_dir),
-                #                 "chunk_id": -1
-                #             })
-                #             # Optionally, push the summary embedding to Weaviate as a node
-                #             self.client.data_object.create(
-                #                 data_object={
-                #                     "title": os.path.relpath(file_path, self.repo_dir),
-                #                     "summary": f"[SUMMARY] {summary}",
-                #                     "text": f"[SUMMARY] {original_text}",
-                #                     "source": os.path.relpath(file_path, self.repo_dir),
-                #                     "chunk_id": -1
-                #                 },
-                #                 class_name=self.node_class,
-                #                 vector=summary_embedding
-                #             )
-                # except Exception as e:
-                #     logger.warning(f"[Multi-vector summary addition] {e}")
-                # # # --- End multi-vector addition ---
-
-                msg = f"Indexed {len(node_uuids)} passages with {self.chunk_overlap} token overlap.\n"
-                msg += f"Built graph with {sequential_edges} sequential edges and {similarity_edges} similarity edges."
+                try:
+                    request = json.loads(pre.packet.data) if pre.packet.data else {}
+                except json.JSONDecodeError:
+                    # The payload is only a trigger; options are optional
+                    logger.info("Indexing request data is not JSON, using default options")
+                    request = {}
+                full_rebuild = bool(request.get("full_rebuild", False)) if isinstance(request, dict) else False
+
+                manifest = load_index_manifest(self.manifest_json)
+                if self.incremental_indexing and not full_rebuild and manifest is not None \
+                        and manifest.get("config") == self._index_config():
+                    msg = self._index_incremental(manifest)
+                else:
+                    if manifest is not None:
+                        # Existing nodes were built with another configuration (or a rebuild was requested)
+                        logger.info("Index configuration changed or full rebuild requested, resetting Weaviate")
+                        self.reset_weaviate()
+                    msg = self._index_full()
                 logger.info(msg)
                 return True, OnDataResult(output={"message": msg})
         except Exception as e:
             logger.error(f"[Indexing Error] {e}", exc_info=True)
             return False, str(e)
 
+    def _index_config(self):
+        """Settings that change chunk boundaries or vectors; any change forces a full rebuild."""
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "include_filename_prefix": self.include_filename_prefix,
+            "embed_model": self.embedder.model_name,
+            "embed_backend": self.embedder.backend,
+        }
+
+    def _scan_repo(self):
+        """
+        Returns {source: (file_path, ext, file_hash)} for every indexable file in the repo.
+        """
+        files = {}
+        for file_path, ext in iter_repo_files(self.repo_dir, self.extractors):
+            source = os.path.relpath(file_path, self.repo_dir)
+            files[source] = (file_path, ext, file_content_hash(file_path))
+        return files
+
+    def _iter_source_passages(self, entries):
+        """Extract + chunk the given (file_path, ext) entries through the streaming pipeline."""
+        documents = iter_extracted_documents(
+            entries,
+            num_workers=self.extraction_workers,
+            max_in_flight=self.max_files_in_flight,
+        )
+        for passage in iter_passages(
+            documents, self.repo_dir, self.chunk_size, self.chunk_overlap, self.include_filename_prefix
+        ):
+            passage["chunk_hash"] = chunk_content_hash(passage)
+            yield passage
+
+    def _embed_batches(self, passages):
+        """Yields (batch_passages, float32 embeddings) for token-sized batches of passages."""
+        batches = iter_token_batches(passages, self.embed_batch_tokens, self.embed_batch_size)
+        for batch_passages in tqdm(batches, desc="Embedding & pushing to Weaviate"):
+            batch_texts = [p["cleaned_text"] for p in batch_passages]  # use cleaned for embedding
+            embs = dequantize_output(self.embedder.get_pooled_embeddings(batch_texts))
+            yield batch_passages, embs
+
+    def _index_full(self):
+        files = self._scan_repo()
+        manifest = {"config": self._index_config(), "files": {
+            source: {"file_hash": file_hash, "chunks": [], "sequential_edges": []}
+            for source, (_, _, file_hash) in files.items()
+        }}
+
+        # 1) Extract files in a process pool and chunk them lazily
+        passages = self._iter_source_passages((path, ext) for path, ext, _ in files.values())
+
+        # 2) Serialize passages, embed token-sized batches and hand node uploads to the upload workers
+        os.makedirs(os.path.dirname(self.passages_json), exist_ok=True)
+        embedding_batches = []
+        node_uuids = []
+        chunks_by_source = {}
+        sequential_edges = 0
+        similarity_edges = 0
+        with UploadWorkerPool(self.upload_workers, self.upload_queue_size) as uploader:
+            with open(self.passages_json, "w", encoding="utf-8") as out:
+                for batch_passages, embs in self._embed_batches(passages):
+                    embedding_batches.append(embs)
+                    for j, passage in enumerate(batch_passages):
+                        out.write(json.dumps(passage, ensure_ascii=False) + "\n")
+                        node_uuid = str(uuid.uuid4())
+                        chunks_by_source.setdefault(passage["source"], []).append((passage["chunk_id"], len(node_uuids)))
+                        manifest["files"][passage["source"]]["chunks"].append(
+                            {"chunk_id": passage["chunk_id"], "hash": passage["chunk_hash"], "uuid": node_uuid}
+                        )
+                        node_uuids.append(node_uuid)
+                        uploader.submit(self._create_node, node_uuid, passage, embs[j])
+
+            # Edges reference nodes, so every node has to be stored first
+            uploader.wait()
+            connected = set()
+
+            # 3) Sequential edges between adjacent chunks from same source
+            for source, chunks in chunks_by_source.items():
+                sorted_chunks = sorted(chunks)
+                for (_, a), (_, b) in zip(sorted_chunks, sorted_chunks[1:]):
+                    connected.add((min(a, b), max(a, b)))
+                    edge_uuid = str(uuid.uuid4())
+                    manifest["files"][source]["sequential_edges"].append([node_uuids[a], node_uuids[b], edge_uuid])
+                    uploader.submit(self._create_edge, node_uuids[a], node_uuids[b], 1.0, "sequential", edge_uuid)
+                    sequential_edges += 1
+
+            # 4) Similarity edges (Graph RAG), top-K neighbors computed block by block
+            if embedding_batches:
+                embeddings_np = np.concatenate(embedding_batches)  # shape (N, D)
+                embedding_batches.clear()
+                pairs = iter_topk_similar_pairs(embeddings_np, self.similarity_top_k, self.similarity_threshold)
+                for i, j, sim in tqdm(pairs, desc="Building similarity graph edges (top-K)"):
+                    key = (min(i, j), max(i, j))
+                    # Skip if already connected sequentially or in the other direction
+                    if key in connected:
+                        continue
+                    connected.add(key)
+                    uploader.submit(self._create_edge, node_uuids[i], node_uuids[j], sim, "similarity")
+                    similarity_edges += 1
+
+        # # --- Multi-vector (document-level summary) embedding addition ---
+        # # This block is optional and can be commented out if not needed
+        # try:
+        #     for root, dirs, files in os.walk(self.repo_dir):
+        #         for fname in files:
+        #             ext = os.path.splitext(fname)[1].lower()
+        #             if ext not in self.extractors:
+        #                 continue
+        #             if "scalelayout.txt" in fname:
+        #                 continue
+        #             file_path = os.path.join(root, fname)
+        #             # Check if summary file exists in /summary directory
+        #             summary_dir = os.path.join(self.repo_dir, "../summary")
+        #             os.makedirs(summary_dir, exist_ok=True)
+        #             summary_file = os.path.join(summary_dir, os.path.splitext(os.path.relpath(file_path, self.repo_dir))[0] + ".txt")
+        #             summary = None
+        #             if os.path.isfile(summary_file):
+        #                 try:
+        #                     with open(summary_file, "r", encoding="utf-8") as sf:
+        #                         summary = sf.read().strip()
+        #                     print(f"Loaded summary from {summary_file}")
+        #                 except Exception as e:
+        #                     logger.warning(f"Failed to read summary file {summary_file}: {e}")
+        #                     summary = None
+        #             original_text = self.extractors[ext](file_path)
+        #             print(f"Processing file for multi-vector summary: {file_path}")
+        #             # Use OpenAI API to get a summary for the document
+        #             try:
+        #                 if not summary:
+        #                     #summary = get_openai_summary(original_text,model="gpt-4")
+        #                     summary = get_gemini_summary(original_text)
+        #                     print(f"Generated summary for {file_path}: {summary[:300]}...")  # Log first 300 chars
+        #                     if summary == "Error occurred while summarizing.":
+        #                         raise ValueError("OpenAI summary is empty or None")
+        #                     # Save summary to file
+        #                     os.makedirs(os.path.dirname(summary_file), exist_ok=True)
+        #                     with open(summary_file, "w", encoding="utf-8") as sf:
+        #                         sf.write(summary)
+        #             except Exception as e:
+        #                 logger.warning(f"OpenAI summarization failed, using fallback: {e}")
+        #                 summary = "\n".join(original_text.splitlines()[:3])
+        #             summary_embedding = self.embedder.get_pooled_embeddings([summary])[0]
+        #             # Store the summary as a special passage (chunk_id = -1)
+        #             passages.append({
+        #                 "title": os.path.relpath(file_path, self.repo_dir),
+        #                 "text": f"[SUMMARY] {original_text}",
+        #                 "cleaned_text": clean_text(summary, remove_stopwords=False),
+        #                 "source": os.path.relpath(file_path, self.repo_dir),
+        #                 "chunk_id": -1
+        #             })
+        #             # Optionally, push the summary embedding to Weaviate as a node
+        #             self.client.data_object.create(
+        #                 data_object={
+        #                     "title": os.path.relpath(file_path, self.repo_dir),
+        #                     "summary": f"[SUMMARY] {summary}",
+        #                     "text": f"[SUMMARY] {original_text}",
+        #                     "source": os.path.relpath(file_path, self.repo_dir),
+        #                     "chunk_id": -1
+        #                 },
+        #                 class_name=self.node_class,
+        #                 vector=summary_embedding
+        #             )
+        # except Exception as e:
+        #     logger.warning(f"[Multi-vector summary addition] {e}")
+        # # # --- End multi-vector addition ---
+
+        for entry in manifest["files"].values():
+            entry["chunks"].sort(key=lambda c: c["chunk_id"])
+        save_index_manifest(self.manifest_json, manifest)
+
+        msg = f"Indexed {len(node_uuids)} passages with {self.chunk_overlap} token overlap.\n"
+        msg += f"Built graph with {sequential_edges} sequential edges and {similarity_edges} similarity edges."
+        return msg
+
+    def _index_incremental(self, manifest):
+        """
+        Re-indexes only what changed since the manifest was written: unchanged files are skipped
+        by file hash, unchanged chunks of changed files are kept by chunk hash, removed chunks are
+        deleted together with their edges and similarity edges are computed only for new chunks.
+        """
+        files = self._scan_repo()
+        old_files = manifest["files"]
+        changed = {source: entry for source, entry in files.items()
+                   if old_files.get(source, {}).get("file_hash") != entry[2]}
+        removed_sources = [source for source in old_files if source not in files]
+        if not changed and not removed_sources:
+            return f"Index is up to date ({len(files)} files unchanged)."
+
+        new_files = {source: {"file_hash": file_hash, "chunks": [], "sequential_edges": []}
+                     for source, (_, _, file_hash) in changed.items()}
+        # chunk hash -> old chunk records of the changed files, used to keep existing nodes
+        reusable = {}
+        for source in changed:
+            for chunk in old_files.get(source, {}).get("chunks", []):
+                reusable.setdefault((source, chunk["hash"]), []).append(chunk)
+        kept_uuids = set()
+        new_nodes = []  # (uuid, vector) of chunks that were embedded in this run
+        new_passages = []
+        stats = {"reused": 0, "removed": 0, "sequential": 0, "similarity": 0}
+
+        def _split_new(passages):
+            # Records reused chunks and passes only new/changed chunks on to embedding
+            for passage in passages:
+                new_passages.append(passage)
+                records = reusable.get((passage["source"], passage["chunk_hash"]))
+                if records:
+                    old = records.pop(0)
+                    kept_uuids.add(old["uuid"])
+                    new_files[passage["source"]]["chunks"].append(
+                        {"chunk_id": passage["chunk_id"], "hash": passage["chunk_hash"], "uuid": old["uuid"]}
+                    )
+                    if old["chunk_id"] != passage["chunk_id"]:
+                        uploader.submit(self._update_chunk_id, old["uuid"], passage["chunk_id"])
+                    stats["reused"] += 1
+                    continue
+                yield passage
+
+        with UploadWorkerPool(self.upload_workers, self.upload_queue_size) as uploader:
+            # 1) Embed and upload only new or changed chunks
+            passages = self._iter_source_passages((path, ext) for path, ext, _ in changed.values())
+            for batch_passages, embs in self._embed_batches(_split_new(passages)):
+                for j, passage in enumerate(batch_passages):
+                    node_uuid = str(uuid.uuid4())
+                    new_files[passage["source"]]["chunks"].append(
+                        {"chunk_id": passage["chunk_id"], "hash": passage["chunk_hash"], "uuid": node_uuid}
+                    )
+                    new_nodes.append((node_uuid, embs[j]))
+                    uploader.submit(self._create_node, node_uuid, passage, embs[j])
+            uploader.wait()
+
+            # 2) Delete nodes (and all their edges) of removed chunks and removed files
+            removed_uuids = [chunk["uuid"] for source in removed_sources for chunk in old_files[source]["chunks"]]
+            removed_uuids += [chunk["uuid"] for source in changed for chunk in old_files.get(source, {}).get("chunks", [])
+                              if chunk["uuid"] not in kept_uuids]
+            for node_uuid in removed_uuids:
+                uploader.submit(self._delete_node, node_uuid)
+            stats["removed"] = len(removed_uuids)
+
+            # 3) Rebuild sequential edges of changed files, keeping the ones that are still adjacent
+            connected = set()
+            removed_set = set(removed_uuids)
+            for source, entry in new_files.items():
+                entry["chunks"].sort(key=lambda c: c["chunk_id"])
+                old_edges = {(a, b): edge_uuid for a, b, edge_uuid in old_files.get(source, {}).get("sequential_edges", [])}
+                for prev, nxt in zip(entry["chunks"], entry["chunks"][1:]):
+                    pair = (prev["uuid"], nxt["uuid"])
+                    connected.add(frozenset(pair))
+                    edge_uuid = old_edges.pop(pair, None)
+                    if edge_uuid is None:
+                        edge_uuid = str(uuid.uuid4())
+                        uploader.submit(self._create_edge, pair[0], pair[1], 1.0, "sequential", edge_uuid)
+                        stats["sequential"] += 1
+                    entry["sequential_edges"].append([pair[0], pair[1], edge_uuid])
+                for (a, b), edge_uuid in old_edges.items():
+                    # Edges touching removed nodes are already deleted with the node
+                    if a not in removed_set and b not in removed_set:
+                        uploader.submit(self._delete_edge, edge_uuid)
+            uploader.wait()
+
+            # 4) Similarity edges only in the neighbourhood of the new chunks
+            lock = threading.Lock()
+            for node_uuid, vector in new_nodes:
+                uploader.submit(self._link_similar_nodes, node_uuid, vector, connected, lock, stats)
+
+        for source in removed_sources:
+            del old_files[source]
+        old_files.update(new_files)
+        save_index_manifest(self.manifest_json, manifest)
+        self._rewrite_passages_json(set(changed) | set(removed_sources), new_passages)
+
+        msg = f"Incrementally indexed {len(changed)} changed and {len(removed_sources)} removed files: "
+        msg += f"{len(new_nodes)} new passages, {stats['reused']} unchanged passages kept, {stats['removed']} passages removed.\n"
+        msg += f"Added {stats['sequential']} sequential edges and {stats['similarity']} similarity edges."
+        return msg
+
+    def _link_similar_nodes(self, node_uuid, vector, connected, lock, stats):
+        """Connects a new node to its top-K most similar nodes already stored in Weaviate."""
+        resp = self.client.query.get(self.node_class, ["_additional {id certainty}"])\
+            .with_near_vector({"vector": np.asarray(vector).tolist(),
+                               # Weaviate certainty is (1 + cosine) / 2
+                               "certainty": (1 + self.similarity_threshold) / 2})\
+            .with_limit(self.similarity_top_k + 1).do()
+        hits = resp.get("data", {}).get("Get", {}).get(self.node_class) or []
+        for hit in hits:
+            neighbor_uuid = hit.get("_additional", {}).get("id")
+            certainty = hit.get("_additional", {}).get("certainty", 0.0)
+            if not neighbor_uuid or neighbor_uuid == node_uuid:
+                continue
+            key = frozenset((node_uuid, neighbor_uuid))
+            with lock:
+                if key in connected:
+                    continue
+                connected.add(key)
+                stats["similarity"] += 1
+            self._create_edge(node_uuid, neighbor_uuid, 2 * certainty - 1, "similarity")
+
+    def _rewrite_passages_json(self, replaced_sources, new_passages):
+        """Replaces the passages of the given sources in passages_json, streaming the old file."""
+        os.makedirs(os.path.dirname(self.passages_json), exist_ok=True)
+        tmp_path = self.passages_json + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            if os.path.exists(self.passages_json):
+                with open(self.passages_json, "r", encoding="utf-8") as old:
+                    for line in old:
+                        if line.strip() and json.loads(line).get("source") not in replaced_sources:
+                            out.write(line)
+            for passage in new_passages:
+                out.write(json.dumps(passage, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.passages_json)
+
     def on_update(self, params):
         for key in ("repo_dir", "passages_json"):
             if key in params:
@@ -653,6 +1022,12 @@ class IndexDocumentsBlock:
             self.similarity_threshold = float(params["similarity_threshold"])
         if "include_filename_prefix" in params:
             self.include_filename_prefix = bool(params["include_filename_prefix"])
+        if "incremental_indexing" in params:
+            self.incremental_indexing = bool(params["incremental_indexing"])
+        for key in ("extraction_workers", "max_files_in_flight", "embed_batch_tokens", "embed_batch_size",
+                    "upload_workers", "upload_queue_size", "similarity_top_k"):
+            if key in params:
+                setattr(self, key, int(params[key]))
         return True, params
 
     def reset_weaviate(self):
@@ -661,6 +1036,9 @@ class IndexDocumentsBlock:
                 self.client.schema.delete_class(class_name)
             except Exception as e:
                 logger.warning(f"Could not delete {class_name}: {e}")
+        # The manifest describes objects that no longer exist
+        if os.path.exists(self.manifest_json):
+            os.remove(self.manifest_json)
         self._ensure_weaviate_schema()
 
     def health(self):
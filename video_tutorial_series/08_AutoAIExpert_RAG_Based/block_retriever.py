@@ -6,6 +6,9 @@ import weaviate
 import requests
 import time
 from aios_instance import PreProcessResult, OnDataResult, Block
+from embedding_utils import EmbeddingUtils
+from embedding_pool import EmbeddingModelPool
+from quantized_embedding import dequantize_output
 from aios_transformers.library import TransformersUtils
 from transformers import BitsAndBytesConfig
 from sentence_transformers import CrossEncoder
@@ -331,55 +334,6 @@ class GeminiClient:
             logger.error(f"Error occurred in Gemini summary: {e}")
             return "Error occurred while summarizing."
 
-class EmbeddingUtils:
-    """
-    Generic embedding utility that can use SentenceTransformer or any HuggingFace model.
-    """
-    def __init__(
-        self,
-        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
-        device: str = None,
-        max_length: int = 512,
-    ):
-        self.max_length = max_length
-        self._load_model(model_name)
-        
-    def _load_model(self, model_name):
-        self.model_name = model_name
-        if "sentence-transformers" in model_name:
-            from sentence_transformers import SentenceTransformer
-            self.model = SentenceTransformer(model_name, device=(device or "cuda" if torch.cuda.is_available() else "cpu"))
-            #self.max_length = max_length
-        elif "openai" in model_name:
-            #model_name should openai/text-embedding-3-large
-            OPENAI_API_KEY="YOUR_API_KEY"
-            if OPENAI_API_KEY == "YOUR_API_KEY":
-                OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-            from llama_index.embeddings.openai import OpenAIEmbedding
-            model_version = model_name.split("/")[-1]  # Extract model name from path
-            self.model = OpenAIEmbedding(model=model_version, \
-                        api_key=OPENAI_API_KEY,
-                        dimensions=self.max_length)
-            #self.max_length = max_length
-
-    def switch_model(self, model_name):
-        if model_name != self.model_name:
-            self._load_model(model_name)
-
-    def get_pooled_embeddings(self, texts):
-        if "sentence-transformers" in self.model_name:
-            return self.model.encode(texts, show_progress_bar=False, normalize_embeddings=True)
-        elif "openai" in self.model_name:
-            # For OpenAI models, we need to tokenize and get embeddings differently
-            if isinstance(texts, str):
-                texts = [texts]
-            # Use the correct method for OpenAIEmbedding
-            if len(texts) == 1:
-                outputs = [self.model.get_text_embedding(texts[0])]
-            else:
-                outputs = self.model.get_text_embedding_batch(texts)
-            return outputs
-
 class SentenceTransformerUtils:
     """
     Wraps a SentenceTransformer model for generic embedding.
@@ -903,12 +857,20 @@ class RagQAServiceBlock:
         #     max_length=self.max_length,
         # )
 
-        # Embedding util, can swap the model name easily
-        self.embedder = EmbeddingUtils(
-            model_name=self.embed_model,
-            device=self.device,
-            max_length=self.max_length,
+        # Embedding models are kept resident in a pool, one EmbeddingUtils per model
+        # Embeddings are cached on disk per (model, text hash), shared with the indexer
+        self.embedding_cache_dir = context.block_init_data.get(
+            "embedding_cache_dir", os.path.join(os.path.dirname(self.passages_json), "embedding_cache"))
+        self.embedder_pool = EmbeddingModelPool(
+            factory=self._create_embedder,
+            default_model=self.embed_model,
+            memory_budget_mb=float(context.block_init_data.get("embed_pool_memory_mb", 4096)),
+            cold_policy=context.block_init_data.get("embed_cold_policy", "default"),
+            cold_wait_s=float(context.block_init_data.get("embed_cold_wait_s", 30)),
+            load_workers=int(context.block_init_data.get("embed_pool_workers", 2)),
+            retry_backoff_s=float(context.block_init_data.get("embed_retry_backoff_s", 30)),
         )
+        self.embedder = self.embedder_pool.default
 
         # Load reranker model once at module level
         #RERANKER_MODEL_NAME = self.reranking_model_name #'cross-encoder/ms-marco-MiniLM-L-6-v2'
@@ -1052,7 +1014,26 @@ class RagQAServiceBlock:
         
         return response
     
-    def get_embeddings(self, texts):
+    def _create_embedder(self, model_name):
+        init_data = self.context.block_init_data
+        return EmbeddingUtils(
+            model_name=model_name,
+            device=self.device,
+            max_length=self.max_length,
+            cache_dir=self.embedding_cache_dir,
+            cache_dtype=init_data.get("embedding_cache_dtype", "float32"),
+            backend=init_data.get("embed_backend", "torch"),
+            intra_op_threads=init_data.get("embed_threads"),
+            output_dtype=init_data.get("embed_output_dtype", "float32"),
+            onnx_path=init_data.get("embed_onnx_path"),
+        )
+
+    def _switch_default_embedder(self, model_name):
+        self.embedder_pool.set_default(model_name)
+        self.embed_model = self.embedder_pool.default_model
+        self.embedder = self.embedder_pool.default
+
+    def get_embeddings(self, texts, embed_model=None):
         """Get embeddings for texts using either OpenAI API or local model"""
         if self.use_openai_embeddings:
             try:
@@ -1061,8 +1042,11 @@ class RagQAServiceBlock:
                 logger.error(f"Error using OpenAI embeddings, falling back to local: {e}")
                 self.use_openai_embeddings = False  # Switch to local for future calls
                 
-        # Fall back to local embeddings
-        return self.embedder.get_pooled_embeddings(texts)
+        # Fall back to local embeddings (int8/float16 outputs are widened for Weaviate)
+        embedder, served_model = self.embedder_pool.get(embed_model)
+        if embed_model and served_model != embed_model:
+            logger.info(f"Embedding model {embed_model} is not resident yet, served by {served_model}")
+        return dequantize_output(embedder.get_pooled_embeddings(texts))
 
     def on_preprocess(self, packet):
         data = packet.data
@@ -1080,7 +1064,8 @@ class RagQAServiceBlock:
         mode = pre.extra_data.get("mode")
         pld = pre.extra_data.get("payload")
         try:
-            # Handle model change dynamically via payload
+            # Handle model change dynamically via payload; embedding models are
+            # resolved per request through the pool instead of switching globally
             requested_embed_model = None
             requested_llm_model = None
             
@@ -1091,8 +1076,7 @@ class RagQAServiceBlock:
             if requested_embed_model:
                 if self.use_openai_embeddings and "text-embedding" in requested_embed_model:
                     self.embedding_model = requested_embed_model
-                else:
-                    self.embedder.switch_model(requested_embed_model)
+                    requested_embed_model = None
                 
             if requested_llm_model:
                 # Check if it's an OpenAI model
@@ -1120,7 +1104,7 @@ class RagQAServiceBlock:
                 if sid not in self.chat_sessions:
                     self.create_chat_session(sid, pld.get("system_message", ""))
                 query = pld.get("message", "")
-                q_emb = self.get_embeddings([query])
+                q_emb = self.get_embeddings([query], requested_embed_model)
                 print(f"Query is : {query}")
                 # Get passages with full metadata for proper references
                 passages = get_graphrag_passages_from_weaviate(
@@ -1228,14 +1212,14 @@ Available References:
             # ---------------- EMBED ----------------
             if mode == "embed":
                 text = pld.get("text", "")
-                embeds = self.get_embeddings([text])
+                embeds = self.get_embeddings([text], requested_embed_model)
                 return True, OnDataResult(output={"embedding": embeds[0]})
 
             # ------------- RAG QA (default mode, GraphRAG+Weaviate) -----------------
             query = pld.get("query", pld)
             if isinstance(query, dict):
                 query = query.get("text", str(query))
-            q_emb = self.get_embeddings([query])
+            q_emb = self.get_embeddings([query], requested_embed_model)
             # Get passages with full metadata for proper references
             passages = get_graphrag_passages_from_weaviate(
                 self.client, self.node_class, self.edge_class, q_emb, 
@@ -1355,7 +1339,7 @@ Available References:
             if self.use_openai_embeddings and "text-embedding" in params["embed_model"]:
                 self.embedding_model = params["embed_model"]
             else:
-                self.embedder.switch_model(params["embed_model"])
+                self._switch_default_embedder(params["embed_model"])
         if "llm_model" in params and ((self.use_openai and params["llm_model"] in self.available_models) or not self.use_openai):
             self.llm_model = params["llm_model"]
         if "topk" in params:
@@ -1413,7 +1397,7 @@ Available References:
                 if self.use_openai_embeddings and "text-embedding" in embed_model:
                     self.embedding_model = embed_model
                 else:
-                    self.embedder.switch_model(embed_model)
+                    self._switch_default_embedder(embed_model)
                 changes["embed_model"] = embed_model
                 
             llm_model = data.get("llm_model")
@@ -1451,6 +1435,7 @@ Available References:
                 "gemini_models": self.gemini_models,
                 "current_llm": self.llm_model, 
                 "current_embed": self.embedding_model if self.use_openai_embeddings else self.embed_model,
+                "embed_pool": self.embedder_pool.status(),
                 "using_openai": self.use_openai,
                 "using_gemini": self.use_gemini,
                 "using_openai_embeddings": self.use_openai_embeddings
@@ -0,0 +1,181 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_model_bytes(embedder) -> int:
+    """Bytes held by the parameters and buffers of a torch-backed embedder, 0 for remote models."""
+    model = getattr(embedder, "model", None)
+    model = getattr(model, "model", model)  # QuantizedSentenceEncoder wraps the torch module
+    if model is None or not hasattr(model, "parameters"):
+        return 0
+    total = 0
+    try:
+        for tensor in list(model.parameters()) + list(model.buffers()):
+            total += tensor.numel() * tensor.element_size()
+        # dynamically quantized Linear layers keep their packed weights outside parameters()
+        for module in model.modules():
+            weight = getattr(module, "weight", None)
+            if callable(weight):
+                w = weight()
+                total += w.numel() * w.element_size()
+    except Exception as e:
+        logger.warning(f"Could not estimate size of {getattr(embedder, 'model_name', embedder)}: {e}")
+    return total
+
+
+class EmbeddingModelPool:
+    """
+    Keeps several embedding models resident, bounded by a memory budget with LRU eviction.
+
+    Models are loaded in background threads. A request for a model that is not resident
+    starts its load and, depending on cold_policy, either waits for it ("queue", up to
+    cold_wait_s) or is served by the default model ("default"). The default model is
+    never evicted. Requests for different resident models do not share a lock. A model
+    that failed to load is not retried for retry_backoff_s, doubling with each further
+    failure up to retry_backoff_max_s; meanwhile its requests go to the default model.
+    """
+    def __init__(
+        self,
+        factory,
+        default_model: str,
+        memory_budget_mb: float = 4096,
+        cold_policy: str = "default",
+        cold_wait_s: float = 30.0,
+        load_workers: int = 2,
+        retry_backoff_s: float = 30.0,
+        retry_backoff_max_s: float = 600.0,
+    ):
+        if cold_policy not in ("default", "queue"):
+            raise ValueError(f"Unsupported cold model policy: {cold_policy}")
+        self.factory = factory
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.cold_policy = cold_policy
+        self.cold_wait_s = cold_wait_s
+        self.retry_backoff_s = retry_backoff_s
+        self.retry_backoff_max_s = retry_backoff_max_s
+        self.lock = threading.Lock()
+        self.resident = OrderedDict()  # model name -> (embedder, bytes), oldest first
+        self.loading = {}              # model name -> Future
+        self.failed = {}               # model name -> (error of the last load, consecutive failures, retry at)
+        self.executor = ThreadPoolExecutor(max_workers=load_workers, thread_name_prefix="embed-load")
+
+        self.default_model = default_model
+        self._install(default_model, factory(default_model))
+
+    @property
+    def default(self):
+        with self.lock:
+            return self.resident[self.default_model][0]
+
+    def _resident_bytes(self):
+        return sum(size for _, size in self.resident.values())
+
+    def _install(self, model_name, embedder):
+        size = estimate_model_bytes(embedder)
+        with self.lock:
+            self.resident[model_name] = (embedder, size)
+            self.resident.move_to_end(model_name)
+            self.failed.pop(model_name, None)
+            self._evict(keep=model_name)
+        logger.info(f"Embedding model {model_name} resident ({size / 2**20:.1f} MB, "
+                    f"pool {self._resident_bytes() / 2**20:.1f}/{self.memory_budget / 2**20:.0f} MB)")
+        return embedder
+
+    def _evict(self, keep):
+        # Called with the lock held
+        for name in list(self.resident):
+            if self._resident_bytes() <= self.memory_budget:
+                break
+            if name in (keep, self.default_model):
+                continue
+            self.resident.pop(name)
+            logger.info(f"Evicted embedding model {name} from the pool")
+
+    def _load(self, model_name):
+        try:
+            return self._install(model_name, self.factory(model_name))
+        except Exception as e:
+            logger.error(f"Failed to load embedding model {model_name}: {e}")
+            with self.lock:
+                failures = self.failed.get(model_name, (None, 0, 0))[1] + 1
+                backoff = min(self.retry_backoff_s * 2 ** (failures - 1), self.retry_backoff_max_s)
+                self.failed[model_name] = (str(e), failures, time.monotonic() + backoff)
+            raise
+        finally:
+            with self.lock:
+                self.loading.pop(model_name, None)
+
+    def preload(self, model_name):
+        """
+        Starts loading model_name in the background if needed; returns its Future or None if
+        resident. While a failed model backs off, the Future holds its last error.
+        """
+        with self.lock:
+            if model_name in self.resident:
+                return None
+            future = self.loading.get(model_name)
+            failed = self.failed.get(model_name)
+            if future is None and failed is not None and time.monotonic() < failed[2]:
+                future = Future()
+                future.set_exception(RuntimeError(f"Embedding model {model_name} failed to load: {failed[0]}"))
+            elif future is None:
+                future = self.executor.submit(self._load, model_name)
+                self.loading[model_name] = future
+            return future
+
+    def get(self, model_name=None):
+        """Returns (embedder, served_model_name) for model_name, falling back to the default when cold."""
+        model_name = model_name or self.default_model
+        with self.lock:
+            entry = self.resident.get(model_name)
+            if entry is not None:
+                self.resident.move_to_end(model_name)
+                return entry[0], model_name
+        future = self.preload(model_name)
+        if future is not None and self.cold_policy == "queue":
+            try:
+                return future.result(timeout=self.cold_wait_s), model_name
+            except FutureTimeoutError:
+                logger.warning(f"Embedding model {model_name} still loading after {self.cold_wait_s}s, using default")
+            except Exception:
+                pass  # already logged by _load
+        elif future is None:
+            # became resident between the two checks
+            return self.get(model_name)
+        return self.default, self.default_model
+
+    def set_default(self, model_name, wait: bool = True):
+        """Makes model_name the default; with wait=False the switch happens once it is loaded."""
+        future = self.preload(model_name)
+
+        def switch(_=None):
+            with self.lock:
+                if model_name in self.resident:
+                    self.default_model = model_name
+                    logger.info(f"Default embedding model is now {model_name}")
+
+        if future is None:
+            switch()
+        elif wait:
+            future.result()
+            switch()
+        else:
+            future.add_done_callback(switch)
+
+    def status(self):
+        with self.lock:
+            return {
+                "default": self.default_model,
+                "resident": {name: round(size / 2**20, 1) for name, (_, size) in self.resident.items()},
+                "loading": list(self.loading),
+                "failed": {name: error for name, (error, _, _) in self.failed.items()},
+                "budget_mb": round(self.memory_budget / 2**20),
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,193 @@
+import os
+import json
+import fcntl
+import hashlib
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    """Stable 128-bit content hash used as the cache key of a text."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Persistent embedding cache for a single embedding model, keyed by text hash.
+
+    Layout of <cache_dir>/<model key>/:
+        vectors.bin  - memory-mapped (capacity, dim) array in float32 or float16
+        index.tsv    - append-only "<text hash>\\t<row>" lines
+        meta.json    - dim and dtype of vectors.bin
+
+    Vectors are written before their index line, so every indexed row is complete.
+    Writers take an flock on the index file, so the indexer and the retriever can
+    share one cache directory. Readers pick up rows written by other processes the
+    next time they miss.
+    """
+    def __init__(self, cache_dir: str, model_key: str, dtype: str = "float32", initial_capacity: int = 1024):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported embedding cache dtype: {dtype}")
+        safe_key = "".join(c if c.isalnum() or c in "-_." else "_" for c in model_key)
+        self.path = os.path.join(cache_dir, safe_key)
+        os.makedirs(self.path, exist_ok=True)
+        self.vectors_path = os.path.join(self.path, "vectors.bin")
+        self.index_path = os.path.join(self.path, "index.tsv")
+        self.meta_path = os.path.join(self.path, "meta.json")
+        self.initial_capacity = initial_capacity
+
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self.rows = {}        # text hash -> row
+        self.num_rows = 0
+        self.index_offset = 0  # bytes of index.tsv already loaded
+        self.vectors = None
+        self.lock = threading.Lock()
+
+        self._refresh()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _load_meta(self):
+        """Reads dim and dtype, once meta.json exists (it may be written later by another process)."""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if np.dtype(meta["dtype"]) != self.dtype:
+            logger.warning(f"Embedding cache {self.path} stores {meta['dtype']}, ignoring requested {self.dtype.name}")
+            self.dtype = np.dtype(meta["dtype"])
+        self.dim = int(meta["dim"])
+
+    def _write_meta(self):
+        # Called with the index flock held
+        tmp_path = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _capacity(self):
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (self.dim * self.dtype.itemsize)
+
+    def _map(self):
+        capacity = self._capacity()
+        self.vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim)) \
+            if capacity else None
+
+    def _refresh(self):
+        """Loads index lines appended since the last refresh (by this or another process)."""
+        if self.dim is None:
+            self._load_meta()
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            f.seek(self.index_offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # partially written line, picked up on the next refresh
+                key, row = line.rstrip("\n").split("\t")
+                row = int(row)
+                self.rows[key] = row
+                self.num_rows = max(self.num_rows, row + 1)
+                self.index_offset += len(line.encode("utf-8"))
+        if self.num_rows and (self.vectors is None or self.vectors.shape[0] < self.num_rows):
+            self._map()
+
+    def _ensure_capacity(self, needed: int):
+        capacity = self._capacity()
+        if needed <= capacity:
+            if self.vectors is None or self.vectors.shape[0] < capacity:
+                self._map()
+            return
+        new_capacity = max(self.initial_capacity, capacity)
+        while new_capacity < needed:
+            new_capacity *= 2
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * self.dtype.itemsize)
+        self._map()
+
+    def lookup(self, texts):
+        """
+        Batch lookup. Returns (vectors, missing) where vectors[i] is a float32 vector or None
+        and missing lists the indices of texts that are not cached.
+        """
+        keys = [text_hash(t) for t in texts]
+        with self.lock:
+            if any(k not in self.rows for k in keys):
+                self._refresh()
+            vectors = []
+            missing = []
+            for i, key in enumerate(keys):
+                row = self.rows.get(key)
+                if row is None:
+                    vectors.append(None)
+                    missing.append(i)
+                else:
+                    vectors.append(np.asarray(self.vectors[row], dtype=np.float32))
+            return vectors, missing
+
+    def put(self, texts, vectors):
+        """Writes back vectors for texts that are not cached yet."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        with self.lock:
+            with open(self.index_path, "a", encoding="utf-8") as index_file:
+                fcntl.flock(index_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    if self.dim is None:
+                        self.dim = int(vectors.shape[1])
+                        self._write_meta()
+                    elif vectors.shape[1] != self.dim:
+                        raise ValueError(f"Embedding dim {vectors.shape[1]} does not match cache dim {self.dim}")
+                    lines = []
+                    pending = {}
+                    for text, vector in zip(texts, vectors):
+                        key = text_hash(text)
+                        if key in self.rows or key in pending:
+                            continue
+                        pending[key] = self.num_rows + len(pending)
+                        lines.append((key, pending[key], vector))
+                    if not lines:
+                        return
+                    self._ensure_capacity(self.num_rows + len(lines))
+                    for _, row, vector in lines:
+                        self.vectors[row] = vector
+                    self.vectors.flush()
+                    index_file.write("".join(f"{key}\t{row}\n" for key, row, _ in lines))
+                    index_file.flush()
+                    self.index_offset = os.path.getsize(self.index_path)
+                    self.rows.update(pending)
+                    self.num_rows += len(lines)
+                finally:
+                    fcntl.flock(index_file, fcntl.LOCK_UN)
+
+    def get_or_compute(self, texts, compute_fn):
+        """
+        Returns a float32 (N, dim) array for texts, calling compute_fn only for the texts
+        that are not cached and writing their vectors back.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        vectors, missing = self.lookup(texts)
+        if missing:
+            # duplicates inside one batch are computed once
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            computed = np.asarray(compute_fn(unique_texts), dtype=np.float32)
+            self.put(unique_texts, computed)
+            by_text = dict(zip(unique_texts, computed))
+            for i in missing:
+                vectors[i] = by_text[texts[i]]
+        if not vectors:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.stack(vectors)
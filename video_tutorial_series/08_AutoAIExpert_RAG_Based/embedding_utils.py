@@ -0,0 +1,122 @@
+import os
+import logging
+import torch
+import numpy as np
+
+from embedding_store import EmbeddingStore
+from quantized_embedding import QuantizedSentenceEncoder, quantize_output, OUTPUT_DTYPES
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingUtils:
+    """
+    Generic embedding utility that can use SentenceTransformer or any HuggingFace model.
+    Shared by the indexer and the retriever. When cache_dir is set, embeddings are read
+    from and written back to a persistent EmbeddingStore keyed by (model, text hash).
+
+    backend selects how sentence-transformers models run: "torch" (float32 PyTorch),
+    "int8" (dynamically quantized PyTorch) or "onnx" (ONNX Runtime). output_dtype
+    ("float32", "float16" or "int8") is applied to the returned embeddings, after the
+    float32 cache; consumers that need float vectors (Weaviate) widen them again with
+    dequantize_output.
+    """
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        device: str = None,
+        max_length: int = 512,
+        cache_dir: str = None,
+        cache_dtype: str = "float32",
+        backend: str = "torch",
+        intra_op_threads: int = None,
+        output_dtype: str = "float32",
+        onnx_path: str = None,
+    ):
+        if backend not in ("torch", "int8", "onnx"):
+            raise ValueError(f"Unsupported embedding backend: {backend}")
+        if output_dtype not in OUTPUT_DTYPES:
+            raise ValueError(f"Unsupported embedding output dtype: {output_dtype}")
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.max_length = max_length
+        self.cache_dir = cache_dir
+        self.cache_dtype = cache_dtype
+        self.backend = backend
+        self.intra_op_threads = intra_op_threads
+        self.output_dtype = output_dtype
+        self.onnx_path = onnx_path
+        self.stores = {}  # cache key -> EmbeddingStore, kept across model switches
+        self.store = None
+        self._load_model(model_name)
+
+    def _load_model(self, model_name):
+        self.model_name = model_name
+        if "sentence-transformers" in model_name and self.backend != "torch":
+            self.model = QuantizedSentenceEncoder(
+                model_name,
+                backend=self.backend,
+                max_length=self.max_length,
+                intra_op_threads=self.intra_op_threads,
+                onnx_path=self.onnx_path,
+            )
+        elif "sentence-transformers" in model_name:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(model_name, device=self.device)
+        elif "openai" in model_name:
+            #model_name should openai/text-embedding-3-large
+            OPENAI_API_KEY="YOUR_API_KEY"
+            if OPENAI_API_KEY == "YOUR_API_KEY":
+                OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+            from llama_index.embeddings.openai import OpenAIEmbedding
+            model_version = model_name.split("/")[-1]  # Extract model name from path
+            self.model = OpenAIEmbedding(model=model_version, \
+                        api_key=OPENAI_API_KEY,
+                        dimensions=self.max_length)
+        self.store = self._get_store()
+
+    def _cache_key(self):
+        # OpenAI embeddings are truncated to max_length dimensions, so the size is part of the key
+        if "openai" in self.model_name:
+            return f"{self.model_name}-{self.max_length}d"
+        # Quantized backends produce slightly different vectors than float32
+        if "sentence-transformers" in self.model_name and self.backend != "torch":
+            return f"{self.model_name}-{self.backend}"
+        return self.model_name
+
+    def _get_store(self):
+        if not self.cache_dir:
+            return None
+        key = self._cache_key()
+        if key not in self.stores:
+            self.stores[key] = EmbeddingStore(self.cache_dir, key, dtype=self.cache_dtype)
+        return self.stores[key]
+
+    def switch_model(self, model_name):
+        if model_name != self.model_name:
+            self._load_model(model_name)
+
+    def encode(self, texts):
+        """Computes embeddings with the current model, bypassing the cache."""
+        if "sentence-transformers" in self.model_name and self.backend != "torch":
+            return self.model.encode(texts)
+        elif "sentence-transformers" in self.model_name:
+            return self.model.encode(texts, show_progress_bar=False, normalize_embeddings=True)
+        elif "openai" in self.model_name:
+            # For OpenAI models, we need to tokenize and get embeddings differently
+            if isinstance(texts, str):
+                texts = [texts]
+            # Use the correct method for OpenAIEmbedding
+            if len(texts) == 1:
+                outputs = [self.model.get_text_embedding(texts[0])]
+            else:
+                outputs = self.model.get_text_embedding_batch(texts)
+            return outputs
+
+    def get_pooled_embeddings(self, texts):
+        if self.store is None:
+            embeddings = self.encode(texts)
+        else:
+            embeddings = self.store.get_or_compute(texts, self.encode)
+        if self.output_dtype != "float32":
+            embeddings = quantize_output(np.asarray(embeddings, dtype=np.float32), self.output_dtype)
+        return embeddings
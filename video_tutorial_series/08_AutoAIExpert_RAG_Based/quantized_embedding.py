@@ -0,0 +1,274 @@
+import os
+import time
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_DTYPES = ("float32", "float16", "int8")
+
+# torch's intra-op thread count is process-wide: encoders with their own count hold it
+# only for the duration of their forward passes
+_torch_threads_lock = threading.Lock()
+
+
+@contextmanager
+def torch_threads(num_threads: int = None):
+    """Runs the block with num_threads intra-op threads, restoring the previous count after."""
+    if not num_threads:
+        yield
+        return
+    with _torch_threads_lock:
+        previous = torch.get_num_threads()
+        torch.set_num_threads(num_threads)
+        try:
+            yield
+        finally:
+            torch.set_num_threads(previous)
+
+
+def bucket_by_length(lengths, batch_size: int, bucket_width: int = 16):
+    """
+    Groups indices into batches of similar token length, so each batch is padded
+    only up to its own longest sequence. Returns a list of index lists.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    current = []
+    current_bucket = None
+    for i in order:
+        bucket = lengths[i] // bucket_width
+        if current and (len(current) >= batch_size or bucket != current_bucket):
+            batches.append(current)
+            current = []
+        current.append(i)
+        current_bucket = bucket
+    if current:
+        batches.append(current)
+    return batches
+
+
+def quantize_output(embeddings: np.ndarray, output_dtype: str) -> np.ndarray:
+    """
+    Converts normalized float32 embeddings to the requested output dtype.
+    int8 stores round(v * 127); cosine similarity is unchanged by the scale.
+    """
+    if output_dtype == "float32":
+        return embeddings.astype(np.float32, copy=False)
+    if output_dtype == "float16":
+        return embeddings.astype(np.float16)
+    if output_dtype == "int8":
+        return np.clip(np.rint(embeddings * 127.0), -127, 127).astype(np.int8)
+    raise ValueError(f"Unsupported embedding output dtype: {output_dtype}")
+
+
+def dequantize_output(embeddings) -> np.ndarray:
+    """Inverse of quantize_output, returns float32."""
+    embeddings = np.asarray(embeddings)
+    if embeddings.dtype == np.int8:
+        return embeddings.astype(np.float32) / 127.0
+    return embeddings.astype(np.float32, copy=False)
+
+
+class QuantizedSentenceEncoder:
+    """
+    CPU-oriented sentence-transformers encoder.
+
+    backend="int8" applies PyTorch dynamic int8 quantization to the Linear layers of the
+    SentenceTransformer. backend="onnx" runs an exported model with ONNX Runtime
+    (see export_onnx); the exported graph can itself be int8-quantized.
+    Texts are tokenized once without padding, bucketed by length, and each batch is
+    padded from those token ids up to its own longest sequence.
+    """
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = "int8",
+        max_length: int = 512,
+        batch_size: int = 64,
+        intra_op_threads: int = None,
+        onnx_path: str = None,
+    ):
+        from sentence_transformers import SentenceTransformer
+
+        if backend not in ("int8", "onnx"):
+            raise ValueError(f"Unsupported quantized backend: {backend}")
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.intra_op_threads = intra_op_threads
+
+        model = SentenceTransformer(model_name, device="cpu")
+        self.tokenizer = model.tokenizer
+        self.max_length = min(max_length, model.max_seq_length or max_length)
+        self.normalize = True
+
+        if backend == "int8":
+            model.eval()
+            self.model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.session = None
+        else:
+            import onnxruntime as ort
+            onnx_path = onnx_path or default_onnx_path(model_name)
+            if not os.path.exists(onnx_path):
+                export_onnx(model_name, onnx_path, quantize=True)
+            options = ort.SessionOptions()
+            if intra_op_threads:
+                options.intra_op_num_threads = intra_op_threads
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+            self.input_names = {i.name for i in self.session.get_inputs()}
+            self.model = None
+        logger.info(f"Loaded {backend} encoder for {model_name} (threads={intra_op_threads or torch.get_num_threads()})")
+
+    def _tokenize(self, texts):
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length, add_special_tokens=True)
+        return {key: list(values) for key, values in encoded.items()}
+
+    def _encode_batch(self, encoded, batch):
+        unpadded = {key: [values[i] for i in batch] for key, values in encoded.items()}
+        if self.backend == "int8":
+            features = self.tokenizer.pad(unpadded, padding=True, return_tensors="pt")
+            with torch_threads(self.intra_op_threads), torch.inference_mode():
+                out = self.model(dict(features))["sentence_embedding"]
+            return out.float().numpy()
+
+        features = self.tokenizer.pad(unpadded, padding=True, return_tensors="np")
+        inputs = {k: v.astype(np.int64) for k, v in features.items() if k in self.input_names}
+        token_embeddings = self.session.run(None, inputs)[0]
+        # mean pooling over non-padding tokens, as in the sentence-transformers Pooling module
+        mask = features["attention_mask"][..., None].astype(np.float32)
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts):
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        encoded = self._tokenize(texts)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        result = [None] * len(texts)
+        for batch in bucket_by_length(lengths, self.batch_size):
+            embs = self._encode_batch(encoded, batch)
+            for i, emb in zip(batch, embs):
+                result[i] = emb
+        embeddings = np.stack(result).astype(np.float32, copy=False)
+        if self.normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+
+def default_onnx_path(model_name: str) -> str:
+    safe_name = model_name.replace("/", "__")
+    return os.path.join(os.path.expanduser("~"), ".cache", "aios_onnx", f"{safe_name}.int8.onnx")
+
+
+def export_onnx(model_name: str, onnx_path: str, quantize: bool = True, opset: int = 17):
+    """Exports the transformer of a SentenceTransformer to ONNX, optionally int8-quantized."""
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(os.path.dirname(onnx_path) or ".", exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    dummy = model.tokenizer(["export"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = onnx_path + ".fp32" if quantize else onnx_path
+    torch.onnx.export(
+        transformer,
+        tuple(dummy[n] for n in input_names),
+        fp32_path,
+        input_names=input_names,
+        output_names=["last_hidden_state"],
+        dynamic_axes=dynamic_axes,
+        opset_version=opset,
+    )
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, onnx_path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    logger.info(f"Exported {model_name} to {onnx_path}")
+    return onnx_path
+
+
+def parity_check(reference_fn, candidate_fn, corpus, queries=None, k: int = 10):
+    """
+    Compares a candidate embedding function against the float32 reference.
+    Reports per-text cosine agreement, recall@k of the candidate's nearest neighbours
+    against the reference neighbours, and throughput of both.
+    """
+    queries = queries or corpus
+
+    def timed(fn, texts):
+        start = time.perf_counter()
+        embs = dequantize_output(fn(texts))
+        return embs, time.perf_counter() - start
+
+    ref_corpus, ref_time = timed(reference_fn, corpus)
+    cand_corpus, cand_time = timed(candidate_fn, corpus)
+    ref_queries = dequantize_output(reference_fn(queries))
+    cand_queries = dequantize_output(candidate_fn(queries))
+
+    def unit(x):
+        return x / np.clip(np.linalg.norm(x, axis=1, keepdims=True), 1e-12, None)
+
+    ref_corpus, cand_corpus = unit(ref_corpus), unit(cand_corpus)
+    ref_queries, cand_queries = unit(ref_queries), unit(cand_queries)
+    cosine = (ref_corpus * cand_corpus).sum(axis=1)
+
+    k = min(k, len(corpus))
+    ref_top = np.argsort(-(ref_queries @ ref_corpus.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand_queries @ cand_corpus.T), axis=1)[:, :k]
+    recall = np.mean([len(set(r) & set(c)) / k for r, c in zip(ref_top, cand_top)])
+
+    return {
+        "num_texts": len(corpus),
+        "num_queries": len(queries),
+        "k": k,
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        f"recall@{k}": float(recall),
+        "reference_texts_per_sec": len(corpus) / ref_time if ref_time else float("inf"),
+        "candidate_texts_per_sec": len(corpus) / cand_time if cand_time else float("inf"),
+        "speedup": ref_time / cand_time if cand_time else float("inf"),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parity and throughput check of the quantized embedding backend")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--backend", default="int8", choices=["int8", "onnx"])
+    parser.add_argument("--texts", required=True, help="file with one text per line (corpus)")
+    parser.add_argument("--queries", help="file with one query per line, defaults to the corpus")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--output-dtype", default="float32", choices=OUTPUT_DTYPES)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from sentence_transformers import SentenceTransformer
+
+    def read_lines(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    corpus = read_lines(args.texts)
+    queries = read_lines(args.queries) if args.queries else None
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    reference = SentenceTransformer(args.model, device="cpu")
+    candidate = QuantizedSentenceEncoder(args.model, backend=args.backend, intra_op_threads=args.threads)
+    report = parity_check(
+        lambda t: reference.encode(t, show_progress_bar=False, normalize_embeddings=True),
+        lambda t: quantize_output(candidate.encode(t), args.output_dtype),
+        corpus, queries, k=args.k,
+    )
+    for key, value in report.items():
+        print(f"{key:>26}: {value:.4f}" if isinstance(value, float) else f"{key:>26}: {value}")
@@ -0,0 +1,101 @@
+import json
+import unittest
+
+from aios_instance.aios_packet_pb2 import AIOSPacket
+from aios_instance.admission import AdmissionController, EXPIRED, LATE, SHED
+
+
+class TestAdmissionController(unittest.TestCase):
+    def controller(self, **kwargs):
+        kwargs.setdefault("target_queue_wait_s", 1.0)
+        kwargs.setdefault("adjust_interval_s", 0)
+        return AdmissionController(**kwargs)
+
+    def test_expired_packets_are_rejected_at_intake_and_before_on_data(self):
+        controller = self.controller()
+        packet = AIOSPacket(deadline=100.0)
+        self.assertIsNone(controller.check(packet, now=99.0))
+        self.assertEqual(controller.check(packet, now=100.0, intake=False), EXPIRED)
+        self.assertEqual(controller.stats()[EXPIRED], 1)
+
+    def test_packets_that_would_expire_in_the_queue_are_rejected_late(self):
+        controller = self.controller(target_queue_wait_s=10.0)
+        for _ in range(20):
+            controller.observe(4.0, now=0.0)
+        self.assertEqual(controller.stats()["p95_queue_wait_s"], 4.0)
+
+        # 3s left but 4s of expected queue wait
+        self.assertEqual(controller.check(AIOSPacket(deadline=103.0), now=100.0), LATE)
+        # the time already spent waiting counts against the expected wait
+        self.assertIsNone(controller.check(AIOSPacket(deadline=103.0, enqueued_at=98.0), now=100.0))
+        # without a deadline nothing is late
+        self.assertIsNone(controller.check(AIOSPacket(), now=100.0))
+        # after the executor queue only the deadline itself matters
+        self.assertIsNone(controller.check(AIOSPacket(deadline=103.0), now=100.0, intake=False))
+
+    def test_lowest_classes_are_shed_first_and_readmitted(self):
+        controller = self.controller(num_classes=4)
+        for level in (1, 2, 3, 3):
+            controller.observe(5.0)
+            self.assertEqual(controller.stats()["shed_level"], level)
+
+        admitted = [controller.check(AIOSPacket(priority=priority), now=0.0) is None for priority in range(4)]
+        self.assertEqual(admitted, [True, False, False, False])
+
+        # shed packets keep feeding the wait window, so shedding stops once the queue drains
+        controller.waits.clear()
+        for _ in range(3):
+            self.assertEqual(controller.check(AIOSPacket(priority=3), now=0.0), SHED)
+        self.assertEqual(controller.stats()["shed_level"], 0)
+        self.assertIsNone(controller.check(AIOSPacket(priority=3), now=0.0))
+
+    def test_shed_level_moves_once_per_interval(self):
+        controller = self.controller(adjust_interval_s=1.0)
+        controller.observe(5.0, now=10.0)
+        controller.observe(5.0, now=10.5)
+        self.assertEqual(controller.stats()["shed_level"], 1)
+        controller.observe(5.0, now=11.0)
+        self.assertEqual(controller.stats()["shed_level"], 2)
+
+    def test_default_deadline_from_request_start(self):
+        controller = self.controller(default_timeout_s=30)
+        packet = AIOSPacket(ts=1000.0)
+        controller.stamp(packet, now=1010.0)
+        self.assertEqual(packet.deadline, 1030.0)
+        controller.stamp(packet, now=2000.0)  # an existing deadline is kept
+        self.assertEqual(packet.deadline, 1030.0)
+
+        packet = AIOSPacket()
+        controller.stamp(packet, now=500.0)
+        self.assertEqual(packet.deadline, 530.0)
+
+        packet = AIOSPacket(ts=1000.0)
+        self.controller().stamp(packet, now=1010.0)
+        self.assertEqual(packet.deadline, 0)
+
+    def test_rejection_answers_the_client(self):
+        packet = AIOSPacket(session_id="s1", seq_no=4)
+        self.assertEqual(json.loads(AdmissionController.rejection(packet, LATE)),
+                         {"error": "deadline exceeded", "reason": LATE, "session_id": "s1", "seq_no": 4})
+        self.assertEqual(json.loads(AdmissionController.rejection(packet, SHED))["error"], "overloaded")
+
+    def test_metrics_follow_the_counters(self):
+        calls = []
+
+        class Metrics:
+            def increment_counter(self, name):
+                calls.append(name)
+
+            def set_gauge(self, name, value):
+                calls.append((name, value))
+
+        controller = self.controller(metrics=Metrics())
+        controller.check(AIOSPacket(), now=0.0)
+        controller.check(AIOSPacket(deadline=1.0), now=2.0)
+        controller.observe(0.25)
+        self.assertEqual(calls, ["admission_admitted_count", "admission_expired_count",
+                                 ("admission_queue_wait_p95", 0.25), ("admission_shed_level", 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
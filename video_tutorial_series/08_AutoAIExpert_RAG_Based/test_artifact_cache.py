@@ -0,0 +1,124 @@
+import io
+import sys
+import shutil
+import tarfile
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aios_instance.policy_sandbox.artifact_cache import PolicyArtifactCache
+from aios_instance.policy_sandbox.code_executor import LocalCodeExecutor
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    content = b"v1"
+    requests = []
+
+    def do_GET(self):
+        etag = f'"{self.content.decode()}"'
+        type(self).requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(self.content)))
+        self.end_headers()
+        self.wfile.write(self.content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestPolicyArtifactCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        ArchiveHandler.content = b"v1"
+        ArchiveHandler.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/policy.zip"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_fresh_archive_is_not_requested_again(self):
+        cache = PolicyArtifactCache(self.cache_dir, revalidate_s=3600)
+        self.assertEqual(cache.fetch(self.url).read_bytes(), b"v1")
+        ArchiveHandler.content = b"v2"
+        self.assertEqual(cache.fetch(self.url).read_bytes(), b"v1")
+        self.assertEqual(ArchiveHandler.requests, [None])
+
+    def test_stale_archive_is_revalidated(self):
+        cache = PolicyArtifactCache(self.cache_dir, revalidate_s=0)
+        self.assertEqual(cache.fetch(self.url).read_bytes(), b"v1")
+        self.assertEqual(cache.fetch(self.url).read_bytes(), b"v1")  # 304
+        ArchiveHandler.content = b"v2"
+        self.assertEqual(cache.fetch(self.url).read_bytes(), b"v2")
+        self.assertEqual(ArchiveHandler.requests, [None, '"v1"', '"v1"'])
+
+    def test_cached_copy_is_used_when_the_server_is_down(self):
+        cache = PolicyArtifactCache(self.cache_dir, revalidate_s=0)
+        cache.fetch(self.url)
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertEqual(cache.fetch(self.url).read_bytes(), b"v1")
+
+    def tar_archive(self, *members):
+        path = Path(self.cache_dir) / "policy.tar.gz"
+        with tarfile.open(path, "w:gz") as tar:
+            for name, content in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        return path
+
+    def test_archive_members_stay_inside_the_tree(self):
+        cache = PolicyArtifactCache(self.cache_dir)
+        tree = cache.tree_from_archive(self.tar_archive(("code/function.py", b"x = 1\n")))
+        self.assertEqual((tree / "code" / "function.py").read_bytes(), b"x = 1\n")
+
+        archive = self.tar_archive(("code/function.py", b""), ("../../escaped.py", b"boom"))
+        with self.assertRaises(Exception):
+            cache.tree_from_archive(archive)
+        self.assertFalse((Path(self.cache_dir) / "escaped.py").exists())
+
+
+class TestLocalCodeExecutor(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.path = list(sys.path)
+        self.addCleanup(setattr, sys, "path", self.path)
+
+    def test_policy_dependencies_win_only_while_the_policy_is_imported(self):
+        site_packages = self.root / "site-packages"
+        site_packages.mkdir()
+        (site_packages / "policy_pinned_json.py").write_text("import json\nVERSION = 'pinned'\n")
+        code = self.root / "policy"
+        code.mkdir()
+        (code / "function.py").write_text(
+            "import policy_pinned_json\n"
+            "class AIOSv1PolicyRule:\n"
+            "    def __init__(self, rule_id, settings, parameters):\n"
+            "        self.version = policy_pinned_json.VERSION\n")
+
+        executor = LocalCodeExecutor(str(code), {}, {})
+        executor.artifact_cache = PolicyArtifactCache(str(self.root / "cache"))
+        executor.unpack(executor.download())
+        executor.site_packages = str(site_packages)
+        sys.path.append(executor.site_packages)
+        executor.initialize_function()
+
+        self.assertEqual(executor.function_class.version, "pinned")
+        self.assertEqual(sys.path.count(executor.site_packages), 1)
+        self.assertEqual(sys.path[-1], executor.site_packages)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import json
+import unittest
+from unittest import mock
+
+import redis
+import fakeredis
+
+from aios_instance.aios_packet_pb2 import AIOSPacket
+from aios_instance.blob_store import BlobTransport, blob_ref
+
+
+class TestBlobTransport(unittest.TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.from_url = redis.Redis.from_url
+        redis.Redis.from_url = staticmethod(lambda url, **kwargs: fakeredis.FakeRedis(server=server))
+        self.transport = BlobTransport(threshold=16, location="redis://blobs:6379/0")
+
+    def tearDown(self):
+        redis.Redis.from_url = self.from_url
+
+    def packet(self, *files):
+        packet = AIOSPacket()
+        for data, metadata in files:
+            file_info = packet.files.add()
+            file_info.file_data = data
+            file_info.metadata = metadata
+        return packet
+
+    def test_offload_then_inline_round_trip(self):
+        large = b"x" * 64
+        packet = self.packet((large, json.dumps({"name": "image.png"})), (b"small", ""))
+
+        self.assertEqual(self.transport.offload(packet), 1)
+        self.assertEqual(packet.files[0].file_data, b"")
+        self.assertEqual(blob_ref(packet.files[0])["location"], "redis://blobs:6379/0")
+        self.assertEqual(packet.files[1].file_data, b"small")
+
+        # the next block resolves the reference from the serialized packet
+        received = AIOSPacket.FromString(packet.SerializeToString())
+        self.assertEqual(bytes(self.transport.read(received.files[0])), large)
+
+        self.assertEqual(self.transport.inline(received), 1)
+        self.assertEqual(received.files[0].file_data, large)
+        self.assertEqual(received.files[0].metadata, json.dumps({"name": "image.png"}))
+        self.assertIsNone(blob_ref(received.files[0]))
+
+    def test_non_object_metadata_is_restored_verbatim(self):
+        originals = ["image/png", "[1, 2]", '"quoted"', "{not json"]
+        packet = self.packet(*((b"m" * 32, metadata) for metadata in originals))
+        self.assertEqual(self.transport.offload(packet), len(originals))
+
+        received = AIOSPacket.FromString(packet.SerializeToString())
+        self.assertEqual([self.transport.metadata(f) for f in received.files], originals)
+        self.transport.inline(received)
+        self.assertEqual([f.metadata for f in received.files], originals)
+        self.assertEqual([f.file_data for f in received.files], [b"m" * 32] * len(originals))
+
+    def test_identical_content_is_stored_once(self):
+        packet = self.packet((b"y" * 32, ""), (b"y" * 32, ""))
+        self.transport.offload(packet)
+        self.assertEqual(blob_ref(packet.files[0])["digest"], blob_ref(packet.files[1])["digest"])
+        self.assertEqual(len(self.transport.store().client.keys("blob:*")), 1)
+
+    def test_offload_requires_a_shared_location(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop("BLOB_STORE_URL", None)
+            transport = BlobTransport(threshold=16)
+        packet = self.packet((b"z" * 32, ""))
+        with self.assertRaises(ValueError):
+            transport.offload(packet)
+        self.assertEqual(packet.files[0].file_data, b"z" * 32)
+
+
+if __name__ == "__main__":
+    unittest.main()
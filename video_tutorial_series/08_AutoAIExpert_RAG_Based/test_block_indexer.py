@@ -0,0 +1,302 @@
+import os
+import json
+from uuid import uuid4
+import hashlib
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import block_indexer
+from block_indexer import IndexDocumentsBlock
+from aios_instance import TestContext, PreProcessResult
+from aios_instance.aios_packet_pb2 import AIOSPacket
+
+
+class FakeEmbedder:
+    def __init__(self, model_name, backend="torch", **kwargs):
+        self.model_name = model_name
+        self.backend = backend
+
+    def get_pooled_embeddings(self, texts):
+        # Deterministic per text, so unchanged chunks get the same vector in every run
+        return np.stack([
+            np.random.default_rng(int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)).standard_normal(8)
+            for text in texts
+        ]).astype(np.float32)
+
+
+class FakeWeaviate:
+    """In-memory stand-in for the parts of the Weaviate client the indexer uses."""
+
+    def __init__(self):
+        self.nodes = {}  # uuid -> (properties, vector)
+        self.edges = {}  # uuid -> properties, with from_node/to_node once referenced
+        self.lock = threading.Lock()
+        self.schema = mock.Mock(get=lambda: {"classes": [{"class": "PassageNode"}, {"class": "PassageEdge"}]},
+                                delete_class=self._delete_class)
+        self.data_object = mock.Mock(create=self._create, update=self._update, delete=self._delete)
+        self.data_object.reference.add = self._add_reference
+        self.batch = mock.Mock(delete_objects=self._delete_edges_of)
+        self.query = mock.Mock(get=lambda class_name, fields: self._query())
+
+    def _create(self, data_object, class_name, uuid=None, vector=None):
+        object_uuid = uuid or str(uuid4())
+        with self.lock:
+            if class_name == "PassageNode":
+                self.nodes[object_uuid] = (dict(data_object), np.asarray(vector))
+            else:
+                self.edges[object_uuid] = dict(data_object)
+        return object_uuid
+
+    def _update(self, data_object, class_name, uuid):
+        with self.lock:
+            self.nodes[uuid][0].update(data_object)
+
+    def _delete(self, uuid, class_name):
+        with self.lock:
+            (self.nodes if class_name == "PassageNode" else self.edges).pop(uuid)
+
+    def _delete_class(self, class_name):
+        with self.lock:
+            (self.nodes if class_name == "PassageNode" else self.edges).clear()
+
+    def _add_reference(self, from_class_name, from_uuid, from_property_name, to_class_name, to_uuid):
+        with self.lock:
+            self.edges[from_uuid][from_property_name] = to_uuid
+
+    def _delete_edges_of(self, class_name, where):
+        node_uuid = where["operands"][0]["valueString"]
+        with self.lock:
+            for edge_uuid in [e for e, edge in self.edges.items() if node_uuid in (edge.get("from_node"), edge.get("to_node"))]:
+                del self.edges[edge_uuid]
+
+    def graph(self):
+        """Nodes as {uuid: (source, chunk_id, text)} and edges as {(from, to, edge_type)} in those terms."""
+        nodes = {u: (p["source"], p["chunk_id"], p["text"]) for u, (p, _) in self.nodes.items()}
+        edges = {(nodes[e["from_node"]], nodes[e["to_node"]], e["edge_type"]) for e in self.edges.values()}
+        return nodes, edges
+
+    def _query(self):
+        query = mock.Mock()
+
+        def with_near_vector(near):
+            vector = np.asarray(near["vector"])
+            with self.lock:
+                hits = []
+                for node_uuid, (_, other) in self.nodes.items():
+                    cosine = float(np.dot(vector, other) / (np.linalg.norm(vector) * np.linalg.norm(other)))
+                    if (1 + cosine) / 2 >= near["certainty"]:
+                        hits.append({"_additional": {"id": node_uuid, "certainty": (1 + cosine) / 2}})
+            hits.sort(key=lambda hit: -hit["_additional"]["certainty"])
+            return mock.Mock(with_limit=lambda limit: mock.Mock(
+                do=lambda: {"data": {"Get": {"PassageNode": hits[:limit]}}}))
+
+        query.with_near_vector = with_near_vector
+        return query
+
+
+class IndexerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.repo = os.path.join(self.tmp, "repo")
+        os.makedirs(self.repo)
+        # Without the spaCy model: lower-case and collapse whitespace
+        patcher = mock.patch.object(block_indexer, "clean_text",
+                                    lambda text, remove_stopwords=False: " ".join(text.split()).lower())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = FakeWeaviate()
+
+    def write(self, name, words):
+        # One word per line, so word chunks (embedded) and line chunks (stored) line up
+        with open(os.path.join(self.repo, name), "w", encoding="utf-8") as f:
+            f.write("\n".join(words))
+
+    def block(self, **parameters):
+        context = TestContext()
+        context.block_init_data = {"repo_dir": self.repo, "passages_json": os.path.join(self.tmp, "out", "passages.jsonl"),
+                                   "embed_model": "fake", "client_type": "none"}
+        context.block_init_parameters = dict({"chunk_size": 3, "chunk_overlap": 0, "extraction_workers": 1,
+                                              "upload_workers": 2, "similarity_top_k": 2,
+                                              "similarity_threshold": 0.0}, **parameters)
+        with mock.patch.object(block_indexer, "EmbeddingUtils", FakeEmbedder):
+            block = IndexDocumentsBlock(context)
+        block.client_type = "weaviate"
+        block.node_class, block.edge_class = "PassageNode", "PassageEdge"
+        block.client = self.client
+        return block
+
+    def run_block(self, block, data=""):
+        return block.on_data(PreProcessResult(packet=AIOSPacket(data=data), extra_data={}, session_id="s1"))
+
+    def index(self, block, data=""):
+        ok, result = self.run_block(block, data)
+        self.assertTrue(ok, result)
+        return result.output["message"]
+
+    def assert_manifest_matches_store(self, block):
+        with open(block.manifest_json, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        nodes, _ = self.client.graph()
+        chunks = {c["uuid"]: (source, c["chunk_id"]) for source, entry in manifest["files"].items() for c in entry["chunks"]}
+        self.assertEqual(chunks, {u: node[:2] for u, node in nodes.items()})
+        edge_uuids = {e for entry in manifest["files"].values() for _, _, e in entry["sequential_edges"]}
+        self.assertEqual(edge_uuids, {u for u, e in self.client.edges.items() if e["edge_type"] == "sequential"})
+        return manifest
+
+
+class TestOnData(IndexerTestCase):
+    def test_non_json_payload_is_a_plain_index_request(self):
+        self.write("a.txt", ["alpha", "beta", "gamma", "delta"])
+        block = self.block()
+        for data in ("", "reindex please", json.dumps({"full_rebuild": False}), json.dumps(["not", "a", "dict"])):
+            ok, result = self.run_block(block, data)
+            self.assertTrue(ok, result)
+        self.assertEqual(len(self.client.nodes), 2)
+
+
+class TestUploadWorkerPool(unittest.TestCase):
+    def test_upload_error_is_raised_on_wait_and_close(self):
+        def fail():
+            raise OSError("weaviate down")
+
+        uploader = block_indexer.UploadWorkerPool(2)
+        uploader.submit(fail)
+        with self.assertRaisesRegex(OSError, "weaviate down"):
+            uploader.wait()
+        with self.assertRaisesRegex(OSError, "weaviate down"):
+            uploader.close()
+
+    def test_upload_error_does_not_mask_the_original_exception(self):
+        def fail():
+            raise OSError("weaviate down")
+
+        with self.assertRaisesRegex(ValueError, "embedding failed"):
+            with block_indexer.UploadWorkerPool(2) as uploader:
+                uploader.submit(fail)
+                uploader.tasks.join()
+                raise ValueError("embedding failed")
+        with self.assertRaisesRegex(OSError, "weaviate down"):
+            with block_indexer.UploadWorkerPool(2) as uploader:
+                uploader.submit(fail)
+
+    def test_full_queue_blocks_submit(self):
+        release = threading.Event()
+        uploader = block_indexer.UploadWorkerPool(1, max_pending=1)
+        uploader.submit(release.wait)  # taken by the worker
+        uploader.submit(release.wait)  # fills the queue
+        submitted = threading.Event()
+        producer = threading.Thread(target=lambda: (uploader.submit(lambda: None), submitted.set()))
+        producer.start()
+        self.assertFalse(submitted.wait(0.2))
+        release.set()
+        self.assertTrue(submitted.wait(5))
+        producer.join()
+        uploader.close()
+
+
+class TestStreamingPipeline(IndexerTestCase):
+    def test_unreadable_file_is_skipped(self):
+        self.write("a.txt", ["alpha"])
+        entries = [(os.path.join(self.repo, "missing.txt"), ".txt"), (os.path.join(self.repo, "a.txt"), ".txt")]
+        documents = list(block_indexer.iter_extracted_documents(entries, num_workers=1, max_in_flight=1))
+        self.assertEqual([(os.path.basename(path), cleaned) for path, _, cleaned in documents], [("a.txt", "alpha")])
+
+    def test_passages_are_batched_in_order_within_the_budget(self):
+        documents = [("/repo/a.txt", "w1\nw2\nw3\nw4\nw5", "w1 w2 w3 w4 w5"), ("/repo/b.txt", "x1\nx2", "x1 x2")]
+        passages = list(block_indexer.iter_passages(documents, "/repo", chunk_size=2, chunk_overlap=0))
+        self.assertEqual([(p["source"], p["chunk_id"], p["cleaned_text"]) for p in passages],
+                         [("a.txt", 0, "w1 w2"), ("a.txt", 1, "w3 w4"), ("a.txt", 2, "w5"), ("b.txt", 0, "x1 x2")])
+        self.assertEqual(passages[0]["text"], "[a.txt] w1\nw2")
+
+        batches = list(block_indexer.iter_token_batches(iter(passages), max_batch_tokens=4, max_batch_size=3))
+        self.assertEqual([[p["cleaned_text"] for p in batch] for batch in batches],
+                         [["w1 w2", "w3 w4"], ["w5", "x1 x2"]])
+        batches = list(block_indexer.iter_token_batches(iter(passages), max_batch_tokens=100, max_batch_size=3))
+        self.assertEqual([len(batch) for batch in batches], [3, 1])
+
+    def test_blockwise_top_k_matches_the_full_matrix(self):
+        embeddings = np.random.default_rng(3).standard_normal((23, 6)).astype(np.float32)
+        normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        sims = normed @ normed.T
+        np.fill_diagonal(sims, 0)
+        expected = {(i, int(j)) for i in range(23) for j in np.argsort(-sims[i])[:4] if sims[i, j] > 0.1}
+        pairs = block_indexer.iter_topk_similar_pairs(embeddings, top_k=4, threshold=0.1, block_rows=5)
+        self.assertEqual({(i, j) for i, j, _ in pairs}, expected)
+
+    def test_full_index_stores_passages_nodes_and_manifest(self):
+        self.write("a.txt", ["a%d" % n for n in range(7)])
+        self.write("b.md", ["b%d" % n for n in range(2)])
+        block = self.block()
+        message = self.index(block)
+        self.assertIn("Indexed 4 passages", message)
+
+        nodes, edges = self.client.graph()
+        self.assertEqual(sorted(node[:2] for node in nodes.values()), [("a.txt", 0), ("a.txt", 1), ("a.txt", 2), ("b.md", 0)])
+        sequential = {(a[:2], b[:2]) for a, b, edge_type in edges if edge_type == "sequential"}
+        self.assertEqual(sequential, {(("a.txt", 0), ("a.txt", 1)), (("a.txt", 1), ("a.txt", 2))})
+        with open(block.passages_json, "r", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 4)
+        manifest = self.assert_manifest_matches_store(block)
+        self.assertEqual(manifest["config"], block._index_config())
+
+
+class TestIncrementalIndexing(IndexerTestCase):
+    def test_unchanged_repo_is_not_reindexed(self):
+        self.write("a.txt", ["a%d" % n for n in range(5)])
+        block = self.block()
+        self.index(block)
+        before = dict(self.client.nodes)
+        self.assertIn("up to date", self.index(block))
+        self.assertEqual(self.client.nodes, before)
+
+    def test_changes_match_a_full_rebuild(self):
+        self.write("keep.txt", ["k%d" % n for n in range(6)])
+        self.write("edit.txt", ["e%d" % n for n in range(9)])
+        self.write("gone.txt", ["g%d" % n for n in range(4)])
+        block = self.block()
+        self.index(block)
+        kept = {u for u, (p, _) in self.client.nodes.items() if p["source"] == "keep.txt"}
+        unchanged_chunk = next(u for u, (p, _) in self.client.nodes.items() if p["text"] == "[edit.txt] e6\ne7\ne8")
+
+        # Insert a chunk in front of edit.txt, drop gone.txt, add new.txt
+        self.write("edit.txt", ["x0", "x1", "x2"] + ["e%d" % n for n in range(9)])
+        os.remove(os.path.join(self.repo, "gone.txt"))
+        self.write("new.txt", ["n0", "n1"])
+        message = self.index(block)
+        self.assertIn("Incrementally indexed 2 changed and 1 removed files", message)
+        self.assertIn("2 new passages, 3 unchanged passages kept, 2 passages removed", message)
+
+        nodes, edges = self.client.graph()
+        self.assertTrue(kept <= set(nodes))
+        self.assertEqual(nodes[unchanged_chunk][:2], ("edit.txt", 3))  # moved chunk keeps its node
+        self.assert_manifest_matches_store(block)
+        incremental = (sorted(nodes.values()), {e for e in edges if e[2] == "sequential"})
+        with open(block.passages_json, "r", encoding="utf-8") as f:
+            incremental_passages = sorted(json.loads(line)["text"] for line in f)
+
+        self.client = FakeWeaviate()
+        block = self.block()
+        self.index(block, json.dumps({"full_rebuild": True}))
+        nodes, edges = self.client.graph()
+        self.assertEqual(incremental, (sorted(nodes.values()), {e for e in edges if e[2] == "sequential"}))
+        with open(block.passages_json, "r", encoding="utf-8") as f:
+            self.assertEqual(incremental_passages, sorted(json.loads(line)["text"] for line in f))
+
+    def test_config_change_rebuilds_from_scratch(self):
+        self.write("a.txt", ["a%d" % n for n in range(6)])
+        self.index(self.block())
+        old = set(self.client.nodes)
+        message = self.index(self.block(chunk_size=2))
+        self.assertIn("Indexed 3 passages", message)
+        self.assertFalse(old & set(self.client.nodes))
+        self.assert_manifest_matches_store(self.block(chunk_size=2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import threading
+import unittest
+from unittest import mock
+
+import embedding_pool
+from embedding_pool import EmbeddingModelPool
+
+
+class FakeEmbedder:
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+
+class TestEmbeddingModelPool(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch.object(embedding_pool.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loads = []
+        self.broken = {"bad"}
+        self.release = threading.Event()
+        self.release.set()
+
+    def factory(self, model_name):
+        self.loads.append(model_name)
+        self.release.wait(5)
+        if model_name in self.broken:
+            raise OSError(f"no such model {model_name}")
+        return FakeEmbedder(model_name)
+
+    def pool(self, **kwargs):
+        pool = EmbeddingModelPool(self.factory, "base", **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_cold_model_is_served_by_the_default_until_loaded(self):
+        pool = self.pool()
+        self.release.clear()
+        embedder, served = pool.get("other")
+        self.assertEqual((embedder.model_name, served), ("base", "base"))
+        self.assertEqual(pool.status()["loading"], ["other"])
+        self.release.set()
+        pool.preload("other").result(5)
+        self.assertEqual(pool.get("other")[1], "other")
+
+    def test_queue_policy_waits_for_the_load(self):
+        pool = self.pool(cold_policy="queue")
+        embedder, served = pool.get("other")
+        self.assertEqual((embedder.model_name, served), ("other", "other"))
+
+    def test_failed_model_backs_off_before_reloading(self):
+        pool = self.pool(cold_policy="queue", retry_backoff_s=30, retry_backoff_max_s=45)
+        for _ in range(3):
+            self.assertEqual(pool.get("bad")[1], "base")
+        self.assertEqual(self.loads.count("bad"), 1)
+        self.assertIn("no such model", pool.status()["failed"]["bad"])
+
+        self.now += 30
+        self.assertEqual(pool.get("bad")[1], "base")
+        self.assertEqual(self.loads.count("bad"), 2)
+        # the second failure doubles the backoff, capped at retry_backoff_max_s
+        self.now += 44
+        pool.get("bad")
+        self.assertEqual(self.loads.count("bad"), 2)
+        self.now += 1
+        pool.get("bad")
+        self.assertEqual(self.loads.count("bad"), 3)
+
+        self.broken.clear()
+        self.now += 45
+        self.assertEqual(pool.get("bad")[1], "bad")
+        self.assertNotIn("bad", pool.status()["failed"])
+
+    def test_least_recently_used_model_is_evicted_but_not_the_default(self):
+        with mock.patch.object(embedding_pool, "estimate_model_bytes", lambda embedder: 2**20):
+            pool = self.pool(memory_budget_mb=2, cold_policy="queue")
+            pool.get("a")
+            pool.get("b")
+        self.assertEqual(list(pool.status()["resident"]), ["base", "b"])
+
+    def test_set_default(self):
+        pool = self.pool()
+        pool.set_default("other")
+        self.assertEqual(pool.get()[1], "other")
+        with self.assertRaises(OSError):
+            pool.set_default("bad")
+        self.assertEqual(pool.status()["default"], "other")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+
+def write_vectors(cache_dir, texts, seed):
+    store = EmbeddingStore(cache_dir, "model", initial_capacity=4)
+    store.put(texts, np.random.default_rng(seed).random((len(texts), 8), dtype=np.float32))
+
+
+class TestEmbeddingStore(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.ctx = multiprocessing.get_context("spawn")
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def run_writer(self, texts, seed=0):
+        process = self.ctx.Process(target=write_vectors, args=(self.cache_dir, texts, seed))
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+
+    def test_get_or_compute_caches(self):
+        store = EmbeddingStore(self.cache_dir, "model")
+        calls = []
+
+        def compute(texts):
+            calls.append(list(texts))
+            return np.ones((len(texts), 4), dtype=np.float32) * len(calls)
+
+        first = store.get_or_compute(["a", "b", "a"], compute)
+        second = store.get_or_compute(["b", "c"], compute)
+        self.assertEqual(calls, [["a", "b"], ["c"]])
+        np.testing.assert_array_equal(first[2], first[0])
+        np.testing.assert_array_equal(second[0], first[1])
+        self.assertEqual(len(store), 3)
+
+    def test_reader_opened_on_empty_cache_sees_other_process(self):
+        reader = EmbeddingStore(self.cache_dir, "model")
+        self.assertEqual(reader.lookup(["x"])[1], [0])
+
+        texts = [f"text {i}" for i in range(10)]  # grows past initial_capacity
+        self.run_writer(texts, seed=1)
+
+        vectors, missing = reader.lookup(texts)
+        self.assertEqual(missing, [])
+        expected = np.random.default_rng(1).random((10, 8), dtype=np.float32)
+        np.testing.assert_allclose(np.stack(vectors), expected)
+
+    def test_concurrent_writers_share_one_index(self):
+        writers = [self.ctx.Process(target=write_vectors,
+                                    args=(self.cache_dir, [f"w{i} {j}" for j in range(20)] + ["shared"], i))
+                   for i in range(3)]
+        for process in writers:
+            process.start()
+        for process in writers:
+            process.join()
+
+        store = EmbeddingStore(self.cache_dir, "model")
+        self.assertEqual(len(store), 61)
+        self.assertEqual(sorted(store.rows.values()), list(range(61)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import json
+import time
+import unittest
+
+from aios_instance.aios_packet_pb2 import AIOSPacket
+from aios_instance.tools import Muxer
+
+
+def packet(seq_no, data, files=()):
+    p = AIOSPacket(session_id="s1", seq_no=seq_no, data=json.dumps(data))
+    for content in files:
+        p.files.add(metadata="{}", file_data=content)
+    return p
+
+
+class TestMuxer(unittest.TestCase):
+    def test_complete_group_is_merged_in_arrival_order(self):
+        muxer = Muxer(3)
+        self.assertIsNone(muxer.process_packet(packet(1, {"branch": "a"}, [b"A"])))
+        self.assertIsNone(muxer.process_packet(packet(2, {"other": "group"})))
+        self.assertIsNone(muxer.process_packet(packet(1, {"branch": "b"})))
+        merged = muxer.process_packet(packet(1, {"branch": "c"}, [b"C1", b"C2"]))
+
+        self.assertEqual(json.loads(merged.data), {"inputs": [{"branch": "a"}, {"branch": "b"}, {"branch": "c"}]})
+        self.assertEqual([f.file_data for f in merged.files], [b"A", b"C1", b"C2"])
+        stats = muxer.stats()
+        self.assertEqual((stats["completed"], stats["pending_groups"]), (1, 1))
+
+    def test_late_packet_of_a_closed_group_is_dropped(self):
+        muxer = Muxer(2)
+        muxer.process_packet(packet(1, 1))
+        self.assertIsNotNone(muxer.process_packet(packet(1, 2)))
+        self.assertIsNone(muxer.process_packet(packet(1, 3)))
+        self.assertEqual(muxer.stats()["late"], 1)
+        self.assertEqual(muxer.stats()["pending_groups"], 0)
+
+    def test_timeout_merges_partial_group(self):
+        partials = []
+        muxer = Muxer(3, timeout_s=10, partial_policy="merge", on_partial=partials.append)
+        muxer.process_packet(packet(1, "a"))
+        muxer.process_packet(packet(1, "b"))
+        start = muxer.store[("s1", 1)][1]
+
+        self.assertEqual(muxer.expire(now=start + 9), 0)
+        self.assertEqual(muxer.expire(now=start + 10), 1)
+        self.assertEqual(json.loads(partials[0].data), {"inputs": ["a", "b"], "partial": True, "expected": 3})
+        self.assertIsNone(muxer.process_packet(packet(1, "c")))
+        self.assertEqual((muxer.stats()["partial"], muxer.stats()["late"]), (1, 1))
+
+    def test_sweeper_drops_expired_groups(self):
+        muxer = Muxer(2, timeout_s=0.05)
+        muxer.process_packet(packet(1, "a"))
+        deadline = time.monotonic() + 5
+        while muxer.stats()["dropped"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual((muxer.stats()["dropped"], muxer.stats()["pending_groups"]), (1, 0))
+
+    def test_group_cap_closes_the_oldest_group(self):
+        partials = []
+        muxer = Muxer(2, max_groups=2, partial_policy="merge", on_partial=partials.append)
+        for seq_no in (1, 2, 3):
+            muxer.process_packet(packet(seq_no, seq_no))
+        self.assertEqual([p.seq_no for p in partials], [1])
+        self.assertEqual(sorted(key[1] for key in muxer.store), [2, 3])
+
+    def test_byte_cap_closes_the_oldest_groups(self):
+        muxer = Muxer(2, max_pending_bytes=250)
+        muxer.process_packet(packet(1, "x", [b"1" * 100]))
+        muxer.process_packet(packet(2, "x", [b"2" * 100]))
+        self.assertEqual(muxer.stats()["dropped"], 0)
+        muxer.process_packet(packet(3, "x", [b"3" * 100]))
+        stats = muxer.stats()
+        self.assertEqual((stats["dropped"], stats["pending_groups"]), (1, 2))
+        self.assertLessEqual(stats["pending_bytes"], 250)
+        # a completed group releases its bytes
+        self.assertIsNotNone(muxer.process_packet(packet(2, "y")))
+        self.assertEqual(muxer.stats()["pending_bytes"], packet(3, "x", [b"3" * 100]).ByteSize())
+
+    def test_single_input_passes_through(self):
+        p = packet(1, "a")
+        self.assertIs(Muxer(1).process_packet(p), p)
+
+    def test_unknown_partial_policy(self):
+        with self.assertRaises(ValueError):
+            Muxer(2, partial_policy="wait")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import time
+import shutil
+import tempfile
+import textwrap
+import unittest
+import threading
+import multiprocessing
+from unittest import mock
+
+from google.protobuf.wrappers_pb2 import BytesValue
+
+from aios_instance.policy_sandbox import process_pool
+from aios_instance.policy_sandbox.process_pool import PolicyProcessPool, PolicyTimeoutError
+
+POLICY = textwrap.dedent('''
+    import os
+    import time
+
+    class AIOSv1PolicyRule:
+        def __init__(self, rule_id, settings, parameters):
+            self.value = None
+
+        def eval(self, parameters, input_data, context):
+            time.sleep(input_data.get("sleep", 0))
+            return {"value": self.value, "pid": os.getpid()}
+
+        def management(self, action, data):
+            if action == "set":
+                self.value = data["value"]
+                return {"pid": os.getpid()}
+            if action == "hang":
+                time.sleep(60)
+            return self.value
+''')
+
+
+class TestPolicyProcessPool(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.policy_dir = tempfile.mkdtemp()
+        os.environ["POLICY_CACHE_DIR"] = self.cache_dir
+        with open(os.path.join(self.policy_dir, "function.py"), "w") as f:
+            f.write(POLICY)
+        self.pool = PolicyProcessPool(self.policy_dir, {}, {}, workers=2, timeout_s=1.0, fallback="error",
+                                      restart_attempts=2, restart_backoff_s=0.05)
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        shutil.rmtree(self.policy_dir, ignore_errors=True)
+
+    def test_mgmt_reaches_every_worker_while_one_is_busy(self):
+        busy = threading.Thread(target=self.pool.evaluate, args=({"sleep": 0.5},))
+        busy.start()
+        time.sleep(0.1)
+        self.pool.mgmt("set", {"value": 7})
+        busy.join()
+
+        pids = set()
+        for _ in range(20):
+            result = self.pool.evaluate({})
+            self.assertEqual(result["value"], 7)
+            pids.add(result["pid"])
+        self.assertEqual(len(pids), 2)
+
+    def test_mgmt_timeout_replaces_the_worker(self):
+        with self.assertRaises(PolicyTimeoutError):
+            self.pool.mgmt("hang", {})
+        self.assertEqual(self.pool.stats()["restarts"], 2)
+
+        deadline = time.monotonic() + 60
+        while self.pool.stats()["idle_workers"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        # replacements answer eval calls with eval results, not a stale management reply
+        for _ in range(4):
+            result = self.pool.evaluate({})
+            self.assertEqual(set(result), {"value", "pid"})
+            self.assertIsNone(result["value"])
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 60
+        while not condition(self.pool.stats()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self.pool.stats()
+
+    def test_failed_restarts_shrink_the_pool(self):
+        with mock.patch.object(self.pool, "_spawn", side_effect=RuntimeError("no room")):
+            with self.assertRaises(PolicyTimeoutError):
+                self.pool.evaluate({"sleep": 5})
+            stats = self.wait_for(lambda stats: stats["lost_workers"] == 1)
+            self.assertEqual((stats["workers"], stats["restart_failures"], stats["degraded"]), (1, 2, 1))
+
+            # management no longer waits for the lost worker
+            self.assertIsNone(self.pool.mgmt("get", {}))
+
+            with self.assertRaises(PolicyTimeoutError):
+                self.pool.evaluate({"sleep": 5})
+            self.wait_for(lambda stats: stats["workers"] == 0)
+            started = time.monotonic()
+            with self.assertRaisesRegex(PolicyTimeoutError, "no live policy worker"):
+                self.pool.evaluate({})
+            self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_shared_memory_outlives_the_timed_out_worker(self):
+        pids = {self.pool.evaluate({"sleep": 0.3})["pid"] for _ in range(2)} | {self.pool.evaluate({})["pid"]}
+        alive_at_release = []
+        release = process_pool._release
+
+        def record(payload):
+            alive_at_release.append({p.pid for p in multiprocessing.active_children()})
+            release(payload)
+
+        with mock.patch.object(process_pool, "_release", record):
+            with self.assertRaises(PolicyTimeoutError):
+                self.pool.evaluate({"sleep": 5, "blob": BytesValue(value=b"x" * (2 * process_pool.SHM_THRESHOLD))})
+        self.assertEqual(len(alive_at_release), 1)
+        self.assertEqual(len(pids - alive_at_release[0]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
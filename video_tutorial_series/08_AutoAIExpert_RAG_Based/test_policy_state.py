@@ -0,0 +1,94 @@
+import pickle
+import unittest
+from unittest import mock
+
+import redis
+import fakeredis
+
+from aios_instance import policy_state
+from aios_instance.policy_state import InMemoryStateStore, RedisStateStore, create_state_store
+
+
+class TestInMemoryStateStore(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(policy_state.time, "time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_put_merges_and_get_copies(self):
+        store = InMemoryStateStore()
+        store.put("s1", {"a": 1})
+        store.put("s1", {"b": 2})
+        state = store.get("s1")
+        self.assertEqual(state, {"a": 1, "b": 2})
+        state["a"] = 99
+        self.assertEqual(store.get("s1")["a"], 1)
+        self.assertIsNone(store.get("s2"))
+
+    def test_least_recently_used_is_evicted(self):
+        store = InMemoryStateStore(max_entries=2)
+        store.put("s1", {"n": 1})
+        store.put("s2", {"n": 2})
+        store.get("s1")  # s2 is now the least recently used
+        store.incr("s3", "n")
+        self.assertEqual(sorted(store.keys()), ["s1", "s3"])
+        self.assertEqual(store.stats()["evictions"], 1)
+
+    def test_entries_expire_after_their_last_write(self):
+        store = InMemoryStateStore(ttl_s=10)
+        store.put("s1", {"n": 1})
+        store.put("s2", {"n": 1}, ttl_s=30)
+        self.now += 5
+        store.incr("s1", "n")  # extends s1 to 1015
+        self.now += 9
+        self.assertEqual(store.get("s1"), {"n": 2})
+        self.now += 2
+        self.assertIsNone(store.get("s1"))
+        self.assertEqual(store.keys(), ["s2"])
+        # an expired entry starts again from an empty state
+        self.assertEqual(store.incr("s1", "n"), 1)
+
+    def test_pickled_store_is_empty(self):
+        store = InMemoryStateStore(namespace="ns", max_entries=5, ttl_s=7)
+        store.put("s1", {"n": 1})
+        copy = pickle.loads(pickle.dumps(store))
+        self.assertEqual((copy.namespace, copy.max_entries, copy.ttl_s), ("ns", 5, 7))
+        self.assertEqual(copy.keys(), [])
+
+
+class TestRedisStateStore(unittest.TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.from_url = redis.Redis.from_url
+        redis.Redis.from_url = staticmethod(lambda url, **kwargs: fakeredis.FakeRedis(server=server))
+
+    def tearDown(self):
+        redis.Redis.from_url = self.from_url
+
+    def test_replicas_share_counters(self):
+        replicas = [create_state_store({"backend": "redis", "url": "redis://state:6379/0"}, namespace="ns")
+                    for _ in range(2)]
+        for i in range(10):
+            replicas[i % 2].incr("s1", "count")
+        self.assertEqual(replicas[0].get("s1"), {"count": 10})
+
+    def test_write_behind_is_visible_and_keeps_counters(self):
+        store = RedisStateStore("redis://state:6379/0", namespace="ns", write_behind_ms=60000)
+        store.put("s1", {"summary": "text", "count": 5})
+        self.assertEqual(store.client.hgetall("ns:s1"), {})
+        self.assertEqual(store.get("s1"), {"summary": "text", "count": 5})
+
+        # buffered fields are written before the increment, never over it
+        self.assertEqual(store.incr("s1", "count"), 6)
+        store.flush()
+        self.assertEqual(store.get("s1"), {"summary": "text", "count": 6})
+        self.assertEqual(store.keys(), ["s1"])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_state_store({"backend": "etcd"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+import numpy as np
+
+from quantized_embedding import (QuantizedSentenceEncoder, bucket_by_length, dequantize_output, parity_check,
+                                 quantize_output)
+
+
+class FakeTokenizer:
+    """Whitespace tokenizer with the call/pad interface of a HuggingFace tokenizer."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, texts, truncation=True, max_length=512, add_special_tokens=True):
+        self.calls += 1
+        ids = [[len(word) for word in text.split()][:max_length] for text in texts]
+        return {"input_ids": ids, "attention_mask": [[1] * len(i) for i in ids]}
+
+    def pad(self, features, padding=True, return_tensors="np"):
+        width = max(len(ids) for ids in features["input_ids"])
+        return {key: np.array([row + [0] * (width - len(row)) for row in rows]) for key, rows in features.items()}
+
+
+class FakeSession:
+    """Token embeddings [id, 1]: mean pooling gives [mean word length, 1]."""
+
+    def __init__(self):
+        self.widths = []
+
+    def run(self, outputs, inputs):
+        ids = inputs["input_ids"]
+        self.widths.append(ids.shape[1])
+        return [np.stack([ids, np.ones_like(ids)], axis=-1).astype(np.float32)]
+
+
+class TestBucketByLength(unittest.TestCase):
+    def test_batches_hold_similar_lengths(self):
+        lengths = [40, 3, 17, 5, 33, 2, 16]
+        batches = bucket_by_length(lengths, batch_size=2, bucket_width=16)
+        self.assertEqual(batches, [[5, 1], [3], [6, 2], [4, 0]])
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(len(lengths))))
+        self.assertEqual(bucket_by_length([], batch_size=4), [])
+
+
+class TestOutputDtype(unittest.TestCase):
+    def test_round_trip(self):
+        embeddings = np.array([[0.6, -0.8], [1.0, 0.0]], dtype=np.float32)
+        self.assertEqual(quantize_output(embeddings, "float16").dtype, np.float16)
+        packed = quantize_output(embeddings, "int8")
+        self.assertEqual(packed.tolist(), [[76, -102], [127, 0]])
+        np.testing.assert_allclose(dequantize_output(packed), embeddings, atol=1 / 127)
+        self.assertIs(quantize_output(embeddings, "float32"), embeddings)
+        with self.assertRaises(ValueError):
+            quantize_output(embeddings, "bfloat16")
+
+
+class TestParityCheck(unittest.TestCase):
+    def test_identical_and_perturbed_candidates(self):
+        rng = np.random.default_rng(3)
+        vectors = {f"t{i}": rng.normal(size=16).astype(np.float32) for i in range(50)}
+        corpus = list(vectors)
+
+        def reference(texts):
+            return np.stack([vectors[t] for t in texts])
+
+        report = parity_check(reference, lambda texts: quantize_output(reference(texts) / 8, "int8"), corpus, k=5)
+        self.assertEqual((report["num_texts"], report["num_queries"], report["k"]), (50, 50, 5))
+        self.assertGreater(report["min_cosine"], 0.99)
+        self.assertGreater(report["recall@5"], 0.9)
+
+        noise = {t: rng.normal(size=16).astype(np.float32) for t in corpus}
+        report = parity_check(reference, lambda texts: np.stack([noise[t] for t in texts]), corpus, k=5)
+        self.assertLess(report["mean_cosine"], 0.5)
+        self.assertLess(report["recall@5"], 0.5)
+
+
+class TestQuantizedSentenceEncoder(unittest.TestCase):
+    def encoder(self, batch_size):
+        encoder = QuantizedSentenceEncoder.__new__(QuantizedSentenceEncoder)
+        encoder.backend = "onnx"
+        encoder.tokenizer = FakeTokenizer()
+        encoder.session = FakeSession()
+        encoder.input_names = {"input_ids", "attention_mask"}
+        encoder.batch_size = batch_size
+        encoder.max_length = 512
+        encoder.intra_op_threads = None
+        encoder.normalize = False
+        return encoder
+
+    def test_texts_are_tokenized_once_and_padded_per_batch(self):
+        encoder = self.encoder(batch_size=2)
+        texts = ["aaaa", "b " * 20, "cc dd", "e " * 21]
+        embeddings = encoder.encode(texts)
+
+        self.assertEqual(encoder.tokenizer.calls, 1)
+        self.assertEqual(sorted(encoder.session.widths), [2, 21])
+        # results come back in input order, pooled over real tokens only
+        np.testing.assert_allclose(embeddings[:, 0], [4.0, 1.0, 2.0, 1.0])
+        np.testing.assert_allclose(embeddings[:, 1], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
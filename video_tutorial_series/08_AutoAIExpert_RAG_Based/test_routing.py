@@ -0,0 +1,102 @@
+import json
+import unittest
+
+import redis
+import fakeredis
+
+from aios_instance.aios_packet_pb2 import AIOSPacket
+from aios_instance.routing import RoutingResolver, compile_routing_table, default_host
+
+
+def output(block_id, **fields):
+    return dict({"block_id": block_id, "host": default_host(block_id), "port": 6379,
+                 "queue_name": "EXECUTOR_INPUTS"}, **fields)
+
+
+GRAPH = {
+    "is_graph": True,
+    "graph": {
+        "a": {"outputs": [output("b"), output("c")]},
+        "b": {"outputs": [output("d")]},
+        "c": {"outputs": [output("d")]},
+        "d": {"outputs": []},
+        "final": {"outputs": [{"block_id": "gateway", "host": "gw.local", "port": 6380, "queue_name": "OUTPUT"}]},
+    },
+}
+
+
+class TestRoutingResolver(unittest.TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.from_url = redis.Redis.from_url
+        redis.Redis.from_url = staticmethod(lambda url, **kwargs: fakeredis.FakeRedis(server=server))
+
+    def tearDown(self):
+        redis.Redis.from_url = self.from_url
+
+    def packet(self):
+        return AIOSPacket(session_id="vdag::uri::1", seq_no=1, data="{}", output_ptr=json.dumps(GRAPH))
+
+    def test_compile_omits_defaults(self):
+        table = compile_routing_table(json.dumps(GRAPH))
+        self.assertEqual(list(table.block_ids), ["a", "b", "c", "d"])
+        first = table.nodes[0].outputs[0]
+        self.assertEqual(first.block, 1)
+        self.assertEqual((first.host, first.port, first.queue_name), ("", 0, ""))
+        final = table.final[0]
+        self.assertFalse(final.HasField("block"))
+        self.assertEqual((final.block_id, final.host, final.port, final.queue_name), ("gateway", "gw.local", 6380, "OUTPUT"))
+
+    def test_compile_rejects_plain_outputs(self):
+        with self.assertRaises(ValueError):
+            compile_routing_table(json.dumps({"outputs": [output("b")]}))
+
+    def test_resolve_matches_the_json_graph(self):
+        for use_graph_ref in (False, True):
+            packet = self.packet()
+            RoutingResolver("a").compile_packet(packet, use_graph_ref)
+            self.assertEqual(packet.output_ptr, "")
+            self.assertEqual(bool(packet.routing.graph_ref), use_graph_ref)
+
+            # a block that never saw the table reads it from the packet or the graph cache
+            resolved = RoutingResolver("a").resolve(packet)
+            self.assertEqual([o for o, _ in resolved], GRAPH["graph"]["a"]["outputs"])
+            self.assertEqual([d for _, d in resolved], [1, 2])
+
+    def test_cursor_selects_the_node_of_the_next_hop(self):
+        sender = RoutingResolver("a")
+        packet = self.packet()
+        sender.compile_packet(packet)
+        base = packet.SerializeToString()
+        (_, to_b), (_, to_c) = sender.resolve(packet)
+
+        received = AIOSPacket.FromString(sender.serialize_for(base, to_c))
+        self.assertEqual(received.routing.cursor, 2)
+        receiver = RoutingResolver("c")
+        self.assertFalse(receiver.is_final(received))
+        self.assertEqual([o["block_id"] for o, _ in receiver.resolve(received)], ["d"])
+
+        # d has no outputs of its own: the final outputs apply
+        at_d = AIOSPacket.FromString(receiver.serialize_for(received.SerializeToString(), 3))
+        last = RoutingResolver("d")
+        self.assertTrue(last.is_final(at_d))
+        self.assertEqual(last.resolve(at_d), [(GRAPH["graph"]["final"]["outputs"][0], None)])
+
+    def test_overrides_replace_node_outputs(self):
+        packet = self.packet()
+        RoutingResolver("a").compile_packet(packet)
+        packet.routing.overrides[0].outputs.add().block = 3
+        self.assertEqual([o["block_id"] for o, _ in RoutingResolver("a").resolve(packet)], ["d"])
+        packet.routing.overrides[1].SetInParent()
+        self.assertTrue(RoutingResolver("b").is_final(packet))
+
+    def test_missing_graph_ref(self):
+        packet = self.packet()
+        packet.output_ptr = ""
+        packet.routing.graph_ref = "missing"
+        with self.assertRaises(KeyError):
+            RoutingResolver("a").resolve(packet)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import threading
+import unittest
+
+import grpc
+import redis
+import fakeredis
+
+from aios_instance.aios_packet_pb2 import AIOSPacket
+from aios_instance.vdag_service_pb2 import vDAGInferencePacket
+from aios_instance.streaming import StreamHub, StreamPublisher, StreamingInferenceServicer
+
+HUB_URL = "redis://hub:6379/0"
+
+
+class Aborted(Exception):
+    pass
+
+
+class FakeContext:
+    def __init__(self, time_remaining=None, active_for=None):
+        self.remaining = time_remaining
+        self.active_for = active_for  # is_active() calls answered True
+        self.code = None
+
+    def time_remaining(self):
+        return self.remaining
+
+    def is_active(self):
+        if self.active_for is None:
+            return True
+        self.active_for -= 1
+        return self.active_for >= 0
+
+    def abort(self, code, details):
+        self.code = code
+        raise Aborted(details)
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.from_url = redis.Redis.from_url
+        redis.Redis.from_url = staticmethod(lambda url, **kwargs: fakeredis.FakeRedis(server=server))
+        self.hub = StreamHub()
+        self.publisher = StreamPublisher(self.hub)
+        self.submitted = []
+
+    def tearDown(self):
+        redis.Redis.from_url = self.from_url
+
+    def servicer(self, produce=None, **kwargs):
+        def submit(packet):
+            self.submitted.append(packet)
+            if produce:
+                produce(packet)
+        kwargs.setdefault("poll_ms", 50)
+        return StreamingInferenceServicer(submit, self.hub, HUB_URL, **kwargs)
+
+    def answer(self, packet, partials):
+        """The final node: partial outputs through write_ws, then the final output."""
+        self.publisher.open(packet)
+        for data in partials:
+            self.publisher.partial(packet.session_id, {"token": data})
+        packet.data = "done"
+        self.publisher.finish(packet)
+
+    def test_partials_then_final_in_order(self):
+        servicer = self.servicer(lambda packet: self.answer(packet, ["a", "b", "c"]))
+        request = vDAGInferencePacket(session_id="s1", seq_no=3, data="hi")
+        responses = list(servicer.infer_stream(request, FakeContext()))
+
+        self.assertEqual([r.chunk_no for r in responses], [0, 1, 2, 3])
+        self.assertEqual([r.is_final for r in responses], [False, False, False, True])
+        self.assertEqual(responses[-1].data, "done")
+        self.assertEqual(servicer.stats()["chunks"], 4)
+        # the stream is removed once relayed
+        self.assertEqual(self.hub.client(HUB_URL).keys("vdag_stream:*"), [])
+
+        final = servicer.infer(request, FakeContext())
+        self.assertEqual((final.data, final.is_final, final.chunk_no), ("done", True, 3))
+
+    def test_partials_of_concurrent_requests_stay_apart(self):
+        first = AIOSPacket(session_id="s1", seq_no=1, stream_ref=HUB_URL + "#vdag_stream:s1:1:x")
+        second = AIOSPacket(session_id="s1", seq_no=2, stream_ref=HUB_URL + "#vdag_stream:s1:2:y")
+        self.publisher.open(first)
+        self.publisher.open(second)
+        self.publisher.partial("s1", "to second", seq_no=2)
+        self.publisher.partial("s1", {"seq_no": 1, "token": "to first"})
+        self.publisher.partial("s1", "ambiguous")  # dropped: two requests are streaming
+        self.publisher.finish(first)
+        self.publisher.partial("s1", "only second left")
+
+        def data(packet):
+            return [entry[1] for entry in self.hub.read(packet.stream_ref, block_ms=1)]
+
+        self.assertEqual(data(first), ['{"seq_no": 1, "token": "to first"}', ""])
+        self.assertEqual(data(second), ["to second", "only second left"])
+
+    def test_trimmed_partials_are_reported_as_a_gap(self):
+        def produce(packet):
+            self.answer(packet, ["a", "b", "c", "d"])
+            # a client lagging behind maxlen entries finds the oldest ones trimmed
+            _, key = packet.stream_ref.split("#")
+            self.hub.client(HUB_URL).xtrim(key, maxlen=2, approximate=False)
+
+        servicer = self.servicer(produce)
+        responses = list(servicer.infer_stream(vDAGInferencePacket(session_id="s1"), FakeContext()))
+
+        self.assertEqual([r.chunk_no for r in responses], [3, 4])
+        self.assertTrue(responses[-1].is_final)
+        self.assertEqual(servicer.stats()["gaps"], 1)
+
+    def test_missing_final_output_ends_with_deadline_exceeded(self):
+        servicer = self.servicer(timeout_s=0.2)
+        context = FakeContext()
+        with self.assertRaises(Aborted):
+            list(servicer.infer_stream(vDAGInferencePacket(session_id="s1"), context))
+        self.assertEqual(context.code, grpc.StatusCode.DEADLINE_EXCEEDED)
+        self.assertEqual(servicer.stats()["timeouts"], 1)
+
+        # the call's own deadline is shorter than timeout_s and travels with the packet
+        with self.assertRaises(Aborted):
+            list(servicer.infer_stream(vDAGInferencePacket(session_id="s2"), FakeContext(time_remaining=0.1)))
+        self.assertLess(self.submitted[1].deadline - self.submitted[1].ts, 1.0)
+
+    def test_cancelled_call_stops_relaying(self):
+        release = threading.Event()
+
+        def produce(packet):
+            def run():
+                self.publisher.open(packet)
+                self.publisher.partial(packet.session_id, "a")
+                release.wait(5)
+                self.publisher.finish(packet)
+            threading.Thread(target=run, daemon=True).start()
+
+        servicer = self.servicer(produce)
+        responses = list(servicer.infer_stream(vDAGInferencePacket(session_id="s1"), FakeContext(active_for=3)))
+        release.set()
+        self.assertEqual([r.data for r in responses], ["a"])
+        self.assertEqual(servicer.stats()["cancelled"], 1)
+
+    def test_rejected_submission_is_unavailable(self):
+        def submit(packet):
+            raise ConnectionError("queue down")
+
+        servicer = StreamingInferenceServicer(submit, self.hub, HUB_URL)
+        context = FakeContext()
+        with self.assertRaises(Aborted):
+            servicer.infer(vDAGInferencePacket(session_id="s1"), context)
+        self.assertEqual(context.code, grpc.StatusCode.UNAVAILABLE)
+
+
+if __name__ == "__main__":
+    unittest.main()
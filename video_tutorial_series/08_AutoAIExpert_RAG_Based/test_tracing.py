@@ -0,0 +1,90 @@
+import time
+import unittest
+from unittest import mock
+
+from aios_instance.aios_packet_pb2 import AIOSPacket
+from aios_instance.tracing import Tracer, NOOP_TRACE, otlp_payload
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.exporter = ListExporter()
+
+    def tracer(self, block_id, sample_rate=1.0, **kwargs):
+        return Tracer(block_id, "inst-1", self.exporter, sample_rate=sample_rate, linger_ms=1, **kwargs)
+
+    def wait_for(self, count):
+        deadline = time.monotonic() + 5
+        while len(self.exporter.spans) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.exporter.spans
+
+    def test_unsampled_decision_is_propagated(self):
+        packet = AIOSPacket(session_id="s1")
+        self.assertIs(self.tracer("a", sample_rate=0.0).begin(packet), NOOP_TRACE)
+        self.assertTrue(packet.HasField("trace"))
+        self.assertFalse(packet.trace.sampled)
+        # the next hop follows the first decision, whatever its own rate
+        self.assertIs(self.tracer("b", sample_rate=1.0).begin(packet), NOOP_TRACE)
+
+    def test_spans_of_two_hops_form_one_trace(self):
+        packet = AIOSPacket(session_id="s1")
+        first = self.tracer("a")
+        trace = first.begin(packet)
+        with trace.span("on_data"):
+            pass
+        trace.inject(packet)
+        trace.end()
+
+        received = AIOSPacket.FromString(packet.SerializeToString())
+        second = self.tracer("b").begin(received, received_at=time.time())
+        with self.assertRaises(RuntimeError):
+            with second.span("on_data"):
+                raise RuntimeError("boom")
+        second.end()
+
+        spans = self.wait_for(5)
+        self.assertEqual(len(spans), 5)
+        self.assertEqual(len({s["trace_id"] for s in spans}), 1)
+        hops = {s["block_id"]: s for s in spans if s["name"] == "hop"}
+        self.assertEqual(hops["b"]["parent_id"], hops["a"]["span_id"])
+        self.assertTrue(hops["a"]["attributes"]["root"])
+        stages = {(s["block_id"], s["name"]): s for s in spans if s["name"] != "hop"}
+        self.assertIn(("b", "queue_wait"), stages)
+        self.assertEqual(stages[("b", "on_data")]["error"], "boom")
+        self.assertEqual(stages[("b", "on_data")]["parent_id"], hops["b"]["span_id"])
+
+    def test_full_queue_drops_spans(self):
+        with mock.patch.object(Tracer, "_run", lambda self: None):
+            tracer = self.tracer("a", max_queue=2)
+        trace = tracer.begin(AIOSPacket(session_id="s1"))
+        for name in ("one", "two", "three"):
+            trace.add(name, 0.0, 1.0)
+        trace.end()
+        self.assertEqual((tracer.stats()["spans"], tracer.stats()["dropped"]), (2, 2))
+
+    def test_otlp_payload_groups_spans_by_block(self):
+        spans = [
+            {"trace_id": "t", "span_id": "1", "parent_id": "", "name": "hop", "block_id": "a", "instance_id": "i",
+             "start": 1.0, "end": 2.0, "attributes": {}, "error": None},
+            {"trace_id": "t", "span_id": "2", "parent_id": "1", "name": "on_data", "block_id": "b", "instance_id": "i",
+             "start": 1.5, "end": 1.75, "attributes": {}, "error": "boom"},
+        ]
+        payload = otlp_payload(spans)
+        self.assertEqual(len(payload["resourceSpans"]), 2)
+        on_data = payload["resourceSpans"][1]["scopeSpans"][0]["spans"][0]
+        self.assertEqual((on_data["parentSpanId"], on_data["startTimeUnixNano"]), ("1", "1500000000"))
+        self.assertEqual(on_data["status"], {"code": 2, "message": "boom"})
+        self.assertNotIn("parentSpanId", payload["resourceSpans"][0]["scopeSpans"][0]["spans"][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
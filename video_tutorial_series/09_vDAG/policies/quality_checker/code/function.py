@@ -19,35 +19,59 @@ class AIOSv1PolicyRule:
             decode_responses=True  # Store values as strings
         )
 
+    def _audit_record(self, input_data):
+        request_packet = input_data["input_data"]["request"]
+        response_packet = input_data["input_data"]["response"]
+
+        # Extract JSON data fields
+        request_json = json.loads(request_packet.data)
+        response_json = json.loads(response_packet.data)
+
+        # Create audit record
+        record = {
+            "timestamp": time.time(),
+            "session_id": request_packet.session_id,
+            "seq_no": request_packet.seq_no,
+            "request": request_json,
+            "response": response_json
+        }
+
+        # Generate Redis key
+        key = f"audit:{record['session_id']}:{record['seq_no']}"
+        return key, json.dumps(record)
+
     def eval(self, parameters, input_data, context):
         try:
-            request_packet = input_data["input_data"]["request"]
-            response_packet = input_data["input_data"]["response"]
-
-            # Extract JSON data fields
-            request_json = json.loads(request_packet.data)
-            response_json = json.loads(response_packet.data)
-
-            # Create audit record
-            record = {
-                "timestamp": time.time(),
-                "session_id": request_packet.session_id,
-                "seq_no": request_packet.seq_no,
-                "request": request_json,
-                "response": response_json
-            }
-
-            # Generate Redis key
-            key = f"audit:{record['session_id']}:{record['seq_no']}"
+            key, value = self._audit_record(input_data)
 
             # Save to Redis
-            self.redis_client.set(key, json.dumps(record))
+            self.redis_client.set(key, value)
 
         except Exception as e:
             context["last_error"] = str(e)
 
         return {}
 
+    def eval_batch(self, parameters, inputs, context):
+        """Writes the audit records of several packets in one pipelined round trip."""
+        errors = []
+        pipe = self.redis_client.pipeline(transaction=False)
+        for input_data in inputs:
+            try:
+                pipe.set(*self._audit_record(input_data))
+            except Exception as e:
+                errors.append(str(e))
+
+        try:
+            pipe.execute()
+        except Exception as e:
+            errors.append(str(e))
+
+        if errors and context is not None:
+            context["last_error"] = errors[-1]
+
+        return [{} for _ in inputs]
+
     def management(self, action: str, data: dict) -> dict:
         try:
             if action == "get":
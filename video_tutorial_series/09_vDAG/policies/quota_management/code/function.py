@@ -1,3 +1,99 @@
+"""
+Quota Checker Policy
+
+Two modes:
+  - table mode (no "redis_url" parameter): the controller passes its quota_table and the
+    proposed quota (current + 1), which is compared against the session limit.
+  - engine mode ("redis_url" set): the policy keeps its own counters in Redis, updated by
+    Lua scripts so every check-and-consume is atomic across controllers. Supported
+    "limit_type"s, each keyed per session or per tenant ("key_by"):
+        fixed_window    at most limit packets per window_s window
+        sliding_window  at most limit packets in any window_s span, estimated from the
+                        current and previous fixed windows (O(1) memory per key)
+        token_bucket    bursts of up to "burst" packets, refilled at limit / window_s per second
+    Hot keys take a lease of several units per Redis round trip and consume it locally;
+    the lease doubles while it is used up quickly (up to max_lease) and falls back to a
+    single unit when the key cools down, so quiet sessions stay exact. Unused units of an
+    expired lease stay consumed.
+"""
+import threading
+import time
+
+import redis
+
+
+FIXED_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window_ms = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local ttl = redis.call('PTTL', KEYS[1])
+local available = limit - used
+if available <= 0 then
+    return {0, ttl}
+end
+local granted = math.min(wanted, available)
+local value = redis.call('INCRBY', KEYS[1], granted)
+if value == granted or ttl < 0 then
+    redis.call('PEXPIRE', KEYS[1], window_ms)
+    ttl = window_ms
+end
+return {granted, ttl}
+"""
+
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window_ms = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local index = math.floor(now_ms / window_ms)
+local current_key = KEYS[1] .. ':' .. index
+local previous_key = KEYS[1] .. ':' .. (index - 1)
+local current = tonumber(redis.call('GET', current_key) or '0')
+local previous = tonumber(redis.call('GET', previous_key) or '0')
+local elapsed = (now_ms % window_ms) / window_ms
+local estimate = previous * (1 - elapsed) + current
+local available = math.floor(limit - estimate)
+if available <= 0 then
+    local retry_ms = window_ms - (now_ms % window_ms)
+    if previous > 0 and current < limit then
+        retry_ms = math.ceil(window_ms * (1 - (limit - current) / previous)) - (now_ms % window_ms)
+    end
+    return {0, math.max(retry_ms, 1)}
+end
+local granted = math.min(wanted, available)
+redis.call('INCRBY', current_key, granted)
+redis.call('PEXPIRE', current_key, window_ms * 2)
+return {granted, 0}
+"""
+
+TOKEN_BUCKET_SCRIPT = """
+local rate_per_ms = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = burst
+    ts = now_ms
+end
+tokens = math.min(burst, tokens + (now_ms - ts) * rate_per_ms)
+local granted = math.min(wanted, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now_ms)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate_per_ms) + 1000)
+local retry_ms = 0
+if granted == 0 then
+    retry_ms = math.ceil((1 - tokens) / rate_per_ms)
+end
+return {granted, retry_ms}
+"""
+
+LIMIT_TYPES = ("fixed_window", "sliding_window", "token_bucket")
 
 
 class AIOSv1PolicyRule:
@@ -6,15 +102,150 @@ class AIOSv1PolicyRule:
         self.session_limits = parameters.get("session_limits", {})
         self.whitelist = set(parameters.get("whitelist", []))
 
+        self.redis_client = None
+        redis_url = parameters.get("redis_url")
+        if redis_url:
+            self.limit_type = parameters.get("limit_type", "fixed_window")
+            if self.limit_type not in LIMIT_TYPES:
+                raise ValueError(f"Unsupported limit_type '{self.limit_type}'")
+            self.window_s = float(parameters.get("window_s", 3600))
+            self.burst = parameters.get("burst")  # token_bucket only, defaults to the limit
+            self.key_by = parameters.get("key_by", "session")
+            self.key_prefix = parameters.get("key_prefix", "quota")
+            self.max_lease = int(parameters.get("max_lease", 32))
+            self.lease_ttl_s = float(parameters.get("lease_ttl_s", 1.0))
+
+            self.redis_client = redis.Redis.from_url(redis_url)
+            self.scripts = {
+                "fixed_window": self.redis_client.register_script(FIXED_WINDOW_SCRIPT),
+                "sliding_window": self.redis_client.register_script(SLIDING_WINDOW_SCRIPT),
+                "token_bucket": self.redis_client.register_script(TOKEN_BUCKET_SCRIPT),
+            }
+            self.lock = threading.Lock()
+            self.leases = {}  # subject -> {"remaining", "expires", "recheck_at", "retry_at", "size"}
+
+    # ------------------------------------------------------------------ engine mode
+    def _subject(self, input_data):
+        session_id = input_data.get("session_id")
+        if self.key_by == "tenant":
+            tenant_id = input_data.get("tenant_id") or (input_data.get("input") or {}).get("tenant_id")
+            return tenant_id or session_id
+        return session_id
+
+    def _key(self, subject):
+        return f"{self.key_prefix}:{self.limit_type}:{subject}"
+
+    def _acquire(self, subject, limit, wanted):
+        """Takes up to wanted units from Redis; returns (granted, retry_after_ms)."""
+        key = self._key(subject)
+        if self.limit_type == "token_bucket":
+            burst = self.burst if self.burst is not None else limit
+            args = [limit / (self.window_s * 1000.0), burst, wanted]
+        else:
+            args = [limit, int(self.window_s * 1000), wanted]
+        granted, retry_ms = self.scripts[self.limit_type](keys=[key], args=args)
+        return int(granted), max(int(retry_ms), 0)
+
+    def _consume(self, subject, limit, cost):
+        now = time.monotonic()
+        with self.lock:
+            lease = self.leases.get(subject)
+            if lease and lease["expires"] > now:
+                if lease["remaining"] >= cost:
+                    lease["remaining"] -= cost
+                    return True, 0
+                if lease["recheck_at"] > now:
+                    # exhausted keys are not re-checked in Redis on every packet, but the
+                    # caller is told when Redis will grant again, not when we re-check
+                    return False, max(int((lease["retry_at"] - now) * 1000), 1)
+            # lease used up before it expired: the key is hot, take a bigger one next time
+            hot = lease is not None and lease["expires"] > now
+            size = min(self.max_lease, lease["size"] * 2) if hot else 1
+
+        granted, retry_ms = self._acquire(subject, limit, max(cost, size))
+        allowed = granted >= cost
+        with self.lock:
+            if len(self.leases) >= 100000:
+                self.leases = {k: v for k, v in self.leases.items() if v["expires"] > now}
+            # a partial grant cannot serve this packet, it stays as a lease for smaller ones
+            self.leases[subject] = {
+                "remaining": granted - cost if allowed else granted,
+                "expires": now + self.lease_ttl_s,
+                "recheck_at": now + min(retry_ms / 1000.0, self.lease_ttl_s) if not allowed else 0,
+                "retry_at": now + retry_ms / 1000.0 if not allowed else 0,
+                "size": size,
+            }
+        return allowed, 0 if allowed else retry_ms
+
+    def _usage(self, subject):
+        key = self._key(subject)
+        if self.limit_type == "fixed_window":
+            return int(self.redis_client.get(key) or 0)
+        if self.limit_type == "sliding_window":
+            window_ms = int(self.window_s * 1000)
+            now_ms = int(time.time() * 1000)
+            index = now_ms // window_ms
+            current, previous = self.redis_client.mget(f"{key}:{index}", f"{key}:{index - 1}")
+            elapsed = (now_ms % window_ms) / window_ms
+            return int(previous or 0) * (1 - elapsed) + int(current or 0)
+        tokens = self.redis_client.hget(key, "tokens")
+        burst = self.burst if self.burst is not None else self.session_limits.get(subject, self.default_limit)
+        return burst - float(tokens) if tokens is not None else 0
+
+    def _set_usage(self, subject, value):
+        """Sets the consumed amount with a single write, O(1) in value."""
+        key = self._key(subject)
+        window_ms = int(self.window_s * 1000)
+        pipe = self.redis_client.pipeline()
+        if self.limit_type == "fixed_window":
+            pipe.set(key, value, px=window_ms)
+        elif self.limit_type == "sliding_window":
+            index = int(time.time() * 1000) // window_ms
+            pipe.delete(f"{key}:{index - 1}")
+            pipe.set(f"{key}:{index}", value, px=window_ms * 2)
+        else:
+            burst = self.burst if self.burst is not None else self.session_limits.get(subject, self.default_limit)
+            pipe.hset(key, mapping={"tokens": max(burst - value, 0), "ts": int(time.time() * 1000)})
+            pipe.pexpire(key, window_ms + 1000)
+        pipe.execute()
+        with self.lock:
+            self.leases.pop(subject, None)
+
+    def _reset(self, subject):
+        key = self._key(subject)
+        if self.limit_type == "sliding_window":
+            index = int(time.time() * 1000) // int(self.window_s * 1000)
+            self.redis_client.delete(f"{key}:{index}", f"{key}:{index - 1}")
+        else:
+            self.redis_client.delete(key)
+        with self.lock:
+            self.leases.pop(subject, None)
+
+    def _clear_all(self):
+        for key in self.redis_client.scan_iter(match=f"{self.key_prefix}:{self.limit_type}:*", count=1000):
+            self.redis_client.delete(key)
+        with self.lock:
+            self.leases.clear()
+
+    # ------------------------------------------------------------------ policy interface
     def eval(self, parameters, input_data, context):
-        quota_table = input_data["quota_table"]
         session_id = input_data["session_id"]
-        quota = input_data["quota"]  # proposed quota (current + 1)
 
         # Whitelisted session_ids are always allowed
         if session_id in self.whitelist:
             return {"allowed": True}
 
+        if self.redis_client is not None:
+            subject = self._subject(input_data)
+            limit = self.session_limits.get(subject, self.default_limit)
+            allowed, retry_ms = self._consume(subject, limit, int(input_data.get("cost", 1)))
+            if allowed:
+                return {"allowed": True}
+            return {"allowed": False, "retry_after_s": retry_ms / 1000.0}
+
+        quota_table = input_data["quota_table"]
+        quota = input_data["quota"]  # proposed quota (current + 1)
+
         # Determine limit (session-specific or default)
         limit = self.session_limits.get(session_id, self.default_limit)
 
@@ -30,19 +261,32 @@ class AIOSv1PolicyRule:
             action = action.lower()
             qt = data.get("quota_table")
             sid = data.get("session_id")
+            engine = self.redis_client is not None
+            if engine and data.get("tenant_id"):
+                sid = data["tenant_id"]
 
             if action == "get_quota":
+                if engine:
+                    return {"status": "ok", "value": self._usage(sid)}
                 return {"status": "ok", "value": qt.get(sid)}
 
             elif action == "reset_quota":
-                qt.reset(sid)
+                if engine:
+                    self._reset(sid)
+                else:
+                    qt.reset(sid)
                 return {"status": "ok", "message": f"Quota reset for {sid}"}
 
             elif action == "set_quota":
                 value = int(data.get("value", 0))
-                qt.remove(sid)
-                for _ in range(value):
-                    qt.increment(sid)
+                if engine:
+                    self._set_usage(sid, value)
+                elif hasattr(qt, "set"):
+                    qt.set(sid, value)
+                else:
+                    qt.remove(sid)
+                    for _ in range(value):
+                        qt.increment(sid)
                 return {"status": "ok", "message": f"Quota set to {value} for {sid}"}
 
             elif action == "update_limit":
@@ -63,7 +307,10 @@ class AIOSv1PolicyRule:
                 return {"status": "ok", "message": f"{sid} removed from whitelist"}
 
             elif action == "clear_all":
-                qt.clean()
+                if engine:
+                    self._clear_all()
+                else:
+                    qt.clean()
                 return {"status": "ok", "message": "All quotas cleared"}
 
             else:
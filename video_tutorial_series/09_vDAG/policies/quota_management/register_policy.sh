@@ -25,7 +25,8 @@ curl -X POST http://MANAGEMENTMASTER:30102/policy \
            "policy_output_schema": {
              "type": "object",
              "properties": {
-               "allowed": {"type": "boolean"}
+               "allowed": {"type": "boolean"},
+               "retry_after_s": {"type": "number"}
              },
              "required": ["allowed"]
            },
@@ -41,7 +42,15 @@ curl -X POST http://MANAGEMENTMASTER:30102/policy \
                "whitelist": {
                  "type": "array",
                  "items": {"type": "string"}
-               }
+               },
+               "redis_url": {"type": "string"},
+               "limit_type": {"type": "string", "enum": ["fixed_window", "sliding_window", "token_bucket"]},
+               "window_s": {"type": "number"},
+               "burst": {"type": "integer"},
+               "key_by": {"type": "string", "enum": ["session", "tenant"]},
+               "key_prefix": {"type": "string"},
+               "max_lease": {"type": "integer"},
+               "lease_ttl_s": {"type": "number"}
              }
            },
            "policy_settings": {},
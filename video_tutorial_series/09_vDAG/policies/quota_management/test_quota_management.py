@@ -0,0 +1,78 @@
+import unittest
+import os,sys
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+from function import AIOSv1PolicyRule
+sys.path.remove(os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+
+import redis
+import fakeredis
+
+
+class TestQuotaEngine(unittest.TestCase):
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.from_url = redis.Redis.from_url
+        redis.Redis.from_url = staticmethod(lambda url, **kwargs: fakeredis.FakeRedis(server=server))
+
+    def tearDown(self):
+        redis.Redis.from_url = self.from_url
+
+    def policy(self, **parameters):
+        parameters.setdefault("redis_url", "redis://quota:6379/0")
+        return AIOSv1PolicyRule("test-quota", {}, parameters)
+
+    def check(self, policy, session_id="s1"):
+        return policy.eval({}, {"session_id": session_id}, {})
+
+    def test_fixed_window_limit(self):
+        policy = self.policy(limit_type="fixed_window", default_limit=3, window_s=60)
+        results = [self.check(policy) for _ in range(5)]
+        self.assertEqual([r["allowed"] for r in results], [True, True, True, False, False])
+        self.assertGreater(results[3]["retry_after_s"], 55)
+        self.assertTrue(self.check(policy, "s2")["allowed"])
+
+    def test_local_denial_reports_the_real_retry_time(self):
+        policy = self.policy(limit_type="fixed_window", default_limit=1, window_s=60, lease_ttl_s=5)
+        self.assertTrue(self.check(policy)["allowed"])
+        denied = self.check(policy)  # from Redis
+        again = self.check(policy)   # from the local lease, no Redis round trip
+        self.assertFalse(again["allowed"])
+        self.assertGreater(denied["retry_after_s"], 55)
+        self.assertGreater(again["retry_after_s"], 55)
+
+    def test_sliding_window_limit(self):
+        policy = self.policy(limit_type="sliding_window", default_limit=2, window_s=60)
+        results = [self.check(policy) for _ in range(3)]
+        self.assertEqual([r["allowed"] for r in results], [True, True, False])
+        self.assertGreater(results[2]["retry_after_s"], 0)
+
+    def test_token_bucket_burst_and_refill_time(self):
+        policy = self.policy(limit_type="token_bucket", default_limit=60, window_s=60, burst=2)
+        results = [self.check(policy) for _ in range(3)]
+        self.assertEqual([r["allowed"] for r in results], [True, True, False])
+        # one token per second
+        self.assertGreater(results[2]["retry_after_s"], 0)
+        self.assertLessEqual(results[2]["retry_after_s"], 1.0)
+
+    def test_replicas_share_the_limit(self):
+        replicas = [self.policy(limit_type="fixed_window", default_limit=10, window_s=60) for _ in range(2)]
+        allowed = sum(self.check(replicas[i % 2])["allowed"] for i in range(40))
+        self.assertGreater(allowed, 0)
+        self.assertLessEqual(allowed, 10)
+
+    def test_management_set_and_reset(self):
+        policy = self.policy(limit_type="fixed_window", default_limit=3, window_s=60)
+        policy.management("set_quota", {"session_id": "s1", "value": 3})
+        self.assertEqual(policy.management("get_quota", {"session_id": "s1"})["value"], 3)
+        self.assertFalse(self.check(policy)["allowed"])
+        policy.management("reset_quota", {"session_id": "s1"})
+        self.assertTrue(self.check(policy)["allowed"])
+
+    def test_whitelist_bypasses_the_engine(self):
+        policy = self.policy(limit_type="fixed_window", default_limit=0, window_s=60, whitelist=["vip"])
+        self.assertTrue(self.check(policy, "vip")["allowed"])
+        self.assertFalse(self.check(policy, "s1")["allowed"])
+
+
+if __name__ == "__main__":
+    unittest.main()
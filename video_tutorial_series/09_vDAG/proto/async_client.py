@@ -0,0 +1,75 @@
+import json
+import time
+import uuid
+from typing import AsyncIterable, AsyncIterator, List, Optional
+
+import grpc
+
+from .vdag_service_pb2 import vDAGInferencePacket, vDAGFileInfo
+from .vdag_service_pb2_grpc import vDAGInferenceServiceStub
+
+
+class AsyncvDAGClient:
+    """
+    asyncio client for vDAGInferenceService.
+
+        async with AsyncvDAGClient("CLUSTER1MASTER:32409") as client:
+            async for chunk in client.infer_stream({"mode": "chat", "message": "hi"}):
+                print(chunk.data, end="", flush=True)
+
+    infer_stream yields the partial outputs of the final node as the server produces them
+    and ends with the final output (chunk.is_final). The gRPC stream is flow controlled: the
+    server sends no faster than the loop consumes. infer_bidi sends several requests over
+    one stream and yields their responses in order. priority is the request's admission
+    class (0, the default, is shed last) and the call's timeout becomes its deadline.
+    """
+
+    def __init__(self, target: str, options: Optional[list] = None, timeout_s: Optional[float] = 300):
+        self.target = target
+        self.timeout_s = timeout_s
+        self.channel = grpc.aio.insecure_channel(target, options=options or [])
+        self.stub = vDAGInferenceServiceStub(self.channel)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        await self.channel.close()
+
+    @staticmethod
+    def make_request(data, session_id: str = None, seq_no: int = 1,
+                     files: List[vDAGFileInfo] = None, priority: int = 0) -> vDAGInferencePacket:
+        return vDAGInferencePacket(
+            session_id=session_id or str(uuid.uuid4()),
+            seq_no=seq_no,
+            data=data if isinstance(data, str) else json.dumps(data),
+            ts=time.time(),
+            files=files or [],
+            priority=priority,
+        )
+
+    async def infer(self, data, session_id: str = None, seq_no: int = 1,
+                    files: List[vDAGFileInfo] = None, priority: int = 0) -> vDAGInferencePacket:
+        request = self.make_request(data, session_id, seq_no, files, priority)
+        return await self.stub.infer(request, timeout=self.timeout_s)
+
+    async def infer_stream(self, data, session_id: str = None, seq_no: int = 1,
+                           files: List[vDAGFileInfo] = None, priority: int = 0) -> AsyncIterator[vDAGInferencePacket]:
+        request = self.make_request(data, session_id, seq_no, files, priority)
+        call = self.stub.infer_stream(request, timeout=self.timeout_s)
+        try:
+            async for chunk in call:
+                yield chunk
+        finally:
+            call.cancel()
+
+    async def infer_bidi(self, requests: AsyncIterable[vDAGInferencePacket]) -> AsyncIterator[vDAGInferencePacket]:
+        call = self.stub.infer_bidi(requests, timeout=self.timeout_s)
+        try:
+            async for chunk in call:
+                yield chunk
+        finally:
+            call.cancel()
@@ -20,6 +20,16 @@ class vDAGInferenceServiceStub(object):
                 request_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
                 response_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
                 )
+        self.infer_stream = channel.unary_stream(
+                '/vDAGInferenceService/infer_stream',
+                request_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+                response_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
+                )
+        self.infer_bidi = channel.stream_stream(
+                '/vDAGInferenceService/infer_bidi',
+                request_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+                response_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
+                )
 
 
 class vDAGInferenceServiceServicer(object):
@@ -32,6 +42,20 @@ class vDAGInferenceServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def infer_stream(self, request, context):
+        """Partial outputs of the final node as they are produced, ending with the final output
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def infer_bidi(self, request_iterator, context):
+        """Several requests over one stream; each is answered like infer_stream, in order
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_vDAGInferenceServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -40,6 +64,16 @@ def add_vDAGInferenceServiceServicer_to_server(servicer, server):
                     request_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
                     response_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
             ),
+            'infer_stream': grpc.unary_stream_rpc_method_handler(
+                    servicer.infer_stream,
+                    request_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
+                    response_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+            ),
+            'infer_bidi': grpc.stream_stream_rpc_method_handler(
+                    servicer.infer_bidi,
+                    request_deserializer=vdag__service__pb2.vDAGInferencePacket.FromString,
+                    response_serializer=vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'vDAGInferenceService', rpc_method_handlers)
@@ -67,3 +101,37 @@ class vDAGInferenceService(object):
             vdag__service__pb2.vDAGInferencePacket.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def infer_stream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/vDAGInferenceService/infer_stream',
+            vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+            vdag__service__pb2.vDAGInferencePacket.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def infer_bidi(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/vDAGInferenceService/infer_bidi',
+            vdag__service__pb2.vDAGInferencePacket.SerializeToString,
+            vdag__service__pb2.vDAGInferencePacket.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
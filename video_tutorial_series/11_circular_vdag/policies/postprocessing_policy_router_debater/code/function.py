@@ -1,10 +1,18 @@
 import logging
 import os
+import re
 import json
+import math
 import time
-from typing import List, Dict, Any, Optional
+import threading
+import importlib
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 import hashlib
+import redis
 import requests
+from requests.adapters import HTTPAdapter
 import traceback
 
 
@@ -34,7 +42,7 @@ def _snippet(s: Any, limit: int = 500) -> str:
     return t if len(t) <= limit else t[:limit] + "..."
 
 
-def call_external_llm(server_address, block_id, prompt):
+def call_external_llm(server_address, block_id, prompt, session=None, timeout=120):
     """
     Calls an external LLM service via HTTP POST.
 
@@ -42,6 +50,8 @@ def call_external_llm(server_address, block_id, prompt):
         server_address (str): The address of the HTTP server (e.g., 'CLUSTER1MASTER:31504').
         block_id (str): The ID of the model/block to call.
         prompt (str): The prompt to send to the LLM.
+        session (requests.Session): Pooled session to send the request with (default: a new connection).
+        timeout (float | tuple): requests timeout, in seconds.
 
     Returns:
         str: The response from the LLM, or an error message.
@@ -61,7 +71,7 @@ def call_external_llm(server_address, block_id, prompt):
     }
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=120)
+        response = (session or requests).post(url, headers=headers, data=json.dumps(payload), timeout=timeout)
         response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
 
         response_data = response.json()
@@ -111,6 +121,14 @@ class GraphTools:
             logger.error("[GraphTools:init] block_id %s not found in graph keys=%s", self.block_id, list(self.graph_data["graph"].keys()))
             raise ValueError(f"Current block_id '{self.block_id}' not found in the graph")
 
+    @staticmethod
+    def for_packet(packet):
+        """RoutingTableTools for packets carrying a compiled routing header, GraphTools otherwise."""
+        # runtimes older than the routing header have no such field
+        if "routing" in packet.DESCRIPTOR.fields_by_name and packet.HasField("routing"):
+            return RoutingTableTools(packet)
+        return GraphTools(packet.output_ptr)
+
     def set_destination_nodes(self, nodes: List[str], node_to_block_map: Dict[str, str]) -> str:
         logger.info("[GraphTools:set_destination_nodes] nodes=%s map_keys=%s", nodes, list(node_to_block_map.keys()))
         try:
@@ -170,8 +188,373 @@ class GraphTools:
         return json.dumps(parsed)
 
 
+ROUTING_GRAPH_KEY_PREFIX = "routing_graph:"
+_routing_graph_block_ids: Dict[str, List[str]] = {}
+_routing_graph_redis = None
+
+
+def routing_block_ids(routing) -> List[str]:
+    """
+    Node order of a RoutingTable header. Headers sent by graph_ref carry no block_ids; the
+    runtime publishes the table to the graph cache (ROUTING_GRAPH_REDIS_URL), and tables are
+    immutable, so each graph_ref is fetched once.
+    """
+    global _routing_graph_redis
+    if not routing.graph_ref:
+        return list(routing.block_ids)
+    block_ids = _routing_graph_block_ids.get(routing.graph_ref)
+    if block_ids is None:
+        if _routing_graph_redis is None:
+            _routing_graph_redis = redis.Redis.from_url(os.getenv("ROUTING_GRAPH_REDIS_URL", "redis://localhost:6379/0"))
+        data = _routing_graph_redis.get(ROUTING_GRAPH_KEY_PREFIX + routing.graph_ref)
+        if data is None:
+            logger.error("[routing_block_ids] routing graph %s not found in the graph cache", routing.graph_ref)
+            raise KeyError(f"routing graph {routing.graph_ref} not found")
+        table = type(routing)()
+        table.ParseFromString(data)
+        block_ids = _routing_graph_block_ids[routing.graph_ref] = list(table.block_ids)
+    return block_ids
+
+
+class RoutingTableTools:
+    """
+    GraphTools for packets with a RoutingTable header: rewrites this block's outputs in
+    routing.overrides, without parsing or re-serializing the graph. The methods return the
+    packet's (unchanged) output_ptr so call sites stay the same.
+    """
+
+    def __init__(self, packet):
+        self.block_id = os.getenv("BLOCK_ID")
+        if not self.block_id:
+            logger.error("[RoutingTableTools] BLOCK_ID missing in environment")
+            raise EnvironmentError("BLOCK_ID not set in environment variables")
+
+        self.packet = packet
+        routing = packet.routing
+        self.block_ids = routing_block_ids(routing)
+        if routing.HasField("cursor"):
+            self.node = routing.cursor
+        elif self.block_id in self.block_ids:
+            self.node = self.block_ids.index(self.block_id)
+        else:
+            logger.error("[RoutingTableTools:init] block_id %s has no node index in the routing header", self.block_id)
+            raise ValueError(f"Current block_id '{self.block_id}' not found in the routing header")
+
+    def set_destination_blocks(self, block_ids: List[str]) -> str:
+        logger.info("[RoutingTableTools:set_destination_blocks] block_ids=%s", block_ids)
+        routing = self.packet.routing
+        index = {block_id: i for i, block_id in enumerate(self.block_ids)}
+        node = routing.overrides[self.node]
+        del node.outputs[:]
+        for dest_block in block_ids:
+            output = node.outputs.add()
+            if dest_block in index:
+                output.block = index[dest_block]
+            else:
+                output.block_id = dest_block
+        return self.packet.output_ptr
+
+    def set_destination_nodes(self, nodes: List[str], node_to_block_map: Dict[str, str]) -> str:
+        logger.info("[RoutingTableTools:set_destination_nodes] nodes=%s", nodes)
+        for node in nodes:
+            if node not in node_to_block_map:
+                logger.error("[RoutingTableTools:set_destination_nodes] node '%s' missing in node_to_block_map", node)
+                raise ValueError(f"Node '{node}' not found in node_to_block_map")
+        return self.set_destination_blocks([node_to_block_map[node] for node in nodes])
+
+    def finalize(self, data: str = None) -> str:
+        logger.info("[RoutingTableTools:finalize] clearing outputs for block_id=%s", self.block_id)
+        del self.packet.routing.overrides[self.node].outputs[:]
+        return self.packet.output_ptr
+
+
+SINGLE_SCORE_PROMPT = "You are a strict relevance scorer. Read the topic and the candidate reply and return a single line 'SCORE: <0..1>'.\n\nTopic:\n{topic}\n\nCandidate Reply:\n{reply}\n\nRespond ONLY with 'SCORE: <number>'"
+BATCH_SCORE_PROMPT = "You are a strict relevance scorer. For every numbered item, read its topic and candidate reply and rate how relevant the reply is to the topic, from 0 to 1.\n\n{items}\n\nRespond ONLY with one line per item, in order: 'SCORE <item number>: <number>'"
+_SCORE_LINE = re.compile(r"SCORE\s*(?:#?\s*(\d+))?\s*[:=]\s*([-+]?\d*\.?\d+)", re.IGNORECASE)
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _text_hash(text: Any) -> str:
+    return hashlib.sha1(str(text or "").encode("utf-8")).hexdigest()
+
+
+def parse_scores(response_text: str, count: int) -> List[Optional[float]]:
+    """
+    Scores from an evaluator response, one per item (None where missing). Accepts
+    'SCORE <n>: <x>' lines, and unnumbered 'SCORE: <x>' lines in item order.
+    """
+    scores: List[Optional[float]] = [None] * count
+    position = 0
+    for line in (response_text or "").splitlines():
+        match = _SCORE_LINE.search(line)
+        if not match:
+            continue
+        index = int(match.group(1)) - 1 if match.group(1) else position
+        position = index + 1
+        if 0 <= index < count and scores[index] is None:
+            try:
+                scores[index] = max(0.0, min(1.0, float(match.group(2))))
+            except ValueError:
+                continue
+    return scores
+
+
+class ScoreCache:
+    """LRU of relevance scores keyed by (topic hash, reply hash); entries expire after ttl_s."""
+
+    def __init__(self, max_entries: int = 4096, ttl_s: float = 3600):
+        self.max_entries = int(max_entries)
+        self.ttl_s = float(ttl_s)
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[float, float]]" = OrderedDict()
+
+    def get(self, key: Tuple[str, str]) -> Optional[float]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Tuple[str, str], score: float):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (score, time.monotonic() + self.ttl_s)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class LocalRelevanceScorer:
+    """
+    Cheap relevance estimate in [0,1], computed in-process before escalating to the LLM.
+
+    "lexical" (no dependencies) is the cosine of the word-count vectors of topic and reply.
+    "embedding" is the cosine of sentence_transformers embeddings of `model`, "cross_encoder"
+    the (sigmoid of the) score of a sentence_transformers CrossEncoder. sentence_transformers
+    is optional: when it is not installed the scorer is disabled and every reply goes to
+    the LLM.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.kind = str(config.get("type", "lexical"))
+        self.model_name = config.get("model")
+        self.model = None
+        self.enabled = True
+        self.topic_vectors: "OrderedDict[str, Any]" = OrderedDict()
+
+        if self.kind in ("embedding", "cross_encoder"):
+            try:
+                st = importlib.import_module("sentence_transformers")
+                if self.kind == "embedding":
+                    self.model = st.SentenceTransformer(self.model_name or "sentence-transformers/all-MiniLM-L6-v2")
+                else:
+                    self.model = st.CrossEncoder(self.model_name or "cross-encoder/ms-marco-MiniLM-L-6-v2")
+            except Exception as e:
+                logger.warning("[evaluator] local %s scorer unavailable (%s); scoring with the LLM only", self.kind, e)
+                self.enabled = False
+        elif self.kind != "lexical":
+            logger.warning("[evaluator] unknown local scorer type '%s'; scoring with the LLM only", self.kind)
+            self.enabled = False
+
+    @staticmethod
+    def _cosine(a, b) -> float:
+        if isinstance(a, Counter):
+            dot = sum(count * b.get(word, 0) for word, count in a.items())
+            norm = math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values()))
+        else:
+            dot = float(sum(x * y for x, y in zip(a, b)))
+            norm = math.sqrt(float(sum(x * x for x in a))) * math.sqrt(float(sum(y * y for y in b)))
+        return max(0.0, min(1.0, dot / norm)) if norm else 0.0
+
+    def _vector(self, text: str):
+        if self.kind == "lexical":
+            return Counter(word.lower() for word in _WORD.findall(text or ""))
+        return self.model.encode(text or "")
+
+    def _topic_vector(self, topic: str):
+        key = _text_hash(topic)
+        vector = self.topic_vectors.get(key)
+        if vector is None:
+            vector = self.topic_vectors[key] = self._vector(topic)
+            if len(self.topic_vectors) > 256:
+                self.topic_vectors.popitem(last=False)
+        return vector
+
+    def score(self, topic: str, reply: str) -> Optional[float]:
+        if not self.enabled:
+            return None
+        try:
+            if self.kind == "cross_encoder":
+                raw = float(self.model.predict([(str(topic or ""), reply or "")])[0])
+                return raw if 0.0 <= raw <= 1.0 else 1.0 / (1.0 + math.exp(-raw))
+            return self._cosine(self._topic_vector(str(topic or "")), self._vector(reply))
+        except Exception:
+            logger.exception("[evaluator] local scorer failed; escalating to the LLM")
+            return None
+
+
+class _PendingScore:
+    __slots__ = ("topic", "reply", "key", "deadline", "done", "score")
+
+    def __init__(self, topic, reply, key, deadline):
+        self.topic = topic
+        self.reply = reply
+        self.key = key
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.score = None
+
+
+class RelevanceEvaluator:
+    """
+    Relevance scoring for policies, in front of an external llama.cpp block.
+
+    score(topic, reply) answers, in order:
+      1. from the score cache, keyed by (topic hash, reply hash);
+      2. from the local scorer, when one is configured and it is confident: at or above
+         accept_above, or at or below reject_below;
+      3. from the LLM. Concurrent requests are collected for up to batch_wait_ms (or until
+         batch_size are pending) and scored together with one structured prompt; identical
+         (topic, reply) pairs already in flight share a slot.
+
+    LLM calls go through one pooled requests.Session, at most pool_size at a time, each
+    bounded by the caller's deadline (timeout_s). A caller whose deadline passes, or whose
+    item the LLM did not score, gets default_score; such results are not cached.
+    """
+
+    def __init__(self, server_address: str, model_id: str, config: Dict[str, Any] = None):
+        config = dict(config or {})
+        self.server_address = server_address
+        self.model_id = model_id
+        self.batch_size = max(1, int(config.get("batch_size", 8)))
+        self.batch_wait_s = float(config.get("batch_wait_ms", 20)) / 1000.0
+        self.timeout_s = float(config.get("timeout_s", 30))
+        self.connect_timeout_s = float(config.get("connect_timeout_s", 3))
+        self.default_score = float(config.get("default_score", 1.0))
+        self.cache = ScoreCache(config.get("cache_size", 4096), config.get("cache_ttl_s", 3600))
+
+        local = config.get("local_scorer")
+        self.local_scorer = LocalRelevanceScorer(local) if local else None
+        local = local or {}
+        self.accept_above = float(local.get("accept_above", 0.6))
+        self.reject_below = float(local.get("reject_below", 0.1))
+
+        pool_size = max(1, int(config.get("pool_size", 4)))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.calls = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="evaluator")
+
+        self.lock = threading.Condition()
+        self.pending: "OrderedDict[Tuple[str, str], _PendingScore]" = OrderedDict()
+        self.batcher = None
+        self.counters = {"requests": 0, "cache_hits": 0, "local_accepts": 0, "local_rejects": 0,
+                         "llm_calls": 0, "llm_items": 0, "coalesced": 0, "timeouts": 0, "unscored": 0}
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+    def score(self, topic: Any, reply: str) -> float:
+        self._count("requests")
+        key = (_text_hash(topic), _text_hash(reply))
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count("cache_hits")
+            return cached
+
+        if self.local_scorer is not None:
+            local = self.local_scorer.score(topic, reply)
+            if local is not None and (local >= self.accept_above or local <= self.reject_below):
+                self._count("local_accepts" if local >= self.accept_above else "local_rejects")
+                logger.debug("[evaluator] local %s score=%.3f decided without the LLM", self.local_scorer.kind, local)
+                self.cache.put(key, local)
+                return local
+
+        item = self._submit(topic, reply, key)
+        if not item.done.wait(max(0.0, item.deadline - time.monotonic())):
+            self._count("timeouts")
+            logger.warning("[evaluator] no score within %.1fs; defaulting score=%.2f", self.timeout_s, self.default_score)
+            return self.default_score
+        return self.default_score if item.score is None else item.score
+
+    def _submit(self, topic, reply, key) -> _PendingScore:
+        with self.lock:
+            item = self.pending.get(key)
+            if item is not None:
+                self.counters["coalesced"] += 1
+                return item
+            item = self.pending[key] = _PendingScore(topic, reply, key, time.monotonic() + self.timeout_s)
+            if self.batcher is None:
+                self.batcher = threading.Thread(target=self._batch_loop, daemon=True)
+                self.batcher.start()
+            self.lock.notify()
+            return item
+
+    def _batch_loop(self):
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.lock.wait()
+                linger_until = time.monotonic() + self.batch_wait_s
+                while len(self.pending) < self.batch_size:
+                    remaining = linger_until - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.lock.wait(remaining)
+                batch = []
+                while self.pending and len(batch) < self.batch_size:
+                    batch.append(self.pending.popitem(last=False)[1])
+            self.calls.submit(self._score_batch, batch)
+
+    def _prompt(self, batch: List[_PendingScore]) -> str:
+        if len(batch) == 1:
+            return SINGLE_SCORE_PROMPT.format(topic=batch[0].topic, reply=batch[0].reply)
+        items = "\n\n".join(
+            f"Item {i}\nTopic:\n{item.topic}\n\nCandidate Reply:\n{item.reply}" for i, item in enumerate(batch, 1))
+        return BATCH_SCORE_PROMPT.format(items=items)
+
+    def _score_batch(self, batch: List[_PendingScore]):
+        try:
+            remaining = max(item.deadline for item in batch) - time.monotonic()
+            if remaining <= 0:
+                return
+            self._count("llm_calls")
+            self._count("llm_items", len(batch))
+            response_text = call_external_llm(self.server_address, self.model_id, self._prompt(batch),
+                                              session=self.session,
+                                              timeout=(min(self.connect_timeout_s, remaining), remaining))
+            logger.debug("[evaluator] batch of %d, raw=%s", len(batch), _snippet(response_text, 300))
+            for item, score in zip(batch, parse_scores(response_text, len(batch))):
+                if score is None:
+                    self._count("unscored")
+                    continue
+                item.score = score
+                self.cache.put(item.key, score)
+        except Exception:
+            logger.exception("[evaluator] batch scoring failed")
+        finally:
+            for item in batch:
+                item.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.counters)
+            stats["pending"] = len(self.pending)
+        stats["cached"] = len(self.cache)
+        return stats
+
 
-# Module-level state store for debates
+# Module-level state store for debates, used when the runtime provides no settings["state_store"]
 STATE: Dict[str, Dict[str, Any]] = {}
 
 class AIOSv1PolicyRule:
@@ -180,6 +563,9 @@ class AIOSv1PolicyRule:
         self.rule_id = rule_id
         self.settings = settings
         self.parameters = parameters
+        self.state_store = (settings or {}).get("state_store")
+        self._evaluator = None
+        self._evaluator_lock = threading.Lock()
 
     # Optional management hook kept for compatibility and introspection
     def management(self, parameters: Dict[str, Any], input_data: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
@@ -191,6 +577,7 @@ class AIOSv1PolicyRule:
                 "rule_id": self.rule_id,
                 "logger": LOGGER_NAME,
                 "settings_keys": list(self.settings.keys()) if isinstance(self.settings, dict) else None,
+                "evaluator_stats": self._evaluator.stats() if self._evaluator is not None else None,
             }
         except Exception:
             logger.exception("[Policy:management] Exception during management call")
@@ -223,13 +610,33 @@ class AIOSv1PolicyRule:
         }
 
     def _get_state(self, debate_key: str) -> Dict[str, Any]:
+        if self.state_store is not None:
+            st = self._default_state()
+            stored = self.state_store.get(debate_key) or {}
+            for role in ("A", "B"):
+                st["rounds_by_role"][role] = int(stored.pop(f"rounds_{role}", 0) or 0)
+            st["total_rounds"] = int(stored.pop("total_rounds", 0) or 0)
+            st.update(stored)
+            return st
         st = STATE.get(debate_key)
         if st is None:
             st = self._default_state()
             STATE[debate_key] = st
         return st
 
+    def _count_round(self, debate_key: str, st: Dict[str, Any], role: str) -> None:
+        if self.state_store is not None:
+            # separate store fields, incremented atomically so scaled-out routers agree
+            st["rounds_by_role"][role] = self.state_store.incr(debate_key, f"rounds_{role}")
+            st["total_rounds"] = self.state_store.incr(debate_key, "total_rounds")
+            return
+        st["rounds_by_role"][role] = st["rounds_by_role"].get(role, 0) + 1
+        st["total_rounds"] = st.get("total_rounds", 0) + 1
+
     def _save_state(self, debate_key: str, st: Dict[str, Any]) -> None:
+        if self.state_store is not None:
+            self.state_store.put(debate_key, {k: v for k, v in st.items() if k not in ("rounds_by_role", "total_rounds")})
+            return
         STATE[debate_key] = st
 
     def _augment_router_meta_for_judge(self, router_meta_in: Optional[Dict[str, Any]], st: Dict[str, Any], role: Optional[str]) -> Dict[str, Any]:
@@ -302,8 +709,9 @@ class AIOSv1PolicyRule:
             cc = 0
         return limit > 0 and cc >= limit
 
-    def _run_evaluator(self, text: str, topic: Any) -> float:
-        # Return a score in [0,1]. If not configured, accept by default.
+    def _get_evaluator(self) -> Optional[RelevanceEvaluator]:
+        if self._evaluator is not None:
+            return self._evaluator
         settings = self.settings or {}
         evaluator = (settings or {}).get("evaluator") or {}
         # Fallbacks for ad-hoc evaluator inference
@@ -312,24 +720,20 @@ class AIOSv1PolicyRule:
         server_address = evaluator.get("url") or evaluator.get("server_address") or default_addr
         model_id = evaluator.get("model") or evaluator.get("model_id") or default_model
         if not server_address or not model_id:
-            logger.debug("[debater] evaluator configuration missing; defaulting score=1.0 (addr=%s, model=%s)", server_address, model_id)
-            return 1.0
-        prompt = f"You are a strict relevance scorer. Read the topic and the candidate reply and return a single line 'SCORE: <0..1>'.\n\nTopic:\n{topic}\n\nCandidate Reply:\n{text}\n\nRespond ONLY with 'SCORE: <number>'"
+            logger.debug("[debater] evaluator configuration missing (addr=%s, model=%s)", server_address, model_id)
+            return None
+        with self._evaluator_lock:
+            if self._evaluator is None:
+                self._evaluator = RelevanceEvaluator(server_address, model_id, evaluator)
+        return self._evaluator
+
+    def _run_evaluator(self, text: str, topic: Any) -> float:
+        # Return a score in [0,1]. If not configured, accept by default.
         try:
-            response_text = call_external_llm(server_address, model_id, prompt)
-            logger.debug("[debater] evaluator_raw=%s", _snippet(response_text, 300))
-            score = None
-            for line in (response_text or "").splitlines():
-                if "SCORE" in line.upper():
-                    try:
-                        score = float(line.split(":", 1)[1].strip())
-                        break
-                    except Exception:
-                        continue
-            if score is None:
-                logger.warning("[debater] evaluator score not found; defaulting to 1.0")
+            evaluator = self._get_evaluator()
+            if evaluator is None:
                 return 1.0
-            return max(0.0, min(1.0, score))
+            return evaluator.score(topic, text)
         except Exception:
             logger.exception("[debater] evaluator call failed; defaulting score=1.0")
             return 1.0
@@ -390,7 +794,7 @@ class AIOSv1PolicyRule:
                 # Persist state
                 self._save_state(debate_key, st)
                 # Route immediately
-                gt = GraphTools(output_ptr_str)
+                gt = GraphTools.for_packet(packet)
                 packet.data = json.dumps(payload)
                 updated_output_ptr = gt.set_destination_nodes(nodes, node_to_block_map)
                 packet.output_ptr = updated_output_ptr
@@ -404,8 +808,7 @@ class AIOSv1PolicyRule:
 
             # Update counters only for real A/B turns (not retries)
             if not is_retry_turn and prev_role in {"A", "B"}:
-                st["rounds_by_role"][prev_role] = st["rounds_by_role"].get(prev_role, 0) + 1
-                st["total_rounds"] = st.get("total_rounds", 0) + 1
+                self._count_round(debate_key, st, prev_role)
                 if st.get("last_role") == prev_role:
                     st["consec_count"] = st.get("consec_count", 0) + 1
                 else:
@@ -557,7 +960,7 @@ class AIOSv1PolicyRule:
             self._save_state(debate_key, st)
 
             # Enforce minimal payload and route
-            gt = GraphTools(output_ptr_str)
+            gt = GraphTools.for_packet(packet)
             packet.data = json.dumps(payload)
             updated_output_ptr = gt.set_destination_nodes(nodes, node_to_block_map) if nodes else gt.finalize(output_ptr_str)
             if nodes:
@@ -0,0 +1,157 @@
+import re
+import threading
+import unittest
+import importlib.util
+from unittest import mock
+import os,sys
+import redis
+import fakeredis
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+import function
+from function import parse_scores, ScoreCache, RelevanceEvaluator, GraphTools
+sys.path.remove(os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+
+# the runtime's packet definition, loaded on its own so the block runtime is not imported
+_spec = importlib.util.spec_from_file_location("aios_packet_pb2", os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "..", "..", "08_AutoAIExpert_RAG_Based", "aios_instance", "aios_packet_pb2.py"))
+aios_packet_pb2 = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(aios_packet_pb2)
+
+
+class TestParseScores(unittest.TestCase):
+    def test_numbered_lines_in_any_order(self):
+        text = "SCORE 2: 0.25\nnoise\nscore #1 = 0.9\nSCORE 3: 1"
+        self.assertEqual(parse_scores(text, 3), [0.9, 0.25, 1.0])
+
+    def test_unnumbered_lines_follow_item_order(self):
+        self.assertEqual(parse_scores("SCORE: 0.3\nSCORE: .7", 2), [0.3, 0.7])
+        # an unnumbered line continues after the last numbered one
+        self.assertEqual(parse_scores("SCORE 2: 0.5\nSCORE: 0.6", 3), [None, 0.5, 0.6])
+
+    def test_missing_out_of_range_and_clamped(self):
+        self.assertEqual(parse_scores("SCORE 5: 0.5\nSCORE 1: 1.7\nSCORE 1: 0.2\nSCORE 2: -3", 3), [1.0, 0.0, None])
+        self.assertEqual(parse_scores("", 2), [None, None])
+        self.assertEqual(parse_scores(None, 1), [None])
+
+
+class TestScoreCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch.object(function.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ScoreCache(max_entries=2)
+        cache.put(("t", "a"), 0.1)
+        cache.put(("t", "b"), 0.2)
+        self.assertEqual(cache.get(("t", "a")), 0.1)
+        cache.put(("t", "c"), 0.3)
+        self.assertIsNone(cache.get(("t", "b")))
+        self.assertEqual((cache.get(("t", "a")), cache.get(("t", "c"))), (0.1, 0.3))
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire(self):
+        cache = ScoreCache(ttl_s=10)
+        cache.put(("t", "a"), 0.5)
+        self.now += 9.9
+        self.assertEqual(cache.get(("t", "a")), 0.5)
+        self.now += 0.1
+        self.assertIsNone(cache.get(("t", "a")))
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled_cache(self):
+        cache = ScoreCache(max_entries=0)
+        cache.put(("t", "a"), 0.5)
+        self.assertIsNone(cache.get(("t", "a")))
+
+
+class TestRelevanceEvaluator(unittest.TestCase):
+    def setUp(self):
+        self.prompts = []
+        patcher = mock.patch.object(function, "call_external_llm", self.fake_llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_llm(self, server_address, block_id, prompt, session=None, timeout=None):
+        self.prompts.append(prompt)
+        items = len(re.findall(r"^Item \d+$", prompt, re.MULTILINE)) or 1
+        return "\n".join(f"SCORE {i}: 0.{i}" for i in range(1, items + 1))
+
+    def test_concurrent_requests_share_one_llm_call(self):
+        evaluator = RelevanceEvaluator("llm:8000", "model", {"batch_size": 8, "batch_wait_ms": 300})
+        scores = {}
+
+        def score(reply):
+            scores[reply] = evaluator.score("topic", reply)
+
+        threads = [threading.Thread(target=score, args=(reply,)) for reply in ("a", "b", "c", "a")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.prompts), 1)
+        self.assertEqual(sorted(scores.values()), [0.1, 0.2, 0.3])
+        stats = evaluator.stats()
+        self.assertEqual((stats["llm_items"], stats["coalesced"], stats["cached"]), (3, 1, 3))
+
+        # answered from the cache afterwards
+        self.assertEqual(evaluator.score("topic", "b"), scores["b"])
+        self.assertEqual(len(self.prompts), 1)
+
+    def test_confident_local_scores_skip_the_llm(self):
+        evaluator = RelevanceEvaluator("llm:8000", "model", {
+            "batch_wait_ms": 0, "local_scorer": {"type": "lexical", "accept_above": 0.6, "reject_below": 0.1}})
+        self.assertAlmostEqual(evaluator.score("solar power", "solar power"), 1.0)
+        self.assertEqual(evaluator.score("solar power", "bananas"), 0.0)
+        self.assertEqual(self.prompts, [])
+        # in between, the LLM decides
+        self.assertEqual(evaluator.score("solar power costs", "the costs of wind and power lines"), 0.1)
+        self.assertEqual(len(self.prompts), 1)
+
+    def test_unscored_items_get_the_default(self):
+        with mock.patch.object(function, "call_external_llm", lambda *args, **kwargs: "no idea"):
+            evaluator = RelevanceEvaluator("llm:8000", "model", {"batch_wait_ms": 0, "default_score": 0.42})
+            self.assertEqual(evaluator.score("topic", "reply"), 0.42)
+        self.assertEqual(evaluator.stats()["cached"], 0)
+
+
+class TestRoutingTableTools(unittest.TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        for patcher in (mock.patch.object(redis.Redis, "from_url", staticmethod(lambda url, **kwargs: self.redis)),
+                        mock.patch.object(function, "_routing_graph_redis", None),
+                        mock.patch.dict(function._routing_graph_block_ids, clear=True),
+                        mock.patch.dict(os.environ, {"BLOCK_ID": "b"})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        table = aios_packet_pb2.RoutingTable(block_ids=["a", "b", "c"])
+        self.redis.set("routing_graph:g1", table.SerializeToString())
+
+    def packet(self, **routing):
+        return aios_packet_pb2.AIOSPacket(session_id="s1", routing=aios_packet_pb2.RoutingTable(**routing))
+
+    def test_graph_ref_header_resolves_node_indices_from_the_graph_cache(self):
+        packet = self.packet(graph_ref="g1")
+        tools = GraphTools.for_packet(packet)
+        self.assertEqual(tools.node, 1)
+        tools.set_destination_blocks(["c", "external"])
+        outputs = packet.routing.overrides[1].outputs
+        # known blocks keep their index, so the sender can set the next hop's cursor
+        self.assertEqual((outputs[0].block, outputs[1].block_id), (2, "external"))
+        self.assertEqual(list(packet.routing.block_ids), [])
+
+        self.redis.flushall()
+        self.assertEqual(GraphTools.for_packet(self.packet(graph_ref="g1")).node, 1)
+
+    def test_block_missing_from_the_header_is_reported(self):
+        with mock.patch.dict(os.environ, {"BLOCK_ID": "z"}):
+            with self.assertRaisesRegex(ValueError, "routing header"):
+                GraphTools.for_packet(self.packet(block_ids=["a", "b"]))
+        with self.assertRaises(KeyError):
+            GraphTools.for_packet(self.packet(graph_ref="missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,6 +4,7 @@ import json
 import time
 from typing import List, Dict, Any, Optional
 import hashlib
+import redis
 
 
 # Module-level logger
@@ -54,6 +55,14 @@ class GraphTools:
             logger.error("[GraphTools:init] block_id %s not found in graph keys=%s", self.block_id, list(self.graph_data["graph"].keys()))
             raise ValueError(f"Current block_id '{self.block_id}' not found in the graph")
 
+    @staticmethod
+    def for_packet(packet):
+        """RoutingTableTools for packets carrying a compiled routing header, GraphTools otherwise."""
+        # runtimes older than the routing header have no such field
+        if "routing" in packet.DESCRIPTOR.fields_by_name and packet.HasField("routing"):
+            return RoutingTableTools(packet)
+        return GraphTools(packet.output_ptr)
+
     def set_destination_nodes(self, nodes: List[str], node_to_block_map: Dict[str, str]) -> str:
         logger.info("[GraphTools:set_destination_nodes] nodes=%s map_keys=%s", nodes, list(node_to_block_map.keys()))
         try:
@@ -113,6 +122,86 @@ class GraphTools:
         return json.dumps(parsed)
 
 
+ROUTING_GRAPH_KEY_PREFIX = "routing_graph:"
+_routing_graph_block_ids: Dict[str, List[str]] = {}
+_routing_graph_redis = None
+
+
+def routing_block_ids(routing) -> List[str]:
+    """
+    Node order of a RoutingTable header. Headers sent by graph_ref carry no block_ids; the
+    runtime publishes the table to the graph cache (ROUTING_GRAPH_REDIS_URL), and tables are
+    immutable, so each graph_ref is fetched once.
+    """
+    global _routing_graph_redis
+    if not routing.graph_ref:
+        return list(routing.block_ids)
+    block_ids = _routing_graph_block_ids.get(routing.graph_ref)
+    if block_ids is None:
+        if _routing_graph_redis is None:
+            _routing_graph_redis = redis.Redis.from_url(os.getenv("ROUTING_GRAPH_REDIS_URL", "redis://localhost:6379/0"))
+        data = _routing_graph_redis.get(ROUTING_GRAPH_KEY_PREFIX + routing.graph_ref)
+        if data is None:
+            logger.error("[routing_block_ids] routing graph %s not found in the graph cache", routing.graph_ref)
+            raise KeyError(f"routing graph {routing.graph_ref} not found")
+        table = type(routing)()
+        table.ParseFromString(data)
+        block_ids = _routing_graph_block_ids[routing.graph_ref] = list(table.block_ids)
+    return block_ids
+
+
+class RoutingTableTools:
+    """
+    GraphTools for packets with a RoutingTable header: rewrites this block's outputs in
+    routing.overrides, without parsing or re-serializing the graph. The methods return the
+    packet's (unchanged) output_ptr so call sites stay the same.
+    """
+
+    def __init__(self, packet):
+        self.block_id = os.getenv("BLOCK_ID")
+        if not self.block_id:
+            logger.error("[RoutingTableTools] BLOCK_ID missing in environment")
+            raise EnvironmentError("BLOCK_ID not set in environment variables")
+
+        self.packet = packet
+        routing = packet.routing
+        self.block_ids = routing_block_ids(routing)
+        if routing.HasField("cursor"):
+            self.node = routing.cursor
+        elif self.block_id in self.block_ids:
+            self.node = self.block_ids.index(self.block_id)
+        else:
+            logger.error("[RoutingTableTools:init] block_id %s has no node index in the routing header", self.block_id)
+            raise ValueError(f"Current block_id '{self.block_id}' not found in the routing header")
+
+    def set_destination_blocks(self, block_ids: List[str]) -> str:
+        logger.info("[RoutingTableTools:set_destination_blocks] block_ids=%s", block_ids)
+        routing = self.packet.routing
+        index = {block_id: i for i, block_id in enumerate(self.block_ids)}
+        node = routing.overrides[self.node]
+        del node.outputs[:]
+        for dest_block in block_ids:
+            output = node.outputs.add()
+            if dest_block in index:
+                output.block = index[dest_block]
+            else:
+                output.block_id = dest_block
+        return self.packet.output_ptr
+
+    def set_destination_nodes(self, nodes: List[str], node_to_block_map: Dict[str, str]) -> str:
+        logger.info("[RoutingTableTools:set_destination_nodes] nodes=%s", nodes)
+        for node in nodes:
+            if node not in node_to_block_map:
+                logger.error("[RoutingTableTools:set_destination_nodes] node '%s' missing in node_to_block_map", node)
+                raise ValueError(f"Node '{node}' not found in node_to_block_map")
+        return self.set_destination_blocks([node_to_block_map[node] for node in nodes])
+
+    def finalize(self, data: str = None) -> str:
+        logger.info("[RoutingTableTools:finalize] clearing outputs for block_id=%s", self.block_id)
+        del self.packet.routing.overrides[self.node].outputs[:]
+        return self.packet.output_ptr
+
+
 
 # Module-level state store for debates
 STATE: Dict[str, Dict[str, Any]] = {}
@@ -294,7 +383,7 @@ class AIOSv1PolicyRule:
             decision = self._parse_decision(judge_text)
             logger.info("[judge] decision=%s force_finalize=%s prev_role_mode=%s incoming_prev_role=%s outgoing_prev_role=%s role_counts=%s total_rounds=%s", decision, force_finalize, mode, incoming_prev_role, outgoing_prev_role, st.get("role_counts"), st.get("total_rounds"))
 
-            gt = GraphTools(output_ptr_str)
+            gt = GraphTools.for_packet(packet)
 
             # Helper to determine cap reason
             def _cap_reason() -> str:
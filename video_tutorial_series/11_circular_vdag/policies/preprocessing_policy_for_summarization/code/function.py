@@ -12,6 +12,8 @@ import requests
 import time
 import hashlib
 import re
+import threading
+from collections import OrderedDict
 
 # Module-level logger for use in helpers as well
 logger = logging.getLogger(__name__)
@@ -111,6 +113,10 @@ class AIOSv1PolicyRule:
         "last_summary_label": "Previous summary",
         # NEW: Also ingest receiver self-turns provided via router_meta without bumping cadence by default
         "count_router_meta_into_msgs_since_summary": True,
+        # Summarize in the background: forward the last completed summary plus the raw recent
+        # turns right away; only the newest pending window of a session is summarized
+        "async_summarization": False,
+        "summary_cache_size": 256,
     }
 
     def __init__(self, rule_id, settings, parameters):
@@ -132,6 +138,18 @@ class AIOSv1PolicyRule:
         # Session-scoped state: { norm_session_id: { msgs_since_summary, last_total_msgs, last_summary_hash, last_update_ts, summary_version } }
         self._session_state = {}
         self._last_prune_ts = 0.0
+        # Runtime-provided store (settings["state_store"]): sessions live there, bounded by its
+        # TTL/LRU and shared across replicas; _active holds the sessions loaded by the current call
+        self.state_store = self.settings.get("state_store")
+        self._active = threading.local()
+
+        # Async summarization: newest pending window per session, finished summaries per
+        # session until the next turn picks them up, and summaries by window signature
+        self._summary_lock = threading.Condition()
+        self._pending_summaries = OrderedDict()
+        self._completed_summaries = {}
+        self._summary_cache = OrderedDict()
+        self._summary_worker = None
 
     def _load_config(self):
         """Loads configuration from settings using defaults."""
@@ -212,9 +230,96 @@ class AIOSv1PolicyRule:
             self.logger.error(f"Error during summarization: {e}\n{traceback.format_exc()}")
             return None
 
+    # ---- Async summarization ----
+    def _window_key(self, st: dict) -> str:
+        """Signature of a summarization window: its turn signatures plus the previous summary."""
+        sigs = [self._turn_sig(t.get("role"), t.get("text")) or "" for t in (st.get("recent_turns") or [])]
+        sigs.append(st.get("last_summary_hash") or "")
+        return hashlib.sha1("|".join(sigs).encode("utf-8")).hexdigest()
+
+    def _cached_summary(self, window_key: str) -> Optional[str]:
+        with self._summary_lock:
+            summary = self._summary_cache.get(window_key)
+            if summary is not None:
+                self._summary_cache.move_to_end(window_key)
+            return summary
+
+    def _submit_summary(self, sid: str, window_key: str, text: str, msgs: int, total_msgs: int):
+        with self._summary_lock:
+            # coalesce: a newer window replaces the session's pending one
+            self._pending_summaries.pop(sid, None)
+            self._pending_summaries[sid] = (window_key, text, msgs, total_msgs)
+            if self._summary_worker is None:
+                self._summary_worker = threading.Thread(target=self._summary_loop, daemon=True)
+                self._summary_worker.start()
+            self._summary_lock.notify()
+
+    def _summary_loop(self):
+        while True:
+            with self._summary_lock:
+                while not self._pending_summaries:
+                    self._summary_lock.wait()
+                sid, (window_key, text, msgs, total_msgs) = self._pending_summaries.popitem(last=False)
+
+            summary = self._cached_summary(window_key)
+            if summary is None:
+                summary = self._summarize_text(text)
+                summary = self._strip_think_tags(summary) if summary else None
+            if not summary:
+                self.logger.info("No background summary generated for session %s", sid)
+                continue
+
+            with self._summary_lock:
+                self._summary_cache[window_key] = summary
+                while len(self._summary_cache) > int(self.summary_cache_size):
+                    self._summary_cache.popitem(last=False)
+                self._completed_summaries[sid] = (summary, msgs, total_msgs)
+            self.logger.info("Background summary ready for session %s (chars=%d)", sid, len(summary))
+
+    def _record_summary(self, st: dict, summary: str, msgs: int, total_msgs: int):
+        st["msgs_since_summary"] = max(0, st.get("msgs_since_summary", 0) - msgs)
+        st["last_summary_hash"] = hashlib.sha1(summary.encode("utf-8")).hexdigest()
+        st["summary_version"] = st.get("summary_version", 0) + 1
+        st["last_update_ts"] = time.time()
+        st["last_summary_text"] = summary
+        st["last_total_msgs"] = total_msgs
+
+    def _apply_completed_summary(self, sid: Optional[str], st: Optional[dict]):
+        """Folds a finished background summary into the session before this turn is processed."""
+        if not sid or st is None:
+            return
+        with self._summary_lock:
+            completed = self._completed_summaries.pop(sid, None)
+        if completed:
+            self._record_summary(st, *completed)
+            self.logger.debug("Applied background summary v%s for session %s", st.get("summary_version"), sid)
+
+    def _forward_with_async_summary(self, sid: str, st: dict, target: dict, text_content: str, token_count: int):
+        """Attaches the cached or last completed summary plus the raw recent turns, and queues a refresh."""
+        window_key = self._window_key(st)
+        msgs = st.get("msgs_since_summary", 0)
+        total_msgs = len(st.get("recent_turns") or [])
+        cached = self._cached_summary(window_key)
+        if cached is not None:
+            self._record_summary(st, cached, msgs, total_msgs)
+            target["_summary"] = cached
+            target["_original_token_count"] = token_count
+            target["_summarized"] = True
+            self.logger.info("Summary served from cache for session %s", sid)
+            return
+
+        self._submit_summary(sid, window_key, text_content, msgs, total_msgs)
+        last_summary = st.get("last_summary_text")
+        if last_summary:
+            target["_summary"] = last_summary
+            target["_summary_version"] = st.get("summary_version", 0)
+        target["_summary_pending"] = True
+        target[self.recent_appendix_field] = self._build_text_from_recent(st)
+        self.logger.info("Summary queued for session %s; forwarding last summary v%s", sid, st.get("summary_version", 0))
+
     def _prune_sessions_if_needed(self):
         now = time.time()
-        if not self.enable_session_state:
+        if not self.enable_session_state or self.state_store is not None:
             return
         # Periodic prune every 60s
         if now - self._last_prune_ts < 60:
@@ -246,7 +351,14 @@ class AIOSv1PolicyRule:
     def _get_or_init_state(self, norm_sid: Optional[str]) -> Optional[dict]:
         if not (self.enable_session_state and norm_sid):
             return None
-        st = self._session_state.setdefault(
+        sessions = self._session_state
+        if self.state_store is not None:
+            sessions = self._active_sessions()
+            if norm_sid not in sessions:
+                stored = self.state_store.get(norm_sid)
+                if stored is not None:
+                    sessions[norm_sid] = stored
+        st = sessions.setdefault(
             norm_sid,
             {
                 "msgs_since_summary": 0,
@@ -270,6 +382,25 @@ class AIOSv1PolicyRule:
                 st["seen_turn_sigs"] = set()
         return st
 
+    def _active_sessions(self) -> dict:
+        sessions = getattr(self._active, "sessions", None)
+        if sessions is None:
+            sessions = self._active.sessions = {}
+        return sessions
+
+    def _persist_sessions(self):
+        """Writes the sessions loaded by this call back to the state store."""
+        sessions = self._active_sessions()
+        for sid, st in sessions.items():
+            fields = dict(st)
+            if isinstance(fields.get("seen_turn_sigs"), set):
+                fields["seen_turn_sigs"] = sorted(fields["seen_turn_sigs"])
+            try:
+                self.state_store.put(sid, fields, ttl_s=float(self.session_ttl_seconds or 0) or None)
+            except Exception as e:
+                self.logger.error("Failed to persist session state for %s: %s", sid, e)
+        sessions.clear()
+
     def _turn_sig(self, role: Optional[str], text: Optional[str]) -> Optional[str]:
         try:
             if not text:
@@ -439,6 +570,14 @@ class AIOSv1PolicyRule:
 
     def eval(self, parameters, input_data, context):
         """Processes input data for summarization using only session recent_turns; ignores upstream history."""
+        if self.state_store is None:
+            return self._eval(parameters, input_data, context)
+        try:
+            return self._eval(parameters, input_data, context)
+        finally:
+            self._persist_sessions()
+
+    def _eval(self, parameters, input_data, context):
         if not self.enable_summarization:
             self.logger.info("Summarization is disabled.")
             return input_data
@@ -594,6 +733,9 @@ class AIOSv1PolicyRule:
             except Exception:
                 pass
 
+            if self.async_summarization:
+                self._apply_completed_summary(norm_sid, st)
+
             # Build text window from session recent_turns
             text_content = self._build_text_from_recent(st) if st is not None else None
             if not text_content:
@@ -667,7 +809,11 @@ class AIOSv1PolicyRule:
                     self.logger.info("\n===== Summarization Window (tokens=%s, chars=%s) =====\n%s\n===== End Window =====", token_count, len(text_content), text_content)
                 except Exception:
                     pass
-                summary = self._summarize_text(text_content)
+                if self.async_summarization and st is not None and norm_sid:
+                    self._forward_with_async_summary(norm_sid, st, target, text_content, token_count)
+                    summary = None
+                else:
+                    summary = self._summarize_text(text_content)
                 if summary:
                     # Sanitize summary from hidden thoughts before storing/logging
                     sanitized = self._strip_think_tags(summary)
@@ -696,7 +842,7 @@ class AIOSv1PolicyRule:
                             "Session updated after summarize: %s",
                             {k: st.get(k) for k in ("msgs_since_summary", "last_total_msgs", "summary_version")},
                         )
-                else:
+                elif not self.async_summarization:
                     self.logger.info("No summary generated by external LLM.")
             else:
                 # Emit marker with pending delta and optionally the recent appendix
@@ -760,12 +906,17 @@ class AIOSv1PolicyRule:
                 except Exception as e:
                     return {"status": "error", "message": f"Connection test failed: {e}"}
             elif action == "reset_sessions":
+                if self.state_store is not None:
+                    self.state_store.clear()
                 self._session_state.clear()
                 return {"status": "success", "message": "Session state cleared."}
             elif action == "get_sessions":
                 # Return a sanitized shallow copy (do not expose texts)
                 safe = {}
-                for k, v in self._session_state.items():
+                sessions = self._session_state
+                if self.state_store is not None:
+                    sessions = {sid: self.state_store.get(sid) for sid in self.state_store.keys()}
+                for k, v in sessions.items():
                     if not isinstance(v, dict):
                         continue
                     c = {kk: vv for kk, vv in v.items() if kk not in ("recent_turns", "last_summary_text")}
@@ -0,0 +1,89 @@
+import time
+import threading
+import unittest
+from unittest import mock
+import os,sys
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+import function
+from function import AIOSv1PolicyRule
+sys.path.remove(os.path.join(os.path.dirname(os.path.realpath(__file__)),"code"))
+
+
+class TestAsyncSummary(unittest.TestCase):
+    def setUp(self):
+        self.prompts = []
+        self.release = threading.Event()
+        self.release.set()
+        patcher = mock.patch.object(function, "call_external_llm", self.fake_llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.policy = AIOSv1PolicyRule("test-summary", {"async_summarization": True}, {})
+
+    def fake_llm(self, server_address, block_id, prompt):
+        self.prompts.append(prompt)
+        self.release.wait(5)
+        return f"<think>hmm</think>summary {len(self.prompts)}"
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    @staticmethod
+    def state(*texts):
+        return {"recent_turns": [{"role": "A", "text": text} for text in texts], "msgs_since_summary": len(texts)}
+
+    def test_newer_window_replaces_the_pending_one(self):
+        self.release.clear()
+        self.policy._submit_summary("s1", "w1", "first window", 1, 1)
+        self.wait_for(lambda: len(self.prompts) == 1)  # the worker is busy with w1
+        self.policy._submit_summary("s1", "w2", "second window", 2, 2)
+        self.policy._submit_summary("s1", "w3", "third window", 3, 3)
+        self.assertEqual([key for key, *_ in self.policy._pending_summaries.values()], ["w3"])
+
+        self.release.set()
+        self.wait_for(lambda: len(self.prompts) == 2 and "s1" in self.policy._completed_summaries
+                      and self.policy._completed_summaries["s1"][1] == 3)
+        self.assertTrue(self.prompts[0].endswith("first window"))
+        self.assertTrue(self.prompts[1].endswith("third window"))
+        self.assertEqual(self.policy._completed_summaries["s1"], ("summary 2", 3, 3))
+        self.assertEqual(set(self.policy._summary_cache), {"w1", "w3"})
+
+    def test_cache_hit_skips_the_llm(self):
+        st = self.state("A says one", "B says two")
+        self.policy._summary_cache[self.policy._window_key(st)] = "cached summary"
+        target = {}
+        self.policy._forward_with_async_summary("s1", st, target, "A says one\nB says two", 6)
+
+        self.assertEqual(target["_summary"], "cached summary")
+        self.assertTrue(target["_summarized"])
+        self.assertNotIn("_summary_pending", target)
+        self.assertEqual((st["summary_version"], st["msgs_since_summary"]), (1, 0))
+        self.assertEqual(self.prompts, [])
+        self.assertEqual(len(self.policy._pending_summaries), 0)
+
+    def test_completed_summary_is_folded_into_the_next_turn(self):
+        st = self.state("A says one")
+        target = {}
+        self.policy._forward_with_async_summary("s1", st, target, "A says one", 3)
+        # nothing summarized yet: the raw recent turns go along
+        self.assertTrue(target["_summary_pending"])
+        self.assertNotIn("_summary", target)
+        self.assertEqual(target[self.policy.recent_appendix_field], "A: A says one")
+        self.wait_for(lambda: "s1" in self.policy._completed_summaries)
+
+        st["recent_turns"].append({"role": "B", "text": "B says two"})
+        st["msgs_since_summary"] += 1
+        self.policy._apply_completed_summary("s1", st)
+        self.assertEqual((st["last_summary_text"], st["summary_version"]), ("summary 1", 1))
+        self.assertEqual(st["msgs_since_summary"], 1)  # only the turn after the summarized window is left
+        self.assertNotIn("s1", self.policy._completed_summaries)
+
+        target = {}
+        self.policy._forward_with_async_summary("s1", st, target, "A says one\nB says two", 6)
+        self.assertEqual((target["_summary"], target["_summary_version"]), ("summary 1", 1))
+        self.assertTrue(target["_summary_pending"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+"""
+Async gRPC load generator and latency benchmark for blocks and vDAGs.
+
+All requests of a run share a small pool of grpc.aio channels (--channels). Two arrival
+models are supported:
+  closed loop  --concurrency N: N virtual users, each sending its next request when the
+               previous one finishes (plus --think-s)
+  open loop    --rate R: Poisson arrivals at R requests/s, or --trace: a JSON lines trace
+               of {"t": <s>, "input_tokens": .., "output_tokens": ..} replayed on time.
+               Arrivals do not wait for responses; beyond --max-in-flight they are
+               counted as rejected, so an overloaded target shows up as such.
+
+Input and output lengths are drawn from --input-tokens / --output-tokens, given as
+fixed:N, uniform:A,B, normal:MEAN,SD, lognormal:MEAN,SIGMA (of the underlying normal)
+or exp:MEAN.
+
+Targets (--api):
+  block        BlockInferenceService.infer (unary: end-to-end latency only)
+  vdag         vDAGInferenceService.infer (unary)
+  vdag-stream  vDAGInferenceService.infer_stream: time to first token (first partial
+               output), time per output token and end-to-end latency
+
+TTFT, TPOT (time per output token after the first), inter-chunk gaps and end-to-end
+latency are recorded in HDR histograms (3 significant digits). The report (JSON, to
+stdout or --json) has percentiles, throughput and errors by gRPC status; --csv writes
+one row per request. With the hdrh package installed the report also carries the
+encoded histograms.
+
+--stub starts a local stub server for all three APIs, with simulated prefill and decode
+speeds, so the tool can be tried without a cluster:
+
+    python loadgen.py --stub --api vdag-stream --rate 20 --duration 30 \\
+        --input-tokens lognormal:5,0.5 --output-tokens uniform:50,200 --json report.json
+"""
+import os
+import sys
+import csv
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import importlib
+from collections import Counter
+from typing import Callable, List, Tuple
+
+import grpc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "inference_client"))
+sys.path.append(os.path.join(HERE, "..", "..", "09_vDAG"))
+
+import service_pb2
+import service_pb2_grpc
+from proto import vdag_service_pb2, vdag_service_pb2_grpc
+
+try:
+    hdrh = importlib.import_module("hdrh.histogram")
+except ImportError:
+    hdrh = None
+
+
+WORDS = ["report", "details", "analysis", "scene", "image", "summary", "context", "objects", "actions", "story"]
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+# ----------------------------------------------------------------------------------
+# Token length distributions
+# ----------------------------------------------------------------------------------
+
+def parse_distribution(spec: str) -> Callable[[random.Random], int]:
+    """fixed:N, uniform:A,B, normal:MEAN,SD, lognormal:MU,SIGMA or exp:MEAN; samples are >= 1."""
+    name, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if name == "fixed":
+        sample = lambda rng: values[0]
+    elif name == "uniform":
+        sample = lambda rng: rng.uniform(values[0], values[1])
+    elif name == "normal":
+        sample = lambda rng: rng.gauss(values[0], values[1])
+    elif name == "lognormal":
+        sample = lambda rng: rng.lognormvariate(values[0], values[1])
+    elif name == "exp":
+        sample = lambda rng: rng.expovariate(1.0 / values[0])
+    else:
+        raise ValueError(f"Unknown distribution: {spec}")
+    return lambda rng: max(1, int(round(sample(rng))))
+
+
+def make_prompt(rng: random.Random, tokens: int) -> str:
+    """About `tokens` tokens of text (one word per token)."""
+    return " ".join(rng.choice(WORDS) for _ in range(tokens))
+
+
+# ----------------------------------------------------------------------------------
+# Histograms
+# ----------------------------------------------------------------------------------
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of latencies, recorded in microseconds with 3 significant digits:
+    values below 2048us are exact, larger ones share log-spaced buckets of 1024 linear
+    sub-buckets each. Memory does not grow with the number of samples.
+    """
+
+    SUB_BUCKET_BITS = 11  # 2048 sub-buckets: 3 significant digits
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counts = Counter()
+        self.total = 0
+        self.sum_us = 0
+        self.max_us = 0
+        self.hdr = hdrh.HdrHistogram(1, 3600 * 1000 * 1000, 3) if hdrh else None
+
+    def record(self, seconds: float):
+        value = max(0, int(seconds * 1e6))
+        shift = max(0, value.bit_length() - self.SUB_BUCKET_BITS)
+        self.counts[(shift, value >> shift)] += 1
+        self.total += 1
+        self.sum_us += value
+        self.max_us = max(self.max_us, value)
+        if self.hdr is not None:
+            self.hdr.record_value(max(1, value))
+
+    def percentile(self, p: float) -> float:
+        """Latency in seconds at percentile p (highest value equivalent to its bucket)."""
+        if not self.total:
+            return 0.0
+        target = max(1, math.ceil(self.total * p / 100.0))
+        seen = 0
+        for shift, sub in sorted(self.counts, key=lambda k: k[1] << k[0]):
+            seen += self.counts[(shift, sub)]
+            if seen >= target:
+                return min(((sub + 1) << shift) - 1, self.max_us) / 1e6
+        return self.max_us / 1e6
+
+    def summary(self) -> dict:
+        summary = {"count": self.total}
+        if self.total:
+            summary["mean_s"] = self.sum_us / self.total / 1e6
+            for p in PERCENTILES:
+                summary[f"p{p:g}_s"] = self.percentile(p)
+            summary["max_s"] = self.max_us / 1e6
+        if self.hdr is not None and self.total:
+            summary["hdr"] = self.hdr.encode().decode()
+        return summary
+
+
+# ----------------------------------------------------------------------------------
+# Clients
+# ----------------------------------------------------------------------------------
+
+def count_tokens(data: str) -> int:
+    """Output tokens of a response: usage.completion_tokens when reported, else words of the reply."""
+    try:
+        payload = json.loads(data)
+    except (TypeError, json.JSONDecodeError):
+        return len((data or "").split())
+    if isinstance(payload, dict):
+        usage = payload.get("usage") or {}
+        if isinstance(usage, dict) and usage.get("completion_tokens"):
+            return int(usage["completion_tokens"])
+        for key in ("reply", "text", "token", "output"):
+            if isinstance(payload.get(key), str):
+                return len(payload[key].split())
+    return len(str(payload).split())
+
+
+class LoadClient:
+    """Round-robins requests over a pool of shared grpc.aio channels."""
+
+    def __init__(self, target: str, api: str, channels: int = 1, block_id: str = "", timeout_s: float = 300):
+        self.api = api
+        self.block_id = block_id
+        self.timeout_s = timeout_s
+        self.channels = [grpc.aio.insecure_channel(target) for _ in range(max(1, channels))]
+        if api == "block":
+            self.stubs = [service_pb2_grpc.BlockInferenceServiceStub(c) for c in self.channels]
+        else:
+            self.stubs = [vdag_service_pb2_grpc.vDAGInferenceServiceStub(c) for c in self.channels]
+        self.next = 0
+
+    async def close(self):
+        for channel in self.channels:
+            await channel.close()
+
+    def _stub(self):
+        self.next = (self.next + 1) % len(self.stubs)
+        return self.stubs[self.next]
+
+    def _payload(self, prompt: str, output_tokens: int, session_id: str) -> str:
+        return json.dumps({
+            "mode": "chat",
+            "message": prompt,
+            "gen_params": {"temperature": 0.1, "top_p": 0.95, "max_tokens": output_tokens},
+            "session_id": session_id,
+        })
+
+    async def send(self, prompt: str, output_tokens: int, record: dict):
+        """Sends one request and fills record with its timings (seconds from the send)."""
+        session_id = f"loadgen-{uuid.uuid4()}"
+        data = self._payload(prompt, output_tokens, session_id)
+        start = time.perf_counter()
+
+        if self.api == "block":
+            request = service_pb2.BlockInferencePacket(block_id=self.block_id, session_id=session_id, seq_no=1,
+                                                       data=data, ts=time.time())
+            response = await self._stub().infer(request, timeout=self.timeout_s)
+            record["e2e_s"] = time.perf_counter() - start
+            record["output_tokens"] = count_tokens(response.data)
+            return
+
+        request = vdag_service_pb2.vDAGInferencePacket(session_id=session_id, seq_no=1, data=data, ts=time.time())
+        if self.api == "vdag":
+            response = await self._stub().infer(request, timeout=self.timeout_s)
+            record["e2e_s"] = time.perf_counter() - start
+            record["output_tokens"] = count_tokens(response.data)
+            return
+
+        tokens, last, gaps = 0, None, []
+        async for chunk in self._stub().infer_stream(request, timeout=self.timeout_s):
+            now = time.perf_counter()
+            if chunk.is_final:
+                if not tokens:
+                    tokens = count_tokens(chunk.data)
+                break
+            if last is None:
+                record["ttft_s"] = now - start
+            else:
+                gaps.append(now - last)
+            last = now
+            tokens += count_tokens(chunk.data)
+        record["e2e_s"] = time.perf_counter() - start
+        record["output_tokens"] = tokens
+        record["gaps"] = gaps
+        if "ttft_s" in record and tokens > 1:
+            record["tpot_s"] = (last - start - record["ttft_s"]) / (tokens - 1)
+
+
+# ----------------------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------------------
+
+class Benchmark:
+    def __init__(self, client: LoadClient, input_dist, output_dist, seed: int = 0, max_in_flight: int = 1000):
+        self.client = client
+        self.input_dist = input_dist
+        self.output_dist = output_dist
+        self.rng = random.Random(seed)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.records: List[dict] = []
+        self.errors = Counter()
+        self.rejected = 0
+        self.histograms = {name: LatencyHistogram(name) for name in ("ttft", "tpot", "inter_chunk", "e2e")}
+
+    async def one(self, input_tokens: int = None, output_tokens: int = None):
+        input_tokens = input_tokens or self.input_dist(self.rng)
+        output_tokens = output_tokens or self.output_dist(self.rng)
+        record = {"start": time.time(), "input_tokens": input_tokens, "requested_output_tokens": output_tokens,
+                  "status": "OK"}
+        self.in_flight += 1
+        try:
+            await self.client.send(make_prompt(self.rng, input_tokens), output_tokens, record)
+        except grpc.aio.AioRpcError as e:
+            record["status"] = e.code().name
+        except Exception as e:
+            record["status"] = type(e).__name__
+        finally:
+            self.in_flight -= 1
+
+        if record["status"] != "OK":
+            self.errors[record["status"]] += 1
+        else:
+            self.histograms["e2e"].record(record["e2e_s"])
+            if "ttft_s" in record:
+                self.histograms["ttft"].record(record["ttft_s"])
+            if "tpot_s" in record:
+                self.histograms["tpot"].record(record["tpot_s"])
+            for gap in record.pop("gaps", []):
+                self.histograms["inter_chunk"].record(gap)
+        record.pop("gaps", None)
+        self.records.append(record)
+
+    async def closed_loop(self, concurrency: int, duration_s: float, requests: int = None, think_s: float = 0):
+        deadline = time.monotonic() + duration_s
+        remaining = [requests]
+
+        async def user():
+            while time.monotonic() < deadline:
+                if remaining[0] is not None:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                await self.one()
+                if think_s:
+                    await asyncio.sleep(self.rng.expovariate(1.0 / think_s))
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+
+    async def open_loop(self, arrivals):
+        """arrivals: (offset s, input tokens or None, output tokens or None), in time order."""
+        start = time.monotonic()
+        tasks = set()
+        for offset, input_tokens, output_tokens in arrivals:
+            delay = start + offset - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                continue
+            task = asyncio.ensure_future(self.one(input_tokens, output_tokens))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    def report(self, wall_s: float, config: dict) -> dict:
+        ok = [r for r in self.records if r["status"] == "OK"]
+        output_tokens = sum(r.get("output_tokens", 0) for r in ok)
+        return {
+            "config": config,
+            "wall_s": wall_s,
+            "requests": len(self.records),
+            "ok": len(ok),
+            "rejected": self.rejected,
+            "errors": dict(self.errors),
+            "throughput_rps": len(ok) / wall_s if wall_s else 0.0,
+            "output_tokens_per_s": output_tokens / wall_s if wall_s else 0.0,
+            "input_tokens_per_s": sum(r["input_tokens"] for r in ok) / wall_s if wall_s else 0.0,
+            "latency": {name: h.summary() for name, h in self.histograms.items() if h.total},
+        }
+
+    def write_csv(self, path: str):
+        columns = ["start", "status", "input_tokens", "requested_output_tokens", "output_tokens",
+                   "ttft_s", "tpot_s", "e2e_s"]
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(self.records)
+
+
+def poisson_arrivals(rng: random.Random, rate: float, duration_s: float):
+    t = rng.expovariate(rate)
+    while t < duration_s:
+        yield t, None, None
+        t += rng.expovariate(rate)
+
+
+def trace_arrivals(path: str, speed: float = 1.0):
+    """JSON lines of {"t", "input_tokens"?, "output_tokens"?}, replayed speed times faster."""
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    for row in sorted(rows, key=lambda r: float(r["t"])):
+        yield float(row["t"]) / speed, row.get("input_tokens"), row.get("output_tokens")
+
+
+# ----------------------------------------------------------------------------------
+# Stub server
+# ----------------------------------------------------------------------------------
+
+class StubModel:
+    """Answers like an LLM block: waits input/prefill_tps, then emits a token every 1/decode_tps."""
+
+    def __init__(self, prefill_tps: float = 5000, decode_tps: float = 50, error_rate: float = 0.0, seed: int = 0):
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+
+    @staticmethod
+    def _request(data: str) -> Tuple[int, int]:
+        payload = json.loads(data or "{}")
+        return len(str(payload.get("message", "")).split()), int((payload.get("gen_params") or {}).get("max_tokens", 16))
+
+    async def generate(self, data: str, context):
+        input_tokens, output_tokens = self._request(data)
+        if self.rng.random() < self.error_rate:
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "stub error")
+        await asyncio.sleep(input_tokens / self.prefill_tps)
+        for i in range(output_tokens):
+            await asyncio.sleep(1.0 / self.decode_tps)
+            yield WORDS[i % len(WORDS)]
+
+    async def reply(self, data: str, context) -> str:
+        tokens = [token async for token in self.generate(data, context)]
+        return json.dumps({"reply": " ".join(tokens), "usage": {"completion_tokens": len(tokens)}})
+
+
+class StubBlockService(service_pb2_grpc.BlockInferenceServiceServicer):
+    def __init__(self, model: StubModel):
+        self.model = model
+
+    async def infer(self, request, context):
+        data = await self.model.reply(request.data, context)
+        return service_pb2.AIOSPacket(session_id=request.session_id, seq_no=request.seq_no, data=data, ts=time.time())
+
+
+class StubvDAGService(vdag_service_pb2_grpc.vDAGInferenceServiceServicer):
+    def __init__(self, model: StubModel):
+        self.model = model
+
+    async def infer(self, request, context):
+        data = await self.model.reply(request.data, context)
+        return vdag_service_pb2.vDAGInferencePacket(session_id=request.session_id, seq_no=request.seq_no,
+                                                    data=data, ts=time.time(), is_final=True)
+
+    async def infer_stream(self, request, context):
+        tokens = []
+        async for token in self.model.generate(request.data, context):
+            tokens.append(token)
+            yield vdag_service_pb2.vDAGInferencePacket(session_id=request.session_id, seq_no=request.seq_no,
+                                                       data=json.dumps({"token": token}), ts=time.time(),
+                                                       chunk_no=len(tokens) - 1)
+        yield vdag_service_pb2.vDAGInferencePacket(
+            session_id=request.session_id, seq_no=request.seq_no, ts=time.time(), is_final=True,
+            chunk_no=len(tokens), data=json.dumps({"reply": " ".join(tokens), "usage": {"completion_tokens": len(tokens)}}))
+
+    async def infer_bidi(self, request_iterator, context):
+        async for request in request_iterator:
+            async for chunk in self.infer_stream(request, context):
+                yield chunk
+
+
+async def start_stub_server(port: int, model: StubModel):
+    server = grpc.aio.server()
+    service_pb2_grpc.add_BlockInferenceServiceServicer_to_server(StubBlockService(model), server)
+    vdag_service_pb2_grpc.add_vDAGInferenceServiceServicer_to_server(StubvDAGService(model), server)
+    port = server.add_insecure_port(f"127.0.0.1:{port}")
+    await server.start()
+    return server, port
+
+
+# ----------------------------------------------------------------------------------
+
+async def run(args) -> dict:
+    server = None
+    target = args.target
+    if args.stub:
+        model = StubModel(args.stub_prefill_tps, args.stub_decode_tps, args.stub_error_rate, args.seed)
+        server, port = await start_stub_server(args.stub_port, model)
+        target = target or f"127.0.0.1:{port}"
+        if args.stub_only:
+            print(f"stub server listening on {target}", file=sys.stderr)
+            await server.wait_for_termination()
+            return {}
+    if not target:
+        raise SystemExit("--target is required without --stub")
+
+    client = LoadClient(target, args.api, args.channels, args.block_id, args.timeout_s)
+    bench = Benchmark(client, parse_distribution(args.input_tokens), parse_distribution(args.output_tokens),
+                      seed=args.seed, max_in_flight=args.max_in_flight)
+    start = time.monotonic()
+    try:
+        if args.trace:
+            await bench.open_loop(trace_arrivals(args.trace, args.trace_speed))
+        elif args.rate:
+            await bench.open_loop(poisson_arrivals(random.Random(args.seed + 1), args.rate, args.duration))
+        else:
+            await bench.closed_loop(args.concurrency, args.duration, args.requests, args.think_s)
+    finally:
+        wall_s = time.monotonic() - start
+        await client.close()
+        if server is not None:
+            await server.stop(None)
+
+    config = {k: v for k, v in vars(args).items() if k not in ("json", "csv")}
+    config["target"] = target
+    config["arrival"] = "trace" if args.trace else ("poisson" if args.rate else "closed")
+    report = bench.report(wall_s, config)
+    if args.csv:
+        bench.write_csv(args.csv)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Async gRPC load generator and latency benchmark")
+    parser.add_argument("--target", help="host:port of the inference endpoint (default with --stub: the stub)")
+    parser.add_argument("--api", default="vdag-stream", choices=["block", "vdag", "vdag-stream"])
+    parser.add_argument("--block-id", default="", help="block_id for --api block")
+    parser.add_argument("--channels", type=int, default=1, help="shared gRPC channels")
+    parser.add_argument("--timeout-s", type=float, default=300)
+    arrival = parser.add_mutually_exclusive_group()
+    arrival.add_argument("--rate", type=float, help="open loop: Poisson arrivals per second")
+    arrival.add_argument("--trace", help="open loop: JSON lines of {t, input_tokens?, output_tokens?}")
+    parser.add_argument("--trace-speed", type=float, default=1.0, help="replay the trace this many times faster")
+    parser.add_argument("--concurrency", type=int, default=1, help="closed loop: virtual users")
+    parser.add_argument("--requests", type=int, help="closed loop: stop after this many requests")
+    parser.add_argument("--think-s", type=float, default=0, help="closed loop: mean think time between requests")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="open loop: reject arrivals beyond this")
+    parser.add_argument("--input-tokens", default="fixed:100")
+    parser.add_argument("--output-tokens", default="fixed:100")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report here instead of stdout")
+    parser.add_argument("--csv", help="write one row per request here")
+    parser.add_argument("--stub", action="store_true", help="start a local stub server")
+    parser.add_argument("--stub-only", action="store_true", help="only run the stub server")
+    parser.add_argument("--stub-port", type=int, default=0)
+    parser.add_argument("--stub-prefill-tps", type=float, default=5000)
+    parser.add_argument("--stub-decode-tps", type=float, default=50)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    if args.stub_only:
+        args.stub = True
+
+    report = asyncio.run(run(args))
+    if not report:
+        return
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
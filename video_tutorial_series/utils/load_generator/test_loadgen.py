@@ -0,0 +1,62 @@
+import math
+import random
+import unittest
+
+from loadgen import LatencyHistogram, count_tokens
+
+
+def exact_percentile(values_us, p):
+    ordered = sorted(values_us)
+    return ordered[max(1, math.ceil(len(ordered) * p / 100.0)) - 1]
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram("ttft")
+        for us in range(1, 2048):
+            histogram.record(us / 1e6)
+        for p in (1, 50, 99, 100):
+            self.assertEqual(round(histogram.percentile(p) * 1e6), exact_percentile(range(1, 2048), p))
+
+    def test_three_significant_digits(self):
+        rng = random.Random(7)
+        values_us = [int(rng.lognormvariate(11, 1.5)) for _ in range(20000)]  # ~60ms median, long tail
+        histogram = LatencyHistogram("e2e")
+        for us in values_us:
+            histogram.record(us / 1e6)
+        for p in (50, 90, 99, 99.9):
+            exact = exact_percentile(values_us, p)
+            estimate = histogram.percentile(p) * 1e6
+            self.assertGreaterEqual(estimate, exact)
+            self.assertLessEqual(estimate - exact, exact / 1000.0 + 1)
+        self.assertEqual(histogram.percentile(100), max(values_us) / 1e6)
+
+    def test_memory_is_bounded_by_buckets(self):
+        histogram = LatencyHistogram("e2e")
+        for i in range(100000):
+            histogram.record(0.5 + i * 1e-7)
+        self.assertLess(len(histogram.counts), 1100)
+        self.assertEqual(histogram.total, 100000)
+
+    def test_summary(self):
+        histogram = LatencyHistogram("e2e")
+        self.assertEqual(histogram.summary(), {"count": 0})
+        self.assertEqual(histogram.percentile(50), 0.0)
+        for seconds in (0.001, 0.002, 0.003):
+            histogram.record(seconds)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 3)
+        self.assertAlmostEqual(summary["mean_s"], 0.002)
+        self.assertEqual((summary["p50_s"], summary["max_s"]), (0.002, 0.003))
+        self.assertIn("p99.9_s", summary)
+
+
+class TestCountTokens(unittest.TestCase):
+    def test_usage_reply_and_plain_text(self):
+        self.assertEqual(count_tokens('{"usage": {"completion_tokens": 12}, "reply": "a b"}'), 12)
+        self.assertEqual(count_tokens('{"reply": "three short words"}'), 3)
+        self.assertEqual(count_tokens("not json at all"), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Offline autoscaler / load balancer simulator.
+
+Replays a token-rate trace (synthetic, a JSON trace file, or recorded NODE_METRICS
+snapshots) against a simulated block and drives the real AIOSv1PolicyRule.eval of an
+autoscaler policy (default: 03_autoscaler) and a load balancer policy (default:
+04_loadbalancer) through the same settings['get_metrics'] interface the runtime uses.
+
+Each instance is modelled as `concurrency` parallel servers with prefill/decode token
+rates and a FIFO queue. New instances become routable after `startup_s`; instances
+removed by a downscale stop receiving traffic and drain their queue. Metrics are
+published every `metrics_interval_s` (the runtime pushes NODE_METRICS every 30s), so
+policies see the same staleness they see in production.
+
+The report lists latency percentiles, SLO violations, replica-seconds and scaling
+churn, so policy or parameter changes can be compared locally:
+
+    python simulator.py --pattern ramp --duration 3600 --peak-rate 6000 \\
+        --autoscaler-params '{"cooldown_seconds": 60}'
+"""
+import os
+import sys
+import json
+import heapq
+import math
+import random
+import types
+import logging
+import argparse
+import importlib.util
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_AUTOSCALER = os.path.join(HERE, "..", "..", "03_autoscaler", "code", "function.py")
+DEFAULT_LOADBALANCER = os.path.join(HERE, "..", "..", "04_loadbalancer", "code", "function.py")
+
+ROLLING_WINDOWS = (("average_1m", 60), ("average_5m", 300), ("average_15m", 900))
+
+
+class SimClock:
+    """Stands in for the `time` module inside loaded policies so cooldowns follow simulated time."""
+
+    def __init__(self):
+        self.now = 0.0
+        self._real = __import__("time")
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+
+def load_policy(path: str, clock: SimClock, name: str):
+    """Imports a policy function.py under a unique module name with its clock patched."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if hasattr(module, "time"):
+        module.time = clock
+    return module
+
+
+# ----------------------------------------------------------------------------------
+# Traces: lists of (t seconds, input tokens/min, output tokens/min)
+# ----------------------------------------------------------------------------------
+
+def synthetic_trace(pattern: str, duration: float, base_rate: float, peak_rate: float,
+                    output_ratio: float) -> List[Tuple[float, float, float]]:
+    points = []
+    for t in range(0, int(duration) + 1, 10):
+        x = t / duration
+        if pattern == "constant":
+            rate = base_rate
+        elif pattern == "ramp":
+            rate = base_rate + (peak_rate - base_rate) * min(1.0, x * 2)
+        elif pattern == "step":
+            rate = peak_rate if 0.3 <= x < 0.7 else base_rate
+        elif pattern == "spike":
+            rate = peak_rate if 0.45 <= x < 0.5 else base_rate
+        elif pattern == "diurnal":
+            rate = base_rate + (peak_rate - base_rate) * 0.5 * (1 - math.cos(2 * math.pi * x))
+        else:
+            raise ValueError(f"Unknown pattern: {pattern}")
+        points.append((float(t), rate, rate * output_ratio))
+    return points
+
+
+def load_trace(path: str) -> List[Tuple[float, float, float]]:
+    """JSON lines or a JSON list of {"t", "input_tokens_per_min", "output_tokens_per_min"}."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    rows = json.loads(text) if text.startswith("[") else [json.loads(l) for l in text.splitlines() if l.strip()]
+    return sorted((float(r["t"]), float(r["input_tokens_per_min"]), float(r["output_tokens_per_min"])) for r in rows)
+
+
+def trace_from_node_metrics(path: str, block_id: Optional[str] = None, bucket_s: float = 30.0):
+    """
+    Builds a fleet-wide token-rate trace from recorded NODE_METRICS snapshots
+    (JSON lines, e.g. `redis-cli LRANGE NODE_METRICS 0 -1`). The average_1m input and
+    output token rates of all instances are summed per bucket_s interval.
+    """
+    buckets: Dict[int, Dict[str, Tuple[float, float]]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            snap = json.loads(line)
+            if block_id and snap.get("blockId") != block_id:
+                continue
+            if "timestamp" not in snap:
+                continue
+            bucket = int(snap["timestamp"] // bucket_s)
+            rates = (
+                snap.get("llm_input_tokens_per_minute_rolling", {}).get("average_1m", 0) or 0,
+                snap.get("llm_output_tokens_per_minute_rolling", {}).get("average_1m", 0) or 0,
+            )
+            # the latest snapshot of an instance within a bucket wins
+            buckets.setdefault(bucket, {})[snap.get("instanceId")] = rates
+    if not buckets:
+        raise ValueError(f"No NODE_METRICS snapshots found in {path}")
+    start = min(buckets)
+    return [((b - start) * bucket_s,
+             sum(r[0] for r in per_instance.values()),
+             sum(r[1] for r in per_instance.values()))
+            for b, per_instance in sorted(buckets.items())]
+
+
+def rate_at(trace, t: float) -> Tuple[float, float]:
+    """Piecewise-linear interpolation of the trace at time t."""
+    if t <= trace[0][0]:
+        return trace[0][1], trace[0][2]
+    for (t0, i0, o0), (t1, i1, o1) in zip(trace, trace[1:]):
+        if t0 <= t <= t1:
+            w = (t - t0) / (t1 - t0) if t1 > t0 else 0.0
+            return i0 + w * (i1 - i0), o0 + w * (o1 - o0)
+    return trace[-1][1], trace[-1][2]
+
+
+# ----------------------------------------------------------------------------------
+# Simulated block
+# ----------------------------------------------------------------------------------
+
+class Request:
+    __slots__ = ("rid", "arrival", "input_tokens", "output_tokens", "session_id", "start", "end")
+
+    def __init__(self, rid, arrival, input_tokens, output_tokens, session_id):
+        self.rid = rid
+        self.arrival = arrival
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.session_id = session_id
+        self.start = None
+        self.end = None
+
+
+class SimInstance:
+    def __init__(self, instance_id: str, created: float, ready_at: float, concurrency: int,
+                 prefill_tps: float, decode_tps: float):
+        self.instance_id = instance_id
+        self.created = created
+        self.ready_at = ready_at
+        self.concurrency = concurrency
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.queue = deque()
+        self.busy = 0
+        self.draining = False
+        self.stopped_at = None
+        self.served = 0
+        self.accepted = deque()   # (t, input tokens, output tokens) for rolling token rates
+        self.latencies = deque()  # (t, latency) for end_to_end_latency
+
+    def service_time(self, req: Request) -> float:
+        return req.input_tokens / self.prefill_tps + req.output_tokens / self.decode_tps
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        """Metrics in the shape the runtime pushes to NODE_METRICS."""
+        while self.accepted and self.accepted[0][0] < now - 900:
+            self.accepted.popleft()
+        while self.latencies and self.latencies[0][0] < now - 60:
+            self.latencies.popleft()
+        input_rolling, output_rolling = {}, {}
+        for key, window in ROLLING_WINDOWS:
+            age = min(window, max(now - self.ready_at, 1.0))
+            inp = sum(i for t, i, _ in self.accepted if t >= now - window)
+            out = sum(o for t, _, o in self.accepted if t >= now - window)
+            input_rolling[key] = inp * 60.0 / age
+            output_rolling[key] = out * 60.0 / age
+        input_rolling["current"] = input_rolling["average_1m"]
+        output_rolling["current"] = output_rolling["average_1m"]
+        latency = sorted(l for _, l in self.latencies)
+        return {
+            "blockId": "simulated-block",
+            "instanceId": self.instance_id,
+            "type": "app",
+            "timestamp": now,
+            "llm_input_tokens_per_minute_rolling": input_rolling,
+            "llm_output_tokens_per_minute_rolling": output_rolling,
+            "queue_length": len(self.queue),
+            "llm_active_sessions": self.busy,
+            "end_to_end_latency": latency[-1] if latency else 0.0,
+            "end_to_end_latency_rolling": {
+                "average_1m": sum(latency) / len(latency) if latency else 0.0,
+                "p95": latency[int(0.95 * (len(latency) - 1))] if latency else 0.0,
+            },
+        }
+
+
+class Simulator:
+    def __init__(self, trace, autoscaler_path: str, loadbalancer_path: str,
+                 autoscaler_params: Dict = None, loadbalancer_params: Dict = None,
+                 initial_instances: int = 1, max_instances: int = 20, concurrency: int = 4,
+                 prefill_tps: float = 2000.0, decode_tps: float = 40.0, startup_s: float = 60.0,
+                 mean_input_tokens: float = 500.0, autoscaler_interval_s: float = 30.0,
+                 metrics_interval_s: float = 30.0, slo_s: float = 30.0, sessions: int = 200,
+                 duration: Optional[float] = None, seed: int = 0):
+        self.trace = trace
+        self.duration = duration or trace[-1][0]
+        self.rng = random.Random(seed)
+        self.clock = SimClock()
+        self.concurrency = concurrency
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.startup_s = startup_s
+        self.max_instances = max_instances
+        self.mean_input_tokens = mean_input_tokens
+        self.autoscaler_interval_s = autoscaler_interval_s
+        self.metrics_interval_s = metrics_interval_s
+        self.slo_s = slo_s
+        self.sessions = sessions
+
+        self.instances: Dict[str, SimInstance] = {}
+        self.next_instance = 0
+        self.events = []
+        self.seq = 0
+        self.metrics_snapshot = {"block_metrics": []}
+        self.completed: List[Request] = []
+        self.scale_events = []  # (t, operation, count)
+        self.misroutes = 0
+        self.max_replicas = 0
+
+        settings = {"get_metrics": lambda: self.metrics_snapshot}
+        self.autoscaler = None
+        if autoscaler_path:
+            module = load_policy(autoscaler_path, self.clock, "sim_autoscaler_policy")
+            self.autoscaler = module.AIOSv1PolicyRule("sim-autoscaler", settings, autoscaler_params or {})
+        module = load_policy(loadbalancer_path, self.clock, "sim_loadbalancer_policy")
+        self.loadbalancer = module.AIOSv1PolicyRule("sim-loadbalancer", settings, loadbalancer_params or {})
+
+        for _ in range(initial_instances):
+            self._add_instance(ready_at=0.0)
+
+    # -- event queue --------------------------------------------------------------
+    def _push(self, t: float, kind: str, payload=None):
+        self.seq += 1
+        heapq.heappush(self.events, (t, self.seq, kind, payload))
+
+    # -- instances ------------------------------------------------------------------
+    def _add_instance(self, ready_at: float):
+        instance_id = f"inst-{self.next_instance}"
+        self.next_instance += 1
+        self.instances[instance_id] = SimInstance(
+            instance_id, self.clock.now, ready_at, self.concurrency, self.prefill_tps, self.decode_tps)
+        return instance_id
+
+    def _routable(self) -> List[str]:
+        now = self.clock.now
+        return [i.instance_id for i in self.instances.values()
+                if i.ready_at <= now and not i.draining and i.stopped_at is None]
+
+    def _provisioned(self) -> List[SimInstance]:
+        return [i for i in self.instances.values() if i.stopped_at is None]
+
+    def _start_next(self, inst: SimInstance):
+        while inst.busy < inst.concurrency and inst.queue:
+            req = inst.queue.popleft()
+            req.start = self.clock.now
+            inst.busy += 1
+            self._push(self.clock.now + inst.service_time(req), "complete", (inst.instance_id, req))
+        if inst.draining and inst.busy == 0 and not inst.queue and inst.stopped_at is None:
+            inst.stopped_at = self.clock.now
+
+    # -- event handlers -------------------------------------------------------------
+    def _on_arrival(self, req: Request):
+        routable = self._routable()
+        if not routable:
+            # nothing ready yet: hold the request on the oldest starting instance
+            pending = [i for i in self._provisioned() if not i.draining]
+            if not pending:
+                instance_id = self._add_instance(ready_at=self.clock.now + self.startup_s)
+                self._push(self.clock.now + self.startup_s, "ready", instance_id)
+                pending = [self.instances[instance_id]]
+            inst = min(pending, key=lambda i: i.ready_at)
+        else:
+            packet = types.SimpleNamespace(session_id=req.session_id)
+            decision = self.loadbalancer.eval({}, {"instances": routable, "packet": packet}, {})
+            instance_id = decision.get("instance_id")
+            if instance_id not in routable:
+                self.misroutes += 1
+                instance_id = self.rng.choice(routable)
+            inst = self.instances[instance_id]
+        inst.accepted.append((self.clock.now, req.input_tokens, req.output_tokens))
+        inst.queue.append(req)
+        if inst.ready_at <= self.clock.now:
+            self._start_next(inst)
+
+    def _on_complete(self, instance_id: str, req: Request):
+        inst = self.instances[instance_id]
+        inst.busy -= 1
+        inst.served += 1
+        req.end = self.clock.now
+        inst.latencies.append((self.clock.now, req.end - req.arrival))
+        self.completed.append(req)
+        self._start_next(inst)
+
+    def _on_ready(self, instance_id: str):
+        self._start_next(self.instances[instance_id])
+
+    def _on_metrics(self):
+        now = self.clock.now
+        self.metrics_snapshot = {"block_metrics": [
+            i.snapshot(now) for i in self.instances.values() if i.ready_at <= now and i.stopped_at is None
+        ]}
+
+    def _on_autoscale(self):
+        current = [i.instance_id for i in self._provisioned() if not i.draining]
+        decision = self.autoscaler.eval({}, {"current_instances": current}, {})
+        if decision.get("skip", True):
+            return
+        if decision.get("operation") == "upscale":
+            count = min(int(decision.get("instances_count", 1)), self.max_instances - len(current))
+            for _ in range(max(0, count)):
+                instance_id = self._add_instance(ready_at=self.clock.now + self.startup_s)
+                self._push(self.clock.now + self.startup_s, "ready", instance_id)
+            if count > 0:
+                self.scale_events.append((self.clock.now, "upscale", count))
+        elif decision.get("operation") == "downscale":
+            removed = 0
+            for instance_id in decision.get("instances_list", []):
+                inst = self.instances.get(instance_id)
+                if inst is None or inst.draining or len(current) - removed <= 1:
+                    continue
+                inst.draining = True
+                removed += 1
+                self._start_next(inst)
+            if removed:
+                self.scale_events.append((self.clock.now, "downscale", removed))
+
+    # -- workload -------------------------------------------------------------------
+    def _generate_arrivals(self):
+        """Non-homogeneous Poisson arrivals by thinning against the peak request rate."""
+        peak = max(r[1] for r in self.trace) / self.mean_input_tokens / 60.0
+        if peak <= 0:
+            return
+        t, rid = 0.0, 0
+        while True:
+            t += self.rng.expovariate(peak)
+            if t > self.duration:
+                break
+            input_rate, output_rate = rate_at(self.trace, t)
+            req_rate = input_rate / self.mean_input_tokens / 60.0
+            if self.rng.random() * peak > req_rate:
+                continue
+            mean_output = output_rate / max(req_rate * 60.0, 1e-9)
+            input_tokens = max(1, int(self.rng.expovariate(1.0 / self.mean_input_tokens)))
+            output_tokens = max(1, int(self.rng.expovariate(1.0 / max(mean_output, 1.0))))
+            session_id = f"session-{self.rng.randrange(self.sessions)}"
+            self._push(t, "arrival", Request(rid, t, input_tokens, output_tokens, session_id))
+            rid += 1
+
+    def run(self) -> Dict[str, Any]:
+        self._generate_arrivals()
+        t = 0.0
+        while t <= self.duration:
+            self._push(t, "metrics")
+            t += self.metrics_interval_s
+        if self.autoscaler is not None:
+            t = self.autoscaler_interval_s
+            while t <= self.duration:
+                self._push(t, "autoscale")
+                t += self.autoscaler_interval_s
+
+        replica_seconds = 0.0
+        last_t = 0.0
+        while self.events:
+            t, _, kind, payload = heapq.heappop(self.events)
+            provisioned = len(self._provisioned())
+            replica_seconds += provisioned * (t - last_t)
+            self.max_replicas = max(self.max_replicas, provisioned)
+            last_t = t
+            self.clock.now = t
+            if kind == "arrival":
+                self._on_arrival(payload)
+            elif kind == "complete":
+                self._on_complete(*payload)
+            elif kind == "ready":
+                self._on_ready(payload)
+            elif kind == "metrics":
+                self._on_metrics()
+            elif kind == "autoscale":
+                self._on_autoscale()
+        return self.report(replica_seconds)
+
+    def report(self, replica_seconds: float) -> Dict[str, Any]:
+        latencies = sorted(r.end - r.arrival for r in self.completed)
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        violations = sum(1 for l in latencies if l > self.slo_s)
+        served = [i.served for i in self.instances.values() if i.served]
+        ups = sum(c for _, op, c in self.scale_events if op == "upscale")
+        downs = sum(c for _, op, c in self.scale_events if op == "downscale")
+        return {
+            "duration_s": self.duration,
+            "requests": len(self.completed),
+            "latency_p50_s": round(pct(0.50), 3),
+            "latency_p95_s": round(pct(0.95), 3),
+            "latency_p99_s": round(pct(0.99), 3),
+            "slo_s": self.slo_s,
+            "slo_violations": violations,
+            "slo_violation_rate": round(violations / len(latencies), 4) if latencies else 0.0,
+            "replica_seconds": round(replica_seconds, 1),
+            "mean_replicas": round(replica_seconds / self.duration, 2) if self.duration else 0.0,
+            "max_replicas": self.max_replicas,
+            "scale_up_events": sum(1 for _, op, _ in self.scale_events if op == "upscale"),
+            "scale_down_events": sum(1 for _, op, _ in self.scale_events if op == "downscale"),
+            "scaling_churn": ups + downs,
+            "lb_misroutes": self.misroutes,
+            "lb_imbalance": round(max(served) / (sum(served) / len(served)), 3) if served else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline autoscaler / load balancer simulator")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--pattern", default="ramp", choices=["constant", "ramp", "step", "spike", "diurnal"])
+    source.add_argument("--trace", help="JSON trace of {t, input_tokens_per_min, output_tokens_per_min}")
+    source.add_argument("--node-metrics", help="recorded NODE_METRICS snapshots, one JSON object per line")
+    parser.add_argument("--block-id", help="only replay NODE_METRICS of this block")
+    parser.add_argument("--duration", type=float, default=3600)
+    parser.add_argument("--base-rate", type=float, default=500, help="input tokens/min (synthetic)")
+    parser.add_argument("--peak-rate", type=float, default=5000, help="input tokens/min (synthetic)")
+    parser.add_argument("--output-ratio", type=float, default=0.4, help="output/input token rate (synthetic)")
+    parser.add_argument("--autoscaler", default=DEFAULT_AUTOSCALER, help="autoscaler function.py, '' to disable")
+    parser.add_argument("--loadbalancer", default=DEFAULT_LOADBALANCER, help="load balancer function.py")
+    parser.add_argument("--autoscaler-params", default="{}", help="JSON parameters for the autoscaler policy")
+    parser.add_argument("--lb-params", default="{}", help="JSON parameters for the load balancer policy")
+    parser.add_argument("--initial-instances", type=int, default=1)
+    parser.add_argument("--max-instances", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel sequences per instance")
+    parser.add_argument("--prefill-tps", type=float, default=2000, help="input tokens/s per sequence")
+    parser.add_argument("--decode-tps", type=float, default=40, help="output tokens/s per sequence")
+    parser.add_argument("--startup-s", type=float, default=60)
+    parser.add_argument("--mean-input-tokens", type=float, default=500)
+    parser.add_argument("--autoscaler-interval-s", type=float, default=30)
+    parser.add_argument("--metrics-interval-s", type=float, default=30)
+    parser.add_argument("--slo-s", type=float, default=30)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="keep policy INFO logs")
+    args = parser.parse_args()
+
+    # policies log every decision at INFO, which dominates the run time
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    if args.node_metrics:
+        trace = trace_from_node_metrics(args.node_metrics, args.block_id)
+        duration = trace[-1][0]
+    elif args.trace:
+        trace = load_trace(args.trace)
+        duration = trace[-1][0]
+    else:
+        trace = synthetic_trace(args.pattern, args.duration, args.base_rate, args.peak_rate, args.output_ratio)
+        duration = args.duration
+
+    sim = Simulator(
+        trace,
+        autoscaler_path=args.autoscaler or None,
+        loadbalancer_path=args.loadbalancer,
+        autoscaler_params=json.loads(args.autoscaler_params),
+        loadbalancer_params=json.loads(args.lb_params),
+        initial_instances=args.initial_instances,
+        max_instances=args.max_instances,
+        concurrency=args.concurrency,
+        prefill_tps=args.prefill_tps,
+        decode_tps=args.decode_tps,
+        startup_s=args.startup_s,
+        mean_input_tokens=args.mean_input_tokens,
+        autoscaler_interval_s=args.autoscaler_interval_s,
+        metrics_interval_s=args.metrics_interval_s,
+        slo_s=args.slo_s,
+        sessions=args.sessions,
+        duration=duration,
+        seed=args.seed,
+    )
+    print(json.dumps(sim.run(), indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Per-request waterfalls from the packet traces of the block runtime.
+
+Blocks with trace_exporter_url set record, for sampled requests, one "hop" span per block
+a packet passes through (a circular vDAG shows the same block several times) with a
+child span per stage: queue_wait, executor_wait, pre_process_policy, muxer, on_preprocess,
+on_data, post_process_policy, output_push. This tool reads them back from the Redis
+stream the blocks export to, or from a file of JSON lines (spans as exported to Redis,
+or OTLP/JSON as written by the collector's file exporter), and prints:
+
+  (default)        the most recent traces, with their end-to-end time and slowest stage
+  --trace-id ID    the waterfall of one request across blocks
+  --summary        per block and stage latency percentiles over all traces, ranked by
+                   their share of the end-to-end time: where the time goes
+
+    python waterfall.py --redis-url redis://localhost:6379/0 --summary
+    python waterfall.py --file spans.jsonl --trace-id 4bf92f3577b34da6a3ce929d0e0e4736
+
+Start times are wall clock times of different nodes, so queue_wait includes their skew.
+"""
+import sys
+import json
+import math
+import argparse
+from collections import defaultdict
+from typing import Dict, List
+
+
+def load_redis(url: str, stream: str = "aios_traces", count: int = 100000) -> List[dict]:
+    import redis
+
+    client = redis.Redis.from_url(url)
+    entries = client.xrevrange(stream, count=count)
+    return [json.loads(fields[b"span"]) for _, fields in reversed(entries)]
+
+
+def _otlp_spans(payload: dict) -> List[dict]:
+    spans = []
+    for resource_spans in payload.get("resourceSpans", []):
+        resource = {a["key"]: a["value"].get("stringValue") for a in resource_spans.get("resource", {}).get("attributes", [])}
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                attributes = {a["key"]: next(iter(a["value"].values()), None) for a in span.get("attributes", [])}
+                status = span.get("status", {})
+                spans.append({
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId", ""),
+                    "name": span["name"],
+                    "block_id": resource.get("service.name", ""),
+                    "instance_id": attributes.pop("instance_id", ""),
+                    "start": int(span["startTimeUnixNano"]) / 1e9,
+                    "end": int(span["endTimeUnixNano"]) / 1e9,
+                    "attributes": attributes,
+                    "error": status.get("message") if status.get("code") == 2 else None,
+                })
+    return spans
+
+
+def load_file(path: str) -> List[dict]:
+    spans = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            spans.extend(_otlp_spans(record) if "resourceSpans" in record else [record])
+    return spans
+
+
+def group_traces(spans: List[dict]) -> Dict[str, List[dict]]:
+    traces = defaultdict(list)
+    for span in spans:
+        traces[span["trace_id"]].append(span)
+    return traces
+
+
+def trace_bounds(spans: List[dict]):
+    return min(s["start"] for s in spans), max(s["end"] for s in spans)
+
+
+def stages(spans: List[dict]) -> List[dict]:
+    return [s for s in spans if s["name"] != "hop"]
+
+
+def slowest_stage(spans: List[dict]):
+    candidates = stages(spans)
+    if not candidates:
+        return None
+    return max(candidates, key=lambda s: s["end"] - s["start"])
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100.0) - 1)]
+
+
+# ----------------------------------------------------------------------------------
+
+def print_recent(traces: Dict[str, List[dict]], limit: int):
+    rows = sorted(traces.items(), key=lambda item: trace_bounds(item[1])[0], reverse=True)[:limit]
+    print(f"{'trace_id':34} {'e2e_ms':>10} {'hops':>5}  slowest stage")
+    for trace_id, spans in rows:
+        start, end = trace_bounds(spans)
+        hops = sum(1 for s in spans if s["name"] == "hop")
+        slowest = slowest_stage(spans)
+        label = f"{slowest['block_id']}/{slowest['name']} {1000 * (slowest['end'] - slowest['start']):.1f}ms" if slowest else "-"
+        error = " ERROR" if any(s.get("error") for s in spans) else ""
+        print(f"{trace_id:34} {1000 * (end - start):10.1f} {hops:5d}  {label}{error}")
+
+
+def print_waterfall(spans: List[dict], width: int = 60):
+    start, end = trace_bounds(spans)
+    total = max(end - start, 1e-9)
+    by_id = {s["span_id"]: s for s in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in spans:
+        if span["parent_id"] and span["parent_id"] in by_id:
+            children[span["parent_id"]].append(span)
+        else:
+            roots.append(span)
+
+    def bar(span):
+        left = int((span["start"] - start) / total * width)
+        length = max(1, int((span["end"] - span["start"]) / total * width))
+        return " " * left + "#" * min(length, width - left)
+
+    def visit(span, depth):
+        label = f"{span['block_id']}" if span["name"] == "hop" else span["name"]
+        label = ("  " * depth + label)[:36]
+        error = f"  ERROR: {span['error']}" if span.get("error") else ""
+        print(f"{label:36} {1000 * (span['start'] - start):9.1f} {1000 * (span['end'] - span['start']):9.1f}  "
+              f"|{bar(span):{width}}|{error}")
+        for child in sorted(children[span["span_id"]], key=lambda s: s["start"]):
+            visit(child, depth + 1)
+
+    print(f"trace {spans[0]['trace_id']}: {1000 * total:.1f}ms, "
+          f"{sum(1 for s in spans if s['name'] == 'hop')} hops")
+    print(f"{'span':36} {'start_ms':>9} {'dur_ms':>9}")
+    for root in sorted(roots, key=lambda s: s["start"]):
+        visit(root, 0)
+
+
+def print_summary(traces: Dict[str, List[dict]]):
+    durations = defaultdict(list)
+    e2e_total = 0.0
+    for spans in traces.values():
+        start, end = trace_bounds(spans)
+        e2e_total += end - start
+        for span in stages(spans):
+            durations[(span["block_id"], span["name"])].append(span["end"] - span["start"])
+
+    e2e = [trace_bounds(spans)[1] - trace_bounds(spans)[0] for spans in traces.values()]
+    print(f"{len(traces)} traces, end-to-end p50 {1000 * percentile(e2e, 50):.1f}ms "
+          f"p95 {1000 * percentile(e2e, 95):.1f}ms p99 {1000 * percentile(e2e, 99):.1f}ms")
+    print(f"{'block':28} {'stage':20} {'count':>6} {'p50_ms':>9} {'p95_ms':>9} {'max_ms':>9} {'share':>7}")
+    for (block_id, name), values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        share = sum(values) / e2e_total if e2e_total else 0.0
+        print(f"{block_id[:28]:28} {name:20} {len(values):6d} {1000 * percentile(values, 50):9.1f} "
+              f"{1000 * percentile(values, 95):9.1f} {1000 * max(values):9.1f} {100 * share:6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request waterfalls from block runtime traces")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--redis-url", help="Redis the blocks export spans to (trace_exporter_url)")
+    source.add_argument("--file", help="JSON lines of spans or OTLP/JSON export requests")
+    parser.add_argument("--stream", default="aios_traces")
+    parser.add_argument("--count", type=int, default=100000, help="most recent spans to read from Redis")
+    parser.add_argument("--trace-id", help="print the waterfall of this trace")
+    parser.add_argument("--summary", action="store_true", help="per block and stage latency over all traces")
+    parser.add_argument("--limit", type=int, default=20, help="traces listed by default")
+    parser.add_argument("--width", type=int, default=60)
+    args = parser.parse_args()
+
+    spans = load_redis(args.redis_url, args.stream, args.count) if args.redis_url else load_file(args.file)
+    traces = group_traces(spans)
+    if not traces:
+        print("no spans found", file=sys.stderr)
+        return 1
+
+    if args.trace_id:
+        if args.trace_id not in traces:
+            print(f"trace {args.trace_id} not found", file=sys.stderr)
+            return 1
+        print_waterfall(traces[args.trace_id], args.width)
+    elif args.summary:
+        print_summary(traces)
+    else:
+        print_recent(traces, args.limit)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())